@@ -11,7 +11,7 @@ import logging
 
 import pandas as pd
 
-from utils.logger import set_logging
+from utils.logger import set_logging, timed_phase
 from config.cfg import cfg
 from aggregations import aggregator
 from utils.utils import (
@@ -194,6 +194,11 @@ if __name__ == '__main__':
     parser.add_argument(
         "--log_filename", type=str,
         default='aggregate_annotations_plurality')
+    parser.add_argument(
+        "--profile", type=str, nargs='?', const='cprofile', default=None,
+        choices=['cprofile', 'pyinstrument'],
+        help="Profile the script, the profile is written next to the log \
+              file (alternatively set the env var PROFILE)")
 
     args = vars(parser.parse_args())
 
@@ -211,7 +216,7 @@ if __name__ == '__main__':
     ######################################
 
     # logging
-    set_logging(args['log_dir'], args['log_filename'])
+    set_logging(args['log_dir'], args['log_filename'], args['profile'])
 
     logger = logging.getLogger(__name__)
 
@@ -233,14 +238,14 @@ if __name__ == '__main__':
 
     # Read Annotations and associate with subject id
     subject_annotations = dict()
-    with open(args['annotations'], "r") as ins:
+    with open(args['annotations'], "r") as ins, \
+            timed_phase('import_annotations', unit='annotations',
+                        log_every=10000) as phase:
         csv_reader = csv.reader(ins, delimiter=',', quotechar='"')
         header = next(csv_reader)
         questions = [x for x in header if x.startswith(question_column_prefix)]
         for line_no, line in enumerate(csv_reader):
-            # print status
-            if ((line_no % 10000) == 0) and (line_no > 0):
-                print("Imported {:,} annotations".format(line_no))
+            phase.update()
             # convert to dict
             line_dict = {header[i]: x for i, x in enumerate(line)}
             if line_dict['subject_id'] not in subject_annotations:
@@ -255,16 +260,16 @@ if __name__ == '__main__':
     ######################################
 
     subject_species_aggregations = dict()
-    for num, (subject_id, subject_data) in enumerate(subject_annotations.items()):
-        # print status
-        if ((num % 10000) == 0) and (num > 0):
-            print("Aggregated {:,} subjects".format(num))
-        record = aggregate_subject_annotations(
-                    subject_data,
-                    questions,
-                    question_type_map,
-                    question_main_id)
-        subject_species_aggregations[subject_id] = record
+    with timed_phase('aggregate_subjects', unit='subjects',
+                     log_every=10000) as phase:
+        for subject_id, subject_data in subject_annotations.items():
+            record = aggregate_subject_annotations(
+                        subject_data,
+                        questions,
+                        question_type_map,
+                        question_main_id)
+            subject_species_aggregations[subject_id] = record
+            phase.update()
 
     # Create one record per identification
     subject_identificatons = list()
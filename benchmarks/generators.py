@@ -0,0 +1,368 @@
+""" Generate Synthetic Data for Benchmarks
+    - all generators are seeded: the same arguments produce identical files
+    - classification exports (Zooniverse survey task), extracted
+      annotations, image inventories and directories with JPEG images
+    Example:
+    python3 -m benchmarks.generators \
+    --dataset classifications \
+    --output /tmp/SER_S1_classifications.csv \
+    --n 100000
+"""
+import os
+import csv
+import json
+import random
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image
+
+
+# species with relative frequencies (roughly as on Snapshot Serengeti)
+SPECIES = [
+    ('WILDEBEEST', 30), ('ZEBRA', 15), ('GAZELLETHOMSONS', 12),
+    ('BUFFALO', 5), ('HARTEBEEST', 4), ('ELEPHANT', 4), ('IMPALA', 4),
+    ('GIRAFFE', 3), ('WARTHOG', 3), ('GAZELLEGRANTS', 3),
+    ('BIRDOTHER', 3), ('LIONFEMALE', 2), ('HYENASPOTTED', 2),
+    ('TOPI', 2), ('BABOON', 2), ('ELAND', 1), ('OSTRICH', 1),
+    ('CHEETAH', 1), ('LEOPARD', 1), ('REEDBUCK', 1)]
+
+BLANK_CHOICE = 'NOANIMALSPRESENT'
+
+BEHAVIORS = ['STANDING', 'RESTING', 'MOVING', 'EATING', 'INTERACTING']
+
+COUNTS = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '1150', '51']
+
+CLASSIFICATION_HEADER = [
+    'classification_id', 'user_name', 'user_id', 'user_ip', 'workflow_id',
+    'workflow_name', 'workflow_version', 'created_at', 'gold_standard',
+    'expert', 'metadata', 'annotations', 'subject_data', 'subject_ids']
+
+ANNOTATION_HEADER = [
+    'user_name', 'user_id', 'created_at', 'subject_id', 'workflow_id',
+    'workflow_version', 'classification_id', 'question__species',
+    'question__count', 'question__standing', 'question__resting',
+    'question__moving', 'question__eating', 'question__interacting',
+    'question__young_present']
+
+INVENTORY_HEADER = [
+    'season', 'site', 'roll', 'image_name_original', 'image_path_original',
+    'image_path_original_rel', 'datetime', 'datetime_exif',
+    'datetime_file_creation', 'image_check__all_black',
+    'image_check__all_white', 'image_check__corrupt_file',
+    'image_check__corrupt_exif', 'image_check__empty_file',
+    'image_check__time_lapse', 'image_check__time_too_old',
+    'image_check__time_too_new', 'exif__Make', 'exif__Model']
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _choose_species(rng):
+    names, weights = zip(*SPECIES)
+    return rng.choices(names, weights=weights)[0]
+
+
+def _site_names(n_sites):
+    return ['{}{:02}'.format(chr(ord('A') + (i // 13) % 26), (i % 13) + 1)
+            for i in range(n_sites)]
+
+
+def _user(user_no):
+    """ user_name, user_id, user_ip -- a third is not logged in """
+    ip = hashlib.md5('ip{}'.format(user_no).encode()).hexdigest()[:20]
+    if user_no % 3 == 0:
+        return 'not-logged-in-{}'.format(ip), '', ip
+    return 'user_{}'.format(user_no), str(1000000 + user_no), ip
+
+
+def _subject_users(rng, n_users, k):
+    """ k different users (few users make most classifications) """
+    users = list()
+    while len(users) < min(k, n_users):
+        user_no = min(int(rng.paretovariate(1.2)), n_users) - 1
+        if user_no not in users:
+            users.append(user_no)
+    return users
+
+
+def _subject_species(rng):
+    """ True species of a subject: blank, one or two species """
+    if rng.random() < 0.3:
+        return [BLANK_CHOICE]
+    elif rng.random() < 0.1:
+        return [_choose_species(rng), _choose_species(rng)]
+    return [_choose_species(rng)]
+
+
+def _annotated_species(rng, species):
+    """ Species annotated by a volunteer (who sometimes disagrees) """
+    annotated = [
+        x if rng.random() < 0.85 else _choose_species(rng) for x in species]
+    return list(dict.fromkeys(annotated))
+
+
+def _survey_task_value(rng, species):
+    """ Annotation of one species in a survey task """
+    if species == BLANK_CHOICE:
+        return {'choice': species, 'answers': {}, 'filters': {}}
+    n_behaviors = rng.choice([1, 1, 1, 2, 2, 3])
+    return {
+        'choice': species,
+        'answers': {
+            'HOWMANY': rng.choice(COUNTS[:10] if rng.random() < 0.95
+                                  else COUNTS[10:]),
+            'WHATBEHAVIORSDOYOUSEE': rng.sample(BEHAVIORS, n_behaviors),
+            'ARETHEREANYYOUNGPRESENT': rng.choice(['YES', 'NO', 'NO'])},
+        'filters': {}}
+
+
+def generate_classifications_csv(
+        path, n_classifications, seed=0, season='SER_S1',
+        workflow_id='4979', workflow_version='275.13',
+        classifications_per_subject=10, n_users=None):
+    """ Zooniverse classification export with survey task annotations
+        - subjects (blank, one or two species) are classified by
+          'classifications_per_subject' different users, some
+          classifications disagree, a few are duplicates or 'already_seen'
+        - returns the number of subjects
+    """
+    rng = random.Random(seed)
+    if n_users is None:
+        n_users = max(2 * classifications_per_subject, n_classifications // 20)
+    n_subjects = -(-n_classifications // classifications_per_subject)
+    sites = _site_names(max(1, n_subjects // 2000))
+    start = datetime(2019, 4, 2, 14, 0, 0)
+    i = 0
+    with open(path, 'w', newline='') as f:
+        csv_writer = csv.writer(f, delimiter=',', quotechar='"')
+        csv_writer.writerow(CLASSIFICATION_HEADER)
+        for subject_no in range(n_subjects):
+            subject_id = str(30000000 + subject_no)
+            site = rng.choice(sites)
+            roll = str(rng.randint(1, 4))
+            capture = str(subject_no + 1)
+            subject_data = {subject_id: {
+                'retired': None, '#season': season, '#site': site,
+                '#roll': roll, '#capture': capture,
+                '#capture_id': '#'.join([season, site, roll, capture])}}
+            species = _subject_species(rng)
+            users = _subject_users(
+                rng, n_users,
+                min(classifications_per_subject, n_classifications - i))
+            for user_no in users:
+                user_name, user_id, user_ip = _user(user_no)
+                annotations = [{
+                    'task': 'T0',
+                    'task_label': None,
+                    'value': [_survey_task_value(rng, x)
+                              for x in _annotated_species(rng, species)]}]
+                created_at = start + timedelta(seconds=i * 3)
+                metadata = {
+                    'source': 'api',
+                    'session': hashlib.md5(user_ip.encode()).hexdigest(),
+                    'viewport': {'width': 1366, 'height': 635},
+                    'started_at': (created_at - timedelta(seconds=20)
+                                   ).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                    'user_agent': 'Mozilla/5.0 (X11; Linux x86_64)',
+                    'utc_offset': '-7200',
+                    'finished_at': created_at.strftime(
+                        '%Y-%m-%dT%H:%M:%S.000Z'),
+                    'live_project': True,
+                    'interventions': {'opt_in': True, 'messageShown': False},
+                    'user_language': 'en',
+                    'subject_dimensions': [
+                        {'clientWidth': 1000, 'clientHeight': 750,
+                         'naturalWidth': 2048, 'naturalHeight': 1536}],
+                    'subject_selection_state': {
+                        'retired': False,
+                        'already_seen': rng.random() < 0.005,
+                        'selection_state': 'normal',
+                        'finished_workflow': False,
+                        'user_has_finished_workflow': False},
+                    'workflow_version': workflow_version}
+                row = [
+                    str(150000000 + i), user_name, user_id, user_ip,
+                    workflow_id, 'Snapshot Serengeti', workflow_version,
+                    created_at.strftime('%Y-%m-%d %H:%M:%S UTC'), '', '',
+                    json.dumps(metadata), json.dumps(annotations),
+                    json.dumps(subject_data), subject_id]
+                csv_writer.writerow(row)
+                i += 1
+                # duplicate submissions
+                if rng.random() < 0.002:
+                    csv_writer.writerow(row)
+    return n_subjects
+
+
+def generate_annotations_csv(
+        path, n_annotations, seed=0, classifications_per_subject=10,
+        n_users=None):
+    """ Extracted annotations (output of extract_annotations), one row per
+        species and classification, subjects are classified by
+        'classifications_per_subject' different users
+        - returns the number of subjects
+    """
+    rng = random.Random(seed)
+    if n_users is None:
+        n_users = max(2 * classifications_per_subject, n_annotations // 20)
+    start = datetime(2019, 4, 2, 14, 0, 0)
+    i = 0
+    subject_no = 0
+    with open(path, 'w', newline='') as f:
+        csv_writer = csv.writer(f, delimiter=',', quotechar='"')
+        csv_writer.writerow(ANNOTATION_HEADER)
+        while i < n_annotations:
+            species = _subject_species(rng)
+            for user_no in _subject_users(
+                    rng, n_users, classifications_per_subject):
+                if i >= n_annotations:
+                    break
+                user_name, user_id, _ = _user(user_no)
+                classification_id = str(150000000 + i)
+                created_at = (start + timedelta(seconds=i * 3)).strftime(
+                    '%Y-%m-%d %H:%M:%S UTC')
+                for annotated in _annotated_species(rng, species):
+                    row = [
+                        user_name, user_id, created_at,
+                        str(30000000 + subject_no), '4979', '275.13',
+                        classification_id]
+                    if annotated == BLANK_CHOICE:
+                        row += ['blank'] + [''] * 7
+                    else:
+                        row += [
+                            annotated.lower(),
+                            rng.choice(['1', '2', '3', '4', '5', '6', '7',
+                                        '8', '9', '10', '11-50', '51+'])]
+                        row += [str(int(rng.random() < p))
+                                for p in [0.4, 0.2, 0.4, 0.3, 0.05, 0.2]]
+                    csv_writer.writerow(row)
+                    i += 1
+            subject_no += 1
+    return subject_no
+
+
+def generate_inventory_csv(
+        path, n_images, seed=0, season='SER_S1', images_per_roll=5000,
+        root_dir='/home/packerc/shared/albums/SER'):
+    """ Image inventory with timestamps (output of basic_inventory_checks)
+        - images are taken in bursts of 1-3 images (1s apart), captures
+          are separated by random (exponential) gaps of about half an hour
+        - returns the number of rolls
+    """
+    rng = random.Random(seed)
+    n_rolls = max(1, -(-n_images // images_per_roll))
+    sites = _site_names(max(1, n_rolls // 2))
+    with open(path, 'w', newline='') as f:
+        csv_writer = csv.writer(f, delimiter=',', quotechar='"')
+        csv_writer.writerow(INVENTORY_HEADER)
+        image_no = 0
+        for roll_no in range(n_rolls):
+            site = sites[roll_no % len(sites)]
+            roll = str(roll_no // len(sites) + 1)
+            roll_dir = '{}_R{}'.format(site, roll)
+            capture_time = datetime(2017, 6, 1) + timedelta(
+                seconds=rng.randint(0, 86400 * 30))
+            n_roll_images = min(images_per_roll, n_images - image_no)
+            i = 0
+            while i < n_roll_images:
+                capture_time += timedelta(
+                    seconds=rng.expovariate(1 / 1800.0) + 60)
+                for burst_no in range(rng.choice([1, 3, 3, 3, 2])):
+                    if i >= n_roll_images:
+                        break
+                    i += 1
+                    image_no += 1
+                    name = 'IMAG{:04}.JPG'.format(i)
+                    path_rel = os.path.join(season, site, roll_dir, name)
+                    image_time = (
+                        capture_time + timedelta(seconds=burst_no)).strftime(
+                        DATETIME_FORMAT)
+                    is_black = int(rng.random() < 0.01)
+                    csv_writer.writerow([
+                        season, site, roll, name,
+                        os.path.join(root_dir, path_rel), path_rel,
+                        image_time, image_time, image_time,
+                        is_black, 0, 0, 0, 0, 0, 0, 0,
+                        'CUDDEBACK', 'E3'])
+    return n_rolls
+
+
+def _image_array(rng, image_size, kind):
+    """ Image content: smooth random scene with some noise """
+    width, height = image_size
+    if kind == 'black':
+        return np.zeros((height, width, 3), dtype=np.uint8)
+    coarse = rng.randint(40, 200, size=(6, 8, 3)).astype(np.uint8)
+    scene = np.asarray(
+        Image.fromarray(coarse).resize((width, height), Image.BILINEAR),
+        dtype=np.int16)
+    noise = rng.randint(-12, 13, size=(height, width, 1))
+    return np.clip(scene + noise, 0, 255).astype(np.uint8)
+
+
+def generate_images(image_dir, n_images, seed=0, image_size=(1024, 768),
+                    name_format='IMAG{:04}.JPG', quality=85):
+    """ Directory with JPEG images (about 2% all black)
+        - returns the list of image paths
+    """
+    rng = np.random.RandomState(seed)
+    os.makedirs(image_dir, exist_ok=True)
+    paths = list()
+    for i in range(n_images):
+        kind = 'black' if rng.random_sample() < 0.02 else 'scene'
+        path = os.path.join(image_dir, name_format.format(i + 1))
+        Image.fromarray(_image_array(rng, image_size, kind)).save(
+            path, 'JPEG', quality=quality)
+        paths.append(path)
+    return paths
+
+
+def generate_album(root_dir, n_images, seed=0, images_per_roll=250,
+                   image_size=(1024, 768)):
+    """ Album (root_dir/site/site_R<roll>/IMAG0001.JPG) with JPEG images
+        - returns the list of roll directories
+    """
+    n_rolls = max(1, -(-n_images // images_per_roll))
+    sites = _site_names(max(1, n_rolls // 2))
+    roll_dirs = list()
+    for roll_no in range(n_rolls):
+        site = sites[roll_no % len(sites)]
+        roll_dir = os.path.join(
+            root_dir, site, '{}_R{}'.format(site, roll_no // len(sites) + 1))
+        n_roll_images = min(
+            images_per_roll, n_images - roll_no * images_per_roll)
+        generate_images(
+            roll_dir, n_roll_images, seed=seed * 1000003 + roll_no,
+            image_size=image_size)
+        roll_dirs.append(roll_dir)
+    return roll_dirs
+
+
+# dataset -> function(output, n, seed)
+DATASETS = {
+    'classifications': generate_classifications_csv,
+    'annotations': generate_annotations_csv,
+    'inventory': generate_inventory_csv,
+    'images': generate_images,
+    'album': generate_album}
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dataset", type=str, required=True, choices=sorted(DATASETS),
+        help="Type of data to generate")
+    parser.add_argument(
+        "--output", type=str, required=True,
+        help="Output file (csv) or directory (images / album)")
+    parser.add_argument(
+        "--n", type=int, required=True,
+        help="Number of classifications / annotations / images")
+    parser.add_argument("--seed", type=int, default=0)
+    args = vars(parser.parse_args())
+
+    DATASETS[args['dataset']](args['output'], args['n'], seed=args['seed'])
@@ -0,0 +1,350 @@
+""" Run Benchmarks of the Pipeline on Synthetic Data
+    - each benchmark runs a script of the pipeline (as a separate process)
+      on seeded synthetic data at different scales, wall time and peak
+      memory are recorded
+    - generated data is kept in 'data_dir' (if specified) and re-used in
+      later runs
+    - startup benchmarks measure the time to start a script (imports,
+      configuration) with '--help', they only run at the 'small' scale
+    - results are written to a json file, use '--compare' with the
+      results of a previous run (e.g. of the previous commit) to find
+      regressions
+    Example:
+    python3 -m benchmarks.run_benchmarks \
+    --output_json /tmp/benchmarks/results.json \
+    --data_dir /tmp/benchmarks/data \
+    --scales small medium
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import logging
+import tempfile
+import subprocess
+from collections import namedtuple, OrderedDict
+
+from utils.logger import set_logging, record_run_status
+from utils.pipeline import run_command, REPO_ROOT
+
+
+logger = logging.getLogger(__name__)
+
+# - inputs: function(input_dir, n, seed) -> commands (arguments of
+#   'python') that create the input data
+# - command: function(input_dir, output_dir) -> arguments of 'python'
+# - scales: scale name -> n (number of records / images)
+Benchmark = namedtuple(
+    'Benchmark', ['name', 'inputs', 'command', 'scales'])
+
+SCALES = ['small', 'medium', 'large']
+
+SEASON = 'SER_S1'
+
+# scripts whose startup time is measured
+STARTUP_MODULES = [
+    'zooniverse_uploads.split_manifest_into_batches',
+    'zooniverse_exports.merge_csvs',
+    'zooniverse_exports.extract_annotations',
+    'pre_processing.group_inventory_into_captures',
+    'pre_processing.create_action_list']
+
+
+def _module_command(module, **kwargs):
+    command = ['-m', module]
+    for k, v in kwargs.items():
+        command += ['--{}'.format(k), str(v)]
+    return command
+
+
+def _generate(dataset, output, n, seed):
+    return _module_command(
+        'benchmarks.generators', dataset=dataset, output=output, n=n,
+        seed=seed)
+
+
+def _album_with_inventory(input_dir, n, seed):
+    return [
+        _generate('album', os.path.join(input_dir, SEASON), n, seed),
+        _module_command(
+            'pre_processing.create_image_inventory',
+            root_dir=os.path.join(input_dir, SEASON),
+            output_csv=os.path.join(input_dir, 'inventory_basic.csv'))]
+
+
+BENCHMARKS = [
+    Benchmark(
+        'extract_annotations',
+        lambda input_dir, n, seed: [_generate(
+            'classifications',
+            os.path.join(input_dir, 'classifications.csv'), n, seed)],
+        lambda input_dir, output_dir: _module_command(
+            'zooniverse_exports.extract_annotations',
+            classification_csv=os.path.join(
+                input_dir, 'classifications.csv'),
+            output_csv=os.path.join(output_dir, 'annotations.csv')),
+        {'small': 2000, 'medium': 20000, 'large': 200000}),
+    Benchmark(
+        'aggregate_annotations_plurality',
+        lambda input_dir, n, seed: [_generate(
+            'annotations',
+            os.path.join(input_dir, 'annotations.csv'), n, seed)],
+        lambda input_dir, output_dir: _module_command(
+            'aggregations.aggregate_annotations_plurality',
+            annotations=os.path.join(input_dir, 'annotations.csv'),
+            output_csv=os.path.join(output_dir, 'aggregated.csv')),
+        {'small': 5000, 'medium': 50000, 'large': 500000}),
+    Benchmark(
+        'group_inventory_into_captures',
+        lambda input_dir, n, seed: [_generate(
+            'inventory',
+            os.path.join(input_dir, 'inventory.csv'), n, seed)],
+        lambda input_dir, output_dir: _module_command(
+            'pre_processing.group_inventory_into_captures',
+            inventory=os.path.join(input_dir, 'inventory.csv'),
+            output_csv=os.path.join(output_dir, 'captures.csv')),
+        {'small': 5000, 'medium': 50000, 'large': 500000}),
+    Benchmark(
+        'create_image_inventory',
+        lambda input_dir, n, seed: [_generate(
+            'album', os.path.join(input_dir, SEASON), n, seed)],
+        lambda input_dir, output_dir: _module_command(
+            'pre_processing.create_image_inventory',
+            root_dir=os.path.join(input_dir, SEASON),
+            output_csv=os.path.join(output_dir, 'inventory_basic.csv')),
+        {'small': 50, 'medium': 500, 'large': 5000}),
+    Benchmark(
+        'basic_inventory_checks',
+        _album_with_inventory,
+        lambda input_dir, output_dir: _module_command(
+            'pre_processing.basic_inventory_checks',
+            inventory=os.path.join(input_dir, 'inventory_basic.csv'),
+            output_csv=os.path.join(output_dir, 'inventory.csv')),
+        {'small': 50, 'medium': 500, 'large': 5000}),
+    Benchmark(
+        'compress_images',
+        lambda input_dir, n, seed: [_generate(
+            'images', os.path.join(input_dir, 'images'), n, seed)],
+        lambda input_dir, output_dir: _module_command(
+            'utils.compress_directory_with_images',
+            input_image_dir=os.path.join(input_dir, 'images'),
+            output_image_dir=output_dir,
+            max_image_pixel_side=640),
+        {'small': 20, 'medium': 200, 'large': 2000})] + [
+    Benchmark(
+        'startup_{}'.format(module.split('.')[-1]),
+        lambda input_dir, n, seed: [],
+        lambda input_dir, output_dir, module=module: [
+            '-m', module, '--help'],
+        {'small': 1})
+    for module in STARTUP_MODULES]
+
+
+def prepare_input(benchmark, n, seed, data_dir):
+    """ Generate the input data of a benchmark (if not already done)
+        - data is generated in separate processes (to keep the memory of
+          this process, which is inherited by the benchmark processes,
+          small)
+        - returns the input directory
+    """
+    input_dir = os.path.join(
+        data_dir, benchmark.name, 'n{}_seed{}'.format(n, seed))
+    marker = os.path.join(input_dir, 'generated.json')
+    if os.path.isfile(marker):
+        logger.info("Re-using input data in {}".format(input_dir))
+        return input_dir
+    if os.path.isdir(input_dir):
+        shutil.rmtree(input_dir)
+    os.makedirs(input_dir)
+    generation_time = 0
+    for command in benchmark.inputs(input_dir, n, seed):
+        exit_code, wall_time, _ = run_command(
+            [sys.executable] + command,
+            os.path.join(input_dir, 'generate.out'))
+        if exit_code != 0:
+            raise RuntimeError(
+                "Failed to generate input data - see {}".format(
+                    os.path.join(input_dir, 'generate.out')))
+        generation_time += wall_time
+    with open(marker, 'w') as f:
+        json.dump({'n': n, 'seed': seed,
+                   'generation_time_s': generation_time}, f)
+    logger.info("Generated input data in {} ({:.1f}s)".format(
+        input_dir, generation_time))
+    return input_dir
+
+
+def run_benchmark(benchmark, scale, data_dir, seed=0, repeat=1):
+    """ Run a benchmark at a scale
+        - returns a dict with the timings (min. wall time of all repeats)
+    """
+    n = benchmark.scales[scale]
+    input_dir = prepare_input(benchmark, n, seed, data_dir)
+    output_dir = os.path.join(input_dir, 'output')
+    wall_times = list()
+    peak_memory = list()
+    exit_code = 0
+    for _ in range(repeat):
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir)
+        command = [sys.executable] + benchmark.command(input_dir, output_dir)
+        exit_code, wall_time, peak_memory_mb = run_command(
+            command, os.path.join(input_dir, 'benchmark.out'))
+        if exit_code != 0:
+            logger.error(
+                "Benchmark {} ({}) failed - see {}".format(
+                    benchmark.name, scale,
+                    os.path.join(input_dir, 'benchmark.out')))
+            break
+        wall_times.append(wall_time)
+        peak_memory.append(peak_memory_mb)
+    result = OrderedDict([
+        ('benchmark', benchmark.name),
+        ('scale', scale),
+        ('n', n),
+        ('exit_code', exit_code),
+        ('wall_time_s', min(wall_times) if wall_times else None),
+        ('wall_times_s', wall_times),
+        ('peak_memory_mb', max(
+            [x for x in peak_memory if x is not None], default=None))])
+    logger.info(
+        "{:35} {:7} n={:<8} wall time: {} peak memory: {}".format(
+            benchmark.name, scale, n,
+            '-' if result['wall_time_s'] is None
+            else '{:.2f}s'.format(result['wall_time_s']),
+            '-' if result['peak_memory_mb'] is None
+            else '{:.0f}MB'.format(result['peak_memory_mb'])))
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info():
+    """ Information about the environment the benchmarks run in """
+    return OrderedDict([
+        ('commit', _git_commit()),
+        ('created_at', time.strftime('%Y-%m-%d %H:%M:%S')),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('cpu_count', os.cpu_count())])
+
+
+def compare_results(previous, current, max_slowdown=1.2):
+    """ Compare results with the results of a previous run
+        - returns a list of (benchmark, scale, previous wall time,
+          current wall time) that are slower than max_slowdown
+    """
+    previous_times = {
+        (x['benchmark'], x['scale']): x['wall_time_s']
+        for x in previous['results']}
+    regressions = list()
+    for result in current['results']:
+        key = (result['benchmark'], result['scale'])
+        previous_time = previous_times.get(key)
+        current_time = result['wall_time_s']
+        if previous_time is None or current_time is None:
+            continue
+        ratio = current_time / previous_time
+        logger.info("{:35} {:7} {:8.2f}s -> {:8.2f}s ({:+.0%})".format(
+            key[0], key[1], previous_time, current_time, ratio - 1))
+        if ratio > max_slowdown:
+            regressions.append((key[0], key[1], previous_time, current_time))
+    return regressions
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--output_json", type=str, required=True,
+        help="Path to store the results (json)")
+    parser.add_argument(
+        "--benchmarks", type=str, nargs='+', default=None,
+        choices=[x.name for x in BENCHMARKS],
+        help="Benchmarks to run (default: all)")
+    parser.add_argument(
+        "--scales", type=str, nargs='+', default=['small'], choices=SCALES,
+        help="Scales to run each benchmark at")
+    parser.add_argument(
+        "--data_dir", type=str, default=None,
+        help="Directory to store (and re-use) the generated data \
+              (default: temporary directory)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat", type=int, default=1,
+        help="Run each benchmark this many times (min. is reported)")
+    parser.add_argument(
+        "--compare", type=str, default=None,
+        help="Results (json) of a previous run to compare with")
+    parser.add_argument(
+        "--max_slowdown", type=float, default=1.2,
+        help="Exit with an error if a benchmark is slower than this \
+              factor compared to '--compare'")
+    parser.add_argument("--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str, default='run_benchmarks')
+    args = vars(parser.parse_args())
+
+    set_logging(args['log_dir'], args['log_filename'])
+
+    logger = logging.getLogger(__name__)
+
+    for k, v in args.items():
+        logger.info("Argument {}: {}".format(k, v))
+
+    with record_run_status():
+        data_dir = args['data_dir']
+        if data_dir is None:
+            data_dir = tempfile.mkdtemp(prefix='benchmarks_')
+
+        benchmarks = [
+            x for x in BENCHMARKS
+            if args['benchmarks'] is None or x.name in args['benchmarks']]
+
+        output = environment_info()
+        output['seed'] = args['seed']
+        output['results'] = list()
+        try:
+            for benchmark in benchmarks:
+                for scale in args['scales']:
+                    if scale not in benchmark.scales:
+                        continue
+                    output['results'].append(run_benchmark(
+                        benchmark, scale, data_dir, seed=args['seed'],
+                        repeat=args['repeat']))
+        finally:
+            if args['data_dir'] is None:
+                shutil.rmtree(data_dir)
+
+        with open(args['output_json'], 'w') as f:
+            json.dump(output, f, indent=2)
+        logger.info("Results written to {}".format(args['output_json']))
+
+        failed = [x for x in output['results'] if x['exit_code'] != 0]
+
+        regressions = list()
+        if args['compare'] is not None:
+            with open(args['compare']) as f:
+                previous = json.load(f)
+            logger.info("Comparison with commit {}".format(previous['commit']))
+            regressions = compare_results(
+                previous, output, max_slowdown=args['max_slowdown'])
+            for name, scale, previous_time, current_time in regressions:
+                logger.error(
+                    "Regression: {} ({}) {:.2f}s -> {:.2f}s".format(
+                        name, scale, previous_time, current_time))
+
+        if len(failed) > 0 or len(regressions) > 0:
+            sys.exit(1)
@@ -1,28 +1,40 @@
-""" Read Config File """
-import yaml
+""" Read Config File
+    - yaml files are parsed with the (C-accelerated, if available) safe
+      loader
+"""
 import os
 
+import yaml
+
 working_dir = os.path.abspath(os.path.dirname(__file__))
 
+
+def load_yaml(path):
+    """ Parse a yaml file with the safe loader """
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=loader)
+
+
 # load cfg.yaml if available, otherwise, load cfg_default.yaml
 try:
     cfg_path = os.path.join(working_dir, "../config/cfg.yaml")
-    cfg = yaml.load(open(cfg_path, 'r'))
+    cfg = load_yaml(cfg_path)
 except:
     # load default config
     cfg_path = os.path.join(working_dir, "../config/cfg_default.yaml")
-    cfg = yaml.load(open(cfg_path, 'r'))
+    cfg = load_yaml(cfg_path)
 
 # separately, load default cfg
 try:
     cfg_path = os.path.join(working_dir, "../config/cfg_default.yaml")
-    cfg_default = yaml.load(open(cfg_path, 'r'))
+    cfg_default = load_yaml(cfg_path)
 except:
     cfg_default = None
 
 # Read Mappings (if available)
 try:
     ml_mappings_path = os.path.join(working_dir, "../config/ml_mappings.yaml")
-    ml_mappings = yaml.load(open(ml_mappings_path, 'r'))
+    ml_mappings = load_yaml(ml_mappings_path)
 except:
     ml_mappings = None
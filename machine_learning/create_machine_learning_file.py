@@ -6,11 +6,12 @@ import csv
 import argparse
 import logging
 
-from collections import OrderedDict
+import numpy as np
+import pandas as pd
 
 from utils.logger import set_logging
 from utils.utils import (
-    set_file_permission, read_cleaned_season_file_df)
+    set_file_permission, read_cleaned_season_file_df, slice_generator)
 
 # #For Testing
 # args = dict()
@@ -18,6 +19,43 @@ from utils.utils import (
 # args['output_csv'] = "/home/packerc/shared/zooniverse/MachineLearning/SER/SER_S1_machine_learning_input.csv"
 # args['max_images_per_capture'] = 3
 
+logger = logging.getLogger(__name__)
+
+
+def create_capture_images_df(season_df, max_images_per_capture):
+    """ One row per capture with the paths of its first images
+        - captures in order of first appearance in season_df
+        - columns: capture_id, image1, image2, ... (empty if no image)
+    """
+    image_cols = ['image%s' % x for x in range(1, max_images_per_capture + 1)]
+    capture_codes, capture_ids = pd.factorize(
+        season_df['capture_id'], sort=False)
+    image_no = season_df.groupby(
+        'capture_id', sort=False).cumcount().to_numpy()
+    to_keep = image_no < max_images_per_capture
+    image_paths = np.full(
+        (len(capture_ids), max_images_per_capture), '', dtype=object)
+    image_paths[capture_codes[to_keep], image_no[to_keep]] = \
+        season_df['path'].to_numpy()[to_keep]
+    df = pd.DataFrame(image_paths, columns=image_cols)
+    df.insert(0, 'capture_id', np.asarray(capture_ids, dtype=object))
+    return df
+
+
+def shard_path(path, shard_no):
+    """ Path of a shard: <name>_shard_<shard_no><ext> """
+    root, ext = os.path.splitext(path)
+    return '{}_shard_{}{}'.format(root, shard_no, ext)
+
+
+def write_capture_images_csv(df, path):
+    """ Write one row per capture with the image paths to a csv """
+    with open(path, 'w') as csvfile:
+        csvwriter = csv.writer(csvfile, delimiter=',')
+        csvwriter.writerow(df.columns.tolist())
+        csvwriter.writerows(df.itertuples(index=False, name=None))
+
+
 if __name__ == "__main__":
 
     # Parse command line arguments
@@ -31,6 +69,11 @@ if __name__ == "__main__":
     parser.add_argument(
         "--max_images_per_capture", type=int, default=3,
         help="The maximum number of images per capture event (default 3)")
+    parser.add_argument(
+        "--n_shards", type=int, default=None,
+        help="Split the captures into 'n_shards' files of (almost) equal \
+              size, e.g. one per inference job. The shards are written to \
+              'output_csv' with postfix '_shard_1', '_shard_2', ...")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
@@ -40,13 +83,16 @@ if __name__ == "__main__":
     args = vars(parser.parse_args())
 
     # Check Inputs
+    if (args['n_shards'] is not None) and (args['n_shards'] < 1):
+        parser.error(
+            "--n_shards must be at least 1 (got {})".format(args['n_shards']))
+
     if not os.path.exists(args['cleaned_csv']):
         raise FileNotFoundError("cleaned_csv: %s not found" %
                                 args['cleaned_csv'])
 
     # logging
     set_logging(args['log_dir'], args['log_filename'])
-    logger = logging.getLogger(__name__)
 
     for k, v in args.items():
         logger.info("Argument {}: {}".format(k, v))
@@ -63,35 +109,23 @@ if __name__ == "__main__":
     logger.info("Found {} images in {}".format(
                 cleaned_csv.shape[0], args['cleaned_csv']))
 
-    # collect all images per capture
-    capture_to_images = OrderedDict()
-
-    for row_no, row in cleaned_csv.iterrows():
-        if row.capture_id not in capture_to_images:
-            capture_to_images[row.capture_id] = list()
-        if len(capture_to_images[row.capture_id]) < args['max_images_per_capture']:
-            capture_to_images[row.capture_id].append(row.path)
-
-    logger.info("Found {} captures with images".format(
-        len(capture_to_images.keys())))
-
-    with open(args['output_csv'], 'w') as csvfile:
-        csvwriter = csv.writer(csvfile, delimiter=',')
-        # write header
-        n_images = args['max_images_per_capture']
-        image_cols = ['image%s' % x for x in range(1,  n_images + 1)]
-        header = ['capture_id'] + image_cols
-        csvwriter.writerow(header)
-        # Write each capture event and the associated images
-        for capture_id, image_paths in capture_to_images.items():
-            image_paths_to_write = ['' for i in range(0, n_images)]
-            for i, image in enumerate(image_paths):
-                image_paths_to_write[i] = image
-            row_to_write = [capture_id]
-            row_to_write += image_paths_to_write
-            csvwriter.writerow(row_to_write)
-
-    logger.info("Wrote {} records to {}".format(
-        len(capture_to_images.keys()), args['output_csv']))
-
-    set_file_permission(args['output_csv'])
+    # collect the first images of each capture
+    df_captures = create_capture_images_df(
+        cleaned_csv, args['max_images_per_capture'])
+
+    n_captures = df_captures.shape[0]
+    logger.info("Found {} captures with images".format(n_captures))
+
+    if args['n_shards'] is None:
+        write_capture_images_csv(df_captures, args['output_csv'])
+        logger.info("Wrote {} records to {}".format(
+            n_captures, args['output_csv']))
+        set_file_permission(args['output_csv'])
+    else:
+        slices = slice_generator(n_captures, args['n_shards'])
+        for shard_no, (i_start, i_end) in enumerate(slices):
+            path = shard_path(args['output_csv'], shard_no + 1)
+            write_capture_images_csv(df_captures.iloc[i_start:i_end], path)
+            logger.info("Wrote {} records to {}".format(
+                i_end - i_start, path))
+            set_file_permission(path)
@@ -6,9 +6,7 @@ import datetime
 from collections import Counter, OrderedDict
 import argparse
 
-from utils.utils import (
-    correct_image_name, id_to_zero_one,
-    assign_zero_one_to_split)
+from utils.utils import correct_image_name, ids_to_splits
 from config.cfg import cfg
 
 
@@ -115,14 +113,15 @@ if __name__ == '__main__':
                                    row[header_to_id["RollNumber"]],
                                    row[header_to_id["CaptureEventNum"]]])
             row[header_to_id['capture_id']] = capture_id
-            # randomly assign to test / train / val
-            zero_one_hash = id_to_zero_one(capture_id)
-            split_name = assign_zero_one_to_split(
-                zero_one_hash,
-                args['split_percent'], args['split_names'])
-            row[header_to_id["split_name"]] = '_'.join([split_name, row[header_to_id["Season"]].lower()])
             all_records.append(row)
 
+    # randomly assign to test / train / val
+    split_names = ids_to_splits(
+        [row[header_to_id['capture_id']] for row in all_records],
+        args['split_percent'], args['split_names'])
+    for row, split_name in zip(all_records, split_names):
+        row[header_to_id["split_name"]] = '_'.join([split_name, row[header_to_id["Season"]].lower()])
+
     # check counts
     print("Counts distribution:")
     print(Counter(counts))
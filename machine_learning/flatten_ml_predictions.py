@@ -1,30 +1,254 @@
-""" Flatten ML predictions and Export to CSV """
+""" Flatten ML predictions and Export to CSV
+    - prediction files are parsed incrementally
+    - flattened values are collected per column and written at once, the
+      column layout of a prediction is computed once per distinct set of
+      labels instead of for every capture
+"""
 import os
 import logging
-import json
-import pandas as pd
 import argparse
+from operator import itemgetter
 from collections import OrderedDict
 
+import numpy as np
+import pandas as pd
+
 from utils.logger import set_logging
-from utils.utils import set_file_permission, sort_df_by_capture_id
+from utils.utils import (
+    set_file_permission, iter_json_object_items, int_values)
 from machine_learning.flatten_preds import (
-    flatten_ml_empty_preds, flatten_ml_species_preds
-)
+    flatten_ml_empty_preds, _is_binary_label)
 
 # args = dict()
 # args['predictions_empty'] = '/home/packerc/shared/zooniverse/MachineLearning/GRU/GRU_S1_predictions_empty_or_not.json'
 # args['predictions_species'] = '/home/packerc/shared/zooniverse/MachineLearning/GRU/GRU_S1_predictions_species.json'
 # args['output_csv'] = '/home/packerc/shared/zooniverse/MachineLearning/GRU/GRU_S1_ml_preds_flat.csv'
 
+logger = logging.getLogger(__name__)
+
+
+def _tuple_getter(keys):
+    """ Function returning the values of keys (tuple) of a dict """
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda d: (d[key], )
+    return itemgetter(*keys)
+
+
+class SpeciesPredsLayout(object):
+    """ Columns of flattened species preds and how to extract their values
+        (same columns as 'flatten_ml_species_preds')
+    """
+
+    def __init__(self, preds):
+        # raw values in order of the getters
+        self.getters = list()
+        raw_cols = list()
+        sections = [
+            ('machine_topprediction_%s', ('predictions_top', )),
+            ('machine_topconfidence_%s', ('confidences_top', ))]
+        for col_format, section in sections:
+            keys = tuple(preds[section[0]])
+            raw_cols.append([col_format % x for x in keys])
+            self.getters.append((section, _tuple_getter(keys)))
+        confidence_cols = list()
+        for label_name, label_preds in preds['aggregated_pred'].items():
+            if _is_binary_label(label_preds):
+                keys = ('1', )
+                confidence_cols.append(
+                    'machine_confidence_{}'.format(label_name))
+            else:
+                keys = tuple(label_preds)
+                confidence_cols += [
+                    'machine_confidence_{}_{}'.format(label_name, x)
+                    for x in keys]
+            self.getters.append(
+                (('aggregated_pred', label_name), _tuple_getter(keys)))
+        raw_cols.append(confidence_cols)
+        # order columns like 'flatten_ml_species_preds': sorted per section,
+        # the last value wins for duplicate columns
+        self.columns = list()
+        self.take = list()
+        n_raw = 0
+        self.has_duplicate_cols = False
+        for section_cols in raw_cols:
+            col_to_raw = dict()
+            for i, col in enumerate(section_cols):
+                col_to_raw[col] = n_raw + i
+            if len(col_to_raw) < len(section_cols):
+                self.has_duplicate_cols = True
+            for col in sorted(col_to_raw.keys()):
+                self.columns.append(col)
+                self.take.append(col_to_raw[col])
+            n_raw += len(section_cols)
+
+    def values(self, preds):
+        """ Raw values of preds (in order of 'take') """
+        values = ()
+        for section, getter in self.getters:
+            data = preds
+            for key in section:
+                data = data[key]
+            values += getter(data)
+        return values
+
+
+def _species_preds_signature(preds):
+    """ Labels that determine the layout of flattened species preds """
+    return (
+        frozenset(preds['predictions_top']),
+        frozenset(preds['confidences_top']),
+        frozenset((label_name, frozenset(label_preds)) for
+                  label_name, label_preds in preds['aggregated_pred'].items()))
+
+
+class FlatPredictions(object):
+    """ Flattened predictions stored in blocks of captures with identical
+        columns
+    """
+
+    def __init__(self):
+        self.capture_ids = list()
+        self.capture_to_row = dict()
+        # block id -> (source, columns, take, [row ids], [value tuples])
+        self.blocks = dict()
+        self.species_layouts = dict()
+
+    def _row(self, capture_id):
+        try:
+            return self.capture_to_row[capture_id]
+        except KeyError:
+            row = len(self.capture_ids)
+            self.capture_to_row[capture_id] = row
+            self.capture_ids.append(capture_id)
+            return row
+
+    def _block(self, block_id, source, columns, take):
+        try:
+            return self.blocks[block_id]
+        except KeyError:
+            block = (source, columns, take, list(), list())
+            self.blocks[block_id] = block
+            return block
+
+    def add_empty_preds(self, capture_id, preds):
+        """ Add empty predictions of a capture """
+        flat = flatten_ml_empty_preds(preds)
+        columns = tuple(flat.keys())
+        block = self._block(
+            ('empty', columns), 0, columns, range(len(columns)))
+        block[3].append(self._row(capture_id))
+        block[4].append(tuple(flat.values()))
+
+    def add_species_preds(self, capture_id, preds):
+        """ Add species predictions of a capture """
+        signature = _species_preds_signature(preds)
+        try:
+            layout = self.species_layouts[signature]
+        except KeyError:
+            layout = SpeciesPredsLayout(preds)
+            # which duplicate column wins depends on the order of the labels
+            if layout.has_duplicate_cols:
+                signature = ('unique', len(self.blocks))
+            self.species_layouts[signature] = layout
+        block = self._block(
+            ('species', signature), 1, layout.columns, layout.take)
+        block[3].append(self._row(capture_id))
+        block[4].append(layout.values(preds))
+
+    def to_df(self):
+        """ DataFrame with one row per capture (sorted by capture_id) and
+            one column per flattened prediction ('' if not available)
+        """
+        n_rows = len(self.capture_ids)
+        # columns in order of first appearance (as if adding the empty and
+        # species preds of each capture to one dict per capture)
+        first_appearance = dict()
+        for source, columns, _, rows, _ in self.blocks.values():
+            first_row = min(rows)
+            for position, col in enumerate(columns):
+                first = (first_row, source, position)
+                if col not in first_appearance or \
+                        first < first_appearance[col]:
+                    first_appearance[col] = first
+        cols = sorted(first_appearance, key=lambda x: first_appearance[x])
+        data = OrderedDict()
+        data['capture_id'] = np.array(self.capture_ids, dtype=object)
+        for col in cols:
+            data[col] = np.full(n_rows, '', dtype=object)
+        # species preds overwrite empty preds
+        for source, columns, take, rows, values in self.blocks.values():
+            rows = np.array(rows, dtype='int64')
+            values_by_col = list(zip(*values))
+            for col, i in zip(columns, take):
+                column = data[col]
+                column[rows] = values_by_col[i]
+        df = pd.DataFrame(data)
+        return df.iloc[capture_id_sort_order(df['capture_id'])]
+
+
+def capture_id_sort_order(capture_ids):
+    """ Row order to sort by capture_id (as 'sort_df_by_capture_id') """
+    if len(capture_ids) == 0:
+        return np.array([], dtype='int64')
+    parts = capture_ids.str.split('#', expand=True)
+    captures = pd.Series(int_values(parts[3]), index=parts.index)
+    sort_id = parts[0].str.cat(
+        [parts[1], parts[2], captures.astype(str).str.zfill(5)], sep='#')
+    return np.argsort(sort_id.to_numpy(), kind='stable')
+
+
+def flatten_predictions_files(predictions_empty, predictions_species):
+    """ Flatten empty and species prediction files
+        Args:
+        - predictions_empty: list of paths to empty predictions (.json)
+        - predictions_species: list of paths to species predictions (.json)
+        Returns:
+        - DataFrame with one row per capture
+    """
+    flat_preds = FlatPredictions()
+    for path in predictions_empty:
+        n_captures = len(flat_preds.capture_ids)
+        for capture_id, preds in iter_json_object_items(path):
+            flat_preds.add_empty_preds(capture_id, preds)
+        logger.info("Imported {} captures with empty predictions from {}".format(
+            len(flat_preds.capture_ids) - n_captures, path))
+    for path in predictions_species:
+        n_species = 0
+        for capture_id, preds in iter_json_object_items(path):
+            flat_preds.add_species_preds(capture_id, preds)
+            n_species += 1
+        logger.info(
+            "Imported {} captures with species predictions from {}".format(
+                n_species, path))
+    return flat_preds.to_df()
+
+
+def write_flat_predictions(df, path):
+    """ Write flat predictions to a csv or (if path ends with '.parquet')
+        to a parquet file (requires pyarrow or fastparquet)
+    """
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
 
 if __name__ == '__main__':
 
     # Parse command line arguments
     parser = argparse.ArgumentParser()
-    parser.add_argument("--predictions_species", type=str, required=True)
-    parser.add_argument("--predictions_empty", type=str, required=True)
-    parser.add_argument("--output_csv", type=str, required=True)
+    parser.add_argument(
+        "--predictions_species", type=str, nargs='+', required=True,
+        help="Species predictions (.json), several files (e.g. shards) \
+              can be specified")
+    parser.add_argument(
+        "--predictions_empty", type=str, nargs='+', required=True,
+        help="Empty predictions (.json), several files (e.g. shards) \
+              can be specified")
+    parser.add_argument(
+        "--output_csv", type=str, required=True,
+        help="Output file, written as parquet if it ends with '.parquet'")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
@@ -33,58 +257,27 @@ if __name__ == '__main__':
 
     args = vars(parser.parse_args())
 
-    if not os.path.exists(args['predictions_species']):
-        raise FileNotFoundError("predictions: %s not found" %
-                                args['predictions_species'])
+    for path in args['predictions_species'] + args['predictions_empty']:
+        if not os.path.exists(path):
+            raise FileNotFoundError("predictions: %s not found" % path)
 
-    if not os.path.exists(args['predictions_empty']):
-        raise FileNotFoundError("predictions: %s not found" %
-                                args['predictions_empty'])
     # logging
     set_logging(args['log_dir'], args['log_filename'])
-    logger = logging.getLogger(__name__)
 
     for k, v in args.items():
         logger.info("Argument {}: {}".format(k, v))
 
-    # import predictions
-    with open(args['predictions_species'], 'r') as f:
-        preds_species = json.load(f)
-
-    with open(args['predictions_empty'], 'r') as f:
-        preds_empty = json.load(f)
-
-    logger.info("Imported {} captures with species predictions".format(
-        len(preds_species.keys())))
-
-    logger.info("Imported {} captures with empty predictions".format(
-        len(preds_empty.keys())))
-
-    all_preds = OrderedDict()
-
-    # get empty preds
-    for capture_id, empty_preds in preds_empty.items():
-        flat_empty = flatten_ml_empty_preds(empty_preds)
-        all_preds[capture_id] = flat_empty
-
-    # get species preds
-    for capture_id, species_preds in preds_species.items():
-        flat_species = flatten_ml_species_preds(species_preds)
-        try:
-            all_preds[capture_id].update(flat_species)
-        except:
-            all_preds[capture_id] = flat_species
-
-    # export as csv
-    df = pd.DataFrame.from_dict(all_preds, orient='index')
-    df.index.name = 'capture_id'
-    sort_df_by_capture_id(df)
+    df = flatten_predictions_files(
+        args['predictions_empty'], args['predictions_species'])
 
     logger.info("Automatically generated output header: {}".format(
-        df.columns.tolist()))
+        df.columns.tolist()[1:]))
 
     # export
-    df.to_csv(args['output_csv'], index=True)
+    write_flat_predictions(df, args['output_csv'])
+
+    logger.info("Wrote {} records to {}".format(
+        df.shape[0], args['output_csv']))
 
     # change permmissions to read/write for group
     set_file_permission(args['output_csv'])
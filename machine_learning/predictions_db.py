@@ -0,0 +1,166 @@
+""" Store Flattened ML Predictions in an On-Disk Index (SQLite)
+    - prediction files are parsed incrementally and flattened (optionally
+      using multiple processes)
+    - flattened predictions can be looked up by capture_id without
+      holding all predictions in memory
+    - the file is built under a temporary name and renamed when complete,
+      it stores the paths, sizes and modification times of the prediction
+      files it was built from (see 'predictions_db_is_current')
+"""
+import os
+import json
+import sqlite3
+import logging
+from multiprocessing import Pool
+
+from utils.utils import iter_json_object_items
+from machine_learning.flatten_preds import (
+    flatten_ml_empty_preds, flatten_ml_species_preds,
+    _flatten_ml_confidences)
+
+
+logger = logging.getLogger(__name__)
+
+
+def _flatten_empty_item(item):
+    """ Flatten an empty prediction (capture_id, preds) """
+    capture_id, preds = item
+    return (capture_id, json.dumps(flatten_ml_empty_preds(preds)))
+
+
+def _flatten_species_item(item):
+    """ Flatten a species prediction (capture_id, preds) """
+    capture_id, preds = item
+    top = flatten_ml_species_preds(preds, only_top=True)
+    confidences = _flatten_ml_confidences(preds)
+    return (capture_id, json.dumps(top), json.dumps(confidences))
+
+
+def _flatten_predictions_file(
+        path, flatten_function, n_processes=1, chunksize=1000):
+    """ Generator over flattened predictions of a prediction file """
+    items = iter_json_object_items(path)
+    if n_processes <= 1:
+        yield from map(flatten_function, items)
+        return
+    with Pool(n_processes) as pool:
+        yield from pool.imap(flatten_function, items, chunksize=chunksize)
+
+
+def create_predictions_db(
+        db_path, predictions_empty, predictions_species,
+        n_processes=1, commit_every=10000):
+    """ Flatten prediction files and store them in a SQLite file
+        Args:
+        - db_path: path of the SQLite file to create (or to replace)
+        - predictions_empty: path to the empty predictions (.json)
+        - predictions_species: path to the species predictions (.json)
+        - n_processes: number of processes to flatten predictions with
+    """
+    tmp_path = '{}.tmp{}'.format(db_path, os.getpid())
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(
+            "CREATE TABLE sources "
+            "(role TEXT PRIMARY KEY, path TEXT, size INTEGER, "
+            "mtime INTEGER)")
+        conn.executemany(
+            "INSERT INTO sources VALUES (?, ?, ?, ?)",
+            _source_files(predictions_empty, predictions_species))
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS empty_preds "
+            "(capture_id TEXT PRIMARY KEY, flat TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS species_preds "
+            "(capture_id TEXT PRIMARY KEY, flat_top TEXT, "
+            "flat_confidences TEXT)")
+        tables = [
+            ('empty_preds', predictions_empty, _flatten_empty_item,
+             "INSERT OR REPLACE INTO empty_preds VALUES (?, ?)"),
+            ('species_preds', predictions_species, _flatten_species_item,
+             "INSERT OR REPLACE INTO species_preds VALUES (?, ?, ?)")]
+        for table, path, flatten_function, query in tables:
+            n_inserted = 0
+            for row in _flatten_predictions_file(
+                    path, flatten_function, n_processes):
+                conn.execute(query, row)
+                n_inserted += 1
+                if (n_inserted % commit_every) == 0:
+                    conn.commit()
+                    logger.info("Stored {:,} records in {}".format(
+                        n_inserted, table))
+            conn.commit()
+            logger.info("Stored {:,} records from {} in {}".format(
+                n_inserted, path, table))
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, db_path)
+
+
+def _source_files(predictions_empty, predictions_species):
+    """ (role, path, size, mtime) of the prediction files """
+    sources = list()
+    for role, path in [('empty', predictions_empty),
+                       ('species', predictions_species)]:
+        stat = os.stat(path)
+        sources.append(
+            (role, os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+    return sources
+
+
+def predictions_db_is_current(
+        db_path, predictions_empty, predictions_species):
+    """ Check if the predictions db was built from the prediction files
+        in their current state (same paths, sizes and modification times)
+    """
+    if not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path)
+    try:
+        stored = conn.execute(
+            "SELECT role, path, size, mtime FROM sources "
+            "ORDER BY role").fetchall()
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+    return stored == _source_files(predictions_empty, predictions_species)
+
+
+def count_predictions(conn):
+    """ Number of captures with (empty, species) predictions """
+    n_empty = conn.execute("SELECT COUNT(*) FROM empty_preds").fetchone()[0]
+    n_species = conn.execute(
+        "SELECT COUNT(*) FROM species_preds").fetchone()[0]
+    return n_empty, n_species
+
+
+def find_flat_empty_preds(conn, capture_id):
+    """ Flattened empty predictions of a capture_id (None if not found) """
+    row = conn.execute(
+        "SELECT flat FROM empty_preds WHERE capture_id = ?",
+        (capture_id, )).fetchone()
+    if row is None:
+        return None
+    return json.loads(row[0])
+
+
+def find_flat_species_preds(conn, capture_id, only_top=False):
+    """ Flattened species predictions of a capture_id (None if not found)
+        - identical to 'flatten_ml_species_preds'
+    """
+    row = conn.execute(
+        "SELECT flat_top, flat_confidences FROM species_preds "
+        "WHERE capture_id = ?",
+        (capture_id, )).fetchone()
+    if row is None:
+        return None
+    res = json.loads(row[0])
+    if not only_top:
+        res.update(json.loads(row[1]))
+    return res
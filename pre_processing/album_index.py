@@ -0,0 +1,253 @@
+""" Persistent Index of the Files of an Album (SQLite)
+    - stores path, size, mtime and creation time of all files in
+      root_dir/site_directory/roll_directory/
+    - updated incrementally: only roll directories that are new or whose
+      mtime changed (files added / removed / renamed) are re-scanned,
+      files are compared by size and mtime
+    - files modified in place do not change the mtime of their directory,
+      use 'full_scan' to re-scan all roll directories
+    - tools can store per-file results (e.g. content hashes, image checks)
+      in the index, results of new / changed / removed files are deleted
+      on update -- files without results are 'new or changed since the
+      last run' of that tool
+    - results are re-used only after re-stat'ing their file ('verify'),
+      results of files modified in place are deleted
+"""
+import os
+import json
+import sqlite3
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from pre_processing.utils import file_creation_time_from_stat
+from pre_processing.directory_scanner import (
+    FileEntry, scan_roll_directories, scan_directories)
+
+
+logger = logging.getLogger(__name__)
+
+
+def open_album_index(db_path, timeout=600, create=True):
+    """ Open (or create) an album index
+        - timeout: seconds to wait for other processes (e.g. concurrent
+          pipeline stages) to release a lock on the index
+        - create: create the index if it does not exist, otherwise raise
+          FileNotFoundError
+    """
+    if not create and not os.path.isfile(db_path):
+        raise FileNotFoundError(
+            "album index {} does not exist -- create it with "
+            "create_image_inventory --album_index".format(db_path))
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS meta "
+        "(key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS directories "
+        "(path TEXT PRIMARY KEY, mtime REAL)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS files "
+        "(path TEXT PRIMARY KEY, directory TEXT, site TEXT, "
+        "roll_directory TEXT, name TEXT, is_file INTEGER, size INTEGER, "
+        "mtime REAL, creation_time REAL, scan_id INTEGER)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS files_directory ON files (directory)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS file_results "
+        "(name TEXT, path TEXT, data TEXT, PRIMARY KEY (name, path))")
+    conn.commit()
+    return conn
+
+
+def _get_meta(conn, key, default=None):
+    row = conn.execute(
+        "SELECT value FROM meta WHERE key = ?", (key, )).fetchone()
+    if row is None:
+        return default
+    return row[0]
+
+
+def _set_meta(conn, key, value):
+    conn.execute(
+        "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+
+def _delete_files(conn, paths):
+    for path in paths:
+        conn.execute("DELETE FROM files WHERE path = ?", (path, ))
+        conn.execute("DELETE FROM file_results WHERE path = ?", (path, ))
+
+
+def _store_file(conn, file_entry, directory, scan_id):
+    conn.execute(
+        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (file_entry.path, directory, file_entry.site,
+         file_entry.roll_directory, file_entry.name, int(file_entry.is_file),
+         file_entry.size, file_entry.mtime, file_entry.creation_time,
+         scan_id))
+    conn.execute(
+        "DELETE FROM file_results WHERE path = ?", (file_entry.path, ))
+
+
+def update_album_index(conn, root_dir=None, n_threads=16, full_scan=False):
+    """ Update the index with the current state of root_dir
+        - root_dir: defaults to the root_dir of the last update
+        - full_scan: re-scan all roll directories, not only those with
+          a changed mtime
+        - returns a Counter with the number of new / changed / removed
+          files
+    """
+    indexed_root_dir = _get_meta(conn, 'root_dir')
+    if root_dir is None:
+        if indexed_root_dir is None:
+            raise ValueError("album index is empty - root_dir required")
+        root_dir = indexed_root_dir
+    elif (indexed_root_dir is not None) and \
+            (os.path.normpath(root_dir) !=
+             os.path.normpath(indexed_root_dir)):
+        raise ValueError(
+            "album index was built for root_dir {} - not for {}".format(
+                indexed_root_dir, root_dir))
+    scan_id = int(_get_meta(conn, 'last_scan_id', 0)) + 1
+
+    _, rolls = scan_roll_directories(root_dir, n_threads=n_threads)
+    roll_mtimes = {x.path: x.mtime for x in rolls if x.is_dir}
+    indexed_mtimes = dict(conn.execute("SELECT path, mtime FROM directories"))
+    to_scan = [
+        path for path, mtime in roll_mtimes.items()
+        if full_scan or (mtime is None) or
+        (indexed_mtimes.get(path) != mtime)]
+
+    files_per_directory = defaultdict(list)
+    for file_entry in scan_directories(
+            to_scan, n_threads=n_threads, stat_files=True):
+        files_per_directory[os.path.dirname(file_entry.path)].append(
+            file_entry)
+
+    stats = Counter()
+    for directory in to_scan:
+        indexed = {
+            path: (is_file, size, mtime) for path, is_file, size, mtime in
+            conn.execute(
+                "SELECT path, is_file, size, mtime FROM files "
+                "WHERE directory = ?", (directory, ))}
+        for file_entry in files_per_directory[directory]:
+            current = (int(file_entry.is_file), file_entry.size,
+                       file_entry.mtime)
+            previous = indexed.pop(file_entry.path, None)
+            if previous is None:
+                stats.update({'new'})
+            elif previous != current:
+                stats.update({'changed'})
+            else:
+                continue
+            _store_file(conn, file_entry, directory, scan_id)
+        stats['removed'] += len(indexed)
+        _delete_files(conn, indexed.keys())
+        conn.execute(
+            "INSERT OR REPLACE INTO directories VALUES (?, ?)",
+            (directory, roll_mtimes[directory]))
+
+    # roll directories that no longer exist
+    for directory in indexed_mtimes.keys():
+        if directory in roll_mtimes:
+            continue
+        removed = [x[0] for x in conn.execute(
+            "SELECT path FROM files WHERE directory = ?", (directory, ))]
+        stats['removed'] += len(removed)
+        _delete_files(conn, removed)
+        conn.execute("DELETE FROM directories WHERE path = ?", (directory, ))
+
+    _set_meta(conn, 'root_dir', root_dir)
+    _set_meta(conn, 'last_scan_id', scan_id)
+    conn.commit()
+    n_files = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    logger.info(
+        "Updated album index of {} - scanned {}/{} roll directories - \
+{} new, {} changed, {} removed, {} files total".format(
+            root_dir, len(to_scan), len(roll_mtimes), stats['new'],
+            stats['changed'], stats['removed'], n_files))
+    return stats
+
+
+def list_indexed_files(conn, since_scan_id=0):
+    """ List of FileEntry of all files in the index (ordered by path)
+        - since_scan_id: only files that were added / changed after the
+          update with this id
+    """
+    rows = conn.execute(
+        "SELECT site, roll_directory, name, path, is_file, size, mtime, "
+        "creation_time FROM files WHERE scan_id > ? ORDER BY path",
+        (since_scan_id, ))
+    return [FileEntry(
+                site, roll_directory, name, path, bool(is_file), size,
+                mtime, creation_time)
+            for site, roll_directory, name, path, is_file, size, mtime,
+            creation_time in rows]
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _refresh_file(conn, path, stat, scan_id):
+    """ Update the stats of a file modified in place, delete its results """
+    conn.execute(
+        "UPDATE files SET size = ?, mtime = ?, creation_time = ?, "
+        "scan_id = ? WHERE path = ?",
+        (stat.st_size, stat.st_mtime, file_creation_time_from_stat(stat),
+         scan_id, path))
+    conn.execute("DELETE FROM file_results WHERE path = ?", (path, ))
+
+
+def read_file_results(conn, name, verify=True, n_threads=16):
+    """ Stored results of a tool: dict path -> data
+        - verify: re-stat all files with results, results of files whose
+          size / mtime differ from the index (modified in place) are
+          deleted and the index is updated
+    """
+    results = {path: json.loads(data) for path, data in conn.execute(
+        "SELECT path, data FROM file_results WHERE name = ?", (name, ))}
+    if not verify or len(results) == 0:
+        return results
+    indexed = {path: (size, mtime) for path, size, mtime in conn.execute(
+        "SELECT files.path, size, mtime FROM files JOIN file_results "
+        "ON files.path = file_results.path WHERE file_results.name = ?",
+        (name, ))}
+    paths = list(results.keys())
+    with ThreadPoolExecutor(max_workers=max(n_threads, 1)) as pool:
+        stats = list(pool.map(_stat, paths))
+    scan_id = int(_get_meta(conn, 'last_scan_id', 0))
+    n_stale = 0
+    for path, stat in zip(paths, stats):
+        if stat is not None and \
+                indexed.get(path) == (stat.st_size, stat.st_mtime):
+            continue
+        n_stale += 1
+        del results[path]
+        if stat is None:
+            _delete_files(conn, [path])
+        else:
+            _refresh_file(conn, path, stat, scan_id)
+    conn.commit()
+    if n_stale > 0:
+        logger.info(
+            "Discarded {} results of {} of files changed since they "
+            "were stored".format(n_stale, name))
+    return results
+
+
+def write_file_results(conn, name, results):
+    """ Store results of a tool: dict path -> data (json-serializable)
+        - results of files that are not in the index are not stored
+    """
+    indexed = {x[0] for x in conn.execute("SELECT path FROM files")}
+    conn.executemany(
+        "INSERT OR REPLACE INTO file_results VALUES (?, ?, ?)",
+        [(name, path, json.dumps(data))
+         for path, data in results.items() if path in indexed])
+    conn.commit()
@@ -5,7 +5,7 @@ import logging
 
 from utils.logger import set_logging
 from pre_processing.utils import read_image_inventory, export_inventory_to_csv
-from pre_processing.actions import apply_action
+from pre_processing.actions import apply_action, Action
 from config.cfg import cfg
 
 # args = dict()
@@ -15,6 +15,27 @@ from config.cfg import cfg
 
 flags = cfg['pre_processing_flags']
 
+logger = logging.getLogger(__name__)
+
+
+def apply_actions(actions, captures, flags):
+    """ Apply actions to captures
+        - actions: iterable of Action / dicts with the fields of Action
+        - captures: dict (key: image_name), updated in place and returned
+    """
+    try:
+        for action in actions:
+            if isinstance(action, Action):
+                image = action.image
+            else:
+                image = action['image']
+            apply_action(captures[image], action, flags)
+        logger.info("Successfully applied actions")
+    except Exception as e:
+        logger.error("Failed to apply actions", exc_info=True)
+    return captures
+
+
 if __name__ == '__main__':
 
     # Parse command line arguments
@@ -49,12 +70,7 @@ if __name__ == '__main__':
     captures = read_image_inventory(
         args['captures'], unique_id='image_name')
 
-    try:
-        for _id, action in actions.items():
-            apply_action(captures[action['image']], action, flags)
-        logger.info("Successfully applied actions")
-    except Exception as e:
-        logger.error("Failed to apply actions", exc_info=True)
+    apply_actions(actions.values(), captures, flags)
 
     export_inventory_to_csv(captures, args['captures'])
 
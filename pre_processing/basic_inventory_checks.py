@@ -1,15 +1,22 @@
 """ Check images in inventory """
 import os
+import json
+import hashlib
 import argparse
 import logging
 import time
 import numpy as np
 import copy
 import traceback
+from collections import OrderedDict
 from multiprocessing import Process, Manager
 from PIL import Image
 
-from utils.logger import set_logging
+from utils.logger import set_logging, timed_phase
+from pre_processing.directory_scanner import scan_directories
+from pre_processing.album_index import (
+    open_album_index, update_album_index, list_indexed_files,
+    read_file_results, write_file_results)
 from pre_processing.utils import (
     datetime_file_creation, image_check_stats, p_pixels_above_threshold,
     p_pixels_below_threshold, export_inventory_to_csv, read_image_inventory,
@@ -21,6 +28,11 @@ from config.cfg import cfg
 
 flags = cfg['pre_processing_flags']
 
+# image checks that only depend on the image file
+IMAGE_FILE_CHECKS = [
+    'image_check__corrupt_file', 'image_check__all_black',
+    'image_check__all_white']
+
 # args = dict()
 # args['root_dir'] = '/home/packerc/shared/albums/ENO/ENO_S1'
 # args['output_csv'] = '/home/packerc/shared/season_captures/ENO/ENO_S1_captures_raw.csv'
@@ -49,6 +61,39 @@ def _image_is_white(pixel_data, flags):
     return (p_pixels_white > white_percent)
 
 
+def _check_image_file(image_path, image_data, flags):
+    """ Open the image and check for uniformly colored images """
+    # try to open the image
+    try:
+        img = Image.open(image_path)
+    except:
+        img = None
+        image_data['image_check__corrupt_file'] = 1
+        logger.debug(
+            "Failed to open file {}".format(
+             image_path))
+    # check for uniformly colored images
+    try:
+        pixel_data = np.asarray(img)
+        if _image_is_black(pixel_data, flags):
+            image_data['image_check__all_black'] = 1
+        if _image_is_white(pixel_data, flags):
+            image_data['image_check__all_white'] = 1
+    except:
+        logger.debug(
+            "Failed to check all_white/all_black for {}".format(
+             image_path))
+
+
+def image_checks_result_name(flags):
+    """ Name of the image check results in the album index, depends on
+        the image check parameters (thresholds)
+    """
+    parameters = json.dumps(flags['image_check_parameters'], sort_keys=True)
+    return 'basic_inventory_checks_{}'.format(
+        hashlib.sha1(parameters.encode('utf-8')).hexdigest()[:12])
+
+
 if __name__ == '__main__':
 
     # Parse command line arguments
@@ -56,12 +101,26 @@ if __name__ == '__main__':
     parser.add_argument("--inventory", type=str, required=True)
     parser.add_argument("--output_csv", type=str, required=True)
     parser.add_argument("--n_processes", type=int, default=4)
+    parser.add_argument(
+        "--n_threads", type=int, default=16,
+        help="Number of threads to scan the image directories")
     parser.add_argument("--timezone", type=str, default=None)
+    parser.add_argument(
+        "--album_index", type=str, default=None,
+        help="Path to an album index (see create_image_inventory). File \
+              creation dates are read from the index and the image checks \
+              of files unchanged since the last run (same size and mtime, \
+              same image check parameters) are re-used.")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
         "--log_filename", type=str,
         default='basic_inventory_checks')
+    parser.add_argument(
+        "--profile", type=str, nargs='?', const='cprofile', default=None,
+        choices=['cprofile', 'pyinstrument'],
+        help="Profile the script, the profile is written next to the log \
+              file (alternatively set the env var PROFILE)")
     args = vars(parser.parse_args())
 
     ######################################
@@ -79,7 +138,7 @@ if __name__ == '__main__':
     msg_width = 99
 
     # logging
-    set_logging(args['log_dir'], args['log_filename'])
+    set_logging(args['log_dir'], args['log_filename'], args['profile'])
 
     logger = logging.getLogger(__name__)
 
@@ -108,6 +167,38 @@ if __name__ == '__main__':
             {'image_check__{}'.format(k): 0
              for k in flags['image_checks']})
 
+    ######################################
+    # Scan the image directories to get
+    # all file creation dates at once
+    ######################################
+
+    if args['album_index'] is not None:
+        conn = open_album_index(args['album_index'], create=False)
+        update_album_index(conn, n_threads=args['n_threads'])
+        cached_image_checks = read_file_results(
+            conn, image_checks_result_name(flags),
+            n_threads=args['n_threads'])
+        file_entries = list_indexed_files(conn)
+        logger.info(
+            "Found image checks of {} images in the album index".format(
+                len(cached_image_checks)))
+    else:
+        image_directories = list(OrderedDict.fromkeys(
+            os.path.dirname(x) for x in image_inventory.keys()))
+        try:
+            file_entries = scan_directories(
+                image_directories, n_threads=args['n_threads'],
+                stat_files=True)
+        except OSError:
+            logger.warning(
+                "Failed to scan image directories, reading file creation \
+                 dates per image", exc_info=True)
+            file_entries = list()
+        cached_image_checks = dict()
+    file_creation_times = {
+        x.path: x.creation_time for x in file_entries
+        if x.creation_time is not None}
+
     ######################################
     # Process Inventory Images
     ######################################
@@ -117,18 +208,17 @@ if __name__ == '__main__':
         start_time = time.time()
         for img_no, image_path in enumerate(image_paths_batch):
             current_data = copy.deepcopy(image_inventory[image_path])
-            # try to open the image
-            try:
-                img = Image.open(image_path)
-            except:
-                img = None
-                current_data['image_check__corrupt_file'] = 1
-                logger.debug(
-                    "Failed to open file {}".format(
-                     image_path))
+            # open the image and check its pixels (unless stored in the
+            # album index)
+            if image_path in cached_image_checks:
+                current_data.update(cached_image_checks[image_path])
+            else:
+                _check_image_file(image_path, current_data, flags)
             # get file creation date
             try:
-                img_creation_date = datetime_file_creation(image_path)
+                img_creation_date = file_creation_times.get(image_path)
+                if img_creation_date is None:
+                    img_creation_date = datetime_file_creation(image_path)
                 img_creation_date_dt = \
                     convert_ctime_to_datetime(img_creation_date)
                 target_tz = flags['time_formats']['default_timezone']
@@ -146,17 +236,6 @@ if __name__ == '__main__':
                     "Failed to read file creation date for {}".format(
                      image_path), exc_info=True)
                 current_data['datetime_file_creation'] = ''
-            # check for uniformly colored images
-            try:
-                pixel_data = np.asarray(img)
-                if _image_is_black(pixel_data, flags):
-                    current_data['image_check__all_black'] = 1
-                if _image_is_white(pixel_data, flags):
-                    current_data['image_check__all_white'] = 1
-            except:
-                logger.debug(
-                    "Failed to check all_white/all_black for {}".format(
-                     image_path))
             results[image_path] = current_data
             if (img_no % 100) == 0:
                 est_t = estimate_remaining_time(
@@ -170,28 +249,37 @@ if __name__ == '__main__':
     n_images_total = len(image_paths_all)
 
     # parallelize image checking into 'n_processes'
-    manager = Manager()
-    results = manager.dict()
-    try:
-        processes_list = list()
-        n_processes = min(args['n_processes'], n_images_total)
-        slices = slice_generator(n_images_total, n_processes)
-        for i, (start_i, end_i) in enumerate(slices):
-            pr = Process(target=process_image_batch,
-                         args=(i, image_paths_all[start_i:end_i],
-                               image_inventory,
-                               results))
-            pr.start()
-            processes_list.append(pr)
-        for p in processes_list:
-            p.join()
-    except Exception:
-        print(traceback.format_exc())
+    with timed_phase('check_images', unit='images') as phase:
+        manager = Manager()
+        results = manager.dict()
+        try:
+            processes_list = list()
+            n_processes = min(args['n_processes'], n_images_total)
+            slices = slice_generator(n_images_total, n_processes)
+            for i, (start_i, end_i) in enumerate(slices):
+                pr = Process(target=process_image_batch,
+                             args=(i, image_paths_all[start_i:end_i],
+                                   image_inventory,
+                                   results))
+                pr.start()
+                processes_list.append(pr)
+            for p in processes_list:
+                p.join()
+        except Exception:
+            print(traceback.format_exc())
+        phase.update(len(results))
 
     # update data
     for image_path, image_data in image_inventory.items():
         image_inventory[image_path] = results[image_path]
 
+    if args['album_index'] is not None:
+        write_file_results(conn, image_checks_result_name(flags), {
+            image_path: {k: image_data[k] for k in IMAGE_FILE_CHECKS}
+            for image_path, image_data in image_inventory.items()
+            if image_path not in cached_image_checks})
+        conn.close()
+
     image_check_stats(image_inventory)
 
     export_inventory_to_csv(image_inventory, args['output_csv'])
@@ -12,15 +12,35 @@ import logging
 
 from utils.logger import set_logging
 from utils.utils import get_hash
+from pre_processing.directory_scanner import scan_album
+from pre_processing.album_index import (
+    open_album_index, update_album_index, list_indexed_files,
+    read_file_results, write_file_results)
 
+logger = logging.getLogger(__name__)
 
-def check_for_duplicates(paths, hash=hashlib.sha1):
+
+def check_for_duplicates(
+        paths, hash=hashlib.sha1, file_sizes=None, full_hashes=None):
+    """ Check for duplicate files
+        - file_sizes: optional dict with path -> size (e.g. from a
+          directory scan), other file sizes are read from disk
+        - full_hashes: optional dict with path -> hash of the full file
+          (e.g. from a previous run), used instead of hashing the file,
+          new hashes are added to it
+    """
+    if full_hashes is None:
+        full_hashes = dict()
     hashes_by_size = {}
     hashes_on_1k = {}
     hashes_full = {}
     n_tot = len(paths)
+    if file_sizes is None:
+        file_sizes = dict()
     for i, path in enumerate(paths):
-        file_size = os.path.getsize(path)
+        file_size = file_sizes.get(path)
+        if file_size is None:
+            file_size = os.path.getsize(path)
         duplicate = hashes_by_size.get(file_size)
         if duplicate:
             hashes_by_size[file_size].append(path)
@@ -60,10 +80,15 @@ def check_for_duplicates(paths, hash=hashlib.sha1):
             continue
         for filename in files:
             try:
-                full_hash = get_hash(filename, first_chunk_only=False)
-            except (OSError,):
-                # the file access might've changed till the exec point got here
-                continue
+                full_hash = full_hashes[filename]
+            except KeyError:
+                try:
+                    full_hash = get_hash(filename, first_chunk_only=False)
+                except (OSError,):
+                    # the file access might've changed till the exec point
+                    # got here
+                    continue
+                full_hashes[filename] = full_hash
             duplicate = hashes_full.get(full_hash)
             if duplicate:
                 logger.info("Duplicate found: %s and %s" %
@@ -87,6 +112,14 @@ if __name__ == '__main__':
     parser.add_argument(
         "--log_filename", type=str,
         default='check_for_duplicates')
+    parser.add_argument(
+        "--n_threads", type=int, default=16,
+        help="Number of threads to scan the roll directories")
+    parser.add_argument(
+        "--album_index", type=str, default=None,
+        help="Path to an album index (SQLite file, created if it does not \
+              exist). Hashes of unchanged files (same size and mtime) \
+              are re-used from the index.")
     args = vars(parser.parse_args())
 
     # check existence of root dir
@@ -100,23 +133,36 @@ if __name__ == '__main__':
 
     logger = logging.getLogger(__name__)
 
-    site_directory_names = os.listdir(args['root_dir'])
-
-    all_image_paths = list()
+    if args['album_index'] is not None:
+        conn = open_album_index(args['album_index'])
+        update_album_index(
+            conn, args['root_dir'], n_threads=args['n_threads'])
+        full_hashes = {
+            k: bytes.fromhex(v) for k, v in read_file_results(
+                conn, 'sha1', n_threads=args['n_threads']).items()}
+        file_entries = list_indexed_files(conn)
+        known_hashes = set(full_hashes.keys())
+    else:
+        file_entries = scan_album(
+            args['root_dir'], n_threads=args['n_threads'],
+            stat_files=True).files
+        full_hashes = dict()
 
     # Collect all image paths
-    for site_directory_name in site_directory_names:
-        site_full_path = os.path.join(
-            args['root_dir'], site_directory_name)
-        roll_directory_names = os.listdir(site_full_path)
-        for roll_directory_name in roll_directory_names:
-            roll_directory_path = os.path.join(
-                site_full_path, roll_directory_name)
-            image_file_names = os.listdir(roll_directory_path)
-            for image_file_name in image_file_names:
-                all_image_paths.append(
-                    os.path.join(roll_directory_path, image_file_name))
+    image_files = [x for x in file_entries if x.is_file]
+    all_image_paths = [x.path for x in image_files]
+    file_sizes = {x.path: x.size for x in image_files}
     logger.info("Found {} images".format(len(all_image_paths)))
 
     # check for duplicates
-    check_for_duplicates(all_image_paths, hash=hashlib.sha1)
+    check_for_duplicates(
+        all_image_paths, hash=hashlib.sha1, file_sizes=file_sizes,
+        full_hashes=full_hashes)
+
+    if args['album_index'] is not None:
+        new_hashes = {k: v.hex() for k, v in full_hashes.items()
+                      if k not in known_hashes}
+        write_file_results(conn, 'sha1', new_hashes)
+        logger.info("Stored {} new hashes in the album index".format(
+            len(new_hashes)))
+        conn.close()
@@ -12,13 +12,14 @@
     - Code checks for correct structure and naming
     - Prints error messages if input is invalid
 """
-import os
 import argparse
 import logging
 import textwrap
+from collections import defaultdict
 
 from utils.logger import set_logging
 from utils.utils import check_dir_existence
+from pre_processing.directory_scanner import scan_album
 
 
 def is_ok_site_code(site):
@@ -108,6 +109,9 @@ if __name__ == '__main__':
     parser.add_argument(
         "--log_filename", type=str,
         default='check_directory_structure')
+    parser.add_argument(
+        "--n_threads", type=int, default=16,
+        help="Number of threads to scan the roll directories")
     args = vars(parser.parse_args())
 
     check_dir_existence(args['root_dir'])
@@ -118,57 +122,51 @@ if __name__ == '__main__':
 
     msg_width = 250
 
-    site_directory_names = os.listdir(args['root_dir'])
+    album_listing = scan_album(args['root_dir'], n_threads=args['n_threads'])
 
     # check each site directory
-    for site_directory_name in site_directory_names:
+    for site_entry in album_listing.sites:
         # check if file is a directory
-        dir_full_path = os.path.join(args['root_dir'], site_directory_name)
-        if not os.path.isdir(dir_full_path):
+        if not site_entry.is_dir:
             logger.error("site_directory_name {} is not a directory, \
-                remove file {}".format(site_directory_name, dir_full_path))
+                remove file {}".format(site_entry.name, site_entry.path))
         # check site directory name
-        if not is_ok_site_code(site_directory_name):
+        if not is_ok_site_code(site_entry.name):
             msg = _create_invalid_site_msg(
-                site_directory_name,
+                site_entry.name,
                 msg_width)
             logger.error(msg)
+
+    files_per_roll = defaultdict(list)
+    for file_entry in album_listing.files:
+        files_per_roll[(file_entry.site, file_entry.roll_directory)].append(
+            file_entry)
+
     # check each roll in a site directory
-    for site_directory_name in site_directory_names:
-        # get all roll directories in a site directory
-        current_dir_full_path = os.path.join(
-            args['root_dir'], site_directory_name)
-        roll_directory_names = os.listdir(current_dir_full_path)
-        # check rolls
-        for roll_directory_name in roll_directory_names:
-            roll_directory_path = os.path.join(
-                current_dir_full_path, roll_directory_name)
-            if not is_ok_roll_directory_name(roll_directory_name):
-                msg = _create_invalid_roll_msg(
-                    roll_directory_name,
-                    roll_directory_path,
+    for roll_entry in album_listing.rolls:
+        if not is_ok_roll_directory_name(roll_entry.name):
+            msg = _create_invalid_roll_msg(
+                roll_entry.name,
+                roll_entry.path,
+                msg_width)
+            logger.error(msg)
+        else:
+            (site, roll) = roll_entry.name.split('_')
+            # site part must be idential to site directory
+            if site != roll_entry.site:
+                msg = _create_roll_site_missmatch_msg(
+                    roll_entry.name,
+                    site,
+                    roll_entry.site,
                     msg_width)
                 logger.error(msg)
-            else:
-                (site, roll) = roll_directory_name.split('_')
-                # site part must be idential to site directory
-                if site != site_directory_name:
-                    msg = _create_roll_site_missmatch_msg(
-                        roll_directory_name,
-                        site,
-                        site_directory_name,
+            # check each file in a roll directory
+            for file_entry in files_per_roll[(roll_entry.site, roll_entry.name)]:
+                # check file ending
+                if not file_entry.name.lower().endswith('.jpg'):
+                    msg = _create_invalid_image_msg(
+                        file_entry.name,
+                        roll_entry.name,
                         msg_width)
                     logger.error(msg)
-                # check each file in a roll directory
-                image_file_names = os.listdir(roll_directory_path)
-                for image_file_name in image_file_names:
-                    # check file ending
-                    if not image_file_name.lower().endswith('.jpg'):
-                        image_path = os.path.join(
-                            roll_directory_path, image_file_name)
-                        msg = _create_invalid_image_msg(
-                            image_file_name,
-                            roll_directory_name,
-                            msg_width)
-                        logger.error(msg)
     logger.info("Finished checking input structure")
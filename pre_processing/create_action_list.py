@@ -19,6 +19,8 @@ from config.cfg import cfg
 
 flags = cfg['pre_processing_flags']
 
+logger = logging.getLogger(__name__)
+
 
 def at_least_one_specific_check(image_data, check_columns, checks_to_find):
     """ Find specific checks """
@@ -64,33 +66,34 @@ def _issue_is_resolved(image_data):
 # args['no_newer_than_year'] = 9999
 
 
-if __name__ == '__main__':
-
-    # Parse command line arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--captures", type=str, required=True)
-    parser.add_argument("--action_list_csv", type=str, required=True)
-    parser.add_argument("--log_dir", type=str, default=None)
-    parser.add_argument(
-        "--log_filename", type=str, default='create_action_list')
-    parser.add_argument("--plot_timelines", action='store_true')
-    args = vars(parser.parse_args())
-
-    # check existence of root dir
-    if not os.path.isfile(args['captures']):
-        raise FileNotFoundError(
-            "captures {} does not exist -- must be a file".format(
-                args['captures']))
+# Action columns
+ACTION_COLS = [
+    'action_site',
+    'action_roll',
+    'action_from_image',
+    'action_to_image',
+    'action_to_take',
+    'action_to_take_reason',
+    'datetime_current',
+    'datetime_new']
+
+# columns of the action list
+ACTION_LIST_COLS = \
+    ['season', 'site', 'roll', 'image_rank_in_roll',
+     'capture', 'image_rank_in_capture',
+     'image_name'] + \
+    ACTION_COLS + \
+    ['datetime', 'datetime_exif', 'datetime_file_creation',
+     'days_to_last_image_taken', 'days_to_next_image_taken',
+     'image_path', 'image_path_rel']
 
-    # logging
-    set_logging(args['log_dir'], args['log_filename'])
-    logger = logging.getLogger(__name__)
-
-    # read grouped data
-    inventory = read_image_inventory(
-        args['captures'],
-        unique_id='image_path_original')
 
+def create_action_list(inventory, flags):
+    """ Create an action list with all images with (unresolved) issues
+        - inventory: captures (dict)
+        - returns the action list (dict) with ACTION_LIST_COLS,
+          the inventory is not modified
+    """
     header = list(inventory[list(inventory.keys())[0]].keys())
 
     # check columns
@@ -105,21 +108,11 @@ if __name__ == '__main__':
         ['image_check__{}'.format(x)
          for x in flags['image_checks_propose_time']]
 
-    # Action columns
-    action_cols = [
-        'action_site',
-        'action_roll',
-        'action_from_image',
-        'action_to_image',
-        'action_to_take',
-        'action_to_take_reason',
-        'datetime_current',
-        'datetime_new']
-
     # create check columns
     inventory_with_issues = OrderedDict()
     for image_path_original, image_data in inventory.items():
-        automatic_status = {x: '' for x in action_cols}
+        image_data = dict(image_data)
+        automatic_status = {x: '' for x in ACTION_COLS}
         has_deletion = at_least_one_specific_check(
             image_data,
             check_columns,
@@ -161,34 +154,52 @@ if __name__ == '__main__':
     logger.info("Images with potential issues")
     image_check_stats(inventory_with_issues)
 
-    first_cols = ['season', 'site', 'roll', 'image_rank_in_roll',
-                  'capture', 'image_rank_in_capture',
-                  'image_name']
-    info_cols = [
-     'datetime', 'datetime_exif', 'datetime_file_creation',
-     'days_to_last_image_taken', 'days_to_next_image_taken',
-     'image_path', 'image_path_rel']
-
-    first_cols += action_cols
-    first_cols += info_cols
-
     # add a dummy record if no issues found
     if len(inventory_with_issues.keys()) == 0:
-        random_record = inventory[list(inventory.keys())[0]]
-        empty_record = {k: '' for k in random_record.keys()}
-        inventory_with_issues['dummy'] = empty_record
+        inventory_with_issues['dummy'] = {k: '' for k in ACTION_LIST_COLS}
         logger.info("No issues found - creating empty action list")
 
     # keep only relevant columns
     inventory_with_issues_short = OrderedDict()
     for image, image_data in inventory_with_issues.items():
         inventory_with_issues_short[image] = {
-            k: image_data[k] for k in first_cols}
+            k: image_data[k] for k in ACTION_LIST_COLS}
+    return inventory_with_issues_short
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--captures", type=str, required=True)
+    parser.add_argument("--action_list_csv", type=str, required=True)
+    parser.add_argument("--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str, default='create_action_list')
+    parser.add_argument("--plot_timelines", action='store_true')
+    args = vars(parser.parse_args())
+
+    # check existence of root dir
+    if not os.path.isfile(args['captures']):
+        raise FileNotFoundError(
+            "captures {} does not exist -- must be a file".format(
+                args['captures']))
+
+    # logging
+    set_logging(args['log_dir'], args['log_filename'])
+    logger = logging.getLogger(__name__)
+
+    # read grouped data
+    inventory = read_image_inventory(
+        args['captures'],
+        unique_id='image_path_original')
+
+    action_list = create_action_list(inventory, flags)
 
     export_inventory_to_csv(
-        inventory_with_issues_short,
+        action_list,
         args['action_list_csv'],
-        first_cols=first_cols)
+        first_cols=ACTION_LIST_COLS)
 
     # create plot for site/roll timelines
     if args['plot_timelines']:
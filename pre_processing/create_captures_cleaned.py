@@ -13,41 +13,14 @@ from config.cfg import cfg
 flags = cfg['pre_processing_flags']
 
 
-if __name__ == '__main__':
-
-    # Parse command line arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--captures", type=str, required=True)
-    parser.add_argument("--captures_cleaned", type=str, required=True)
-    parser.add_argument("--log_dir", type=str, default=None)
-    parser.add_argument(
-        "--log_filename", type=str, default='create_captures_cleaned')
-    args = vars(parser.parse_args())
+logger = logging.getLogger(__name__)
 
-    # check existence of root dir
-    if not os.path.isfile(args['captures']):
-        raise FileNotFoundError(
-            "captures {} does not exist -- must be a file".format(
-                args['captures']))
-
-    ######################################
-    # Configuration
-    ######################################
-
-    set_logging(args['log_dir'], args['log_filename'])
-    logger = logging.getLogger(__name__)
-
-    ######################################
-    # Read and Prepare Data
-    ######################################
-
-    # read captures
-    df = pd.read_csv(args['captures'], dtype='str')
-    df.fillna('', inplace=True)
-
-    logger.info(
-        "Read {} records from {}".format(df.shape[0], args['captures']))
 
+def create_captures_cleaned(df, flags):
+    """ Select and order the columns of the final cleaned captures
+        - df: captures (values as str)
+        - returns the cleaned captures (df), sorted by capture / image
+    """
     # get flags
     try:
         first_cols = flags['final_cleaned']['first_columns']
@@ -97,6 +70,45 @@ if __name__ == '__main__':
     logger.info(
         "Found the following columns for export: {}".format(df.columns))
     sort_df(df)
+    return df
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--captures", type=str, required=True)
+    parser.add_argument("--captures_cleaned", type=str, required=True)
+    parser.add_argument("--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str, default='create_captures_cleaned')
+    args = vars(parser.parse_args())
+
+    # check existence of root dir
+    if not os.path.isfile(args['captures']):
+        raise FileNotFoundError(
+            "captures {} does not exist -- must be a file".format(
+                args['captures']))
+
+    ######################################
+    # Configuration
+    ######################################
+
+    set_logging(args['log_dir'], args['log_filename'])
+    logger = logging.getLogger(__name__)
+
+    ######################################
+    # Read and Prepare Data
+    ######################################
+
+    # read captures
+    df = pd.read_csv(args['captures'], dtype='str')
+    df.fillna('', inplace=True)
+
+    logger.info(
+        "Read {} records from {}".format(df.shape[0], args['captures']))
+
+    df = create_captures_cleaned(df, flags)
 
     ######################################
     # Export
@@ -10,6 +10,9 @@ from utils.utils import check_dir_existence
 from pre_processing.utils import (
     image_check_stats, export_inventory_to_csv,
     get_rollnum_from_roll_directory)
+from pre_processing.directory_scanner import scan_album
+from pre_processing.album_index import (
+    open_album_index, update_album_index, list_indexed_files)
 from config.cfg import cfg
 
 
@@ -25,6 +28,18 @@ if __name__ == '__main__':
         "--season_id", type=str, default="",
         help="identifier that is exported to the inventory")
     parser.add_argument("--output_csv", type=str, required=True)
+    parser.add_argument(
+        "--n_threads", type=int, default=16,
+        help="Number of threads to scan the roll directories")
+    parser.add_argument(
+        "--album_index", type=str, default=None,
+        help="Path to an album index (SQLite file, created if it does not \
+              exist). The index is updated incrementally and only new or \
+              changed roll directories are scanned.")
+    parser.add_argument(
+        "--full_scan", action='store_true',
+        help="Re-scan all roll directories to update the album index \
+              (to detect files that were modified in place).")
     parser.add_argument("--log_dir", type=str, default=None)
     parser.add_argument(
         "--log_filename", type=str, default='create_image_inventory')
@@ -45,37 +60,37 @@ if __name__ == '__main__':
         logger.info("Updating 'season_id' with {}".format(
             args['season_id']))
 
-    site_directory_names = os.listdir(args['root_dir'])
+    if args['album_index'] is not None:
+        conn = open_album_index(args['album_index'])
+        try:
+            update_album_index(
+                conn, args['root_dir'], n_threads=args['n_threads'],
+                full_scan=args['full_scan'])
+            file_entries = list_indexed_files(conn)
+        finally:
+            conn.close()
+    else:
+        file_entries = scan_album(
+            args['root_dir'], n_threads=args['n_threads']).files
 
     image_inventory = OrderedDict()
 
-    # Loop over site directories
-    for site_directory_name in site_directory_names:
-        current_dir_full_path = os.path.join(
-            args['root_dir'], site_directory_name)
-        roll_directory_names = os.listdir(current_dir_full_path)
-        # Loop over roll directories
-        for roll_directory_name in roll_directory_names:
-            roll = get_rollnum_from_roll_directory(roll_directory_name)
-            roll_directory_path = os.path.join(
-                current_dir_full_path, roll_directory_name)
-            roll_directory_path_rel = os.path.join(
-                site_directory_name, roll_directory_name)
-            image_file_names = os.listdir(roll_directory_path)
-            # Loop over image files
-            for image_file_name in image_file_names:
-                image_path = os.path.join(roll_directory_path, image_file_name)
-                image_path_rel = os.path.join(
-                    last_dir,
-                    roll_directory_path_rel,
-                    image_file_name)
-                image_inventory[image_path] = {
-                    'season': args['season_id'],
-                    'site': site_directory_name,
-                    'roll': roll,
-                    'image_name_original': image_file_name,
-                    'image_path_original': image_path,
-                    'image_path_original_rel': image_path_rel}
+    # Loop over image files
+    for file_entry in file_entries:
+        roll_directory_path_rel = os.path.join(
+            file_entry.site, file_entry.roll_directory)
+        image_path_rel = os.path.join(
+            last_dir,
+            roll_directory_path_rel,
+            file_entry.name)
+        image_inventory[file_entry.path] = {
+            'season': args['season_id'],
+            'site': file_entry.site,
+            'roll': get_rollnum_from_roll_directory(
+                file_entry.roll_directory),
+            'image_name_original': file_entry.name,
+            'image_path_original': file_entry.path,
+            'image_path_original_rel': image_path_rel}
 
     image_check_stats(image_inventory)
 
@@ -0,0 +1,141 @@
+""" Scan the directory tree of an album
+    - expected structure: root_dir/site_directory/roll_directory/files
+    - uses os.scandir: the entry type comes from the directory listing,
+      size / modification and creation time from one stat per file (only
+      if stat_files is set, i.e. for callers which need them)
+    - site and roll directories are scanned in parallel by a thread pool,
+      the (slow) metadata requests on network file systems overlap
+    - the resulting listing is used by create_image_inventory,
+      check_input_structure, check_for_duplicates and
+      basic_inventory_checks
+"""
+import os
+import logging
+from functools import partial
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from pre_processing.utils import file_creation_time_from_stat
+
+logger = logging.getLogger(__name__)
+
+
+# Entry in the root directory
+SiteEntry = namedtuple(
+    'SiteEntry',
+    ['name', 'path', 'is_dir'])
+
+# Entry in a site directory - mtime is None if the entry could not be
+# stat'ed
+RollEntry = namedtuple(
+    'RollEntry',
+    ['site', 'name', 'path', 'is_dir', 'mtime'])
+
+# Entry in a roll directory - size / mtime / creation_time are None
+# if the entry was not (or could not be) stat'ed
+FileEntry = namedtuple(
+    'FileEntry',
+    ['site', 'roll_directory', 'name', 'path', 'is_file',
+     'size', 'mtime', 'creation_time'])
+
+# Listing of an album
+AlbumListing = namedtuple(
+    'AlbumListing',
+    ['root_dir', 'sites', 'rolls', 'files'])
+
+
+def _list_directory(path):
+    """ List the entries of a directory (os.DirEntry objects) """
+    with os.scandir(path) as it:
+        return list(it)
+
+
+def _is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _is_file(entry):
+    try:
+        return entry.is_file()
+    except OSError:
+        return False
+
+
+def _mtime(entry):
+    try:
+        return entry.stat().st_mtime
+    except OSError:
+        return None
+
+
+def _scan_site_directory(site_entry):
+    """ List all entries of a site directory """
+    return [RollEntry(site_entry.name, x.name, x.path, _is_dir(x), _mtime(x))
+            for x in _list_directory(site_entry.path)]
+
+
+def _scan_roll_directory(path, stat_files=False):
+    """ List all entries of a roll directory (with their file stats) """
+    site = os.path.basename(os.path.dirname(path))
+    roll_directory = os.path.basename(path)
+    files = list()
+    for entry in _list_directory(path):
+        size, mtime, creation_time = None, None, None
+        if stat_files:
+            try:
+                stat = entry.stat()
+                size = stat.st_size
+                mtime = stat.st_mtime
+                creation_time = file_creation_time_from_stat(stat)
+            except OSError:
+                pass
+        files.append(FileEntry(
+            site, roll_directory, entry.name, entry.path, _is_file(entry),
+            size, mtime, creation_time))
+    return files
+
+
+def scan_directories(directories, n_threads=16, stat_files=False):
+    """ List the entries of roll directories (in parallel)
+        - stat_files: read size / mtime / creation_time of each entry
+          (one stat per file, slow on network file systems)
+        - returns a list of FileEntry, in the order of directories
+    """
+    scan = partial(_scan_roll_directory, stat_files=stat_files)
+    with ThreadPoolExecutor(max_workers=max(n_threads, 1)) as pool:
+        files_per_directory = pool.map(scan, directories)
+        return [x for files in files_per_directory for x in files]
+
+
+def scan_roll_directories(root_dir, n_threads=16):
+    """ Scan root_dir/site_directory/roll_directory without listing the
+        roll directories
+        - returns a list of SiteEntry and a list of RollEntry
+    """
+    sites = [SiteEntry(x.name, x.path, _is_dir(x))
+             for x in _list_directory(root_dir)]
+    site_dirs = [x for x in sites if x.is_dir]
+    with ThreadPoolExecutor(max_workers=max(n_threads, 1)) as pool:
+        rolls_per_site = pool.map(_scan_site_directory, site_dirs)
+        rolls = [x for site_rolls in rolls_per_site for x in site_rolls]
+    return sites, rolls
+
+
+def scan_album(root_dir, n_threads=16, stat_files=False):
+    """ Scan root_dir/site_directory/roll_directory/files
+        - entries that are not directories are listed in sites / rolls
+          but not descended into
+        - stat_files: see scan_directories
+        - returns an AlbumListing
+    """
+    sites, rolls = scan_roll_directories(root_dir, n_threads=n_threads)
+    site_dirs = [x for x in sites if x.is_dir]
+    files = scan_directories(
+        [x.path for x in rolls if x.is_dir], n_threads=n_threads,
+        stat_files=stat_files)
+    logger.info("Scanned {}: {} sites, {} rolls, {} files".format(
+        root_dir, len(site_dirs), len(rolls), len(files)))
+    return AlbumListing(root_dir, sites, rolls, files)
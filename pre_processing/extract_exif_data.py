@@ -16,6 +16,9 @@ from config.cfg import cfg
 from utils.logger import set_logging
 from pre_processing.utils import (
     export_inventory_to_csv, read_image_inventory, image_check_stats)
+from pre_processing.album_index import (
+    open_album_index, update_album_index, read_file_results,
+    write_file_results)
 from utils.utils import (
     slice_generator, estimate_remaining_time, set_file_permission)
 
@@ -94,6 +97,11 @@ if __name__ == '__main__':
     parser.add_argument(
         "--exiftool_path", type=str,
         default='/home/packerc/shared/programs/Image-ExifTool-11.31/exiftool')
+    parser.add_argument(
+        "--album_index", type=str, default=None,
+        help="Path to an album index (see create_image_inventory). EXIF \
+              data of files unchanged since the last run (same size and \
+              mtime) is re-used.")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
@@ -163,7 +171,19 @@ if __name__ == '__main__':
 
     # Loop over all images
     image_paths_all = list(image_inventory.keys())
-    n_images_total = len(image_paths_all)
+
+    # EXIF data from previous runs
+    if args['album_index'] is not None:
+        conn = open_album_index(args['album_index'], create=False)
+        update_album_index(conn)
+        cached_exif = read_file_results(conn, 'extract_exif_data')
+        logger.info("Found EXIF data of {} images in the album index".format(
+            len(cached_exif)))
+    else:
+        cached_exif = dict()
+    image_paths_to_process = [
+        x for x in image_paths_all if x not in cached_exif]
+    n_images_total = len(image_paths_to_process)
 
     # parallelize image checking into 'n_processes'
     manager = Manager()
@@ -174,7 +194,7 @@ if __name__ == '__main__':
         slices = slice_generator(n_images_total, n_processes)
         for i, (start_i, end_i) in enumerate(slices):
             pr = Process(target=extract_exif_image_list,
-                         args=(i, image_paths_all[start_i:end_i],
+                         args=(i, image_paths_to_process[start_i:end_i],
                                results, args['exiftool_path']))
             pr.start()
             processes_list.append(pr)
@@ -186,6 +206,14 @@ if __name__ == '__main__':
     # copy the shared dictionary
     exif_all = {k: v for k, v in results.items()}
 
+    # store EXIF data of new images - failed extractions are re-tried
+    if args['album_index'] is not None:
+        write_file_results(conn, 'extract_exif_data', {
+            k: v for k, v in exif_all.items() if v is not None})
+        conn.close()
+        exif_all.update(
+            {k: v for k, v in cached_exif.items() if k in image_inventory})
+
     # Extract relevant EXIF tags
     exif_extracted = dict()
     for img_name, exif_data in exif_all.items():
@@ -7,13 +7,23 @@ import logging
 
 from pre_processing.utils import (
     image_check_stats, read_image_inventory,
-    export_inventory_to_csv, update_time_checks)
+    export_inventory_to_csv, update_time_checks, set_time_check_years)
 from config.cfg import cfg
 from utils.logger import set_logging
 
 
 flags = cfg['pre_processing_flags']
 
+# first columns of the exported captures
+FIRST_COLS_TO_EXPORT = [
+    'capture_id', 'season', 'site', 'roll', 'capture',
+    'image_rank_in_capture', 'image_rank_in_roll',
+    'image_name', 'image_path_rel', 'image_path',
+    'datetime', 'seconds_to_next_image_taken',
+    'seconds_to_last_image_taken', 'days_to_last_image_taken',
+    'days_to_next_image_taken',
+    'image_name_original', 'image_path_original',
+    'image_path_original_rel']
 
 # args = dict()
 # args['inventory'] = '/home/packerc/will5448/data/pre_processing_tests/ENO_S1_inventory.csv'
@@ -206,6 +216,28 @@ def update_time_checks_inventory(inventory, flags):
             pass
 
 
+def group_inventory_into_captures(inventory, flags):
+    """ Group the images of an inventory into captures
+        - updates the inventory in place and returns it
+    """
+    # calculate time_deltas
+    time_deltas = calculate_time_deltas(inventory, flags)
+    update_inventory_with_capture_data(inventory, time_deltas)
+
+    # group images into captures
+    image_to_capture = group_images_into_captures(inventory, flags)
+    update_inventory_with_capture_data(inventory, image_to_capture)
+
+    update_inventory_with_capture_id(inventory)
+
+    update_inventory_with_image_names(inventory)
+
+    update_time_checks_inventory(inventory, flags)
+
+    image_check_stats(inventory)
+    return inventory
+
+
 if __name__ == '__main__':
 
     # Parse command line arguments
@@ -227,42 +259,16 @@ if __name__ == '__main__':
 
     logger = logging.getLogger(__name__)
 
-    # update time checks
-    time_checks = flags['image_check_parameters']
-    time_checks['time_too_old']['min_year'] = args['no_older_than_year']
-    time_checks['time_too_new']['max_year'] = args['no_newer_than_year']
+    set_time_check_years(
+        flags, args['no_older_than_year'], args['no_newer_than_year'])
 
     inventory = read_image_inventory(
         args['inventory'],
         unique_id='image_path_original')
 
-    # calculate time_deltas
-    time_deltas = calculate_time_deltas(inventory, flags)
-    update_inventory_with_capture_data(inventory, time_deltas)
-
-    # group images into captures
-    image_to_capture = group_images_into_captures(inventory, flags)
-    update_inventory_with_capture_data(inventory, image_to_capture)
-
-    update_inventory_with_capture_id(inventory)
-
-    update_inventory_with_image_names(inventory)
-
-    update_time_checks_inventory(inventory, flags)
-
-    image_check_stats(inventory)
-
-    first_cols_to_export = [
-        'capture_id', 'season', 'site', 'roll', 'capture',
-        'image_rank_in_capture', 'image_rank_in_roll',
-        'image_name', 'image_path_rel', 'image_path',
-        'datetime', 'seconds_to_next_image_taken',
-        'seconds_to_last_image_taken', 'days_to_last_image_taken',
-        'days_to_next_image_taken',
-        'image_name_original', 'image_path_original',
-        'image_path_original_rel']
+    group_inventory_into_captures(inventory, flags)
 
     export_inventory_to_csv(
             inventory,
             args['output_csv'],
-            first_cols=first_cols_to_export)
+            first_cols=FIRST_COLS_TO_EXPORT)
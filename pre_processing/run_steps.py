@@ -0,0 +1,230 @@
+""" Run consecutive Pre-Processing Steps in Memory
+    - the inventory / captures are read once and the output of the last
+      step is written once, steps pass their output to the next step in
+      memory (in the same form as the next step would read it from csv)
+    - the outputs of intermediate steps can be exported for auditing
+"""
+import os
+import argparse
+import logging
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.logger import set_logging, timed_phase
+from utils.utils import set_file_permission
+from config.cfg import cfg
+from pre_processing.utils import (
+    read_image_inventory, export_inventory_to_csv, inventory_as_exported,
+    set_time_check_years)
+from pre_processing.actions import Action
+import pre_processing.group_inventory_into_captures as group_step
+import pre_processing.create_action_list as action_list_step
+import pre_processing.generate_actions as generate_actions_step
+import pre_processing.apply_actions as apply_actions_step
+import pre_processing.update_captures as update_captures_step
+import pre_processing.create_captures_cleaned as captures_cleaned_step
+
+
+flags = cfg['pre_processing_flags']
+
+logger = logging.getLogger(__name__)
+
+# all steps in the order they have to be run
+STEPS = [
+    'group_inventory_into_captures',
+    'create_action_list',
+    'generate_actions',
+    'apply_actions',
+    'update_captures',
+    'create_captures_cleaned']
+
+
+def check_steps(steps):
+    """ Check that steps are consecutive steps in the order of STEPS
+        - a chain must not cross from create_action_list to
+          generate_actions (the action list has to be reviewed)
+    """
+    unknown = [x for x in steps if x not in STEPS]
+    if len(steps) == 0 or len(unknown) > 0:
+        raise ValueError(
+            "steps must be one or more of {} - found {}".format(
+                STEPS, steps))
+    first = STEPS.index(steps[0])
+    if steps != STEPS[first:first + len(steps)]:
+        raise ValueError(
+            "steps must be consecutive and in this order: {} - found {}".format(
+                STEPS, steps))
+    # the action list has to be reviewed before actions are generated
+    # from it (proposed actions may delete images)
+    if 'create_action_list' in steps and 'generate_actions' in steps:
+        raise ValueError(
+            "create_action_list and generate_actions can't be run together "
+            "-- review the action list and start with generate_actions "
+            "and '--action_list'")
+
+
+def _key_by(inventory, unique_id):
+    return OrderedDict((v[unique_id], v) for v in inventory.values())
+
+
+def export_step_output(step, output, path):
+    """ Export the output of a step to a csv as the step would """
+    if step == 'group_inventory_into_captures':
+        export_inventory_to_csv(
+            output, path, first_cols=group_step.FIRST_COLS_TO_EXPORT)
+    elif step == 'create_action_list':
+        export_inventory_to_csv(
+            output, path, first_cols=action_list_step.ACTION_LIST_COLS)
+    elif step == 'generate_actions':
+        df = pd.DataFrame.from_records(output, columns=Action._fields)
+        df.to_csv(path, index=False)
+        set_file_permission(path)
+    elif step == 'apply_actions':
+        export_inventory_to_csv(output, path)
+    elif step == 'update_captures':
+        export_inventory_to_csv(
+            output, path, first_cols=update_captures_step.FIRST_COLS_TO_EXPORT)
+    elif step == 'create_captures_cleaned':
+        output.to_csv(path, index=False)
+        set_file_permission(path)
+    logger.info("Exported output of {} to {}".format(step, path))
+
+
+def run_steps(
+        steps, captures, flags, action_list=None, actions=None,
+        audit_dir=None):
+    """ Run consecutive steps in memory
+        - captures: the inventory if the first step is
+          'group_inventory_into_captures', otherwise the captures (dict)
+        - action_list: (dict) required if the first step is
+          'generate_actions'
+        - actions: (list) required if the first step is 'apply_actions'
+        - audit_dir: export the outputs of all but the last step to
+          audit_dir/<step>.csv
+        - returns the output of the last step: captures (dict), action list
+          (dict), actions (list of Action) or cleaned captures (df)
+    """
+    check_steps(steps)
+    if steps[0] == 'generate_actions' and action_list is None:
+        raise ValueError("generate_actions requires an action list")
+    if steps[0] == 'apply_actions' and actions is None:
+        raise ValueError("apply_actions requires actions")
+    for i, step in enumerate(steps):
+        logger.info("Running step {}".format(step))
+        with timed_phase(step, unit='records') as phase:
+            if step == 'group_inventory_into_captures':
+                output = group_step.group_inventory_into_captures(
+                    captures, flags)
+                captures = inventory_as_exported(
+                    output, first_cols=group_step.FIRST_COLS_TO_EXPORT)
+            elif step == 'create_action_list':
+                output = action_list_step.create_action_list(captures, flags)
+                action_list = inventory_as_exported(
+                    output, first_cols=action_list_step.ACTION_LIST_COLS,
+                    unique_id=None)
+            elif step == 'generate_actions':
+                output = generate_actions_step.generate_actions(
+                    action_list, _key_by(captures, 'image_name'))
+                actions = output
+            elif step == 'apply_actions':
+                output = apply_actions_step.apply_actions(
+                    actions, _key_by(captures, 'image_name'), flags)
+                captures = inventory_as_exported(output)
+            elif step == 'update_captures':
+                output = update_captures_step.update_captures(
+                    _key_by(captures, 'image_name'), flags)
+                captures = inventory_as_exported(
+                    output, first_cols=update_captures_step.FIRST_COLS_TO_EXPORT)
+            elif step == 'create_captures_cleaned':
+                df = pd.DataFrame(list(captures.values()))
+                output = captures_cleaned_step.create_captures_cleaned(
+                    df, flags)
+            phase.update(len(output))
+        is_last_step = (i == (len(steps) - 1))
+        if audit_dir is not None and not is_last_step:
+            export_step_output(
+                step, output, os.path.join(audit_dir, '{}.csv'.format(step)))
+    return output
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--steps", type=str, nargs='+', required=True, choices=STEPS,
+        help="Consecutive steps to run (in this order): {}".format(STEPS))
+    parser.add_argument(
+        "--input_csv", type=str, required=True,
+        help="Inventory (if the first step is group_inventory_into_captures) \
+              or captures")
+    parser.add_argument(
+        "--output_csv", type=str, required=True,
+        help="Output of the last step")
+    parser.add_argument(
+        "--action_list", type=str, default=None,
+        help="Action list - required if the first step is generate_actions")
+    parser.add_argument(
+        "--actions_to_perform", type=str, default=None,
+        help="Actions - required if the first step is apply_actions")
+    parser.add_argument(
+        "--audit_dir", type=str, default=None,
+        help="Export the outputs of intermediate steps to this directory")
+    parser.add_argument("--no_older_than_year", type=int, default=1970)
+    parser.add_argument("--no_newer_than_year", type=int, default=9999)
+    parser.add_argument("--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str, default='run_steps')
+    parser.add_argument(
+        "--profile", type=str, nargs='?', const='cprofile', default=None,
+        choices=['cprofile', 'pyinstrument'],
+        help="Profile the script, the profile is written next to the log \
+              file (alternatively set the env var PROFILE)")
+    args = vars(parser.parse_args())
+
+    for path in [args['input_csv'], args['action_list'],
+                 args['actions_to_perform']]:
+        if path is not None and not os.path.isfile(path):
+            raise FileNotFoundError(
+                "{} does not exist -- must be a file".format(path))
+
+    # logging
+    set_logging(args['log_dir'], args['log_filename'], args['profile'])
+    logger = logging.getLogger(__name__)
+
+    for k, v in args.items():
+        logger.info("Argument {}: {}".format(k, v))
+
+    check_steps(args['steps'])
+
+    set_time_check_years(
+        flags, args['no_older_than_year'], args['no_newer_than_year'])
+
+    if args['audit_dir'] is not None:
+        os.makedirs(args['audit_dir'], exist_ok=True)
+
+    # read input
+    if args['steps'][0] == 'group_inventory_into_captures':
+        unique_id = 'image_path_original'
+    else:
+        unique_id = 'image_name'
+    logger.info("Reading {}".format(args['input_csv']))
+    captures = read_image_inventory(args['input_csv'], unique_id=unique_id)
+
+    action_list = None
+    if args['action_list'] is not None:
+        action_list = read_image_inventory(
+            args['action_list'], unique_id=None)
+
+    actions = None
+    if args['actions_to_perform'] is not None:
+        actions = read_image_inventory(
+            args['actions_to_perform'], unique_id=None).values()
+
+    output = run_steps(
+        args['steps'], captures, flags,
+        action_list=action_list, actions=actions,
+        audit_dir=args['audit_dir'])
+
+    export_step_output(args['steps'][-1], output, args['output_csv'])
@@ -7,7 +7,8 @@ from collections import OrderedDict
 from utils.logger import set_logging
 from config.cfg import cfg
 from pre_processing.utils import (
-    read_image_inventory, export_inventory_to_csv, image_check_stats)
+    read_image_inventory, export_inventory_to_csv, image_check_stats,
+    set_time_check_years)
 from pre_processing.group_inventory_into_captures import (
     group_images_into_captures,
     update_inventory_with_capture_data,
@@ -19,6 +20,12 @@ from pre_processing.group_inventory_into_captures import (
 
 flags = cfg['pre_processing_flags']
 
+# first columns of the exported captures
+FIRST_COLS_TO_EXPORT = [
+    'capture_id', 'season', 'site', 'roll', 'capture',
+    'image_rank_in_capture', 'image_name', 'image_path', 'image_path_rel',
+    'datetime']
+
 # args = dict()
 # args['captures'] = '/home/packerc/shared/season_captures/MAD/captures/MAD_S1_captures.csv'
 # args['captures_updated'] = '/home/packerc/shared/season_captures/MAD/captures/MAD_S1_captures_updated2.csv'
@@ -45,6 +52,30 @@ def select_valid_images(captures):
     return captures_updated
 
 
+def update_captures(captures, flags):
+    """ Remove invalid images and re-group the remaining images into
+        captures
+        - captures: dict (key: image_name), is not modified
+        - returns the updated captures (dict)
+    """
+    captures_updated = select_valid_images(captures)
+
+    # re-calculate time_deltas
+    time_deltas = calculate_time_deltas(captures_updated, flags)
+    update_inventory_with_capture_data(captures_updated, time_deltas)
+
+    # update grouping of images into captures
+    image_to_capture = group_images_into_captures(captures_updated, flags)
+    update_inventory_with_capture_data(captures_updated, image_to_capture)
+
+    update_inventory_with_capture_id(captures_updated)
+
+    update_time_checks_inventory(captures_updated, flags)
+
+    image_check_stats(captures_updated)
+    return captures_updated
+
+
 if __name__ == '__main__':
 
     # Parse command line arguments
@@ -68,39 +99,17 @@ if __name__ == '__main__':
     set_logging(args['log_dir'], args['log_filename'])
     logger = logging.getLogger(__name__)
 
-    # update time checks
-    time_checks = flags['image_check_parameters']
-    time_checks['time_too_old']['min_year'] = args['no_older_than_year']
-    time_checks['time_too_new']['max_year'] = args['no_newer_than_year']
+    set_time_check_years(
+        flags, args['no_older_than_year'], args['no_newer_than_year'])
 
     # read captures
     captures = read_image_inventory(
         args['captures'],
         unique_id='image_name')
 
-    captures_updated = select_valid_images(captures)
-
-    # re-calculate time_deltas
-    time_deltas = calculate_time_deltas(captures_updated, flags)
-    update_inventory_with_capture_data(captures_updated, time_deltas)
-
-    # update grouping of images into captures
-    image_to_capture = group_images_into_captures(captures_updated, flags)
-    update_inventory_with_capture_data(captures_updated, image_to_capture)
-
-    update_inventory_with_capture_id(captures_updated)
-
-    update_time_checks_inventory(captures_updated, flags)
-
-    image_check_stats(captures_updated)
-
-    # first columns in exported file
-    first_cols_to_export = [
-        'capture_id', 'season', 'site', 'roll', 'capture',
-        'image_rank_in_capture', 'image_name', 'image_path', 'image_path_rel',
-        'datetime']
+    captures_updated = update_captures(captures, flags)
 
     export_inventory_to_csv(
             captures_updated,
             args['captures_updated'],
-            first_cols=first_cols_to_export)
+            first_cols=FIRST_COLS_TO_EXPORT)
@@ -7,7 +7,6 @@ import pytz
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import csv
 
 from collections import defaultdict, Counter, OrderedDict
@@ -15,8 +14,6 @@ from utils.utils import set_file_permission
 
 logger = logging.getLogger(__name__)
 
-plt.switch_backend('agg')
-
 
 def convert_datetime_utc_to_timezone(datetime_ob, target_tz):
     """ Convert datetime utc to target """
@@ -37,16 +34,21 @@ def datetime_file_creation(path_to_file):
     See http://stackoverflow.com/a/39501288/1709587 for explanation.
     https://stackoverflow.com/questions/237079/how-to-get-file-creation-modification-date-times-in-python
     """
+    return file_creation_time_from_stat(os.stat(path_to_file))
+
+
+def file_creation_time_from_stat(stat):
+    """ File creation time from an os.stat_result (see
+        datetime_file_creation)
+    """
     if platform.system() == 'Windows':
-        return os.path.getctime(path_to_file)
-    else:
-        stat = os.stat(path_to_file)
-        try:
-            return stat.st_birthtime
-        except AttributeError:
-            # We're probably on Linux. No easy way to get creation dates here,
-            # so we'll settle for when its content was last modified.
-            return stat.st_mtime
+        return stat.st_ctime
+    try:
+        return stat.st_birthtime
+    except AttributeError:
+        # We're probably on Linux. No easy way to get creation dates here,
+        # so we'll settle for when its content was last modified.
+        return stat.st_mtime
 
 
 def image_check_stats(image_inventory):
@@ -114,6 +116,10 @@ def plot_site_roll_timelines(
         date_col='datetime',
         date_format='%Y-%m-%d %H:%M:%S'):
     """ Plot timelines for site_roll combination """
+    # import matplotlib only when plotting (slow to import)
+    import matplotlib
+    matplotlib.use('agg')
+    import matplotlib.pyplot as plt
     df_copy = df.loc[df[date_col] != ''].copy()
     date_time_obj = \
         [datetime.strptime(x, date_format) for x in df_copy[date_col].values]
@@ -155,9 +161,15 @@ def read_image_inventory_old(path, unique_id='image_path_original'):
 def read_image_inventory(path, unique_id='image_path_original'):
     df = pd.read_csv(path, dtype='str')
     df.fillna('', inplace=True)
-    inventory = df.to_dict('index', into=OrderedDict)
+    return df_to_inventory(df, unique_id=unique_id)
+
+
+def df_to_inventory(df, unique_id='image_path_original'):
+    """ Convert a df (values as str) to an inventory (dict) """
+    cols = df.columns.tolist()
     inventory_with_index_as_col = OrderedDict()
-    for i, (_id, data) in enumerate(inventory.items()):
+    for i, row in enumerate(df.itertuples(index=False, name=None)):
+        data = dict(zip(cols, row))
         if unique_id is not None:
             inventory_with_index_as_col[data[unique_id]] = data
         else:
@@ -165,17 +177,15 @@ def read_image_inventory(path, unique_id='image_path_original'):
     return inventory_with_index_as_col
 
 
-def export_inventory_to_csv(
+def inventory_to_df(
         inventory,
-        output_path,
         first_cols=['season', 'site', 'roll', 'image_rank_in_roll',
-                    'capture', 'image_rank_in_capture'],
-        return_df=False):
-    """ Export Inventory to CSV
-        inventory: dict
-        output_path: path to a file that is being created
+                    'capture', 'image_rank_in_capture']):
+    """ Convert an inventory (dict) to a df with first_cols first,
+        sorted by first_cols
     """
-    df = pd.DataFrame.from_dict(inventory, orient='index')
+    df = pd.DataFrame(
+        list(inventory.values()), index=list(inventory.keys()))
 
     # re-arrange columns
     cols = df.columns.tolist()
@@ -187,6 +197,54 @@ def export_inventory_to_csv(
 
     # sort rows
     df.sort_values(by=first_cols, inplace=True)
+    return df
+
+
+# values that are read as missing by pd.read_csv
+CSV_NA_VALUES = {
+    '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan',
+    'null'}
+
+
+def inventory_as_exported(
+        inventory,
+        first_cols=['season', 'site', 'roll', 'image_rank_in_roll',
+                    'capture', 'image_rank_in_capture'],
+        unique_id='image_path_original'):
+    """ The inventory as it is read after exporting it to a csv
+        (export_inventory_to_csv and read_image_inventory) -- without
+        writing / parsing the csv
+        - columns / rows are ordered and all values are converted to str
+        - used to pass an inventory from one step to the next in memory
+    """
+    df = inventory_to_df(inventory, first_cols=first_cols)
+    df.reset_index(drop=True, inplace=True)
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.infer_dtype(values, skipna=False) == 'string':
+            missing = values.isin(CSV_NA_VALUES)
+            if missing.any():
+                df[col] = values.where(~missing, '')
+            continue
+        missing = values.isna()
+        values = values.astype(str)
+        missing |= values.isin(CSV_NA_VALUES)
+        df[col] = values.where(~missing, '')
+    return df_to_inventory(df, unique_id=unique_id)
+
+
+def export_inventory_to_csv(
+        inventory,
+        output_path,
+        first_cols=['season', 'site', 'roll', 'image_rank_in_roll',
+                    'capture', 'image_rank_in_capture'],
+        return_df=False):
+    """ Export Inventory to CSV
+        inventory: dict
+        output_path: path to a file that is being created
+    """
+    df = inventory_to_df(inventory, first_cols=first_cols)
 
     # export
     df.to_csv(output_path, index=False)
@@ -198,6 +256,13 @@ def export_inventory_to_csv(
         return df
 
 
+def set_time_check_years(flags, no_older_than_year, no_newer_than_year):
+    """ Set the min / max year of the time checks """
+    time_checks = flags['image_check_parameters']
+    time_checks['time_too_old']['min_year'] = no_older_than_year
+    time_checks['time_too_new']['max_year'] = no_newer_than_year
+
+
 def update_time_checks(image_data, flags):
     checks = flags['image_check_parameters']
     # perform time checks
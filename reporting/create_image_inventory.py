@@ -10,56 +10,32 @@ from utils.logger import set_logging
 from utils.utils import (
     set_file_permission,
     read_cleaned_season_file_df, remove_images_from_df)
+from reporting.partitions import (
+    capture_id_partition_keys, sorted_partition_keys, read_csv_header,
+    partition_csv, write_empty_csv, map_partitions, concatenate_csv_files,
+    partition_dir)
 from config.cfg import cfg
 
 
 flags_report = cfg['report_flags']
 
+logger = logging.getLogger(__name__)
 
-if __name__ == '__main__':
 
-    # Parse command line arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--report_csv", type=str, required=True)
-    parser.add_argument("--season_captures_csv", type=str, required=True)
-    parser.add_argument("--output_csv", type=str, required=True)
-    parser.add_argument("--add_url", action="store_true")
-    parser.add_argument(
-        "--url_prefix", type=str,
-        default="https://s3.msi.umn.edu/snapshotsafari/")
-    parser.add_argument(
-        "--log_dir", type=str, default=None)
-    parser.add_argument(
-        "--log_filename", type=str,
-        default='create_image_inventory')
-
-    args = vars(parser.parse_args())
-
-    ######################################
-    # Check Input
-    ######################################
-
-    if not os.path.isfile(args['season_captures_csv']):
-        raise FileNotFoundError("season_captures_csv: {} not found".format(
-                                args['season_captures_csv']))
-
-    if not os.path.isfile(args['report_csv']):
-        raise FileNotFoundError("report_csv: {} not found".format(
-                                args['report_csv']))
-
-    # logging
-    set_logging(args['log_dir'], args['log_filename'])
-    logger = logging.getLogger(__name__)
+def build_image_inventory(season_captures_csv, report_csv, args):
+    """ Select the images of all captures in a report """
 
     ######################################
     # Read Season File
     ######################################
 
     # read captures data
-    season_data_df = read_cleaned_season_file_df(args['season_captures_csv'])
+    season_data_df = read_cleaned_season_file_df(
+        season_captures_csv,
+        use_cache=args['cache_season_captures'])
     n_images_in_season_data = season_data_df.shape[0]
     logger.info("Read {} records from {}".format(
-        n_images_in_season_data, args['season_captures_csv']))
+        n_images_in_season_data, season_captures_csv))
 
     # remove ineligible images
     season_data_df = remove_images_from_df(
@@ -67,20 +43,20 @@ if __name__ == '__main__':
         flags_report['images_to_remove_from_report'])
     n_images_removed = n_images_in_season_data - season_data_df.shape[0]
     logger.info("Removed {} ineligible images from {} -- {} remaining".format(
-        n_images_removed, args['season_captures_csv'], season_data_df.shape[0]
+        n_images_removed, season_captures_csv, season_data_df.shape[0]
     ))
 
     ######################################
     # Read Report File
     ######################################
 
-    df_report = pd.read_csv(args['report_csv'], index_col=False, dtype=str)
+    df_report = pd.read_csv(report_csv, index_col=False, dtype=str)
     logger.info("Read {} records from {}".format(
-        df_report.shape[0], args['report_csv']))
+        df_report.shape[0], report_csv))
     df_report_deduplicated = df_report.drop_duplicates(subset=['capture_id'])
     logger.info("Found {} distinct capture ids in {}".format(
         df_report_deduplicated.shape[0],
-        args['report_csv']
+        report_csv
     ))
 
     ######################################
@@ -127,15 +103,115 @@ if __name__ == '__main__':
         df_images['url'] = df_images['image_path_rel'].apply(
             lambda x: '/'.join([args['url_prefix'], x]))
 
+    return df_images
+
+
+def create_image_inventory_file(
+        season_captures_csv, report_csv, output_csv, args):
+    """ Create an image inventory and write it to output_csv
+        - returns the number of records written
+    """
+    df_images = build_image_inventory(season_captures_csv, report_csv, args)
+    df_images.to_csv(output_csv, index=False)
+    return df_images.shape[0]
+
+
+def create_image_inventory_file_by_partition(args):
+    """ Create an image inventory per season and site and concatenate them
+        - returns the number of records written
+    """
+    def season_partition_keys(df):
+        if 'capture_id' in df.columns:
+            return capture_id_partition_keys(df['capture_id'])
+        return df['season'].str.cat(df['site'], sep='#')
+
+    with partition_dir(args['tmp_dir']) as tmp_dir:
+        season_parts = partition_csv(
+            args['season_captures_csv'], os.path.join(tmp_dir, 'season'),
+            season_partition_keys)
+        report_parts = partition_csv(
+            args['report_csv'], os.path.join(tmp_dir, 'report'),
+            lambda df: capture_id_partition_keys(df['capture_id']))
+        empty_report_csv = write_empty_csv(
+            read_csv_header(args['report_csv']),
+            os.path.join(tmp_dir, 'report_empty.csv'))
+        partition_args = dict(args, cache_season_captures=False)
+        tasks = list()
+        for i, key in enumerate(sorted_partition_keys(season_parts.keys())):
+            tasks.append((
+                season_parts[key],
+                report_parts.get(key, empty_report_csv),
+                os.path.join(tmp_dir, 'images_{:05}.csv'.format(i)),
+                partition_args))
+        n_written = map_partitions(
+            create_image_inventory_file, tasks, args['n_processes'])
+        concatenate_csv_files([x[2] for x in tasks], args['output_csv'])
+    return sum(n_written)
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--report_csv", type=str, required=True)
+    parser.add_argument("--season_captures_csv", type=str, required=True)
+    parser.add_argument(
+        "--cache_season_captures", action="store_true",
+        help="Cache the parsed season captures next to the \
+              'season_captures_csv' (re-used while the file is unchanged).")
+    parser.add_argument("--output_csv", type=str, required=True)
+    parser.add_argument("--add_url", action="store_true")
+    parser.add_argument(
+        "--url_prefix", type=str,
+        default="https://s3.msi.umn.edu/snapshotsafari/")
+    parser.add_argument(
+        "--partitioned", action="store_true",
+        help="Create the inventory separately for each season and site \
+              (bounded memory use for multi-season reports).")
+    parser.add_argument(
+        "--n_processes", type=int, default=1,
+        help="Number of partitions to process in parallel \
+              if '--partitioned'.")
+    parser.add_argument(
+        "--tmp_dir", type=str, default=None,
+        help="Directory for temporary partition files if '--partitioned' \
+              (default: system temp directory).")
+    parser.add_argument(
+        "--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str,
+        default='create_image_inventory')
+
+    args = vars(parser.parse_args())
+
+    ######################################
+    # Check Input
+    ######################################
+
+    if not os.path.isfile(args['season_captures_csv']):
+        raise FileNotFoundError("season_captures_csv: {} not found".format(
+                                args['season_captures_csv']))
+
+    if not os.path.isfile(args['report_csv']):
+        raise FileNotFoundError("report_csv: {} not found".format(
+                                args['report_csv']))
+
+    # logging
+    set_logging(args['log_dir'], args['log_filename'])
+
     ######################################
-    # Export
+    # Create and Export Inventory
     ######################################
 
-    # export df
-    df_images.to_csv(args['output_csv'], index=False)
+    if args['partitioned']:
+        n_written = create_image_inventory_file_by_partition(args)
+    else:
+        n_written = create_image_inventory_file(
+            args['season_captures_csv'], args['report_csv'],
+            args['output_csv'], args)
 
     logger.info("Wrote {} records to {}".format(
-        df_images.shape[0], args['output_csv']))
+        n_written, args['output_csv']))
 
     # change permmissions to read/write for group
     set_file_permission(args['output_csv'])
@@ -8,7 +8,11 @@ from utils.logger import set_logging
 from utils.utils import (
     read_cleaned_season_file_df,
     remove_images_from_df, set_file_permission, sort_df_by_capture_id)
-from reporting.create_zooniverse_report import create_season_dict
+from reporting.utils import create_season_dict
+from reporting.partitions import (
+    capture_id_partition_keys, sorted_partition_keys, read_csv_header,
+    partition_csv, write_empty_csv, map_partitions, concatenate_csv_files,
+    partition_dir)
 from config.cfg import cfg
 
 # args = dict()
@@ -19,50 +23,23 @@ from config.cfg import cfg
 
 flags_report = cfg['report_flags']
 
-if __name__ == '__main__':
+logger = logging.getLogger(__name__)
 
-    # Parse command line arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--season_captures_csv", type=str, required=True)
-    parser.add_argument("--predictions_csv", type=str, required=True)
-    parser.add_argument("--output_csv", type=str, required=True)
-    parser.add_argument("--export_only_with_predictions", action="store_true")
-    parser.add_argument(
-        "--log_dir", type=str, default=None)
-    parser.add_argument(
-        "--log_filename", type=str,
-        default='create_ml_report')
 
-    args = vars(parser.parse_args())
-
-    ######################################
-    # Check Input
-    ######################################
-
-    if not os.path.isfile(args['season_captures_csv']):
-        raise FileNotFoundError("season_captures_csv: {} not found".format(
-                                args['season_captures_csv']))
-
-    if not os.path.isfile(args['predictions_csv']):
-        raise FileNotFoundError("predictions_csv: {} not found".format(
-                                args['predictions_csv']))
-
-    # logging
-    set_logging(args['log_dir'], args['log_filename'])
-    logger = logging.getLogger(__name__)
-
-    for k, v in args.items():
-        logger.info("Argument {}: {}".format(k, v))
+def build_ml_report(season_captures_csv, predictions_csv, args):
+    """ Join season captures with flat predictions """
 
     ######################################
     # Read Data
     ######################################
 
     # read captures data
-    season_data_df = read_cleaned_season_file_df(args['season_captures_csv'])
+    season_data_df = read_cleaned_season_file_df(
+        season_captures_csv,
+        use_cache=args['cache_season_captures'])
     n_images_in_season_data = season_data_df.shape[0]
     logger.info("Read {} records from {}".format(
-        n_images_in_season_data, args['season_captures_csv']))
+        n_images_in_season_data, season_captures_csv))
 
     # remove ineligible images
     season_data_df = remove_images_from_df(
@@ -70,7 +47,7 @@ if __name__ == '__main__':
         flags_report['images_to_remove_from_report'])
     n_images_removed = n_images_in_season_data - season_data_df.shape[0]
     logger.info("Removed {} ineligible images from {} -- {} remaining".format(
-        n_images_removed, args['season_captures_csv'], season_data_df.shape[0]
+        n_images_removed, season_captures_csv, season_data_df.shape[0]
     ))
 
     # convert to dictionary
@@ -78,13 +55,13 @@ if __name__ == '__main__':
 
     # Import Flat Predictions
     df_preds = pd.read_csv(
-        args['predictions_csv'], dtype='str',
+        predictions_csv, dtype='str',
         index_col='capture_id')
     df_preds.fillna('', inplace=True)
     df_preds.index.name = 'capture_id'
 
     ######################################
-    # Join and Export Data
+    # Join Data
     ######################################
 
     # Join season captures with preds
@@ -101,12 +78,116 @@ if __name__ == '__main__':
             left_index=True, right_index=True)
         df_merged.fillna('', inplace=True)
 
-    # export
     sort_df_by_capture_id(df_merged)
-    df_merged.to_csv(args['output_csv'], index=False)
+    return df_merged
+
+
+def create_ml_report_file(
+        season_captures_csv, predictions_csv, output_csv, args):
+    """ Create a report with predictions and write it to output_csv
+        - returns the number of records written
+    """
+    df_merged = build_ml_report(season_captures_csv, predictions_csv, args)
+    df_merged.to_csv(output_csv, index=False)
+    return df_merged.shape[0]
+
+
+def create_ml_report_file_by_partition(args):
+    """ Create a report per season and site and concatenate them
+        - returns the number of records written
+    """
+    def season_partition_keys(df):
+        if 'capture_id' in df.columns:
+            return capture_id_partition_keys(df['capture_id'])
+        return df['season'].str.cat(df['site'], sep='#')
+
+    with partition_dir(args['tmp_dir']) as tmp_dir:
+        season_parts = partition_csv(
+            args['season_captures_csv'], os.path.join(tmp_dir, 'season'),
+            season_partition_keys)
+        predictions_parts = partition_csv(
+            args['predictions_csv'], os.path.join(tmp_dir, 'predictions'),
+            lambda df: capture_id_partition_keys(df['capture_id']))
+        empty_predictions_csv = write_empty_csv(
+            read_csv_header(args['predictions_csv']),
+            os.path.join(tmp_dir, 'predictions_empty.csv'))
+        partition_args = dict(args, cache_season_captures=False)
+        tasks = list()
+        for i, key in enumerate(sorted_partition_keys(season_parts.keys())):
+            tasks.append((
+                season_parts[key],
+                predictions_parts.get(key, empty_predictions_csv),
+                os.path.join(tmp_dir, 'report_{:05}.csv'.format(i)),
+                partition_args))
+        n_written = map_partitions(
+            create_ml_report_file, tasks, args['n_processes'])
+        concatenate_csv_files([x[2] for x in tasks], args['output_csv'])
+    return sum(n_written)
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--season_captures_csv", type=str, required=True)
+    parser.add_argument(
+        "--cache_season_captures", action="store_true",
+        help="Cache the parsed season captures next to the \
+              'season_captures_csv' (re-used while the file is unchanged).")
+    parser.add_argument("--predictions_csv", type=str, required=True)
+    parser.add_argument("--output_csv", type=str, required=True)
+    parser.add_argument("--export_only_with_predictions", action="store_true")
+    parser.add_argument(
+        "--partitioned", action="store_true",
+        help="Create the report separately for each season and site \
+              (bounded memory use for multi-season reports).")
+    parser.add_argument(
+        "--n_processes", type=int, default=1,
+        help="Number of partitions to process in parallel \
+              if '--partitioned'.")
+    parser.add_argument(
+        "--tmp_dir", type=str, default=None,
+        help="Directory for temporary partition files if '--partitioned' \
+              (default: system temp directory).")
+    parser.add_argument(
+        "--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str,
+        default='create_ml_report')
+
+    args = vars(parser.parse_args())
+
+    ######################################
+    # Check Input
+    ######################################
+
+    if not os.path.isfile(args['season_captures_csv']):
+        raise FileNotFoundError("season_captures_csv: {} not found".format(
+                                args['season_captures_csv']))
+
+    if not os.path.isfile(args['predictions_csv']):
+        raise FileNotFoundError("predictions_csv: {} not found".format(
+                                args['predictions_csv']))
+
+    # logging
+    set_logging(args['log_dir'], args['log_filename'])
+
+    for k, v in args.items():
+        logger.info("Argument {}: {}".format(k, v))
+
+    ######################################
+    # Join and Export Data
+    ######################################
+
+    if args['partitioned']:
+        n_written = create_ml_report_file_by_partition(args)
+    else:
+        n_written = create_ml_report_file(
+            args['season_captures_csv'], args['predictions_csv'],
+            args['output_csv'], args)
 
     logger.info("Wrote {} records to {}".format(
-        df_merged.shape[0], args['output_csv']))
+        n_written, args['output_csv']))
 
     # change permmissions to read/write for group
     set_file_permission(args['output_csv'])
@@ -1,13 +1,24 @@
 """ Create Statistics Over all TopPredictions """
-from collections import Counter, defaultdict
 import logging
 import argparse
 import os
 
-import pandas as pd
-
 from utils.logger import set_logging
 from utils.utils import set_file_permission
+from reporting.report_stats import (
+    create_report_stats, read_report_header, stats_to_df)
+
+
+def non_empty_prediction_masks(df, toppred_cols):
+    """ Count only 'machine_topprediction_is_empty' for captures that are
+        predicted to be empty
+    """
+    if 'machine_topprediction_is_empty' not in df.columns:
+        return dict()
+    is_empty = df['machine_topprediction_is_empty'].isin(['empty', 'blank'])
+    return {
+        x: ~is_empty for x in toppred_cols
+        if x != 'machine_topprediction_is_empty'}
 
 
 if __name__ == '__main__':
@@ -16,6 +27,17 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--report_path", type=str, required=True)
     parser.add_argument("--output_csv", type=str, required=True)
+    parser.add_argument(
+        "--group_by", nargs='+', default=[],
+        help="Break down the stats by these columns (e.g. site roll), \
+              requires '--output_grouped_csv'.")
+    parser.add_argument(
+        "--output_grouped_csv", type=str, default=None,
+        help="Output file for the stats broken down by '--group_by'.")
+    parser.add_argument(
+        "--chunksize", type=int, default=None,
+        help="Read the report in chunks of this many rows \
+              (for reports larger than memory).")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
@@ -39,49 +61,24 @@ if __name__ == '__main__':
     for k, v in args.items():
         logger.info("Argument {}: {}".format(k, v))
 
-    df = pd.read_csv(args['report_path'], dtype='str')
-    df.fillna('', inplace=True)
+    if args['group_by'] and args['output_grouped_csv'] is None:
+        raise ValueError("'--group_by' requires '--output_grouped_csv'")
 
     #####################################
     # Generate Stats
     ######################################
 
-    pred_stats = defaultdict(Counter)
-    cols_all = df.columns.tolist()
+    cols_all = read_report_header(args['report_path'])
     toppred_cols = [x for x in cols_all if 'topprediction' in x]
 
-    for _id, pred_data in df.iterrows():
-        subject_id = pred_data['capture_id']
-        # try to infer whether this prediction is empty
-        # and exclude all other columns if so
-        try:
-            empty_pred = pred_data['machine_topprediction_is_empty']
-            is_empty = (empty_pred in ['empty', 'blank'])
-        except:
-            is_empty = False
-        for pred_col in toppred_cols:
-            if is_empty:
-                if pred_col != 'machine_topprediction_is_empty':
-                    continue
-            pred = pred_data[pred_col]
-            pred_stats[pred_col].update({pred})
-
-    # Print Stats per Question - All Answers
-    stats_list = []
-    for pred, preds_data in pred_stats.items():
-        logger.info(
-            "Stats for: {}".format(pred))
-        total = sum([x for x in preds_data.values()])
-        for answer, count in preds_data.most_common():
-            logger.info(
-                "Prediction: {:20} -- counts: {:10} / {} ({:.2f} %)".format(
-                 answer, count, total, 100*count/total))
-            stats_list.append(
-                [pred, answer, count, total, round(100*count/total, 1)])
-
-    # build df
-    df_stats = pd.DataFrame(stats_list)
-    df_stats.columns = ['question', 'answer', 'count', 'total', 'percent']
+    # exclude all other columns if a capture is predicted to be empty
+    pred_stats, grouped_stats = create_report_stats(
+        args['report_path'], toppred_cols,
+        row_masks_function=lambda df: non_empty_prediction_masks(
+            df, toppred_cols),
+        group_by=args['group_by'],
+        chunksize=args['chunksize'])
+    df_stats = stats_to_df(pred_stats, log_label='Prediction')
 
     # export df
     df_stats.to_csv(args['output_csv'], index=False)
@@ -91,3 +88,11 @@ if __name__ == '__main__':
 
     # change permmissions to read/write for group
     set_file_permission(args['output_csv'])
+
+    # export stats per group
+    if args['group_by']:
+        df_grouped = stats_to_df(grouped_stats, group_by=args['group_by'])
+        df_grouped.to_csv(args['output_grouped_csv'], index=False)
+        logger.info("Wrote {} records to {}".format(
+            df_grouped.shape[0], args['output_grouped_csv']))
+        set_file_permission(args['output_grouped_csv'])
@@ -1,14 +1,14 @@
 """ Create Statistics Over all Questions """
-from collections import Counter, defaultdict
 import logging
 import argparse
 import os
 
-import pandas as pd
-
 from config.cfg import cfg
 from utils.logger import set_logging
 from utils.utils import set_file_permission
+from reporting.report_stats import (
+    create_report_stats, read_report_header, round_numeric_answer,
+    stats_to_df)
 
 
 flags_global = cfg['global_processing_flags']
@@ -20,6 +20,17 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--report_path", type=str, required=True)
     parser.add_argument("--output_csv", type=str, required=True)
+    parser.add_argument(
+        "--group_by", nargs='+', default=[],
+        help="Break down the stats by these columns (e.g. site roll), \
+              requires '--output_grouped_csv'.")
+    parser.add_argument(
+        "--output_grouped_csv", type=str, default=None,
+        help="Output file for the stats broken down by '--group_by'.")
+    parser.add_argument(
+        "--chunksize", type=int, default=None,
+        help="Read the report in chunks of this many rows \
+              (for reports larger than memory).")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
@@ -47,45 +58,26 @@ if __name__ == '__main__':
         flags_global['QUESTION_PREFIX'],
         flags_global['QUESTION_DELIMITER'])
 
-    df = pd.read_csv(args['report_path'], dtype='str')
-    df.fillna('', inplace=True)
+    if args['group_by'] and args['output_grouped_csv'] is None:
+        raise ValueError("'--group_by' requires '--output_grouped_csv'")
 
     ##############################
     # Generate Stats
     ######################################
 
-    question_stats = defaultdict(Counter)
-    cols_all = df.columns.tolist()
+    cols_all = read_report_header(args['report_path'])
     question_cols = [x for x in cols_all if
                      x.startswith(question_column_prefix)]
-    for _id, identification in df.iterrows():
-        subject_id = identification['capture_id']
-        for question in question_cols:
-            try:
-                if 'count' in question:
-                    answer = identification[question]
-                else:
-                    answer = int(round(float(identification[question]), 0))
-            except:
-                answer = identification[question]
-            question_stats[question].update({answer})
-
-    # Print Stats per Question - All Answers
-    stats_list = []
-    for question, answer_data in question_stats.items():
-        logger.info(
-            "Stats for: {} - All annotations per subject".format(question))
-        total = sum([x for x in answer_data.values()])
-        for answer, count in answer_data.most_common():
-            logger.info(
-                "Answer: {:20} -- counts: {:10} / {} ({:.2f} %)".format(
-                 answer, count, total, 100*count/total))
-            stats_list.append(
-                [question, answer, count, total, round(100*count/total, 1)])
-
-    # build df
-    df_stats = pd.DataFrame(stats_list)
-    df_stats.columns = ['question', 'answer', 'count', 'total', 'percent']
+    # round numeric answers except counts
+    convert_functions = {
+        x: round_numeric_answer for x in question_cols if 'count' not in x}
+
+    question_stats, grouped_stats = create_report_stats(
+        args['report_path'], question_cols,
+        convert_functions=convert_functions,
+        group_by=args['group_by'],
+        chunksize=args['chunksize'])
+    df_stats = stats_to_df(question_stats)
 
     # export df
     df_stats.to_csv(args['output_csv'], index=False)
@@ -95,3 +87,11 @@ if __name__ == '__main__':
 
     # change permmissions to read/write for group
     set_file_permission(args['output_csv'])
+
+    # export stats per group
+    if args['group_by']:
+        df_grouped = stats_to_df(grouped_stats, group_by=args['group_by'])
+        df_grouped.to_csv(args['output_grouped_csv'], index=False)
+        logger.info("Wrote {} records to {}".format(
+            df_grouped.shape[0], args['output_grouped_csv']))
+        set_file_permission(args['output_grouped_csv'])
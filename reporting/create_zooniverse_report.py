@@ -2,14 +2,19 @@
 import logging
 import os
 import argparse
-import textwrap
+from collections import Counter
+
 import pandas as pd
 
 from utils.logger import set_logging
 from utils.utils import (
     set_file_permission,
     read_cleaned_season_file_df, remove_images_from_df)
-from reporting.utils import create_season_dict, exclude_cols
+from reporting.utils import create_season_df, exclude_cols
+from reporting.partitions import (
+    capture_id_partition_keys, sorted_partition_keys, read_csv_header,
+    partition_csv, write_empty_csv, map_partitions, concatenate_csv_files,
+    partition_dir)
 from config.cfg import cfg
 
 
@@ -17,102 +22,122 @@ flags_global = cfg['global_processing_flags']
 flags_report = cfg['report_flags']
 flags_preprocessing = cfg['pre_processing_flags']
 
+logger = logging.getLogger(__name__)
+
+# determine empty/blank answer
+question_main_id = flags_global['QUESTION_DELIMITER'].join(
+    [flags_global['QUESTION_PREFIX'], flags_global['QUESTION_MAIN']])
+
+
+def find_duplicate_subject_ids(df_aggregated):
+    """ Find subjects with a capture_id of a previous subject """
+    first_subject_ids = df_aggregated.drop_duplicates(
+        'capture_id').set_index('capture_id')['subject_id']
+    known_subject_ids = df_aggregated['capture_id'].map(first_subject_ids)
+    is_duplicate = (known_subject_ids != df_aggregated['subject_id'])
+    for capture_id, known_subject_id, subject_id in zip(
+            df_aggregated['capture_id'][is_duplicate],
+            known_subject_ids[is_duplicate],
+            df_aggregated['subject_id'][is_duplicate]):
+        logger.warning(
+            "Subject_ids with identical capture_id found -- "
+            "capture_id {} - subject_ids {} - {}".format(
+                capture_id, known_subject_id, subject_id))
+    return set(df_aggregated['subject_id'][is_duplicate])
+
 
 def deduplicate_captures(df_aggregated):
-    """ De-Duplicate Captures with multiple subjects """
-    capture_to_subject_mapping = dict()
-    duplicate_subject_ids = set()
-    for row_id, row_data in df_aggregated.iterrows():
-        capture_id = row_data['capture_id']
-        subject_id = row_data['subject_id']
-        if capture_id not in capture_to_subject_mapping:
-            capture_to_subject_mapping[capture_id] = subject_id
-            continue
-        else:
-            known_subject_id = capture_to_subject_mapping[capture_id]
-            is_identical = (known_subject_id == subject_id)
-        if not is_identical:
-            msg = textwrap.shorten(
-                "Subject_ids with identical capture_id found -- \
-                 capture_id {} - subject_ids {} - {}".format(
-                 capture_id, known_subject_id, subject_id
-                 ), width=150)
-            logger.warning(msg)
-            duplicate_subject_ids.add(subject_id)
-    msg = textwrap.shorten(
-            "Found {} subjects that have identical capture id to other \
-             subjects - removing them ...".format(
-             len(duplicate_subject_ids)), width=150)
+    """ De-Duplicate Captures with multiple subjects
+        - keep the first subject of each capture, remove other subjects
+    """
+    duplicate_subject_ids = find_duplicate_subject_ids(df_aggregated)
     if len(duplicate_subject_ids) > 0:
-        logger.warning(msg)
+        logger.warning(
+            "Found {} subjects that have identical capture id to other "
+            "subjects - removing them ...".format(
+                len(duplicate_subject_ids)))
         df_aggregated = \
             df_aggregated[~df_aggregated['subject_id'].isin(
                 duplicate_subject_ids)]
     return df_aggregated
 
 
-if __name__ == '__main__':
-
-    # Parse command line arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--season_captures_csv", type=str, required=True)
-    parser.add_argument("--aggregated_csv", type=str, required=True)
-    parser.add_argument("--output_csv", type=str, required=True)
-    parser.add_argument("--default_season_id", type=str, default='')
-    parser.add_argument("--exclude_non_consensus", action="store_true")
-    parser.add_argument("--exclude_humans", action="store_true")
-    parser.add_argument("--exclude_blanks", action="store_true")
-    parser.add_argument("--exclude_captures_without_data", action="store_true")
-    parser.add_argument("--exclude_zooniverse_cols", action="store_true")
-    parser.add_argument("--exclude_zooniverse_urls", action="store_true")
-    parser.add_argument(
-        "--exclude_additional_plurality_infos", action="store_true")
-    parser.add_argument(
-        "--exclude_cols", nargs='+', default=[],
-        help="Specifiy column names to exclude from the export.")
-    parser.add_argument(
-        "--log_dir", type=str, default=None)
-    parser.add_argument(
-        "--log_filename", type=str,
-        default='create_zooniverse_report')
-
-    args = vars(parser.parse_args())
-
-    ######################################
-    # Check Input
-    ######################################
-
-    if not os.path.isfile(args['season_captures_csv']):
-        raise FileNotFoundError("season_captures_csv: {} not found".format(
-                                args['season_captures_csv']))
-
-    if not os.path.isfile(args['aggregated_csv']):
-        raise FileNotFoundError("aggregated_csv: {} not found".format(
-                                args['aggregated_csv']))
-
-    # logging
-    set_logging(args['log_dir'], args['log_filename'])
-    logger = logging.getLogger(__name__)
-
-    # determine empty/blank answer
-    question_main_id = flags_global['QUESTION_DELIMITER'].join(
-        [flags_global['QUESTION_PREFIX'], flags_global['QUESTION_MAIN']])
-    question_column_prefix = '{}{}'.format(
-        flags_global['QUESTION_PREFIX'],
-        flags_global['QUESTION_DELIMITER'])
-
-    # create stats variables
-    n_humans_excluded = 0
-    n_blanks_excluded = 0
-    n_non_consensus_excluded = 0
-    n_without_data_excluded = 0
-
+def select_aggregations(
+        df_aggregated, question_main_id,
+        exclude_non_consensus=False, exclude_humans=False,
+        exclude_blanks=False):
+    """ Exclude non-consensus, human and blank aggregations
+        - returns (selected aggregations, Counter of excluded aggregations)
+    """
+    n_excluded = Counter()
+    main_answers = df_aggregated[question_main_id]
+    exclude = pd.Series(False, index=df_aggregated.index)
+    if exclude_non_consensus and \
+            ('species_is_plurality_consensus' in df_aggregated.columns):
+        is_non_consensus = \
+            (df_aggregated['species_is_plurality_consensus'] == '0')
+        n_excluded['non_consensus'] = is_non_consensus.sum()
+        exclude |= is_non_consensus
+    if exclude_humans:
+        is_human = ~exclude & main_answers.isin(
+            flags_report['identify_humans_for_exclusion'])
+        n_excluded['humans'] = is_human.sum()
+        exclude |= is_human
+    if exclude_blanks:
+        is_blank = ~exclude & \
+            (main_answers == flags_global['QUESTION_MAIN_EMPTY'])
+        n_excluded['blanks'] = is_blank.sum()
+        exclude |= is_blank
+    return df_aggregated[~exclude], n_excluded
+
+
+def create_report(
+        season_df, df_aggregated, df_selected,
+        exclude_captures_without_data=False):
+    """ Join per-capture season data with selected aggregations
+        - one row per aggregation in 'df_selected'
+        - one (empty) row for captures without any aggregations in
+          'df_aggregated' (unless 'exclude_captures_without_data')
+        - captures whose aggregations were all excluded are dropped
+        Returns:
+        - (report, number of captures without any aggregations excluded)
+    """
+    season_header = list(season_df.columns)
+    agg_data_to_add = [
+        x for x in df_aggregated.columns if x not in season_header]
+    df_report = pd.merge(
+        season_df, df_selected[['capture_id'] + agg_data_to_add],
+        how='left', on='capture_id', indicator=True)
+    has_valid_aggregations = (df_report['_merge'] == 'both')
+    has_no_aggregations = ~has_valid_aggregations & \
+        ~df_report['capture_id'].isin(df_aggregated['capture_id'])
+    if exclude_captures_without_data:
+        keep = has_valid_aggregations
+    else:
+        keep = has_valid_aggregations | has_no_aggregations
+    n_without_data_excluded = (has_no_aggregations & ~keep).sum()
+    df_report = df_report[keep].drop('_merge', axis=1)
+    df_report.fillna('', inplace=True)
+    df_report.reset_index(drop=True, inplace=True)
+    return df_report, n_without_data_excluded
+
+
+def create_capture_ids(df_aggregated):
+    """ Create capture ids from season, site, roll and capture """
+    return df_aggregated['season'].str.cat(
+        df_aggregated[['site', 'roll', 'capture']], sep='#')
+
+
+def build_report(season_captures_csv, aggregated_csv, args):
+    """ Join season captures and aggregations
+        - returns (report, Counter with numbers of excluded records)
+    """
     ###############################
     # Read / Process Aggregations
     ###############################
 
     # import aggregations
-    df_aggregated = pd.read_csv(args['aggregated_csv'], dtype='str')
+    df_aggregated = pd.read_csv(aggregated_csv, dtype='str')
     df_aggregated.fillna('', inplace=True)
     df_aggregated.loc[df_aggregated.season == '', 'season'] = \
         args['default_season_id']
@@ -121,61 +146,30 @@ if __name__ == '__main__':
     if 'capture_id' not in df_aggregated.columns:
         logger.warning(
             "capture_id not found in {} - re-creating... ".format(
-             args['aggregated_csv']))
-        capture_ids_all = list()
-        for _id, row in df_aggregated.iterrows():
-            capture_id = '#'.join(
-                [row.season, row.site, row.roll, row.capture])
-            capture_ids_all.append(capture_id)
-        df_aggregated['capture_id'] = capture_ids_all
+             aggregated_csv))
+        df_aggregated['capture_id'] = create_capture_ids(df_aggregated)
 
     # deduplicate Aggregated data
     df_aggregated = deduplicate_captures(df_aggregated)
 
-    # Store aggregated data per capture
-    aggregated_data = dict()
-    capture_ids_with_aggregations = set()
-    header_input = df_aggregated.columns
-    for line_no, line in df_aggregated.iterrows():
-        capture_id = line['capture_id']
-        capture_ids_with_aggregations.add(capture_id)
-        main_answer = line[question_main_id]
-        # Skip non-consensus aggregations if specified
-        if args['exclude_non_consensus']:
-            try:
-                if line['species_is_plurality_consensus'] == '0':
-                    n_non_consensus_excluded += 1
-                    continue
-            except:
-                pass
-        # Exclude humans
-        if args['exclude_humans']:
-            if main_answer in flags_report['identify_humans_for_exclusion']:
-                logger.debug("Exclude capture {} because of human".format(
-                    capture_id))
-                n_humans_excluded += 1
-                continue
-        # Exclude blanks
-        if args['exclude_blanks']:
-            if main_answer == flags_global['QUESTION_MAIN_EMPTY']:
-                logger.debug("Exclude capture {} because it is blank".format(
-                    capture_id))
-                n_blanks_excluded += 1
-                continue
-        try:
-            aggregated_data[capture_id].append(line)
-        except:
-            aggregated_data[capture_id] = [line]
+    # Exclude non-consensus / human / blank aggregations
+    df_selected, n_excluded = select_aggregations(
+        df_aggregated, question_main_id,
+        exclude_non_consensus=args['exclude_non_consensus'],
+        exclude_humans=args['exclude_humans'],
+        exclude_blanks=args['exclude_blanks'])
 
     ###############################
     # Read Captures Data
     ###############################
 
     # read captures data
-    season_data_df = read_cleaned_season_file_df(args['season_captures_csv'])
+    season_data_df = read_cleaned_season_file_df(
+        season_captures_csv,
+        use_cache=args['cache_season_captures'])
     n_images_in_season_data = season_data_df.shape[0]
     logger.info("Read {} records from {}".format(
-        n_images_in_season_data, args['season_captures_csv']))
+        n_images_in_season_data, season_captures_csv))
 
     # remove ineligible images
     season_data_df = remove_images_from_df(
@@ -183,73 +177,26 @@ if __name__ == '__main__':
         flags_report['images_to_remove_from_report'])
     n_images_removed = n_images_in_season_data - season_data_df.shape[0]
     logger.info("Removed {} ineligible images from {} -- {} remaining".format(
-        n_images_removed, args['season_captures_csv'], season_data_df.shape[0]
+        n_images_removed, season_captures_csv, season_data_df.shape[0]
     ))
 
     # Create per Capture Data
-    season_dict = create_season_dict(season_data_df)
-
-    # get the season data columns from a random record
-    random_record = season_dict[list(season_dict.keys())[0]]
-    season_header = list(random_record.keys())
+    season_df = create_season_df(season_data_df)
 
     ###############################
     # Create Reports
     ###############################
 
-    # Create Report Dict
-    report_list = list()
-    agg_data_to_add = [x for x in header_input if x not in season_header]
-
-    for line_no, (capture_id, season_data) in enumerate(season_dict.items()):
-
-        # captures with a valid aggregation
-        # (in season file and at least one aggregation to export)
-        capture_has_valid_aggregations = (capture_id in aggregated_data)
-
-        # captures with no aggregations at all
-        # (in season file but no aggregation)
-        capture_has_no_aggregations = \
-            (capture_id not in capture_ids_with_aggregations)
-
-        # exclude captures without aggregations to export
-        if args['exclude_captures_without_data']:
-            if not capture_has_valid_aggregations:
-                # count only captures without any aggregations at all
-                if capture_has_no_aggregations:
-                    n_without_data_excluded += 1
-                continue
-
-        # export captures with valid aggregations or no aggregations at all
-        # however, exclude deliberately excluded captures
-        if capture_has_valid_aggregations:
-            aggregations_list = aggregated_data[capture_id]
-        elif capture_has_no_aggregations:
-            aggregations_list = [{x: '' for x in agg_data_to_add}]
-        else:
-            continue
-
-        # for each capture get all annotations
-        for aggregation in aggregations_list:
-            row = list()
-            row += [season_data[x] for x in season_header]
-            row += [aggregation[x] for x in agg_data_to_add]
-            report_list.append(row)
-
-    # report stats
-    logger.info("Excluded {} blank aggregations".format(n_blanks_excluded))
-    logger.info("Excluded {} human aggregations".format(n_humans_excluded))
-    logger.info("Excluded {} non-consensus aggregations".format(
-        n_non_consensus_excluded))
-    logger.info("Excluded {} without aggregations".format(
-        n_without_data_excluded))
+    # captures with valid aggregations get one row per aggregation,
+    # captures without any aggregations get an empty row
+    df_report, n_excluded['without_data'] = create_report(
+        season_df, df_aggregated, df_selected,
+        exclude_captures_without_data=args['exclude_captures_without_data'])
+    return df_report, n_excluded
 
-    # build df
-    df_report = pd.DataFrame(report_list)
-    df_report.columns = season_header + agg_data_to_add
 
-    # determine which columns to export
-    cols_to_export = list(df_report.columns)
+def select_report_cols(cols_to_export, args):
+    """ Determine which columns to export """
     #####################################
     # Exclude Zooniverse Columns
     #####################################
@@ -297,15 +244,165 @@ if __name__ == '__main__':
             logging.debug("Failed to exclude 'exclude_cols': {}".format(
                 args['exclude_cols']))
             pass
+    return cols_to_export
 
+
+def create_report_file(season_captures_csv, aggregated_csv, output_csv, args):
+    """ Create a report and write it to output_csv
+        - returns Counter with numbers of excluded records
+    """
+    df_report, n_excluded = build_report(
+        season_captures_csv, aggregated_csv, args)
+    cols_to_export = select_report_cols(list(df_report.columns), args)
     logging.info("Exporting columns: {}".format(cols_to_export))
     df_report = df_report[cols_to_export]
+    df_report.to_csv(output_csv, index=False)
+    n_excluded['written'] = df_report.shape[0]
+    return n_excluded
+
+
+def create_report_file_by_partition(args):
+    """ Create a report per season and site and concatenate them
+        - subjects with duplicate capture ids are removed before
+          partitioning since they may span partitions
+        - returns Counter with numbers of excluded records
+    """
+    def aggregated_capture_ids(df):
+        if 'capture_id' in df.columns:
+            return df['capture_id']
+        seasons = df['season'].where(
+            df['season'] != '', args['default_season_id'])
+        return create_capture_ids(df.assign(season=seasons))
+
+    def season_partition_keys(df):
+        if 'capture_id' in df.columns:
+            return capture_id_partition_keys(df['capture_id'])
+        return df['season'].str.cat(df['site'], sep='#')
+
+    header = read_csv_header(args['aggregated_csv'])
+    id_cols = [x for x in header if x in (
+        'subject_id', 'capture_id', 'season', 'site', 'roll', 'capture')]
+    df_ids = pd.read_csv(
+        args['aggregated_csv'], dtype='str', usecols=id_cols)
+    df_ids.fillna('', inplace=True)
+    duplicate_subject_ids = find_duplicate_subject_ids(pd.DataFrame({
+        'subject_id': df_ids['subject_id'],
+        'capture_id': aggregated_capture_ids(df_ids)}))
+    if len(duplicate_subject_ids) > 0:
+        logger.warning(
+            "Found {} subjects that have identical capture id to other "
+            "subjects - removing them ...".format(
+                len(duplicate_subject_ids)))
+    del df_ids
+
+    n_excluded = Counter()
+    with partition_dir(args['tmp_dir']) as tmp_dir:
+        season_parts = partition_csv(
+            args['season_captures_csv'], os.path.join(tmp_dir, 'season'),
+            season_partition_keys)
+        aggregated_parts = partition_csv(
+            args['aggregated_csv'], os.path.join(tmp_dir, 'aggregated'),
+            lambda df: capture_id_partition_keys(aggregated_capture_ids(df)),
+            row_mask_function=lambda df: ~df['subject_id'].isin(
+                duplicate_subject_ids))
+        empty_aggregated_csv = write_empty_csv(
+            header, os.path.join(tmp_dir, 'aggregated_empty.csv'))
+        partition_args = dict(args, cache_season_captures=False)
+        tasks = list()
+        for i, key in enumerate(sorted_partition_keys(season_parts.keys())):
+            tasks.append((
+                season_parts[key],
+                aggregated_parts.get(key, empty_aggregated_csv),
+                os.path.join(tmp_dir, 'report_{:05}.csv'.format(i)),
+                partition_args))
+        for n_excluded_partition in map_partitions(
+                create_report_file, tasks, args['n_processes']):
+            n_excluded.update(n_excluded_partition)
+        concatenate_csv_files([x[2] for x in tasks], args['output_csv'])
+    return n_excluded
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--season_captures_csv", type=str, required=True)
+    parser.add_argument(
+        "--cache_season_captures", action="store_true",
+        help="Cache the parsed season captures next to the \
+              'season_captures_csv' (re-used while the file is unchanged).")
+    parser.add_argument("--aggregated_csv", type=str, required=True)
+    parser.add_argument("--output_csv", type=str, required=True)
+    parser.add_argument("--default_season_id", type=str, default='')
+    parser.add_argument("--exclude_non_consensus", action="store_true")
+    parser.add_argument("--exclude_humans", action="store_true")
+    parser.add_argument("--exclude_blanks", action="store_true")
+    parser.add_argument("--exclude_captures_without_data", action="store_true")
+    parser.add_argument("--exclude_zooniverse_cols", action="store_true")
+    parser.add_argument("--exclude_zooniverse_urls", action="store_true")
+    parser.add_argument(
+        "--exclude_additional_plurality_infos", action="store_true")
+    parser.add_argument(
+        "--exclude_cols", nargs='+', default=[],
+        help="Specifiy column names to exclude from the export.")
+    parser.add_argument(
+        "--partitioned", action="store_true",
+        help="Create the report separately for each season and site \
+              (bounded memory use for multi-season reports).")
+    parser.add_argument(
+        "--n_processes", type=int, default=1,
+        help="Number of partitions to process in parallel \
+              if '--partitioned'.")
+    parser.add_argument(
+        "--tmp_dir", type=str, default=None,
+        help="Directory for temporary partition files if '--partitioned' \
+              (default: system temp directory).")
+    parser.add_argument(
+        "--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str,
+        default='create_zooniverse_report')
 
-    # export df
-    df_report.to_csv(args['output_csv'], index=False)
+    args = vars(parser.parse_args())
+
+    ######################################
+    # Check Input
+    ######################################
+
+    if not os.path.isfile(args['season_captures_csv']):
+        raise FileNotFoundError("season_captures_csv: {} not found".format(
+                                args['season_captures_csv']))
+
+    if not os.path.isfile(args['aggregated_csv']):
+        raise FileNotFoundError("aggregated_csv: {} not found".format(
+                                args['aggregated_csv']))
+
+    # logging
+    set_logging(args['log_dir'], args['log_filename'])
+
+    ###############################
+    # Create Reports
+    ###############################
+
+    if args['partitioned']:
+        n_excluded = create_report_file_by_partition(args)
+    else:
+        n_excluded = create_report_file(
+            args['season_captures_csv'], args['aggregated_csv'],
+            args['output_csv'], args)
+
+    # report stats
+    logger.info("Excluded {} blank aggregations".format(
+        n_excluded['blanks']))
+    logger.info("Excluded {} human aggregations".format(
+        n_excluded['humans']))
+    logger.info("Excluded {} non-consensus aggregations".format(
+        n_excluded['non_consensus']))
+    logger.info("Excluded {} without aggregations".format(
+        n_excluded['without_data']))
 
     logger.info("Wrote {} records to {}".format(
-        df_report.shape[0], args['output_csv']))
+        n_excluded['written'], args['output_csv']))
 
     # change permmissions to read/write for group
     set_file_permission(args['output_csv'])
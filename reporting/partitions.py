@@ -0,0 +1,109 @@
+""" Process Reports in Partitions (season and site)
+    - input csv files are streamed into one file per partition
+    - each partition is processed independently (optionally in parallel)
+    - the outputs are concatenated in partition order
+"""
+import os
+import logging
+import shutil
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+def capture_id_partition_keys(capture_ids):
+    """ Partition keys ('season#site') of capture ids """
+    return capture_ids.str.rsplit('#', n=2).str[0]
+
+
+def sorted_partition_keys(keys):
+    """ Sort partition keys such that the concatenated partitions are in
+        the same order as the sorted captures
+    """
+    return sorted(keys, key=lambda x: '{}#'.format(x))
+
+
+def read_csv_header(path):
+    """ Read the column names of a csv """
+    return pd.read_csv(path, dtype='str', nrows=0).columns.tolist()
+
+
+def partition_csv(
+        path, output_dir, key_function, row_mask_function=None,
+        chunksize=100000):
+    """ Stream a csv into one csv per partition
+        - values are written unchanged (no NA conversion)
+        Args:
+        - path: csv file to partition
+        - output_dir: directory to write the partitions to
+        - key_function: function(df) returning the partition key of each row
+        - row_mask_function: function(df) returning a boolean Series of the
+          rows to keep (default: all rows)
+        Returns:
+        - OrderedDict {partition_key: path of the partition}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    partitions = OrderedDict()
+    n_rows = 0
+    chunks = pd.read_csv(
+        path, dtype='str', keep_default_na=False, na_filter=False,
+        chunksize=chunksize)
+    for df in chunks:
+        n_rows += df.shape[0]
+        if row_mask_function is not None:
+            df = df[row_mask_function(df)]
+        keys = key_function(df)
+        for key, df_partition in df.groupby(keys, sort=False):
+            if key not in partitions:
+                partitions[key] = os.path.join(
+                    output_dir, 'part_{:05}.csv'.format(len(partitions)))
+                df_partition.to_csv(partitions[key], index=False)
+            else:
+                df_partition.to_csv(
+                    partitions[key], index=False, header=False, mode='a')
+    logger.info("Partitioned {} records of {} into {} partitions".format(
+        n_rows, path, len(partitions)))
+    return partitions
+
+
+def write_empty_csv(header, path):
+    """ Write a csv with only a header """
+    pd.DataFrame(columns=header).to_csv(path, index=False)
+    return path
+
+
+def map_partitions(function, tasks, n_processes=1):
+    """ Apply function(*task) to each task, in parallel if n_processes > 1
+        - returns the results in the order of the tasks
+    """
+    if n_processes <= 1:
+        return [function(*task) for task in tasks]
+    with Pool(n_processes) as pool:
+        return pool.starmap(function, tasks, chunksize=1)
+
+
+def concatenate_csv_files(paths, output_path):
+    """ Concatenate csv files with identical headers """
+    with open(output_path, 'wb') as f_out:
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f_in:
+                header = f_in.readline()
+                if i == 0:
+                    f_out.write(header)
+                shutil.copyfileobj(f_in, f_out)
+
+
+@contextmanager
+def partition_dir(tmp_dir=None):
+    """ Temporary directory for partitions, removed afterwards """
+    path = tempfile.mkdtemp(prefix='partitions_', dir=tmp_dir)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path)
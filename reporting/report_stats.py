@@ -0,0 +1,164 @@
+""" Compute Value Counts over Report Columns
+    - counts are computed per column with 'value_counts' (no row loops)
+    - results are identical to updating a Counter row by row: answers are
+      ordered by count, ties in order of first appearance
+    - reports can be processed in chunks and broken down by groups
+"""
+import logging
+from collections import OrderedDict
+
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+STATS_COLS = ['question', 'answer', 'count', 'total', 'percent']
+
+
+def round_numeric_answer(answer):
+    """ Round numeric answers to int, leave other answers as they are """
+    try:
+        return int(round(float(answer), 0))
+    except (ValueError, OverflowError):
+        return answer
+
+
+def read_report_chunks(path, chunksize=None):
+    """ Generator over a report (in chunks of 'chunksize' rows) """
+    if chunksize is None:
+        chunks = [pd.read_csv(path, dtype='str')]
+    else:
+        chunks = pd.read_csv(path, dtype='str', chunksize=chunksize)
+    for df in chunks:
+        df.fillna('', inplace=True)
+        yield df
+
+
+def update_column_stats(
+        stats, df, cols, convert_functions=None, row_masks=None,
+        group_by=None):
+    """ Update per-column value counts with the rows of df
+        Args:
+        - stats: dict to update: {group: {col: {answer: count}}}, the group
+          is a tuple of the 'group_by' values (empty tuple if no 'group_by')
+        - cols: columns to count values of
+        - convert_functions: dict {col: function} to convert values of a
+          column before counting (e.g. round_numeric_answer)
+        - row_masks: dict {col: boolean Series} to count only some rows
+        - group_by: list of columns to break down the counts by
+    """
+    if convert_functions is None:
+        convert_functions = dict()
+    if row_masks is None:
+        row_masks = dict()
+    if group_by:
+        # a one-element list raises a FutureWarning when iterating over
+        # the groups (pandas >= 1.5), group by the column itself
+        if len(group_by) == 1:
+            groups = df.groupby(group_by[0], sort=True)
+        else:
+            groups = df.groupby(group_by, sort=True)
+    else:
+        groups = [((), df)]
+    for group, df_group in groups:
+        if not isinstance(group, tuple):
+            group = (group, )
+        group_stats = stats.setdefault(group, OrderedDict())
+        # columns are added in the order they are first counted
+        to_count = list()
+        for col_no, col in enumerate(cols):
+            values = df_group[col]
+            first_row = 0
+            if col in row_masks:
+                mask = row_masks[col].loc[df_group.index].to_numpy()
+                values = values[mask]
+                first_row = mask.argmax() if mask.any() else 0
+            if values.shape[0] > 0:
+                to_count.append((first_row, col_no, values))
+        for _, col_no, values in sorted(to_count, key=lambda x: x[0:2]):
+            col = cols[col_no]
+            col_stats = group_stats.setdefault(col, OrderedDict())
+            convert = convert_functions.get(col)
+            counts = values.value_counts(sort=False, dropna=False)
+            for value, count in counts.items():
+                if convert is not None:
+                    value = convert(value)
+                col_stats[value] = col_stats.get(value, 0) + int(count)
+    return stats
+
+
+def most_common(col_stats):
+    """ (answer, count) ordered by count, ties in order of first appearance
+        (like Counter.most_common)
+    """
+    return sorted(col_stats.items(), key=lambda x: x[1], reverse=True)
+
+
+def stats_to_df(stats, group_by=None, log_label='Answer'):
+    """ Create a DataFrame with one row per (group), question and answer
+        with columns: (group_by) + STATS_COLS
+    """
+    group_by = list() if group_by is None else list(group_by)
+    stats_list = list()
+    groups = sorted(stats.keys()) if group_by else stats.keys()
+    for group in groups:
+        group_stats = stats[group]
+        for question, col_stats in group_stats.items():
+            total = sum(col_stats.values())
+            if not group_by:
+                logger.info("Stats for: {}".format(question))
+            for answer, count in most_common(col_stats):
+                if not group_by:
+                    logger.info(
+                        "{}: {:20} -- counts: {:10} / {} ({:.2f} %)".format(
+                            log_label, answer, count, total,
+                            100 * count / total))
+                stats_list.append(
+                    list(group) +
+                    [question, answer, count, total,
+                     round(100 * count / total, 1)])
+    return pd.DataFrame(stats_list, columns=group_by + STATS_COLS)
+
+
+def read_report_header(path):
+    """ Read the column names of a report """
+    return pd.read_csv(path, dtype='str', nrows=0).columns.tolist()
+
+
+def create_report_stats(
+        report_path, cols, convert_functions=None, row_masks_function=None,
+        group_by=None, chunksize=None):
+    """ Compute stats over a report
+        Args:
+        - report_path: path to the report (csv)
+        - cols: columns to count values of
+        - convert_functions: dict {col: function} to convert values with
+          before counting
+        - row_masks_function: function(df) returning a dict
+          {col: boolean Series} selecting the rows to count per column
+        - group_by: list of columns to additionally break down the stats by
+        - chunksize: read the report in chunks of 'chunksize' rows
+        Returns:
+        - (stats, grouped_stats): {group: {col: {answer: count}}}, the group
+          of 'stats' is () - 'grouped_stats' is None if no 'group_by'
+    """
+    stats = OrderedDict()
+    grouped_stats = OrderedDict() if group_by else None
+    n_rows = 0
+    for df in read_report_chunks(report_path, chunksize):
+        row_masks = None
+        if row_masks_function is not None:
+            row_masks = row_masks_function(df)
+        update_column_stats(
+            stats, df, cols, convert_functions=convert_functions,
+            row_masks=row_masks)
+        if group_by:
+            update_column_stats(
+                grouped_stats, df, cols, convert_functions=convert_functions,
+                row_masks=row_masks, group_by=group_by)
+        n_rows += df.shape[0]
+        logger.debug("Processed {} rows".format(n_rows))
+    logger.info("Computed stats over {} rows of {}".format(
+        n_rows, report_path))
+    return stats, grouped_stats
@@ -23,6 +23,14 @@ if __name__ == '__main__':
     parser.add_argument("--report_csv", type=str, required=True)
     parser.add_argument("--output_csv", type=str, required=True)
     parser.add_argument("--sample_size", type=int, required=True)
+    parser.add_argument(
+        "--stratify_by", nargs='+', default=[],
+        help="Additional columns to balance the sample by, e.g. \
+              'season site' samples each species/season/site \
+              combination as balanced as possible.")
+    parser.add_argument(
+        "--seed", type=int, default=None,
+        help="Seed for reproducible samples (default: random).")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
@@ -60,18 +68,21 @@ if __name__ == '__main__':
     df_report.fillna('', inplace=True)
 
     # get main answer of each record to sample from it
-    main_answers = df_report[question_main_id]
-
-    _ids_all = [i for i in range(0, df_report.shape[0])]
-
-    _ids_sampled = \
-        balanced_sample_best_effort(
-            main_answers, args['sample_size'])
-
-    _ids_sampled_mapped = [_ids_all[i] for i in _ids_sampled]
+    strata_cols = [question_main_id] + args['stratify_by']
+    for col in strata_cols:
+        if col not in df_report.columns:
+            raise ValueError(
+                "column {} not found in {}".format(col, args['report_csv']))
+    if len(strata_cols) > 1:
+        strata = df_report[strata_cols]
+    else:
+        strata = df_report[question_main_id]
+
+    _ids_sampled = balanced_sample_best_effort(
+        strata, args['sample_size'], seed=args['seed'])
 
     # keep only specific rows
-    df_sampled = df_report.iloc[_ids_sampled_mapped, :]
+    df_sampled = df_report.iloc[_ids_sampled, :]
 
     # export df
     df_sampled.to_csv(args['output_csv'], index=False)
@@ -3,6 +3,8 @@ import logging
 from datetime import datetime
 from collections import OrderedDict
 
+import pandas as pd
+
 from config.cfg import cfg
 
 logger = logging.getLogger(__name__)
@@ -78,33 +80,91 @@ def exclude_cols(cols, not_in):
     return [c for c in cols if not any([c.startswith(n) for n in not_in])]
 
 
+# columns of the per-capture season data
+SEASON_DATA_COLS = [
+    'capture_id', 'season', 'site', 'roll', 'capture',
+    'capture_date_local', 'capture_time_local']
+
+
+def _split_datetime_col(values):
+    """ Split a column of date strings with unknown format into date and
+        time columns ('' if the format is unknown)
+        - each unique value is parsed once with '_get_datetime_obj'
+    """
+    date_time_map = dict()
+    for value in values.unique():
+        try:
+            time_obj = _get_datetime_obj(value)
+            date_time_map[value] = (
+                time_obj.strftime("%Y-%m-%d"), time_obj.strftime("%H:%M:%S"))
+        except:
+            date_time_map[value] = ('', '')
+    dates = values.map({k: v[0] for k, v in date_time_map.items()})
+    times = values.map({k: v[1] for k, v in date_time_map.items()})
+    return dates, times
+
+
+def _extract_datetime_cols(captures_df):
+    """ Extract Date and Time columns from Cleaned Season Data
+        - vectorized '_extract_datetime', date and time are '' if either
+          could not be extracted
+    """
+    cols = captures_df.columns
+    datetime_col = None
+    if 'timestamp' in cols:
+        datetime_col = 'timestamp'
+    elif all([x in cols for x in ['date', 'time']]):
+        dates = captures_df['date']
+        times = captures_df['time']
+    elif 'datetime' in cols:
+        datetime_col = 'datetime'
+    elif 'datetime_file_creation' in cols:
+        datetime_col = 'datetime_file_creation'
+    else:
+        dates = pd.Series('', index=captures_df.index)
+        times = pd.Series('', index=captures_df.index)
+    if datetime_col is not None:
+        dates, times = _split_datetime_col(captures_df[datetime_col])
+    failed = (dates == '') | (times == '')
+    dates = dates.where(~failed, '')
+    times = times.where(~failed, '')
+    return dates, times, failed
+
+
+def create_season_df(season_data_df):
+    """ Create a DataFrame with one row per capture (first image of each
+        capture) with columns SEASON_DATA_COLS
+    """
+    if 'capture_id' in season_data_df.columns:
+        capture_ids = season_data_df['capture_id']
+    else:
+        capture_ids = season_data_df['season'].str.cat(
+            season_data_df[['site', 'roll', 'capture']], sep='#')
+    is_first_image = ~capture_ids.duplicated()
+    captures_df = season_data_df[is_first_image]
+    dates, times, failed = _extract_datetime_cols(captures_df)
+    if failed.any():
+        logger.info("Failed to extract date/time for {} captures".format(
+            failed.sum()))
+        logger.debug("Captures: {}".format(
+            capture_ids[is_first_image][failed].tolist()))
+    season_df = pd.DataFrame({
+        'capture_id': capture_ids[is_first_image],
+        'season': captures_df['season'],
+        'site': captures_df['site'],
+        'roll': captures_df['roll'],
+        'capture': captures_df['capture'],
+        'capture_date_local': dates,
+        'capture_time_local': times},
+        columns=SEASON_DATA_COLS)
+    season_df.reset_index(drop=True, inplace=True)
+    return season_df
+
+
 def create_season_dict(season_data_df):
     """ Create Dict of Season Data """
     season_dict = OrderedDict()
-    season_dict_input = season_data_df.to_dict(orient='index')
-    for _id, image_record in season_dict_input.items():
-        try:
-            capture_id = image_record['capture_id']
-        except:
-            capture_id = '#'.join([
-                image_record['season'],
-                image_record['site'],
-                image_record['roll'],
-                image_record['capture']])
-        if capture_id not in season_dict:
-            try:
-                date_time = _extract_datetime(image_record)
-            except:
-                date_time = {'date': '', 'time': ''}
-                logger.info("Failed to extract date/time for {}".format(
-                    capture_id))
-                logger.debug("Full record: {}".format(image_record))
-            season_dict[capture_id] = {
-                'capture_id': capture_id,
-                'season': image_record['season'],
-                'site': image_record['site'],
-                'roll': image_record['roll'],
-                'capture': image_record['capture'],
-                'capture_date_local': date_time['date'],
-                'capture_time_local': date_time['time']}
+    season_df = create_season_df(season_data_df)
+    for record in season_df.to_dict(orient='records'):
+        season_dict[record['capture_id']] = record
     return season_dict
@@ -0,0 +1,131 @@
+""" Test Synthetic Data Generators for Benchmarks """
+import unittest
+import os
+import csv
+import json
+import logging
+import tempfile
+import shutil
+import filecmp
+from collections import Counter
+
+from PIL import Image
+
+from benchmarks import generators
+from benchmarks.run_benchmarks import compare_results, BENCHMARKS
+from zooniverse_exports import extractor
+from zooniverse_exports.extract_annotations import extract_raw_classification
+from pre_processing.utils import read_image_inventory
+from pre_processing.group_inventory_into_captures import (
+    group_inventory_into_captures)
+from config.cfg import cfg_default as cfg
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.ERROR)
+
+
+def _read_csv(path):
+    with open(path, 'r') as f:
+        return list(csv.DictReader(f))
+
+
+class GeneratorsTests(unittest.TestCase):
+    """ Test Synthetic Data Generators for Benchmarks """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def testSameSeedIdenticalFiles(self):
+        for dataset in ['classifications', 'annotations', 'inventory']:
+            generate = generators.DATASETS[dataset]
+            generate(self._path('a.csv'), 200, seed=3)
+            generate(self._path('b.csv'), 200, seed=3)
+            generate(self._path('c.csv'), 200, seed=4)
+            self.assertTrue(filecmp.cmp(
+                self._path('a.csv'), self._path('b.csv'), shallow=False))
+            self.assertFalse(filecmp.cmp(
+                self._path('a.csv'), self._path('c.csv'), shallow=False))
+
+    def testClassificationsCanBeExtracted(self):
+        path = self._path('classifications.csv')
+        generators.generate_classifications_csv(path, 300, seed=1)
+        classifications = _read_csv(path)
+        self.assertGreaterEqual(len(classifications), 300)
+        args = {'filter_by_season': 'SER_S1'}
+        stats = Counter()
+        duplicate_tracker = set()
+        extracted = list()
+        for cl in classifications:
+            self.assertTrue(
+                extractor.is_eligible_workflow(cl, '4979', None))
+            subject_data = json.loads(cl['subject_data'])
+            self.assertEqual(
+                extractor.get_season_from_subject_data(
+                    subject_data, cl['subject_ids']), 'SER_S1')
+            if extractor.subject_already_seen(cl):
+                continue
+            if extractor.classification_is_duplicate(cl, duplicate_tracker):
+                continue
+            extracted += extract_raw_classification(cl, args, stats)
+        self.assertGreaterEqual(len(extracted), 300 * 0.9)
+        species = Counter(
+            answer['species'] for x in extracted for answer in x['annos']
+            if 'species' in answer)
+        self.assertIn('blank', species)
+        self.assertGreater(len(species), 5)
+
+    def testInventoryCanBeGrouped(self):
+        path = self._path('inventory.csv')
+        generators.generate_inventory_csv(path, 500, seed=2)
+        inventory = read_image_inventory(path)
+        self.assertEqual(len(inventory), 500)
+        captures = group_inventory_into_captures(
+            inventory, cfg['pre_processing_flags'])
+        n_captures = len({x['capture_id'] for x in captures.values()})
+        self.assertGreater(n_captures, 500 / 3)
+        self.assertLess(n_captures, 500)
+
+    def testImagesCanBeOpened(self):
+        roll_dirs = generators.generate_album(
+            self._path('SER_S1'), 5, seed=0, images_per_roll=2,
+            image_size=(64, 48))
+        self.assertEqual(len(roll_dirs), 3)
+        images = [os.path.join(roll_dir, x)
+                  for roll_dir in roll_dirs for x in os.listdir(roll_dir)]
+        self.assertEqual(len(images), 5)
+        for image in images:
+            with Image.open(image) as img:
+                self.assertEqual(img.size, (64, 48))
+
+    def testBenchmarksHaveAllScales(self):
+        for benchmark in BENCHMARKS:
+            if benchmark.name.startswith('startup_'):
+                self.assertEqual(list(benchmark.scales), ['small'])
+                self.assertEqual(benchmark.inputs('', 1, 0), [])
+                continue
+            self.assertEqual(
+                sorted(benchmark.scales), ['large', 'medium', 'small'])
+
+    def testCompareResults(self):
+        previous = {'results': [
+            {'benchmark': 'a', 'scale': 'small', 'wall_time_s': 1.0},
+            {'benchmark': 'b', 'scale': 'small', 'wall_time_s': 1.0},
+            {'benchmark': 'c', 'scale': 'small', 'wall_time_s': 1.0}]}
+        current = {'results': [
+            {'benchmark': 'a', 'scale': 'small', 'wall_time_s': 1.1},
+            {'benchmark': 'b', 'scale': 'small', 'wall_time_s': 1.5},
+            {'benchmark': 'c', 'scale': 'small', 'wall_time_s': None},
+            {'benchmark': 'd', 'scale': 'small', 'wall_time_s': 9.0}]}
+        self.assertEqual(
+            compare_results(previous, current, max_slowdown=1.2),
+            [('b', 'small', 1.0, 1.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+""" Test Reading Config Files """
+import unittest
+import os
+import tempfile
+import shutil
+
+from config.cfg import load_yaml, cfg_default
+
+
+class ConfigTests(unittest.TestCase):
+    """ Test Reading Config Files """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.yaml_path = os.path.join(self.tmp_dir, 'test.yaml')
+        with open(self.yaml_path, 'w') as f:
+            f.write('a:\n  b: 1\n  c: [x, y]\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testDefaultConfigLoaded(self):
+        self.assertIn('pre_processing_flags', cfg_default)
+
+    def testLoadYaml(self):
+        self.assertEqual(
+            load_yaml(self.yaml_path), {'a': {'b': 1, 'c': ['x', 'y']}})
+
+    def testSafeLoader(self):
+        with open(self.yaml_path, 'w') as f:
+            f.write('a: !!python/object/apply:os.getcwd []\n')
+        with self.assertRaises(Exception):
+            load_yaml(self.yaml_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
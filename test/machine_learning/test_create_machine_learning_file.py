@@ -0,0 +1,62 @@
+""" Test Creating Machine Learning Input Files """
+import unittest
+import os
+import csv
+import tempfile
+import shutil
+
+import pandas as pd
+
+from machine_learning.create_machine_learning_file import (
+    create_capture_images_df, write_capture_images_csv, shard_path)
+
+
+class CreateMachineLearningFileTests(unittest.TestCase):
+    """ Test Creating Machine Learning Input Files """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.season_df = pd.DataFrame({
+            'capture_id': ['S1#A#1#2', 'S1#A#1#2', 'S1#A#1#2', 'S1#A#1#2',
+                           'S1#A#1#10', 'S1#B#1#1', 'S1#B#1#1'],
+            'path': ['a1', 'a2', 'a3', 'a4', 'b1', 'c1', 'c2']})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testFirstImagesPerCapture(self):
+        df = create_capture_images_df(self.season_df, 3)
+        self.assertEqual(
+            df.values.tolist(),
+            [['S1#A#1#2', 'a1', 'a2', 'a3'],
+             ['S1#A#1#10', 'b1', '', ''],
+             ['S1#B#1#1', 'c1', 'c2', '']])
+        self.assertEqual(
+            df.columns.tolist(), ['capture_id', 'image1', 'image2', 'image3'])
+
+    def testMoreImageColsThanImages(self):
+        df = create_capture_images_df(self.season_df, 5)
+        self.assertEqual(df.shape, (3, 6))
+        self.assertEqual(df['image5'].tolist(), ['', '', ''])
+
+    def testEmpty(self):
+        df = create_capture_images_df(self.season_df.iloc[0:0], 2)
+        self.assertEqual(df.shape, (0, 3))
+
+    def testWriteCsv(self):
+        path = os.path.join(self.tmp_dir, 'ml_input.csv')
+        write_capture_images_csv(
+            create_capture_images_df(self.season_df, 2), path)
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['capture_id', 'image1', 'image2'])
+        self.assertEqual(rows[2], ['S1#A#1#10', 'b1', ''])
+
+    def testShardPath(self):
+        self.assertEqual(
+            shard_path('/a/SER_S1_machine_learning_input.csv', 2),
+            '/a/SER_S1_machine_learning_input_shard_2.csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
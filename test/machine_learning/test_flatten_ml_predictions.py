@@ -0,0 +1,131 @@
+""" Test Flattening ML Predictions """
+import unittest
+import os
+import json
+import random
+import tempfile
+import shutil
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from machine_learning.flatten_ml_predictions import (
+    flatten_predictions_files, write_flat_predictions)
+from machine_learning.flatten_preds import (
+    flatten_ml_empty_preds, flatten_ml_species_preds)
+from utils.utils import sort_df_by_capture_id
+
+
+class FlattenMLPredictionsTests(unittest.TestCase):
+    """ Test Flattening ML Predictions """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        random.seed(11)
+        self.preds_empty = OrderedDict()
+        self.preds_species = OrderedDict()
+        for i in range(200):
+            capture_id = 'SER_S{}#B04#{}#{}'.format(
+                random.choice([1, 2]), random.randint(1, 2),
+                random.randint(1, 300))
+            if random.random() < 0.8:
+                self.preds_empty[capture_id] = self._empty_preds()
+            if random.random() < 0.8:
+                self.preds_species[capture_id] = self._species_preds()
+        self.path_empty = os.path.join(self.tmp_dir, 'empty.json')
+        self.path_species = os.path.join(self.tmp_dir, 'species.json')
+        with open(self.path_empty, 'w') as f:
+            json.dump(self.preds_empty, f)
+        with open(self.path_species, 'w') as f:
+            json.dump(self.preds_species, f, indent=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _conf(self):
+        return '{:.3f}'.format(random.random())
+
+    def _empty_preds(self):
+        if random.random() < 0.5:
+            return {'aggregated_pred': {
+                'empty': {'empty': self._conf(), 'species': self._conf()}}}
+        return {
+            'predictions_top': {'is_blank': random.choice(['0', '1'])},
+            'aggregated_pred': {
+                'is_blank': {'0': self._conf(), '1': self._conf()}}}
+
+    def _species_preds(self):
+        species = random.sample(['zebra', 'lionfemale', 'gazelle'], 3)
+        aggregated_pred = OrderedDict([
+            ('species', {x: self._conf() for x in species}),
+            ('standing', {'0': self._conf(), '1': self._conf()})])
+        if random.random() < 0.1:
+            aggregated_pred['young'] = {'0': self._conf(), '1': self._conf()}
+        # duplicate column: machine_confidence_species_zebra
+        if random.random() < 0.1:
+            aggregated_pred['species_zebra'] = {
+                '0': self._conf(), '1': self._conf()}
+        labels = list(aggregated_pred.keys())
+        random.shuffle(labels)
+        aggregated_pred = OrderedDict((x, aggregated_pred[x]) for x in labels)
+        return {
+            'predictions_top': {
+                x: random.choice(list(aggregated_pred[x])) for x in labels},
+            'confidences_top': {x: self._conf() for x in labels},
+            'aggregated_pred': aggregated_pred}
+
+    def _expected_df(self):
+        """ Reference: flatten into one dict per capture """
+        all_preds = OrderedDict()
+        for capture_id, empty_preds in self.preds_empty.items():
+            all_preds[capture_id] = flatten_ml_empty_preds(empty_preds)
+        for capture_id, species_preds in self.preds_species.items():
+            flat_species = flatten_ml_species_preds(species_preds)
+            try:
+                all_preds[capture_id].update(flat_species)
+            except KeyError:
+                all_preds[capture_id] = flat_species
+        df = pd.DataFrame.from_dict(all_preds, orient='index')
+        df.index.name = 'capture_id'
+        sort_df_by_capture_id(df)
+        return df
+
+    def testIdenticalToDictFlattening(self):
+        expected_path = os.path.join(self.tmp_dir, 'expected.csv')
+        self._expected_df().to_csv(expected_path, index=True)
+        actual_path = os.path.join(self.tmp_dir, 'actual.csv')
+        df = flatten_predictions_files([self.path_empty], [self.path_species])
+        write_flat_predictions(df, actual_path)
+        with open(expected_path) as f_expected:
+            with open(actual_path) as f_actual:
+                self.assertEqual(f_actual.read(), f_expected.read())
+
+    def testMultipleFiles(self):
+        capture_ids = list(self.preds_species.keys())
+        paths = list()
+        for i, ids in enumerate([capture_ids[:50], capture_ids[50:]]):
+            paths.append(os.path.join(self.tmp_dir, 'shard_{}.json'.format(i)))
+            with open(paths[-1], 'w') as f:
+                json.dump({x: self.preds_species[x] for x in ids}, f)
+        df_shards = flatten_predictions_files([self.path_empty], paths)
+        df = flatten_predictions_files([self.path_empty], [self.path_species])
+        self.assertTrue(df_shards.equals(df))
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def testParquetOutput(self):
+        path = os.path.join(self.tmp_dir, 'actual.parquet')
+        df = flatten_predictions_files([self.path_empty], [self.path_species])
+        write_flat_predictions(df, path)
+        actual = pd.read_parquet(path)
+        self.assertEqual(list(actual.columns), list(df.columns))
+        pd.testing.assert_frame_equal(
+            actual, df.reset_index(drop=True), check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
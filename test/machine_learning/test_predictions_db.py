@@ -0,0 +1,103 @@
+""" Test Storing Flattened Predictions """
+import unittest
+import os
+import json
+import sqlite3
+import tempfile
+import shutil
+
+from machine_learning.predictions_db import (
+    create_predictions_db, count_predictions, predictions_db_is_current,
+    find_flat_empty_preds, find_flat_species_preds)
+from machine_learning.flatten_preds import (
+    flatten_ml_empty_preds, flatten_ml_species_preds)
+from utils.utils import iter_json_object_items
+
+
+class PredictionsDbTests(unittest.TestCase):
+    """ Test Predictions DB """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.preds_empty = {
+            'SER_S1#B04#1#{}'.format(i): {
+                'aggregated_pred': {
+                    'empty': {'empty': '0.0030', 'species': '0.9970'}}}
+            for i in range(0, 20, 2)}
+        self.preds_species = {
+            'SER_S1#B04#1#{}'.format(i): {
+                'predictions_top': {'species': 'zebra', 'count': '1'},
+                'confidences_top': {'species': '0.91', 'count': '0.62'},
+                'aggregated_pred': {
+                    'species': {'zebra': '0.91', 'lionfemale': '0.09'},
+                    'standing': {'0': '0.25', '1': '0.75'}}}
+            for i in range(0, 20, 3)}
+        self.path_empty = os.path.join(self.tmp_dir, 'empty.json')
+        self.path_species = os.path.join(self.tmp_dir, 'species.json')
+        with open(self.path_empty, 'w') as f:
+            json.dump(self.preds_empty, f)
+        with open(self.path_species, 'w') as f:
+            json.dump(self.preds_species, f, indent=2)
+        self.db_path = os.path.join(self.tmp_dir, 'preds.sqlite')
+        create_predictions_db(
+            self.db_path, self.path_empty, self.path_species)
+        self.conn = sqlite3.connect(self.db_path)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def testIncrementalJsonParsing(self):
+        for chunk_size in (1, 7, 1024):
+            actual = dict(iter_json_object_items(
+                self.path_species, chunk_size=chunk_size))
+            self.assertEqual(actual, self.preds_species)
+
+    def testCounts(self):
+        self.assertEqual(count_predictions(self.conn), (10, 7))
+
+    def testIdenticalToFlattenPreds(self):
+        for capture_id, preds in self.preds_empty.items():
+            self.assertEqual(
+                find_flat_empty_preds(self.conn, capture_id),
+                flatten_ml_empty_preds(preds))
+        for capture_id, preds in self.preds_species.items():
+            for only_top in (True, False):
+                expected = flatten_ml_species_preds(preds, only_top=only_top)
+                actual = find_flat_species_preds(
+                    self.conn, capture_id, only_top=only_top)
+                self.assertEqual(
+                    list(actual.items()), list(expected.items()))
+
+    def testMissingCapture(self):
+        self.assertIsNone(find_flat_empty_preds(self.conn, 'SER_S1#B04#1#1'))
+        self.assertIsNone(
+            find_flat_species_preds(self.conn, 'SER_S1#B04#1#1'))
+
+    def testIsCurrent(self):
+        self.assertTrue(predictions_db_is_current(
+            self.db_path, self.path_empty, self.path_species))
+        self.assertFalse(predictions_db_is_current(
+            self.db_path, self.path_species, self.path_empty))
+        self.assertFalse(predictions_db_is_current(
+            os.path.join(self.tmp_dir, 'missing.sqlite'),
+            self.path_empty, self.path_species))
+        with open(self.path_empty, 'a') as f:
+            f.write('\n')
+        self.assertFalse(predictions_db_is_current(
+            self.db_path, self.path_empty, self.path_species))
+
+    def testNotReplacedIfIncomplete(self):
+        with open(self.path_species, 'w') as f:
+            f.write('{"SER_S1#B04#1#0": {"aggregated_pred": ')
+        with self.assertRaises(Exception):
+            create_predictions_db(
+                self.db_path, self.path_empty, self.path_species)
+        self.assertEqual(count_predictions(self.conn), (10, 7))
+        self.assertEqual(
+            sorted(os.listdir(self.tmp_dir)),
+            ['empty.json', 'preds.sqlite', 'species.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
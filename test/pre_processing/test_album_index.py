@@ -0,0 +1,111 @@
+""" Test the Album Index """
+import unittest
+import os
+import tempfile
+import shutil
+
+from pre_processing.album_index import (
+    open_album_index, update_album_index, list_indexed_files,
+    read_file_results, write_file_results)
+
+
+class AlbumIndexTests(unittest.TestCase):
+    """ Test the Album Index """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root_dir = os.path.join(self.tmp_dir, 'album')
+        for roll_dir in ['A01/A01_R1', 'A01/A01_R2', 'B02/B02_R1']:
+            os.makedirs(os.path.join(self.root_dir, roll_dir))
+            for name in ['IMG1.JPG', 'IMG2.JPG']:
+                self._write(os.path.join(roll_dir, name), b'abc')
+        self.conn = open_album_index(
+            os.path.join(self.tmp_dir, 'index.sqlite'))
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, path_rel, content):
+        with open(os.path.join(self.root_dir, path_rel), 'wb') as f:
+            f.write(content)
+
+    def _path(self, path_rel):
+        return os.path.join(self.root_dir, path_rel)
+
+    def testUpdate(self):
+        stats = update_album_index(self.conn, self.root_dir, n_threads=2)
+        self.assertEqual(stats['new'], 6)
+        files = list_indexed_files(self.conn)
+        self.assertEqual(len(files), 6)
+        self.assertEqual(
+            (files[0].site, files[0].roll_directory, files[0].name,
+             files[0].size),
+            ('A01', 'A01_R1', 'IMG1.JPG', 3))
+        # no changes
+        stats = update_album_index(self.conn)
+        self.assertEqual(sum(stats.values()), 0)
+        # new roll, removed image
+        os.makedirs(self._path('B02/B02_R2'))
+        self._write('B02/B02_R2/IMG1.JPG', b'abcd')
+        os.remove(self._path('A01/A01_R2/IMG1.JPG'))
+        shutil.rmtree(self._path('A01/A01_R1'))
+        stats = update_album_index(self.conn)
+        self.assertEqual((stats['new'], stats['removed']), (1, 3))
+        new_files = list_indexed_files(self.conn, since_scan_id=2)
+        self.assertEqual(
+            [x.path for x in new_files], [self._path('B02/B02_R2/IMG1.JPG')])
+
+    def testChangedFileInvalidatesResults(self):
+        update_album_index(self.conn, self.root_dir)
+        paths = [x.path for x in list_indexed_files(self.conn)]
+        write_file_results(
+            self.conn, 'test', {x: {'checked': 1} for x in paths})
+        write_file_results(self.conn, 'test', {'not_indexed': 1})
+        self.assertEqual(len(read_file_results(self.conn, 'test')), 6)
+        # modified in place - only detected with a full scan
+        self._write('A01/A01_R1/IMG1.JPG', b'abcdef')
+        stats = update_album_index(self.conn, full_scan=True)
+        self.assertEqual(stats['changed'], 1)
+        results = read_file_results(self.conn, 'test')
+        self.assertEqual(len(results), 5)
+        self.assertNotIn(self._path('A01/A01_R1/IMG1.JPG'), results)
+
+    def testModifiedInPlaceDetectedOnRead(self):
+        update_album_index(self.conn, self.root_dir)
+        paths = [x.path for x in list_indexed_files(self.conn)]
+        write_file_results(
+            self.conn, 'test', {x: {'checked': 1} for x in paths})
+        # modified in place - the roll directory mtime does not change
+        path = self._path('A01/A01_R1/IMG1.JPG')
+        dir_mtime = os.stat(os.path.dirname(path)).st_mtime
+        self._write('A01/A01_R1/IMG1.JPG', b'abcdef')
+        os.utime(path, (0, 12345))
+        os.utime(os.path.dirname(path), (dir_mtime, dir_mtime))
+        self.assertEqual(sum(update_album_index(self.conn).values()), 0)
+        self.assertEqual(
+            len(read_file_results(self.conn, 'test', verify=False)), 6)
+        results = read_file_results(self.conn, 'test')
+        self.assertEqual(len(results), 5)
+        self.assertNotIn(path, results)
+        # the index has the new stats, new results are kept
+        changed = [x for x in list_indexed_files(self.conn) if x.path == path]
+        self.assertEqual((changed[0].size, changed[0].mtime), (6, 12345))
+        write_file_results(self.conn, 'test', {path: {'checked': 2}})
+        self.assertEqual(
+            read_file_results(self.conn, 'test')[path], {'checked': 2})
+
+    def testMissingIndex(self):
+        path = os.path.join(self.tmp_dir, 'missing.sqlite')
+        with self.assertRaises(FileNotFoundError):
+            open_album_index(path, create=False)
+        self.assertFalse(os.path.exists(path))
+
+    def testOtherRootDir(self):
+        update_album_index(self.conn, self.root_dir)
+        with self.assertRaises(ValueError):
+            update_album_index(self.conn, self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+""" Test Scanning Album Directories """
+import unittest
+import os
+import tempfile
+import shutil
+
+from pre_processing.directory_scanner import scan_album, scan_directories
+from pre_processing.utils import datetime_file_creation
+
+
+class DirectoryScannerTests(unittest.TestCase):
+    """ Test Scanning Album Directories """
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.files = {
+            ('A01', 'A01_R1'): {'IMG1.JPG': b'abc', 'IMG2.JPG': b'abcd'},
+            ('A01', 'A01_R2'): {'IMG1.JPG': b''},
+            ('B02', 'B02_R1'): {'notes.txt': b'x'}}
+        for (site, roll), files in self.files.items():
+            roll_dir = os.path.join(self.root_dir, site, roll)
+            os.makedirs(roll_dir)
+            for name, content in files.items():
+                with open(os.path.join(roll_dir, name), 'wb') as f:
+                    f.write(content)
+        # no directory
+        with open(os.path.join(self.root_dir, 'readme.txt'), 'w') as f:
+            f.write('x')
+        os.makedirs(os.path.join(self.root_dir, 'B02', 'B02_R1', 'sub'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def testScanAlbum(self):
+        listing = scan_album(self.root_dir, n_threads=2, stat_files=True)
+        self.assertEqual(
+            sorted((x.name, x.is_dir) for x in listing.sites),
+            [('A01', True), ('B02', True), ('readme.txt', False)])
+        self.assertEqual(
+            sorted((x.site, x.name) for x in listing.rolls),
+            sorted(self.files.keys()))
+        files = {(x.site, x.roll_directory, x.name): x for x in listing.files}
+        self.assertEqual(len(files), 5)
+        img = files[('A01', 'A01_R1', 'IMG2.JPG')]
+        self.assertEqual(img.size, 4)
+        self.assertTrue(img.is_file)
+        self.assertEqual(
+            img.path,
+            os.path.join(self.root_dir, 'A01', 'A01_R1', 'IMG2.JPG'))
+        self.assertEqual(img.creation_time, datetime_file_creation(img.path))
+        self.assertFalse(files[('B02', 'B02_R1', 'sub')].is_file)
+
+    def testScanAlbumWithoutStat(self):
+        listing = scan_album(self.root_dir, n_threads=2)
+        files = {(x.site, x.roll_directory, x.name): x for x in listing.files}
+        self.assertEqual(len(files), 5)
+        img = files[('A01', 'A01_R1', 'IMG2.JPG')]
+        self.assertTrue(img.is_file)
+        self.assertEqual((img.size, img.mtime, img.creation_time),
+                         (None, None, None))
+
+    def testScanDirectories(self):
+        directories = [
+            os.path.join(self.root_dir, 'A01', 'A01_R2'),
+            os.path.join(self.root_dir, 'A01', 'A01_R1')]
+        files = scan_directories(directories, n_threads=1, stat_files=True)
+        self.assertEqual(
+            [(x.roll_directory, x.name, x.size) for x in files][0],
+            ('A01_R2', 'IMG1.JPG', 0))
+        self.assertEqual(len(files), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
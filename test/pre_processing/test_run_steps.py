@@ -0,0 +1,127 @@
+""" Test running Pre-Processing Steps in Memory """
+import unittest
+import os
+import logging
+import tempfile
+import shutil
+from unittest.mock import patch
+
+import pandas as pd
+
+from pre_processing.utils import (
+    read_image_inventory, export_inventory_to_csv, inventory_as_exported)
+from pre_processing.run_steps import run_steps, check_steps
+from pre_processing.group_inventory_into_captures import (
+    group_inventory_into_captures, FIRST_COLS_TO_EXPORT)
+from pre_processing.generate_actions import generate_actions
+from pre_processing.apply_actions import apply_actions
+from pre_processing.update_captures import update_captures
+import pre_processing.update_captures as update_captures_step
+from pre_processing.create_captures_cleaned import create_captures_cleaned
+from config.cfg import cfg_default as cfg
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.ERROR)
+
+
+flags = cfg['pre_processing_flags']
+
+
+class RunStepsTests(unittest.TestCase):
+    """ Test running Pre-Processing Steps in Memory """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_inventory = './test/files/test_inventory.csv'
+        self.file_action_list = './test/files/test_action_list.csv'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _round_trip(self, inventory, first_cols, unique_id):
+        path = os.path.join(self.tmp_dir, 'round_trip.csv')
+        export_inventory_to_csv(inventory, path, first_cols=first_cols)
+        return read_image_inventory(path, unique_id=unique_id)
+
+    def testInventoryAsExported(self):
+        inventory = {
+            'b': {'image_name': 'b', 'capture': 2, 'seconds': 1.5,
+                  'check': 'NA'},
+            'a': {'image_name': 'a', 'capture': 10, 'seconds': 0,
+                  'check': None}}
+        expected = self._round_trip(
+            inventory, first_cols=['capture'], unique_id='image_name')
+        self.assertEqual(
+            inventory_as_exported(
+                inventory, first_cols=['capture'], unique_id='image_name'),
+            expected)
+        self.assertEqual(list(expected.keys()), ['b', 'a'])
+        self.assertEqual(
+            expected['a'],
+            {'capture': '10', 'image_name': 'a', 'seconds': '0.0',
+             'check': ''})
+
+    def testCheckSteps(self):
+        check_steps(['generate_actions', 'apply_actions'])
+        with self.assertRaises(ValueError):
+            check_steps(['group_inventory_into_captures', 'update_captures'])
+        with self.assertRaises(ValueError):
+            check_steps(['apply_actions', 'generate_actions'])
+        with self.assertRaises(ValueError):
+            check_steps([])
+
+    def testCheckStepsRequiresReviewedActionList(self):
+        check_steps(['group_inventory_into_captures', 'create_action_list'])
+        with self.assertRaises(ValueError):
+            check_steps(['create_action_list', 'generate_actions'])
+        with self.assertRaises(ValueError):
+            check_steps(
+                ['group_inventory_into_captures', 'create_action_list',
+                 'generate_actions', 'apply_actions'])
+
+    @patch('pre_processing.actions.os.remove')
+    def testIdenticalToSingleSteps(self, mock_remove):
+        # each step separately with csv round-trips
+        inventory = read_image_inventory(self.file_inventory)
+        captures = self._round_trip(
+            group_inventory_into_captures(inventory, flags),
+            FIRST_COLS_TO_EXPORT, 'image_name')
+        action_list = read_image_inventory(
+            self.file_action_list, unique_id=None)
+        actions = generate_actions(action_list, captures)
+        captures = self._round_trip(
+            apply_actions(actions, captures, flags),
+            ['season', 'site', 'roll', 'image_rank_in_roll',
+             'capture', 'image_rank_in_capture'], 'image_name')
+        path = os.path.join(self.tmp_dir, 'captures_updated.csv')
+        export_inventory_to_csv(
+            update_captures(captures, flags), path,
+            first_cols=update_captures_step.FIRST_COLS_TO_EXPORT)
+        df = pd.read_csv(path, dtype='str').fillna('')
+        expected = create_captures_cleaned(df, flags)
+
+        # steps in memory
+        inventory = read_image_inventory(self.file_inventory)
+        captures = run_steps(
+            ['group_inventory_into_captures'], inventory, flags)
+        cleaned = run_steps(
+            ['generate_actions', 'apply_actions', 'update_captures',
+             'create_captures_cleaned'],
+            inventory_as_exported(
+                captures, first_cols=FIRST_COLS_TO_EXPORT,
+                unique_id='image_name'),
+            flags,
+            action_list=read_image_inventory(
+                self.file_action_list, unique_id=None),
+            audit_dir=self.tmp_dir)
+        self.assertEqual(
+            cleaned.to_csv(index=False), expected.to_csv(index=False))
+        for step in ['generate_actions', 'apply_actions', 'update_captures']:
+            self.assertTrue(os.path.isfile(
+                os.path.join(self.tmp_dir, '{}.csv'.format(step))))
+        self.assertFalse(os.path.isfile(
+            os.path.join(self.tmp_dir, 'create_captures_cleaned.csv')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+""" Test Creating Zooniverse Reports """
+import unittest
+
+import pandas as pd
+
+from reporting.create_zooniverse_report import (
+    deduplicate_captures, select_aggregations, create_report)
+from reporting.utils import create_season_df, create_season_dict
+
+
+class CreateZooniverseReportTests(unittest.TestCase):
+    """ Test Report Creation """
+
+    def setUp(self):
+        self.season_data_df = pd.DataFrame([
+            ['SER_S1#B04#1#1', 'SER_S1', 'B04', '1', '1', '1',
+             '2010-07-18', '16:26:14'],
+            ['SER_S1#B04#1#1', 'SER_S1', 'B04', '1', '1', '2',
+             '2010-07-18', '16:26:15'],
+            ['SER_S1#B04#1#2', 'SER_S1', 'B04', '1', '2', '1',
+             '2010-07-19', '06:00:00'],
+            ['SER_S1#B04#1#3', 'SER_S1', 'B04', '1', '3', '1',
+             '', '06:00:00'],
+            ['SER_S1#B04#1#4', 'SER_S1', 'B04', '1', '4', '1',
+             '2010-07-20', '06:00:00']],
+            columns=['capture_id', 'season', 'site', 'roll', 'capture',
+                     'image_rank_in_capture', 'date', 'time'])
+        self.df_aggregated = pd.DataFrame([
+            ['ASG1', 'SER_S1#B04#1#1', 'zebra', '1'],
+            ['ASG1', 'SER_S1#B04#1#1', 'wildebeest', '0'],
+            ['ASG9', 'SER_S1#B04#1#1', 'zebra', '1'],
+            ['ASG2', 'SER_S1#B04#1#2', 'blank', '1'],
+            ['ASG4', 'SER_S1#B04#1#4', 'human', '1']],
+            columns=['subject_id', 'capture_id', 'question__species',
+                     'species_is_plurality_consensus'])
+
+    def testCreateSeasonDf(self):
+        season_df = create_season_df(self.season_data_df)
+        self.assertEqual(
+            season_df['capture_id'].tolist(),
+            ['SER_S1#B04#1#1', 'SER_S1#B04#1#2',
+             'SER_S1#B04#1#3', 'SER_S1#B04#1#4'])
+        self.assertEqual(season_df['capture_time_local'][0], '16:26:14')
+        # missing date -> no date / time
+        self.assertEqual(season_df['capture_date_local'][2], '')
+        self.assertEqual(season_df['capture_time_local'][2], '')
+
+    def testLegacyTimestamps(self):
+        df = self.season_data_df.drop(['capture_id', 'date', 'time'], axis=1)
+        df['timestamp'] = [
+            '2010:07:18 16:26:14', '', '2010-07-19 06:00:00Z',
+            '2010-07-19 06:00:00', 'unknown']
+        season_dict = create_season_dict(df)
+        self.assertEqual(
+            list(season_dict['SER_S1#B04#1#1'].values()),
+            ['SER_S1#B04#1#1', 'SER_S1', 'B04', '1', '1',
+             '2010-07-18', '16:26:14'])
+        self.assertEqual(
+            season_dict['SER_S1#B04#1#2']['capture_date_local'],
+            '2010-07-19')
+        self.assertEqual(
+            season_dict['SER_S1#B04#1#4']['capture_date_local'], '')
+
+    def testDeduplicateCaptures(self):
+        df = deduplicate_captures(self.df_aggregated)
+        self.assertNotIn('ASG9', df['subject_id'].tolist())
+        self.assertEqual(df.shape[0], 4)
+
+    def testSelectAggregations(self):
+        df_selected, n_excluded = select_aggregations(
+            self.df_aggregated, 'question__species',
+            exclude_non_consensus=True, exclude_humans=True,
+            exclude_blanks=True)
+        self.assertEqual(n_excluded['non_consensus'], 1)
+        self.assertEqual(n_excluded['humans'], 1)
+        self.assertEqual(n_excluded['blanks'], 1)
+        self.assertEqual(df_selected['subject_id'].tolist(), ['ASG1', 'ASG9'])
+
+    def testCreateReport(self):
+        season_df = create_season_df(self.season_data_df)
+        df_aggregated = deduplicate_captures(self.df_aggregated)
+        df_selected, _ = select_aggregations(
+            df_aggregated, 'question__species', exclude_humans=True)
+        df_report, n_without_data = create_report(
+            season_df, df_aggregated, df_selected)
+        # capture 4 has only excluded aggregations, capture 3 has none
+        self.assertEqual(
+            df_report['capture_id'].tolist(),
+            ['SER_S1#B04#1#1', 'SER_S1#B04#1#1',
+             'SER_S1#B04#1#2', 'SER_S1#B04#1#3'])
+        self.assertEqual(
+            df_report['question__species'].tolist(),
+            ['zebra', 'wildebeest', 'blank', ''])
+        self.assertEqual(
+            list(df_report.columns),
+            list(season_df.columns) +
+            ['subject_id', 'question__species',
+             'species_is_plurality_consensus'])
+        self.assertEqual(n_without_data, 0)
+        df_report, n_without_data = create_report(
+            season_df, df_aggregated, df_selected,
+            exclude_captures_without_data=True)
+        self.assertEqual(df_report.shape[0], 3)
+        self.assertEqual(n_without_data, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
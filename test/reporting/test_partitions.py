@@ -0,0 +1,155 @@
+""" Test Processing Reports in Partitions """
+import unittest
+import os
+import tempfile
+import shutil
+
+import pandas as pd
+
+from reporting.partitions import (
+    capture_id_partition_keys, sorted_partition_keys, partition_csv,
+    map_partitions, concatenate_csv_files, partition_dir)
+from reporting.create_zooniverse_report import (
+    create_report_file, create_report_file_by_partition)
+
+
+def _add(a, b):
+    return a + b
+
+
+class PartitionTests(unittest.TestCase):
+    """ Test Partitioning Csv Files """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testCaptureIdPartitionKeys(self):
+        keys = capture_id_partition_keys(
+            pd.Series(['SER_S1#B04#1#1', 'APN_S1#A#B#2#10']))
+        self.assertEqual(keys.tolist(), ['SER_S1#B04', 'APN_S1#A#B'])
+
+    def testSortedPartitionKeys(self):
+        # partitions are in the order of their sorted capture ids
+        self.assertEqual(
+            sorted_partition_keys(['S1#A', 'S1#A!', 'S1#B', 'S0#C']),
+            ['S0#C', 'S1#A!', 'S1#A', 'S1#B'])
+
+    def testPartitionCsv(self):
+        path = os.path.join(self.tmp_dir, 'input.csv')
+        with open(path, 'w') as f:
+            f.write('capture_id,value\n')
+            f.write('S1#A#1#1,NA\n')
+            f.write('S1#B#1#1,\n')
+            f.write('S1#A#1#2,2\n')
+            f.write('S1#A#1#3,3\n')
+        partitions = partition_csv(
+            path, os.path.join(self.tmp_dir, 'parts'),
+            lambda df: capture_id_partition_keys(df['capture_id']),
+            row_mask_function=lambda df: df['value'] != '3',
+            chunksize=2)
+        self.assertEqual(list(partitions.keys()), ['S1#A', 'S1#B'])
+        with open(partitions['S1#A']) as f:
+            self.assertEqual(
+                f.read(), 'capture_id,value\nS1#A#1#1,NA\nS1#A#1#2,2\n')
+        with open(partitions['S1#B']) as f:
+            self.assertEqual(f.read(), 'capture_id,value\nS1#B#1#1,\n')
+
+    def testConcatenateCsvFiles(self):
+        paths = list()
+        for i in range(3):
+            paths.append(os.path.join(self.tmp_dir, '{}.csv'.format(i)))
+            with open(paths[-1], 'w') as f:
+                f.write('a,b\n')
+                if i > 0:
+                    f.write('{},{}\n'.format(i, i))
+        output_path = os.path.join(self.tmp_dir, 'output.csv')
+        concatenate_csv_files(paths, output_path)
+        with open(output_path) as f:
+            self.assertEqual(f.read(), 'a,b\n1,1\n2,2\n')
+
+    def testMapPartitions(self):
+        tasks = [(i, i) for i in range(5)]
+        self.assertEqual(map_partitions(_add, tasks), [0, 2, 4, 6, 8])
+        self.assertEqual(
+            map_partitions(_add, tasks, n_processes=2), [0, 2, 4, 6, 8])
+
+    def testPartitionDirIsRemoved(self):
+        with partition_dir(self.tmp_dir) as path:
+            self.assertTrue(os.path.isdir(path))
+        self.assertFalse(os.path.exists(path))
+
+
+class PartitionedReportTests(unittest.TestCase):
+    """ Test Partitioned Reports are Identical to Un-Partitioned Reports """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        season_rows = list()
+        for season in ['SER_S2', 'SER_S1']:
+            for site in ['C05', 'B04']:
+                for capture in ['2', '1', '10']:
+                    season_rows.append([
+                        season, site, '1', capture, '1',
+                        '{}/{}_R1/IMG_{}.JPG'.format(site, site, capture),
+                        '2010-07-18', '16:26:14'])
+        self.season_captures_csv = os.path.join(self.tmp_dir, 'season.csv')
+        pd.DataFrame(season_rows, columns=[
+            'season', 'site', 'roll', 'capture', 'image_rank_in_capture',
+            'image_path_rel', 'date', 'time']).to_csv(
+                self.season_captures_csv, index=False)
+        self.aggregated_csv = os.path.join(self.tmp_dir, 'aggregated.csv')
+        # ASG9 duplicates a capture of ASG1 (in another partition than
+        # its other capture) and is removed everywhere
+        pd.DataFrame([
+            ['ASG1', 'SER_S1', 'B04', '1', '1', 'zebra', '1'],
+            ['ASG9', '', 'B04', '1', '1', 'zebra', '1'],
+            ['ASG9', 'SER_S2', 'C05', '1', '2', 'zebra', '1'],
+            ['ASG2', 'SER_S2', 'B04', '1', '10', 'blank', '1'],
+            ['ASG3', 'SER_S1', 'C05', '1', '2', 'human', '0'],
+            ['ASG3', 'SER_S1', 'C05', '1', '2', 'lionfemale', '1']],
+            columns=['subject_id', 'season', 'site', 'roll', 'capture',
+                     'question__species', 'species_is_plurality_consensus']
+            ).to_csv(self.aggregated_csv, index=False)
+        self.args = {
+            'season_captures_csv': self.season_captures_csv,
+            'aggregated_csv': self.aggregated_csv,
+            'cache_season_captures': False,
+            'default_season_id': 'SER_S1',
+            'exclude_non_consensus': False,
+            'exclude_humans': False,
+            'exclude_blanks': True,
+            'exclude_captures_without_data': False,
+            'exclude_zooniverse_cols': False,
+            'exclude_zooniverse_urls': False,
+            'exclude_additional_plurality_infos': False,
+            'exclude_cols': [],
+            'tmp_dir': self.tmp_dir}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testIdenticalToUnpartitioned(self):
+        output_csv = os.path.join(self.tmp_dir, 'report.csv')
+        n_excluded = create_report_file(
+            self.season_captures_csv, self.aggregated_csv, output_csv,
+            self.args)
+        with open(output_csv) as f:
+            expected = f.read()
+        self.assertNotIn('ASG9', expected)
+        for n_processes in [1, 2]:
+            args = dict(self.args, n_processes=n_processes)
+            args['output_csv'] = os.path.join(
+                self.tmp_dir, 'report_{}.csv'.format(n_processes))
+            n_excluded_partitioned = create_report_file_by_partition(args)
+            with open(args['output_csv']) as f:
+                self.assertEqual(f.read(), expected)
+            self.assertEqual(n_excluded_partitioned, n_excluded)
+        # only the output files remain
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
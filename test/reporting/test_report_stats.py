@@ -0,0 +1,101 @@
+""" Test Computing Report Statistics """
+import unittest
+import os
+import random
+import tempfile
+import shutil
+import warnings
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+from reporting.report_stats import (
+    create_report_stats, stats_to_df, round_numeric_answer)
+
+
+class ReportStatsTests(unittest.TestCase):
+    """ Test Report Stats """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.report_path = os.path.join(self.tmp_dir, 'report.csv')
+        random.seed(23)
+        self.df = pd.DataFrame({
+            'site': [random.choice(['B04', 'C05']) for _ in range(500)],
+            'question__species': [
+                random.choice(['zebra', 'gazelle', 'blank', ''])
+                for _ in range(500)],
+            'question__standing': [
+                random.choice(['0.5', '1.5', '1.0', '', 'x'])
+                for _ in range(500)]})
+        self.df.to_csv(self.report_path, index=False)
+        self.cols = ['question__species', 'question__standing']
+        self.convert_functions = {'question__standing': round_numeric_answer}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _counter_stats(self, df):
+        """ Reference: update a Counter row by row """
+        stats = defaultdict(Counter)
+        for _, row in df.fillna('').iterrows():
+            stats['question__species'].update({row['question__species']})
+            stats['question__standing'].update(
+                {round_numeric_answer(row['question__standing'])})
+        stats_list = list()
+        for question, counts in stats.items():
+            total = sum(counts.values())
+            for answer, count in counts.most_common():
+                stats_list.append(
+                    [question, answer, count, total,
+                     round(100 * count / total, 1)])
+        return stats_list
+
+    def testIdenticalToCounter(self):
+        for chunksize in [None, 7]:
+            stats, grouped_stats = create_report_stats(
+                self.report_path, self.cols,
+                convert_functions=self.convert_functions,
+                chunksize=chunksize)
+            self.assertIsNone(grouped_stats)
+            df_stats = stats_to_df(stats)
+            self.assertEqual(
+                df_stats.values.tolist(), self._counter_stats(self.df))
+
+    def testRoundNumericAnswer(self):
+        self.assertEqual(round_numeric_answer('1.5'), 2)
+        self.assertEqual(round_numeric_answer('2.5'), 2)
+        self.assertEqual(round_numeric_answer('inf'), 'inf')
+        self.assertEqual(round_numeric_answer('zebra'), 'zebra')
+
+    def testRowMasks(self):
+        def masks(df):
+            return {'question__standing': df['question__species'] != ''}
+        stats, _ = create_report_stats(
+            self.report_path, self.cols,
+            convert_functions=self.convert_functions,
+            row_masks_function=masks, chunksize=50)
+        n_expected = (self.df['question__species'] != '').sum()
+        self.assertEqual(
+            sum(stats[()]['question__standing'].values()), n_expected)
+
+    def testGroupBy(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', FutureWarning)
+            _, grouped_stats = create_report_stats(
+                self.report_path, self.cols,
+                convert_functions=self.convert_functions,
+                group_by=['site'], chunksize=100)
+        df_grouped = stats_to_df(grouped_stats, group_by=['site'])
+        self.assertEqual(
+            list(df_grouped.columns),
+            ['site', 'question', 'answer', 'count', 'total', 'percent'])
+        for site in ['B04', 'C05']:
+            expected = self._counter_stats(self.df[self.df['site'] == site])
+            actual = df_grouped[df_grouped['site'] == site]
+            self.assertEqual(
+                actual.drop('site', axis=1).values.tolist(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
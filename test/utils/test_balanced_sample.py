@@ -0,0 +1,56 @@
+""" Test Balanced Sampling """
+import unittest
+from collections import Counter
+
+import pandas as pd
+
+from utils.utils import balanced_sample_best_effort, balanced_sample_quotas
+
+
+class BalancedSampleTests(unittest.TestCase):
+    """ Test Balanced Sampling """
+
+    def setUp(self):
+        self.y = ['zebra'] * 50 + ['lion'] * 3 + ['elephant'] * 10 + \
+                 ['gazelle'] * 10
+
+    def testQuotas(self):
+        self.assertEqual(balanced_sample_quotas([1, 10, 10], 4), [1, 2, 1])
+        self.assertEqual(
+            balanced_sample_quotas([4, 6, 6, 9, 17, 18], 26),
+            [4, 5, 5, 5, 5, 2])
+        self.assertEqual(balanced_sample_quotas([2, 3], 10), [2, 3])
+        self.assertEqual(balanced_sample_quotas([2, 3], 0), [0, 0])
+
+    def testBalanced(self):
+        sampled = balanced_sample_best_effort(self.y, 20, seed=1)
+        self.assertEqual(len(set(sampled)), 20)
+        counts = Counter([self.y[i] for i in sampled])
+        self.assertEqual(
+            counts, {'lion': 3, 'gazelle': 6, 'elephant': 6, 'zebra': 5})
+        # least frequent classes first
+        self.assertEqual([self.y[i] for i in sampled[0:3]], ['lion'] * 3)
+
+    def testReproducible(self):
+        self.assertEqual(
+            balanced_sample_best_effort(self.y, 30, seed=3),
+            balanced_sample_best_effort(self.y, 30, seed=3))
+        self.assertEqual(
+            sorted(balanced_sample_best_effort(self.y, 100, seed=3)),
+            list(range(len(self.y))))
+
+    def testStrata(self):
+        df = pd.DataFrame({
+            'species': ['zebra'] * 8 + ['lion'] * 4,
+            'site': ['A', 'B'] * 6})
+        sampled = balanced_sample_best_effort(df, 8, seed=1)
+        counts = Counter(
+            [tuple(x) for x in df.iloc[sampled].values.tolist()])
+        self.assertEqual(set(counts.values()), {2})
+
+    def testEmpty(self):
+        self.assertEqual(balanced_sample_best_effort([], 10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+""" Test Run Metrics and Profiling """
+import unittest
+import os
+import json
+import time
+import logging
+import tempfile
+import shutil
+import sys
+from unittest.mock import patch
+
+from utils.logger import (
+    RunMetrics, start_profiler, stop_profiler, current_memory_mb,
+    peak_memory_mb, create_metrics_file_name, record_run_status,
+    _register_at_exit)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.ERROR)
+
+
+class RunMetricsTests(unittest.TestCase):
+    """ Test Run Metrics and Profiling """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testPhases(self):
+        metrics = RunMetrics('test')
+        with metrics.phase('read', unit='rows', log_every=2) as phase:
+            for _ in range(5):
+                phase.update()
+            time.sleep(0.01)
+        with metrics.phase('write'):
+            pass
+        self.assertEqual([x['name'] for x in metrics.phases],
+                         ['read', 'write'])
+        read, write = metrics.phases
+        self.assertEqual(read['n'], 5)
+        self.assertEqual(read['unit'], 'rows')
+        self.assertGreaterEqual(read['wall_time_s'], 0.01)
+        self.assertAlmostEqual(
+            read['per_s'], 5 / read['wall_time_s'], places=3)
+        self.assertIsNone(write['per_s'])
+
+    def testPhaseRecordedOnException(self):
+        metrics = RunMetrics('test')
+        with self.assertRaises(ValueError):
+            with metrics.phase('failing') as phase:
+                phase.update(3)
+                raise ValueError()
+        self.assertEqual(metrics.phases[0]['n'], 3)
+
+    def testSummary(self):
+        metrics = RunMetrics('test')
+        metrics.count('n_rows')
+        metrics.count('n_rows', 2)
+        metrics.gauge('n_sites', 4)
+        sample = metrics.sample_memory('after_read')
+        self.assertEqual(sample['label'], 'after_read')
+        path = os.path.join(self.tmp_dir, create_metrics_file_name('test'))
+        metrics.write_summary(path)
+        with open(path, 'r') as f:
+            summary = json.load(f)
+        self.assertEqual(summary['name'], 'test')
+        self.assertEqual(summary['status'], 'completed')
+        self.assertEqual(summary['counters'], {'n_rows': 3})
+        self.assertEqual(summary['gauges'], {'n_sites': 4})
+        self.assertEqual(len(summary['memory_samples']), 1)
+        metrics.error = 'ValueError: test'
+        self.assertEqual(metrics.summary()['status'], 'failed')
+
+    def testRunStatusRecorded(self):
+        for status, exit_code, expected in [
+                (None, 0, 'completed'), (0, 0, 'completed'),
+                (1, 1, 'failed'), ('error message', 1, 'failed')]:
+            metrics = RunMetrics('test')
+            with self.assertRaises(SystemExit):
+                with record_run_status(metrics):
+                    raise SystemExit(status)
+            self.assertEqual(metrics.exit_code, exit_code)
+            self.assertEqual(metrics.summary()['status'], expected)
+        metrics = RunMetrics('test')
+        with self.assertRaises(ValueError):
+            with record_run_status(metrics):
+                raise ValueError('test')
+        self.assertEqual(metrics.error, 'ValueError: test')
+        self.assertEqual(metrics.summary()['status'], 'failed')
+        metrics = RunMetrics('test')
+        with record_run_status(metrics):
+            pass
+        self.assertEqual(metrics.exit_code, 0)
+
+    def testExitIsNotReplaced(self):
+        exit_function = sys.exit
+        excepthook = sys.excepthook
+        path = os.path.join(self.tmp_dir, create_metrics_file_name('test'))
+        with patch('atexit.register') as register:
+            _register_at_exit(
+                RunMetrics('test'), path, None, self.tmp_dir, 'test')
+        self.assertIs(sys.exit, exit_function)
+        # the excepthook is restored at exit
+        finish = register.call_args[0][0]
+        finish()
+        self.assertIs(sys.excepthook, excepthook)
+
+    def testMemory(self):
+        current = current_memory_mb()
+        peak = peak_memory_mb()
+        if current is not None and peak is not None:
+            self.assertGreater(current, 0)
+            self.assertGreaterEqual(peak * 1.01, current)
+
+    def testProfiler(self):
+        self.assertIsNone(start_profiler(None))
+        self.assertIsNone(start_profiler('0'))
+        profiler = start_profiler('1')
+        self.assertEqual(profiler[0], 'cprofile')
+        sum(range(1000))
+        path = stop_profiler(profiler, os.path.join(self.tmp_dir, 'test'))
+        self.assertEqual(path, os.path.join(self.tmp_dir, 'test.prof'))
+        self.assertTrue(os.path.isfile(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
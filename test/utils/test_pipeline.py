@@ -0,0 +1,153 @@
+""" Test the Pipeline Runner """
+import unittest
+import os
+import json
+import time
+import tempfile
+import shutil
+from unittest.mock import patch
+
+import utils.pipeline
+from utils.pipeline import (
+    load_pipeline, find_dependencies, build_command, run_pipeline,
+    fingerprint_path)
+
+
+class PipelineTests(unittest.TestCase):
+    """ Test the Pipeline Runner """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name, rows in [('base', ['1,a', '2,b']), ('add1', ['1,x']),
+                           ('add2', ['2,y'])]:
+            col = 'value_{}'.format(name)
+            self._write_csv(name, ['subject_id,{}'.format(col)] + rows)
+        self.pipeline_path = os.path.join(self.tmp_dir, 'pipeline.yaml')
+        with open(self.pipeline_path, 'w') as f:
+            f.write('\n'.join([
+                "variables:",
+                "  DIR: {}".format(self.tmp_dir),
+                "stages:",
+                "  merge_second:",
+                "    module: zooniverse_exports.merge_csvs",
+                "    args: {base_csv: '${DIR}/merged1.csv',",
+                "           to_add_csv: '${DIR}/add2.csv',",
+                "           output_csv: '${DIR}/merged2.csv', key: subject_id}",
+                "    inputs: ['${DIR}/merged1.csv', '${DIR}/add2.csv']",
+                "    outputs: ['${DIR}/merged2.csv']",
+                "  merge_first:",
+                "    module: zooniverse_exports.merge_csvs",
+                "    args: {base_csv: '${DIR}/base.csv',",
+                "           to_add_csv: '${DIR}/${ADD}.csv',",
+                "           output_csv: '${DIR}/merged1.csv', key: subject_id,",
+                "           add_new_cols_to_right: true}",
+                "    inputs: ['${DIR}/base.csv', '${DIR}/${ADD}.csv']",
+                "    outputs: ['${DIR}/merged1.csv']",
+                "  independent:",
+                "    module: zooniverse_exports.merge_csvs",
+                "    args: {base_csv: '${DIR}/base.csv',",
+                "           to_add_csv: '${DIR}/add2.csv',",
+                "           output_csv: '${DIR}/merged3.csv', key: subject_id}",
+                "    inputs: ['${DIR}/base.csv', '${DIR}/add2.csv']",
+                "    outputs: ['${DIR}/merged3.csv']"]))
+        self.state_file = os.path.join(self.tmp_dir, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_csv(self, name, lines):
+        with open(os.path.join(self.tmp_dir, name + '.csv'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def _run(self, **kwargs):
+        stages = load_pipeline(self.pipeline_path, {'ADD': 'add1'})
+        return run_pipeline(
+            stages, state_file=self.state_file, output_dir=self.tmp_dir,
+            **kwargs)
+
+    def testDependencies(self):
+        stages = load_pipeline(self.pipeline_path, {'ADD': 'add1'})
+        self.assertEqual(
+            find_dependencies(stages),
+            {'merge_second': {'merge_first'}, 'merge_first': set(),
+             'independent': set()})
+        command = build_command(stages['merge_first'])
+        self.assertEqual(command[1:3], ['-m', 'zooniverse_exports.merge_csvs'])
+        self.assertIn('--add_new_cols_to_right', command)
+        self.assertIn(os.path.join(self.tmp_dir, 'add1.csv'), command)
+
+    def testCycle(self):
+        stages = load_pipeline(self.pipeline_path, {'ADD': 'merged2'})
+        with self.assertRaises(ValueError):
+            find_dependencies(stages)
+
+    def testRunAndSkip(self):
+        status = self._run(max_parallel=2)
+        self.assertEqual(set(status.values()), {'success'})
+        with open(os.path.join(self.tmp_dir, 'merged2.csv')) as f:
+            self.assertEqual(
+                f.read().splitlines(),
+                ['value_add2,subject_id,value_base,value_add1',
+                 ',1,a,x', 'y,2,b,'])
+        with open(self.state_file) as f:
+            state = json.load(f)
+        self.assertGreater(state['merge_first']['wall_time_s'], 0)
+        self.assertGreater(state['merge_first']['peak_memory_mb'], 0)
+        # nothing changed
+        status = self._run()
+        self.assertEqual(set(status.values()), {'skipped'})
+        # changed input: the stage and the stages downstream run again
+        time.sleep(0.01)
+        self._write_csv('add1', ['subject_id,value_add1', '2,z'])
+        status = self._run()
+        self.assertEqual(status, {
+            'merge_first': 'success', 'merge_second': 'success',
+            'independent': 'skipped'})
+
+    def testFailedStageBlocksDownstream(self):
+        os.remove(os.path.join(self.tmp_dir, 'add1.csv'))
+        status = self._run()
+        self.assertEqual(status, {
+            'merge_first': 'failed', 'merge_second': 'blocked',
+            'independent': 'success'})
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.tmp_dir, 'pipeline_merge_first.out')))
+
+    def testFingerprintDirectory(self):
+        fingerprint = fingerprint_path(self.tmp_dir)
+        self.assertEqual(fingerprint, fingerprint_path(self.tmp_dir))
+        self._write_csv('new', ['a'])
+        self.assertNotEqual(fingerprint, fingerprint_path(self.tmp_dir))
+        self.assertIsNone(fingerprint_path(
+            os.path.join(self.tmp_dir, 'missing.csv')))
+
+    def testFingerprintDirectoryLevels(self):
+        roll_dir = os.path.join(self.tmp_dir, 'album', 'A01', 'A01_R1')
+        os.makedirs(roll_dir)
+        image_path = os.path.join(roll_dir, 'IMG1.JPG')
+        with open(image_path, 'w') as f:
+            f.write('a')
+        album_dir = os.path.join(self.tmp_dir, 'album')
+        fingerprint = fingerprint_path(album_dir)
+        # modified in place: files are not stat'ed
+        with open(image_path, 'w') as f:
+            f.write('abc')
+        self.assertEqual(fingerprint, fingerprint_path(album_dir))
+        # new file in a roll directory
+        with open(os.path.join(roll_dir, 'IMG2.JPG'), 'w') as f:
+            f.write('a')
+        os.utime(roll_dir, ns=(0, 12345))
+        self.assertNotEqual(fingerprint, fingerprint_path(album_dir))
+
+    def testFingerprintOncePerRun(self):
+        with patch.object(
+                utils.pipeline, 'fingerprint_path',
+                wraps=fingerprint_path) as mock_fingerprint:
+            self._run(dry_run=True)
+        paths = [x[0][0] for x in mock_fingerprint.call_args_list]
+        self.assertEqual(len(paths), len(set(paths)))
+        self.assertIn(os.path.join(self.tmp_dir, 'base.csv'), paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
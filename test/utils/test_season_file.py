@@ -0,0 +1,80 @@
+""" Test Reading Cleaned Season Files """
+import unittest
+import os
+import time
+import tempfile
+import shutil
+
+import pandas as pd
+
+from utils.utils import (
+    read_cleaned_season_file_df, remove_images_from_df, sort_df)
+
+
+class ReadCleanedSeasonFileTests(unittest.TestCase):
+    """ Test Reading Cleaned Season Files """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.season_file = os.path.join(self.tmp_dir, 'SER_S1_cleaned.csv')
+        df = pd.DataFrame([
+            ['SER_S1', 'B04', '1', '10', '1', 'B04/B04_R1/IMG_3.JPG', '0'],
+            ['SER_S1', 'B04', '1', '2', '2', 'B04/B04_R1/IMG_2.JPG', '1'],
+            ['SER_S1', 'B04', '1', '2', '1',
+             'SER_S1/B04/B04_R1/IMG_1.JPG', ''],
+            ['SER_S1', 'A01', '1', '1', '1', 'A01/A01_R1/IMG_1.JPG', '0']],
+            columns=['season', 'site', 'roll', 'capture',
+                     'image_rank_in_capture', 'image_path_rel',
+                     'image_was_deleted'])
+        df.to_csv(self.season_file, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testRead(self):
+        df = read_cleaned_season_file_df(self.season_file)
+        self.assertEqual(
+            df['capture_id'].tolist(),
+            ['SER_S1#A01#1#1', 'SER_S1#B04#1#2', 'SER_S1#B04#1#2',
+             'SER_S1#B04#1#10'])
+        self.assertEqual(
+            df['path'].tolist(),
+            ['SER_S1/A01/A01_R1/IMG_1.JPG', 'SER_S1/B04/B04_R1/IMG_1.JPG',
+             'SER_S1/B04/B04_R1/IMG_2.JPG', 'SER_S1/B04/B04_R1/IMG_3.JPG'])
+
+    def testRemoveImages(self):
+        df = read_cleaned_season_file_df(self.season_file)
+        df = remove_images_from_df(
+            df, {'image_was_deleted': ['1'], 'not_a_column': ['1']})
+        self.assertEqual(df.shape[0], 3)
+        self.assertNotIn('SER_S1/B04/B04_R1/IMG_2.JPG', df['path'].tolist())
+
+    def testSortWithInvalidImageRanks(self):
+        df = pd.DataFrame({
+            'season': ['S1', 'S1', 'S1'], 'site': ['A', 'A', 'A'],
+            'roll': ['1', '1', '1'], 'capture': ['1', '1', '1'],
+            'image_rank_in_capture': ['3', 'unknown', '2']},
+            index=[0, 1, 2])
+        # invalid ranks are replaced by the row id
+        sort_df(df)
+        self.assertEqual(df.index.tolist(), [1, 2, 0])
+
+    def testCache(self):
+        df = read_cleaned_season_file_df(self.season_file, use_cache=True)
+        cache_file = self.season_file + '.cache.csv'
+        self.assertTrue(os.path.isfile(cache_file))
+        self.assertTrue(os.path.isfile(self.season_file + '.cache.json'))
+        cached = read_cleaned_season_file_df(
+            self.season_file, use_cache=True)
+        self.assertTrue(df.equals(cached))
+        # modifying the season file invalidates the cache
+        with open(self.season_file, 'a') as f:
+            f.write('SER_S1,A01,1,1,2,A01/A01_R1/IMG_2.JPG,0\n')
+        stat = os.stat(self.season_file)
+        os.utime(self.season_file, (stat.st_atime, time.time() + 10))
+        df = read_cleaned_season_file_df(self.season_file, use_cache=True)
+        self.assertEqual(df.shape[0], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+""" Test Deterministic Split Assignment """
+import unittest
+import random
+
+from utils.utils import (
+    id_to_zero_one, assign_zero_one_to_split,
+    ids_to_zero_one, assign_zero_one_to_splits, ids_to_splits)
+
+
+class SplitAssignmentTests(unittest.TestCase):
+    """ Test Batched Split Assignment """
+
+    def setUp(self):
+        random.seed(5)
+        self.ids = ['SER_S{}#B0{}#{}#{}'.format(
+            random.randint(1, 10), random.randint(1, 9),
+            random.randint(1, 5), i) for i in range(2000)]
+
+    def testIdenticalZeroOne(self):
+        self.assertEqual(
+            ids_to_zero_one(self.ids).tolist(),
+            [id_to_zero_one(x) for x in self.ids])
+
+    def testIdenticalSplits(self):
+        for split_percents, split_names in [
+                ([0.9, 0.05, 0.05], ['train', 'val', 'test']),
+                ([0.5, 0.3], ['a', 'b']),
+                ([0.1, 0.1, 0.1], ['a', 'b']),
+                ([0.5, 0.5], ['a', 'b', 'c'])]:
+            expected = [
+                assign_zero_one_to_split(
+                    id_to_zero_one(x), split_percents, split_names)
+                for x in self.ids]
+            self.assertEqual(
+                ids_to_splits(self.ids, split_percents, split_names),
+                expected)
+
+    def testBoundaries(self):
+        values = [0.0, 0.9, 0.95, 0.9500001, 1.0]
+        split_percents = [0.9, 0.05, 0.05]
+        split_names = ['train', 'val', 'test']
+        self.assertEqual(
+            assign_zero_one_to_splits(values, split_percents, split_names),
+            [assign_zero_one_to_split(x, split_percents, split_names)
+             for x in values])
+
+    def testInvalidIds(self):
+        self.assertEqual(ids_to_splits([], [1.0], ['train']), [])
+        with self.assertRaises(ValueError):
+            ids_to_zero_one(['SER_S1#B04#1#ä'])
+
+
+if __name__ == '__main__':
+    unittest.main()
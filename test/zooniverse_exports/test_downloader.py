@@ -0,0 +1,176 @@
+""" Test Downloading Files with Range Requests against a Local Server """
+import unittest
+import os
+import gzip
+import base64
+import hashlib
+import random
+import tempfile
+import shutil
+import threading
+from unittest.mock import patch
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from zooniverse_exports.downloader import download_file, get_download_info
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """ Serve server.content with optional Range support """
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status, length, content_range=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-MD5', self.server.md5)
+        if self.server.accepts_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if content_range is not None:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, len(self.server.content))
+
+    def do_GET(self):
+        content = self.server.content
+        range_header = self.headers.get('Range')
+        if range_header is None or not self.server.accepts_ranges:
+            self.server.n_full_requests += 1
+            self._headers(200, len(content))
+            self.wfile.write(content)
+            return
+        if self.server.n_failures > 0:
+            self.server.n_failures -= 1
+            self._headers(500, 0)
+            return
+        start, end = range_header.replace('bytes=', '').split('-')
+        start, end = int(start), int(end)
+        self.server.requested_ranges.append((start, end))
+        body = content[start:end + 1]
+        self._headers(206, len(body), 'bytes {}-{}/{}'.format(
+            start, end, len(content)))
+        self.wfile.write(body)
+
+
+class DownloaderTests(unittest.TestCase):
+    """ Test Downloader """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.tmp_dir, 'export.csv')
+        random.seed(123)
+        lines = ['classification_id,user_name,annotations']
+        lines += ['{},user{},"[{{""task"": ""T0""}}]"'.format(
+            i, random.randint(0, 100)) for i in range(0, 5000)]
+        content = '\n'.join(lines).encode('utf-8')
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+        self.server.content = content
+        self.server.md5 = base64.b64encode(
+            hashlib.md5(content).digest()).decode('ascii')
+        self.server.accepts_ranges = True
+        self.server.requested_ranges = list()
+        self.server.n_full_requests = 0
+        self.server.n_failures = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}/export.csv'.format(
+            self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp_dir)
+
+    def _read_output(self):
+        with open(self.output_file, 'rb') as f:
+            return f.read()
+
+    def testDownloadInfo(self):
+        info = get_download_info(self.url)
+        self.assertEqual(info.size, len(self.server.content))
+        self.assertTrue(info.accepts_ranges)
+        self.assertEqual(info.md5, self.server.md5)
+
+    def testParallelRangeDownload(self):
+        n_bytes = download_file(
+            self.url, self.output_file, n_connections=4, chunk_size=1024)
+        self.assertEqual(n_bytes, len(self.server.content))
+        self.assertEqual(self._read_output(), self.server.content)
+        self.assertEqual(len(self.server.requested_ranges), 4)
+        self.assertEqual(
+            os.listdir(self.tmp_dir), [os.path.basename(self.output_file)])
+
+    def testNoRangeSupport(self):
+        self.server.accepts_ranges = False
+        download_file(self.url, self.output_file, chunk_size=1024)
+        self.assertEqual(self._read_output(), self.server.content)
+        self.assertEqual(self.server.n_full_requests, 1)
+
+    def testResumePartialDownload(self):
+        # first download is interrupted after a part was partially written
+        content = self.server.content
+        download_file(
+            self.url, self.output_file, n_connections=2, chunk_size=1024)
+        os.remove(self.output_file)
+        half = int(round(len(content) / 2))
+        with open(self.output_file + '.part0', 'wb') as f:
+            f.write(content[0:100])
+        with open(self.output_file + '.part1', 'wb') as f:
+            f.write(content[half:])
+        with open(self.output_file + '.download_state', 'w') as f:
+            f.write('{{"size": {}, "etag": "\\"v1\\"", "n_parts": 2}}'.format(
+                len(content)))
+        self.server.requested_ranges = list()
+        download_file(
+            self.url, self.output_file, n_connections=2, chunk_size=1024)
+        self.assertEqual(self._read_output(), content)
+        # only the missing bytes of the first part were requested
+        self.assertEqual(self.server.requested_ranges, [(100, half - 1)])
+
+    def testEmptyFile(self):
+        self.server.content = b''
+        self.server.md5 = base64.b64encode(
+            hashlib.md5(b'').digest()).decode('ascii')
+        for accepts_ranges in (True, False):
+            self.server.accepts_ranges = accepts_ranges
+            self.assertEqual(download_file(self.url, self.output_file), 0)
+            self.assertEqual(self._read_output(), b'')
+            self.assertEqual(
+                os.listdir(self.tmp_dir),
+                [os.path.basename(self.output_file)])
+
+    def testChecksumMismatch(self):
+        self.server.md5 = base64.b64encode(
+            hashlib.md5(b'other').digest()).decode('ascii')
+        with self.assertRaises(IOError):
+            download_file(self.url, self.output_file, chunk_size=1024)
+        self.assertFalse(os.path.exists(self.output_file))
+
+    @patch('zooniverse_exports.downloader.time.sleep')
+    def testRetryWithBackoff(self, sleep):
+        self.server.n_failures = 3
+        download_file(
+            self.url, self.output_file, n_connections=1, chunk_size=1024,
+            max_retries=3, backoff_seconds=2)
+        self.assertEqual(self._read_output(), self.server.content)
+        self.assertEqual([x[0][0] for x in sleep.call_args_list], [2, 4, 8])
+        self.server.n_failures = 3
+        os.remove(self.output_file)
+        with self.assertRaises(IOError):
+            download_file(
+                self.url, self.output_file, n_connections=1,
+                chunk_size=1024, max_retries=2, backoff_seconds=0)
+
+    def testGzipOutput(self):
+        download_file(
+            self.url, self.output_file, compress=True, chunk_size=1024)
+        with gzip.open(self.output_file, 'rb') as f:
+            self.assertEqual(f.read(), self.server.content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+""" Test Extracting Multiple Legacy Seasons in one Pass """
+import unittest
+import os
+import csv
+import tempfile
+import shutil
+
+from zooniverse_exports.legacy import legacy_extractor
+from config.cfg import cfg
+
+flags = cfg['legacy_extractor_flags']
+flags_global = cfg['global_processing_flags']
+
+
+class ExtractLegacySeasonsTests(unittest.TestCase):
+    """ Test Extracting Multiple Legacy Seasons in one Pass """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.raw_csv = './test/files/raw_legacy_classifications.csv'
+        self.captures = {
+            'S9': [['9', 'C13', '1', '2', '1',
+                    'S9/C13/C13_R1/S9_C13_R1_IMAG1034.JPG', '']],
+            '10': [['10', 'H04', '2', '1', '1',
+                    'S10/H04/H04_R2/S10_H04_R2_IMAG0251.JPG', '']]}
+        self.season_tasks = dict()
+        for season, rows in self.captures.items():
+            captures_csv = os.path.join(
+                self.tmp_dir, '{}_captures.csv'.format(season))
+            with open(captures_csv, 'w') as f:
+                csv_writer = csv.writer(f)
+                csv_writer.writerow([
+                    'Season', ' Site', ' Roll', ' Capture', ' Image',
+                    ' PathFilename', ' TimestampJPG'])
+                csv_writer.writerows(rows)
+            output_csv = os.path.join(
+                self.tmp_dir, 'SER_{}_annotations.csv'.format(season))
+            self.season_tasks[season] = (captures_csv, output_csv)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def testOnePassIdenticalToSingleSeason(self):
+        expected = dict()
+        with open(self.raw_csv) as f:
+            lines = list(csv.reader(f))
+        header = lines[0]
+        for season, (captures_csv, output_csv) in self.season_tasks.items():
+            season_lines = [x for x in lines[1:] if x[6] == season]
+            legacy_extractor.extract_season(
+                header, season_lines, captures_csv, dict(), output_csv,
+                flags, flags_global)
+            expected[season] = self._read(output_csv)
+            os.remove(output_csv)
+        stats = legacy_extractor.extract_seasons_in_one_pass(
+            self.raw_csv, self.season_tasks, dict(), flags, flags_global,
+            batch_size=2)
+        self.assertEqual(stats['S9'], 5)
+        self.assertEqual(stats['tutorial'], 1)
+        for season, (_, output_csv) in self.season_tasks.items():
+            self.assertEqual(self._read(output_csv), expected[season])
+        self.assertIn('SER_S9#C13#1#2', expected['S9'])
+
+    def testPartitionedIdenticalToSerial(self):
+        with open(self.raw_csv) as f:
+            lines = list(csv.reader(f))
+        header = lines[0]
+        captures_csv, output_csv = self.season_tasks['S9']
+        season_lines = [x for x in lines[1:] if x[6] == 'S9']
+        legacy_extractor.extract_season(
+            header, season_lines, captures_csv, dict(), output_csv,
+            flags, flags_global)
+        expected = self._read(output_csv)
+        os.remove(output_csv)
+        legacy_extractor.extract_season(
+            header, season_lines, captures_csv, dict(), output_csv,
+            flags, flags_global, n_processes=3, tmp_dir=self.tmp_dir)
+        self.assertEqual(self._read(output_csv), expected)
+        # temporary partitions are removed
+        self.assertEqual(
+            [x for x in os.listdir(self.tmp_dir)
+             if x.startswith('legacy_extraction_')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+""" Test Getting Ouroboros Data against a Fake Ouroboros API """
+import unittest
+import os
+import json
+import logging
+import tempfile
+import shutil
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from zooniverse_exports.legacy.get_legacy_ouroboros_data import (
+    get_ouroboros_data, checkpoint_path, read_checkpoint_file,
+    append_to_checkpoint_file, repair_checkpoint_file)
+
+logging.getLogger(
+    'zooniverse_exports.legacy.get_legacy_ouroboros_data').setLevel(
+        logging.ERROR)
+
+
+class FakeOuroborosHandler(BaseHTTPRequestHandler):
+    """ Minimal subset of the Ouroboros subjects API """
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        subject_id = self.path.strip('/').split('/')[-1]
+        self.server.n_requests[subject_id] += 1
+        if self.server.n_failures[subject_id] > 0:
+            self.server.n_failures[subject_id] -= 1
+            self._send(500, {})
+            return
+        if subject_id not in self.server.subjects:
+            self._send(404, {})
+            return
+        self._send(200, self.server.subjects[subject_id])
+
+
+class GetOuroborosDataTests(unittest.TestCase):
+    """ Test Getting Ouroboros Data """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.tmp_dir, 'ouroboros.json')
+        self.checkpoint_file = checkpoint_path(self.output_path)
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), FakeOuroborosHandler)
+        self.server.subjects = {
+            'ASG{:07d}'.format(i): {
+                'zooniverse_id': 'ASG{:07d}'.format(i),
+                'location': {'standard': ['{}.jpg'.format(i)]}}
+            for i in range(1, 11)}
+        self.server.n_requests = Counter()
+        self.server.n_failures = Counter()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.api_path = 'http://127.0.0.1:{}/subjects/'.format(
+            self.server.server_port)
+        self.subject_ids = list(self.server.subjects.keys())
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp_dir)
+
+    def _get(self, subject_ids, **kwargs):
+        return get_ouroboros_data(
+            subject_ids, self.output_path, api_path=self.api_path,
+            n_concurrent=4, backoff_seconds=0, **kwargs)
+
+    def _read_output(self):
+        with open(self.output_path, 'r') as f:
+            return json.load(f)
+
+    def testResumeFromCheckpoint(self):
+        with open(self.checkpoint_file, 'w') as f:
+            for subject_id in self.subject_ids[:4]:
+                append_to_checkpoint_file(
+                    f, subject_id, self.server.subjects[subject_id])
+        stats = self._get(self.subject_ids)
+        self.assertEqual(stats, {'success': 6, 'failed': 0})
+        self.assertEqual(
+            set(self.server.n_requests.keys()), set(self.subject_ids[4:]))
+        self.assertEqual(self._read_output(), self.server.subjects)
+
+    def testRetryThenGiveUp(self):
+        retried, failing = self.subject_ids[:2]
+        self.server.n_failures[retried] = 2
+        self.server.n_failures[failing] = 1000
+        stats = self._get(self.subject_ids, max_retries=2)
+        self.assertEqual(stats, {'success': 9, 'failed': 1})
+        self.assertEqual(self.server.n_requests[retried], 3)
+        self.assertEqual(self.server.n_requests[failing], 3)
+        self.assertNotIn(failing, self._read_output())
+        # a re-run only retries the failed subject
+        self.server.n_failures[failing] = 0
+        self.server.n_requests.clear()
+        stats = self._get(self.subject_ids, max_retries=2)
+        self.assertEqual(stats, {'success': 1, 'failed': 0})
+        self.assertEqual(list(self.server.n_requests.keys()), [failing])
+        self.assertEqual(self._read_output(), self.server.subjects)
+
+    def testNotFoundIsNotRetried(self):
+        stats = self._get(['ASG9999999'], max_retries=3)
+        self.assertEqual(stats, {'success': 0, 'failed': 1})
+        self.assertEqual(self.server.n_requests['ASG9999999'], 1)
+
+    def testTruncatedLastLine(self):
+        with open(self.checkpoint_file, 'w') as f:
+            for subject_id in self.subject_ids[:3]:
+                append_to_checkpoint_file(
+                    f, subject_id, self.server.subjects[subject_id])
+            f.write('{"subject_id": "')
+        self.assertEqual(len(read_checkpoint_file(self.checkpoint_file)), 3)
+        stats = self._get(self.subject_ids)
+        self.assertEqual(stats, {'success': 7, 'failed': 0})
+        with open(self.checkpoint_file, 'r') as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(
+            {json.loads(x)['subject_id'] for x in lines},
+            set(self.subject_ids))
+        self.assertEqual(self._read_output(), self.server.subjects)
+
+    def testRepairCheckpointFile(self):
+        with open(self.checkpoint_file, 'w') as f:
+            f.write('{"a": 1}\n' + 'x' * 100)
+        self.assertEqual(
+            repair_checkpoint_file(self.checkpoint_file, chunk_size=7), 100)
+        self.assertEqual(repair_checkpoint_file(self.checkpoint_file), 0)
+        with open(self.checkpoint_file, 'r') as f:
+            self.assertEqual(f.read(), '{"a": 1}\n')
+        with open(self.checkpoint_file, 'w') as f:
+            f.write('x' * 10)
+        self.assertEqual(repair_checkpoint_file(self.checkpoint_file), 10)
+        self.assertEqual(os.path.getsize(self.checkpoint_file), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+""" Test the Compact Image to Capture Lookup """
+import unittest
+import os
+import tempfile
+import shutil
+
+from zooniverse_exports.legacy.image_capture_lookup import ImageCaptureLookup
+from zooniverse_exports.legacy.legacy_extractor import (
+    build_img_to_capture_map, build_img_to_capture_lookup)
+from config.cfg import cfg
+
+flags = cfg['legacy_extractor_flags']
+
+
+class ImageCaptureLookupTests(unittest.TestCase):
+    """ Test the Compact Image to Capture Lookup """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.items = [
+            ('SER_S1#B04#R1#PICT0002.JPG', 'SER_S1#B04#1#1'),
+            ('SER_S1#B04#R1#PICT0001.JPG', 'SER_S1#B04#1#1'),
+            ('SER_S1#B04#R2#PICT0001.JPG', 'SER_S1#B04#2#10'),
+            ('SER_S1#B04#R1#PICT0002.JPG', 'SER_S1#B04#1#2'),
+            ('SER_S1#B04#R1#PICT0003 (2).JPG', 'SER_S1#B04#1#2')]
+        self.captures_csv = os.path.join(self.tmp_dir, 'S1_captures.csv')
+        with open(self.captures_csv, 'w') as f:
+            f.write('Season, Site, Roll, Capture, Image, PathFilename\n')
+            f.write('1,B04,1,1,1,S1/B04/B04_R1/PICT0001.JPG\n')
+            f.write('1,B04,1,1,2,S1/B04/B04_R1/PICT0002.JPG\n')
+            f.write('1,B04,2,3,1,S1/B04/B04_R2/PICT0001.JPG\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testIdenticalToDict(self):
+        lookup = ImageCaptureLookup.from_items(self.items)
+        expected = dict(self.items)
+        self.assertEqual(len(lookup), len(expected))
+        for key, capture_id in expected.items():
+            self.assertEqual(lookup[key], capture_id)
+        with self.assertRaises(KeyError):
+            lookup['SER_S1#B04#R1#PICT0004.JPG']
+        self.assertNotIn('SER_S1#B04#R1#PICT0003.JPG', lookup)
+        self.assertEqual(lookup.get('SER_S1', ''), '')
+
+    def testSaveLoad(self):
+        path = os.path.join(self.tmp_dir, 'lookup')
+        ImageCaptureLookup.from_items(self.items).save(path)
+        lookup = ImageCaptureLookup.load(path)
+        self.assertEqual(
+            lookup['SER_S1#B04#R2#PICT0001.JPG'], 'SER_S1#B04#2#10')
+
+    def testSaveReplacesMappedLookup(self):
+        path = os.path.join(self.tmp_dir, 'lookup')
+        ImageCaptureLookup.from_items(self.items).save(path)
+        mapped = ImageCaptureLookup.load(path, mmap=True)
+        expected = {k: mapped[k] for k, _ in self.items}
+        other_items = [('SER_S9#A01#R1#IMG{}.JPG'.format(i), 'SER_S9#A01#1#1')
+                       for i in range(100)]
+        ImageCaptureLookup.from_items(other_items).save(path)
+        # the mapped lookup still reads the old files
+        self.assertEqual({k: mapped[k] for k in expected}, expected)
+        self.assertEqual(len(ImageCaptureLookup.load(path)), 100)
+        self.assertEqual(os.listdir(self.tmp_dir).count('lookup'), 1)
+        self.assertFalse(
+            [x for x in os.listdir(self.tmp_dir) if x.startswith('lookup.')])
+
+    def testCachedLookup(self):
+        expected = build_img_to_capture_map(self.captures_csv, flags)
+        for _ in range(2):
+            lookup = build_img_to_capture_lookup(
+                self.captures_csv, flags, use_cache=True)
+            self.assertEqual({k: lookup[k] for k in expected}, expected)
+        cache_path = self.captures_csv + '.lookup'
+        self.assertTrue(
+            ImageCaptureLookup.is_up_to_date(cache_path, self.captures_csv))
+        with open(self.captures_csv, 'a') as f:
+            f.write('1,B04,2,3,2,S1/B04/B04_R2/PICT0002.JPG\n')
+        self.assertFalse(
+            ImageCaptureLookup.is_up_to_date(cache_path, self.captures_csv))
+        lookup = build_img_to_capture_lookup(
+            self.captures_csv, flags, use_cache=True)
+        self.assertEqual(
+            lookup['SER_S1#B04#R2#PICT0002.JPG'], 'SER_S1#B04#2#3')
+
+
+if __name__ == '__main__':
+    unittest.main()
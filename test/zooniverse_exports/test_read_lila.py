@@ -0,0 +1,85 @@
+""" Test Reading the LILA json Export """
+import unittest
+import os
+import json
+import tempfile
+import shutil
+
+from zooniverse_exports.legacy.legacy_utils import read_lila
+from utils.utils import iter_json_object_array_items
+
+
+class ReadLilaTests(unittest.TestCase):
+    """ Test Reading the LILA json Export """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lila = {
+            'info': {'version': '2.0'},
+            'categories': [
+                {'id': 0, 'name': 'empty'}, {'id': 1, 'name': 'zebra'},
+                {'id': 2, 'name': 'lionfemale'}],
+            'images': [
+                {'id': 'i1', 'file_name': 'S1/B04/B04_R1/S1_B04_R1_1.JPG',
+                 'seq_id': 'ASG1', 'season': 'S1', 'location': 'B04',
+                 'datetime': '2010-07-18 16:26:14'},
+                {'id': 'i2', 'file_name': 'S1/B04/B04_R1/S1_B04_R1_2.JPG',
+                 'seq_id': 'ASG1', 'season': 'S1', 'location': 'B04',
+                 'datetime': '2010-07-18 16:26:14'},
+                {'id': 'i3', 'file_name': 'S2/B05/B05_R1/S2_B05_R1_1.JPG',
+                 'seq_id': 'ASG2', 'season': 'S2', 'location': 'B05'},
+                {'id': 'i4', 'file_name': 'S2/B05/B05_R1/S2_B05_R1_2.JPG',
+                 'seq_id': 'ASG3', 'season': 'S2', 'location': 'B05'}],
+            'annotations': [
+                {'image_id': 'i1', 'category_id': 1},
+                {'image_id': 'i2', 'category_id': 2},
+                {'image_id': 'i2', 'category_id': 1},
+                {'image_id': 'i3', 'category_id': 0}]}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, data):
+        path = os.path.join(self.tmp_dir, 'lila.json')
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
+        return path
+
+    def testRead(self):
+        df = read_lila(self._write(self.lila))
+        self.assertEqual(
+            df.values.tolist(),
+            [['S1/B04/B04_R1/S1_B04_R1_1.JPG', 'ASG1', 'S1', 'B04',
+              '2010-07-18 16:26:14', 'zebra#lionfemale'],
+             ['S1/B04/B04_R1/S1_B04_R1_2.JPG', 'ASG1', 'S1', 'B04',
+              '2010-07-18 16:26:14', 'zebra#lionfemale'],
+             ['S2/B05/B05_R1/S2_B05_R1_1.JPG', 'ASG2', 'S2', 'B05',
+              '', 'empty'],
+             ['S2/B05/B05_R1/S2_B05_R1_2.JPG', 'ASG3', 'S2', 'B05',
+              '', '']])
+        self.assertEqual(
+            df.columns.tolist(),
+            ['image_path', 'subject_id', 'season', 'site', 'datetime',
+             'species'])
+
+    def testSeasons(self):
+        df = read_lila(self._write(self.lila), seasons=['S2'])
+        self.assertEqual(df['subject_id'].tolist(), ['ASG2', 'ASG3'])
+        self.assertEqual(df['species'].tolist(), ['empty', ''])
+
+    def testAnnotationsBeforeImages(self):
+        reordered = {k: self.lila[k] for k in [
+            'annotations', 'categories', 'info', 'images']}
+        self.assertTrue(
+            read_lila(self._write(reordered)).equals(
+                read_lila(self._write(self.lila))))
+
+    def testIterArrayItems(self):
+        path = self._write({'a': [1, {'b': 2}], 'c': 3, 'd': []})
+        self.assertEqual(
+            list(iter_json_object_array_items(path, chunk_size=3)),
+            [('a', 1), ('a', {'b': 2}), ('c', 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
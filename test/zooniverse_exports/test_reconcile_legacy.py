@@ -0,0 +1,96 @@
+""" Test Reconciliation of Legacy Data Sources """
+import unittest
+import os
+import tempfile
+import shutil
+
+import pandas as pd
+
+from zooniverse_exports.legacy.reconcile import (
+    build_capture_events, build_cleaned_images, cached_frame)
+from zooniverse_exports.legacy.legacy_utils import parse_datetimes
+
+
+class ReconcileLegacyTests(unittest.TestCase):
+    """ Test Reconciliation of Legacy Data Sources """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.df_final = pd.DataFrame({
+            'image_path_rel': ['S1/A/A_R1/1.JPG', 'S1/A/A_R1/2.JPG',
+                               'S1/A/A_R1/3.JPG', 'S1/A/A_R1/4.JPG'],
+            'season': ['S1', 'S1', 'S1', 'S1'],
+            'site': ['A', 'A', 'A', 'A'],
+            'roll': ['1', '1', '1', '1'],
+            'capture': ['10', '10', '10', '2'],
+            'image_rank_in_capture': ['1', '2', '3', '1'],
+            'datetime_exif': ['e1', 'e2', 'e3', 'e4'],
+            'datetime_file_creation': ['', '', '', ''],
+            'datetime': ['', 'db2', 'db3', ''],
+            'datetime_lila': ['', '', 'lila3', ''],
+            'invalid': ['0', '3', '', '0'],
+            'include': ['', '1', '1', '']})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testCaptureEvents(self):
+        df = build_capture_events(self.df_final)
+        self.assertEqual(
+            df.values.tolist(),
+            [['SER_S1#A#1#2', 'S1', 'A', '1', '2', ''],
+             ['SER_S1#A#1#10', 'S1', 'A', '1', '10', 'db2']])
+
+    def testCleanedImages(self):
+        df_captures = build_capture_events(self.df_final)
+        df = build_cleaned_images(self.df_final, df_captures)
+        self.assertEqual(df['include'].tolist(), ['1', '0', '', '1'])
+        self.assertEqual(df['image_is_invalid'].tolist(), ['0', '1', '', '0'])
+        self.assertEqual(df['datetime'].tolist(), ['db2', 'db2', 'db2', ''])
+        self.assertEqual(df['image_name'].tolist()[0], '1.JPG')
+
+    def testParseDatetimes(self):
+        self.assertEqual(
+            parse_datetimes(['2012:01:02 03:04:05', '2012-01-02 03:04:05',
+                             '2012:01:02 03:04:05']).tolist(),
+            ['2012-01-02 03:04:05'] * 3)
+
+    def testCachedFrame(self):
+        source_path = os.path.join(self.tmp_dir, 'source.csv')
+        self.df_final.to_csv(source_path, index=False)
+        calls = list()
+
+        def build():
+            calls.append(1)
+            return pd.read_csv(source_path, dtype=str, na_filter=False)
+
+        df = cached_frame(build, 'df_final', self.tmp_dir, [source_path])
+        df_cached = cached_frame(
+            build, 'df_final', self.tmp_dir, [source_path])
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(df_cached.equals(df))
+        self.assertFalse(
+            any(x.endswith('.pkl') for x in os.listdir(self.tmp_dir)))
+        # source restored with an older modification time (cp -p)
+        mtime = os.path.getmtime(source_path) - 100
+        os.utime(source_path, (mtime, mtime))
+        cached_frame(build, 'df_final', self.tmp_dir, [source_path])
+        self.assertEqual(len(calls), 2)
+        # another (older) source file
+        other_path = os.path.join(self.tmp_dir, 'other.csv')
+        shutil.copy2(source_path, other_path)
+        cached_frame(build, 'df_final', self.tmp_dir, [other_path])
+        self.assertEqual(len(calls), 3)
+        # other build parameters
+        cached_frame(
+            build, 'df_final', self.tmp_dir, [other_path],
+            params={'cleaned_seasons': [4, 5]})
+        self.assertEqual(len(calls), 4)
+        cached_frame(
+            build, 'df_final', self.tmp_dir, [other_path],
+            params={'cleaned_seasons': [4, 5]})
+        self.assertEqual(len(calls), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
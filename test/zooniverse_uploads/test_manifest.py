@@ -0,0 +1,103 @@
+""" Test Reading / Writing of Manifests """
+import unittest
+import os
+import json
+import tempfile
+import shutil
+from collections import OrderedDict
+
+from zooniverse_uploads.manifest import (
+    read_manifest_index, read_manifest_entries, read_manifest_entry,
+    read_manifest_batches, write_manifest, append_to_manifest,
+    manifest_index_path, build_manifest_index)
+
+
+def _create_capture(capture_id):
+    return {
+        'upload_metadata': {'#capture_id': capture_id},
+        'info': {'uploaded': False},
+        'images': ['{}.JPG'.format(capture_id)]}
+
+
+class ManifestTests(unittest.TestCase):
+    """ Test Manifest Formats """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest = OrderedDict(
+            ('SER_S1#B04#1#{}'.format(i),
+             _create_capture('SER_S1#B04#1#{}'.format(i)))
+            for i in range(1, 11))
+        self.path_jsonl = os.path.join(
+            self.tmp_dir, 'SER_S1__complete__manifest.jsonl')
+        self.path_json = os.path.join(
+            self.tmp_dir, 'SER_S1__complete__manifest.json')
+        write_manifest(self.manifest.items(), self.path_jsonl)
+        write_manifest(self.manifest.items(), self.path_json)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testIterateBothFormatsIdentical(self):
+        for path in (self.path_json, self.path_jsonl):
+            actual = OrderedDict(read_manifest_entries(path))
+            self.assertEqual(list(actual.keys()), list(self.manifest.keys()))
+            self.assertEqual(actual, self.manifest)
+
+    def testJsonlIsOneCapturePerLine(self):
+        with open(self.path_jsonl, 'r') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(
+            json.loads(lines[2]),
+            {'SER_S1#B04#1#3': self.manifest['SER_S1#B04#1#3']})
+
+    def testRandomAccess(self):
+        index = read_manifest_index(self.path_jsonl)
+        self.assertEqual(
+            read_manifest_entry(self.path_jsonl, 'SER_S1#B04#1#7', index),
+            self.manifest['SER_S1#B04#1#7'])
+
+    def testBatches(self):
+        batches = list(read_manifest_batches(self.path_jsonl, 4))
+        self.assertEqual([len(x) for x in batches], [4, 4, 2])
+        self.assertEqual(batches[2][0][0], 'SER_S1#B04#1#9')
+
+    def testAppendSupersedesEntries(self):
+        index = read_manifest_index(self.path_jsonl)
+        updated = _create_capture('SER_S1#B04#1#2')
+        updated['info']['uploaded'] = True
+        append_to_manifest(
+            self.path_jsonl, [('SER_S1#B04#1#2', updated)], index)
+        # order is kept, data is updated
+        actual = OrderedDict(read_manifest_entries(self.path_jsonl))
+        self.assertEqual(list(actual.keys()), list(self.manifest.keys()))
+        self.assertTrue(actual['SER_S1#B04#1#2']['info']['uploaded'])
+        # re-building the index gives the same result
+        self.assertEqual(build_manifest_index(self.path_jsonl), index)
+
+    def testStaleIndexIsRebuilt(self):
+        with open(self.path_jsonl, 'a') as f:
+            f.write(json.dumps(
+                {'SER_S1#B04#1#11': _create_capture('SER_S1#B04#1#11')}))
+            f.write('\n')
+        index = read_manifest_index(self.path_jsonl)
+        self.assertIn('SER_S1#B04#1#11', index)
+
+    def testMissingIndexIsRebuilt(self):
+        os.remove(manifest_index_path(self.path_jsonl))
+        actual = OrderedDict(read_manifest_entries(self.path_jsonl))
+        self.assertEqual(actual, self.manifest)
+
+    def testRewriteInPlace(self):
+        entries = read_manifest_entries(self.path_jsonl)
+        write_manifest(
+            ((k, v) for k, v in entries if k != 'SER_S1#B04#1#1'),
+            self.path_jsonl)
+        actual = OrderedDict(read_manifest_entries(self.path_jsonl))
+        self.assertEqual(len(actual), 9)
+        self.assertNotIn('SER_S1#B04#1#1', actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+""" Test Bulk Update of Subjects against a Fake Panoptes Server """
+import unittest
+import os
+import json
+import tempfile
+import shutil
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from panoptes_client import Panoptes
+
+from zooniverse_uploads.subject_updater import (
+    update_subjects, fetch_subjects_metadata, read_update_tracker_file)
+
+
+class FakePanoptesHandler(BaseHTTPRequestHandler):
+    """ Minimal subset of the Panoptes subjects API """
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, etag=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _subject(self, subject_id):
+        metadata = self.server.subjects[subject_id]
+        return {'id': subject_id, 'metadata': metadata}
+
+    def _etag(self, subject_id):
+        return '"{}-{}"'.format(subject_id, self.server.versions[subject_id])
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        self.server.n_requests['GET'] += 1
+        if len(parts) == 3:
+            subject_id = parts[2]
+            self._send(200, {'subjects': [self._subject(subject_id)]},
+                       etag=self._etag(subject_id))
+            return
+        params = parse_qs(url.query)
+        ids = [x for x in params['id'][0].split(',')
+               if x in self.server.subjects]
+        page_size = int(params['page_size'][0])
+        page = int(params.get('page', ['1'])[0])
+        page_ids = ids[(page - 1) * page_size: page * page_size]
+        meta = {'subjects': {'page': page}}
+        if page * page_size < len(ids):
+            meta['subjects']['next_href'] = \
+                '/subjects?id={}&page_size={}&page={}'.format(
+                    params['id'][0], page_size, page + 1)
+        self._send(
+            200, {'subjects': [self._subject(x) for x in page_ids],
+                  'meta': meta},
+            etag='"collection"')
+
+    def do_PUT(self):
+        subject_id = urlparse(self.path).path.strip('/').split('/')[2]
+        body = json.loads(
+            self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.n_requests['PUT'] += 1
+        if self.server.n_failures > 0:
+            self.server.n_failures -= 1
+            self._send(500, {})
+            return
+        if self.headers.get('If-Match') != self._etag(subject_id):
+            self._send(412, {'errors': [{'message': 'etag mismatch'}]})
+            return
+        self.server.subjects[subject_id] = body['subjects']['metadata']
+        self.server.versions[subject_id] += 1
+        self._send(200, {'subjects': [self._subject(subject_id)]},
+                   etag=self._etag(subject_id))
+
+
+class SubjectUpdaterTests(unittest.TestCase):
+    """ Test Subject Updater """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tracker_file = os.path.join(self.tmp_dir, 'tracker.txt')
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), FakePanoptesHandler)
+        self.server.subjects = {
+            str(i): {'#capture_id': 'SER_S1#B04#1#{}'.format(i)}
+            for i in range(1, 26)}
+        self.server.versions = {k: 0 for k in self.server.subjects}
+        self.server.n_requests = {'GET': 0, 'PUT': 0}
+        self.server.n_failures = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = Panoptes(
+            endpoint='http://127.0.0.1:{}'.format(self.server.server_port))
+        # only even subjects need an update
+        self.new_scores = {
+            str(i): {'#machine_topprediction_species': 'zebra'}
+            for i in range(2, 26, 2)}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp_dir)
+
+    def _update_function(self, subject_id, metadata):
+        metadata.update(self.new_scores.get(subject_id, {}))
+        return metadata
+
+    def testFetchInPages(self):
+        ids = [str(i) for i in range(1, 26)] + ['999']
+        fetched = dict(fetch_subjects_metadata(self.client, ids, 10))
+        self.assertEqual(len(fetched), 25)
+        self.assertEqual(fetched['7'], self.server.subjects['7'])
+
+    def testOnlyChangedSubjectsAreSaved(self):
+        stats = update_subjects(
+            list(self.server.subjects.keys()) + ['999'],
+            self._update_function, self.tracker_file,
+            client=self.client, n_workers=4, page_size=10)
+        self.assertEqual(stats['updated'], 12)
+        self.assertEqual(stats['unchanged'], 13)
+        self.assertEqual(stats['not_found'], 1)
+        self.assertEqual(self.server.n_requests['PUT'], 12)
+        self.assertEqual(
+            self.server.subjects['4']['#machine_topprediction_species'],
+            'zebra')
+        self.assertNotIn(
+            '#machine_topprediction_species', self.server.subjects['3'])
+        self.assertEqual(
+            read_update_tracker_file(self.tracker_file),
+            set(self.server.subjects.keys()))
+
+    def testResumeFromTracker(self):
+        update_subjects(
+            list(self.server.subjects.keys()),
+            self._update_function, self.tracker_file,
+            client=self.client, page_size=10)
+        n_get = self.server.n_requests['GET']
+        stats = update_subjects(
+            list(self.server.subjects.keys()),
+            self._update_function, self.tracker_file,
+            client=self.client, page_size=10)
+        self.assertEqual(sum(stats.values()), 0)
+        self.assertEqual(self.server.n_requests['GET'], n_get)
+
+    def testRetryOnServerErrors(self):
+        self.server.n_failures = 3
+        stats = update_subjects(
+            list(self.server.subjects.keys()),
+            self._update_function, self.tracker_file,
+            client=self.client, n_workers=1, page_size=10,
+            max_retries=3, backoff_seconds=0)
+        self.assertEqual(stats['updated'], 12)
+        self.assertEqual(stats['failed'], 0)
+
+    def testFailedSavesAreNotTracked(self):
+        self.server.n_failures = 1000
+        stats = update_subjects(
+            ['2', '3'], self._update_function, self.tracker_file,
+            client=self.client, max_retries=1, backoff_seconds=0)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(read_update_tracker_file(self.tracker_file), {'3'})
+
+    def testDryRun(self):
+        stats = update_subjects(
+            list(self.server.subjects.keys()),
+            self._update_function, self.tracker_file,
+            client=self.client, dry_run=True)
+        self.assertEqual(stats['changed'], 12)
+        self.assertEqual(self.server.n_requests['PUT'], 0)
+        self.assertFalse(os.path.exists(self.tracker_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
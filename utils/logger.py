@@ -1,17 +1,56 @@
-""" Logging """
+""" Logging and Run Metrics
+    - set_logging: log to console and (optionally) to a log file
+    - run metrics: timed phases (with throughput), counters, gauges and
+      memory samples, a json run summary ('<log_filename>_metrics.json')
+      is written next to the log file when the script exits (the run is
+      'failed' after an uncaught exception, or, in entry points wrapped
+      in 'record_run_status', after sys.exit with a non-zero status)
+    - profiling: set the environment variable PROFILE (or pass
+      profile to set_logging, e.g. via a '--profile' flag) to 'cprofile'
+      or 'pyinstrument' (if installed), the profile is written next to
+      the log file
+    Example:
+    with timed_phase('read_classifications', unit='classifications',
+                     log_every=10000) as phase:
+        for line in csv_reader:
+            phase.update()
+    count('n_duplicates')
+"""
 import logging
 import sys
 import os
+import io
+import json
+import time
+import atexit
+import pstats
+import cProfile
 import getpass
+import platform
+from contextlib import contextmanager
+from collections import Counter, OrderedDict
 
 from utils.utils import set_file_permission
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+
 
 def create_logfile_name(_id):
     """ Create a logfile name based on an identifier """
     return '{}.log'.format(_id)
 
 
+def create_metrics_file_name(_id):
+    """ Create a run summary file name based on an identifier """
+    return '{}_metrics.json'.format(_id)
+
+
 def setup_logger(log_file=None):
     # log to file and console
     handlers = list()
@@ -41,10 +80,324 @@ def create_log_file(log_dir, log_file_name):
     return log_file_path
 
 
-def set_logging(log_dir=None, log_filename=None):
-    """ Small wrapper to setup logging """
+def set_logging(log_dir=None, log_filename=None, profile=None):
+    """ Small wrapper to setup logging
+        - registers writing the run summary (if log_dir is specified)
+          and profiling (profile or env var PROFILE) at exit
+    """
     if log_dir is not None:
         log_file_path = create_log_file(log_dir, log_filename)
         setup_logger(log_file_path)
     else:
         setup_logger()
+    metrics = get_metrics()
+    metrics.name = log_filename
+    if metrics.finish_registered:
+        return
+    summary_path = None
+    if log_dir is not None:
+        summary_path = os.path.join(
+            log_dir, create_metrics_file_name(log_filename))
+    profiler = start_profiler(profile or os.environ.get('PROFILE'))
+    _register_at_exit(metrics, summary_path, profiler, log_dir, log_filename)
+
+
+######################################
+# Memory
+######################################
+
+def current_memory_mb():
+    """ Current resident set size of this process in MB (None if n/a) """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            rss_pages = int(f.read().split()[1])
+        return rss_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_memory_mb(children=False):
+    """ Max. resident set size of this process (or of the largest of its
+        terminated child processes) in MB (None if n/a)
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return peak / scale
+
+
+######################################
+# Run Metrics
+######################################
+
+class Phase(object):
+    """ A timed phase, call update() for each processed item to measure
+        throughput (and log progress every 'log_every' items)
+    """
+    def __init__(self, name, unit=None, log_every=None):
+        self.name = name
+        self.unit = unit
+        self.log_every = log_every
+        self.n = 0
+        self.start_time = time.time()
+        self.wall_time = None
+        self.memory_start = current_memory_mb()
+        self._next_log = log_every
+
+    def update(self, n=1):
+        self.n += n
+        if self._next_log is not None and self.n >= self._next_log:
+            self._next_log += self.log_every
+            logger.info("{}: processed {:,} {} ({:,.0f}/s)".format(
+                self.name, self.n, self.unit or 'items', self.rate() or 0))
+
+    def rate(self):
+        """ Processed items per second """
+        wall_time = self.wall_time
+        if wall_time is None:
+            wall_time = time.time() - self.start_time
+        if wall_time <= 0:
+            return None
+        return self.n / wall_time
+
+    def summary(self):
+        return OrderedDict([
+            ('name', self.name),
+            ('wall_time_s', self.wall_time),
+            ('n', self.n),
+            ('unit', self.unit),
+            ('per_s', self.rate() if self.n > 0 else None),
+            ('memory_start_mb', self.memory_start),
+            ('memory_end_mb', current_memory_mb()),
+            ('peak_memory_mb', peak_memory_mb())])
+
+
+class RunMetrics(object):
+    """ Metrics of a run: phases, counters, gauges and memory samples """
+    def __init__(self, name=None):
+        self.name = name
+        self.start_time = time.time()
+        self.phases = list()
+        self.counters = Counter()
+        self.gauges = OrderedDict()
+        self.memory_samples = list()
+        self.error = None
+        self.exit_code = None
+        self.profile = None
+        self.finish_registered = False
+
+    @contextmanager
+    def phase(self, name, unit=None, log_every=None):
+        """ Time a phase of the run """
+        phase = Phase(name, unit=unit, log_every=log_every)
+        try:
+            yield phase
+        finally:
+            phase.wall_time = time.time() - phase.start_time
+            summary = phase.summary()
+            self.phases.append(summary)
+            msg = "Phase {} took {:.2f}s".format(name, phase.wall_time)
+            if summary['per_s'] is not None:
+                msg += " - {:,} {} ({:,.0f}/s)".format(
+                    phase.n, unit or 'items', summary['per_s'])
+            logger.info(msg)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def sample_memory(self, label=None):
+        """ Record the current and the peak memory """
+        sample = OrderedDict([
+            ('label', label),
+            ('elapsed_s', time.time() - self.start_time),
+            ('memory_mb', current_memory_mb()),
+            ('peak_memory_mb', peak_memory_mb())])
+        self.memory_samples.append(sample)
+        return sample
+
+    def status(self):
+        """ 'failed' after an error or a non-zero exit code """
+        if self.error is not None or self.exit_code not in (None, 0):
+            return 'failed'
+        return 'completed'
+
+    def summary(self):
+        """ Machine-readable summary of the run """
+        return OrderedDict([
+            ('name', self.name),
+            ('argv', sys.argv),
+            ('user', getpass.getuser()),
+            ('host', platform.node()),
+            ('python', platform.python_version()),
+            ('started_at', time.strftime(
+                '%Y-%m-%d %H:%M:%S', time.localtime(self.start_time))),
+            ('wall_time_s', time.time() - self.start_time),
+            ('cpu_time_s', time.process_time()),
+            ('status', self.status()),
+            ('exit_code', self.exit_code),
+            ('error', self.error),
+            ('profile', self.profile),
+            ('peak_memory_mb', peak_memory_mb()),
+            ('peak_memory_children_mb', peak_memory_mb(children=True)),
+            ('phases', self.phases),
+            ('counters', dict(self.counters)),
+            ('gauges', self.gauges),
+            ('memory_samples', self.memory_samples)])
+
+    def write_summary(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        set_file_permission(path)
+
+
+_metrics = RunMetrics()
+
+
+def get_metrics():
+    """ Metrics of the current run """
+    return _metrics
+
+
+def timed_phase(name, unit=None, log_every=None):
+    """ Context manager to time a phase of the current run """
+    return _metrics.phase(name, unit=unit, log_every=log_every)
+
+
+def count(name, n=1):
+    """ Increment a counter of the current run """
+    _metrics.count(name, n)
+
+
+def gauge(name, value):
+    """ Set a gauge of the current run """
+    _metrics.gauge(name, value)
+
+
+def sample_memory(label=None):
+    """ Record the memory of the current run """
+    return _metrics.sample_memory(label)
+
+
+######################################
+# Profiling
+######################################
+
+def start_profiler(mode):
+    """ Start a profiler ('cprofile', 'pyinstrument' or any other true
+        value for cprofile), returns (mode, profiler) or None
+    """
+    if not mode or str(mode).lower() in ('0', 'false', 'no'):
+        return None
+    mode = str(mode).lower()
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning(
+                "pyinstrument is not installed -- using cProfile")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return 'pyinstrument', profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return 'cprofile', profiler
+
+
+def stop_profiler(profiler, output_path=None, n_lines=25):
+    """ Stop a profiler, log the top functions (by cumulative time) and
+        write the profile to output_path
+        - cprofile: output_path + '.prof' (use pstats / snakeviz)
+        - pyinstrument: output_path + '.txt'
+        - returns the path of the profile
+    """
+    mode, profiler = profiler
+    if mode == 'pyinstrument':
+        profiler.stop()
+        text = profiler.output_text()
+        path = None
+        if output_path is not None:
+            path = output_path + '.txt'
+            with open(path, 'w') as f:
+                f.write(text)
+        logger.info("Profile:\n{}".format(text))
+        return path
+    profiler.disable()
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(n_lines)
+    logger.info("Profile:\n{}".format(stream.getvalue()))
+    path = None
+    if output_path is not None:
+        path = output_path + '.prof'
+        stats.dump_stats(path)
+    return path
+
+
+def _exit_code(status):
+    """ Exit code of the process for sys.exit(status) """
+    if status is None:
+        return 0
+    if isinstance(status, int):
+        return status
+    return 1
+
+
+@contextmanager
+def record_run_status(metrics=None):
+    """ Record the exit status of the run (in entry points that exit with
+        sys.exit / raise SystemExit), exceptions are re-raised
+        Example:
+        with record_run_status():
+            if failed:
+                sys.exit(1)
+    """
+    if metrics is None:
+        metrics = _metrics
+    try:
+        yield metrics
+    except SystemExit as e:
+        metrics.exit_code = _exit_code(e.code)
+        raise
+    except BaseException as e:
+        metrics.error = '{}: {}'.format(type(e).__name__, e)
+        metrics.exit_code = 1
+        raise
+    metrics.exit_code = 0
+
+
+def _register_at_exit(metrics, summary_path, profiler, log_dir, log_filename):
+    """ Write the run summary and stop the profiler at exit
+        - uncaught exceptions are recorded in metrics (the excepthook is
+          restored at exit), use record_run_status to record the status
+          of sys.exit / SystemExit
+    """
+    def record_error(exc_type, exc_value, exc_traceback):
+        if metrics.error is None:
+            metrics.error = '{}: {}'.format(exc_type.__name__, exc_value)
+            metrics.exit_code = 1
+        previous_excepthook(exc_type, exc_value, exc_traceback)
+
+    def finish():
+        if sys.excepthook is record_error:
+            sys.excepthook = previous_excepthook
+        if profiler is not None:
+            profile_path = None
+            if log_dir is not None:
+                profile_path = os.path.join(
+                    log_dir, '{}_profile'.format(log_filename))
+            metrics.profile = stop_profiler(profiler, profile_path)
+        if summary_path is not None:
+            metrics.write_summary(summary_path)
+            logger.info("Run summary written to {}".format(summary_path))
+
+    previous_excepthook = sys.excepthook
+    sys.excepthook = record_error
+    atexit.register(finish)
+    metrics.finish_registered = True
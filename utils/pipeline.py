@@ -0,0 +1,458 @@
+""" Run a Pipeline of Scripts defined as a DAG
+    - the pipeline is defined in a yaml file (see
+      config/pipeline_season_example.yaml): variables and stages, each
+      stage runs an existing script ('python -m module --arg value ..')
+    - stages depend on the stages that write their inputs (and on the
+      stages listed in 'after')
+    - a stage is skipped if its command is unchanged, all its outputs
+      exist and its inputs have the same fingerprints (size and mtime of
+      files, mtimes of directories and their sub-directories up to two
+      levels, e.g. site and roll directories) as in the last successful
+      run, each path is fingerprinted once per run
+    - independent stages are run concurrently ('max_parallel')
+    - wall time and peak memory (max. resident set size of the stage
+      process and its sub-processes) of each stage are recorded in the
+      state file
+    Example:
+    python3 -m utils.pipeline \
+    --pipeline config/pipeline_season_example.yaml \
+    --state_file /home/packerc/shared/season_captures/SER/SER_S1_pipeline.json \
+    --var SITE=SER SEASON=SER_S1 \
+    --max_parallel 2
+"""
+import os
+import sys
+import json
+import time
+import string
+import hashlib
+import argparse
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import yaml
+
+from utils.logger import set_logging, record_run_status
+from utils.utils import set_file_permission
+
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _substitute(value, variables):
+    """ Replace ${VAR} in value (str, list, dict) """
+    if isinstance(value, str):
+        return string.Template(value).substitute(variables)
+    if isinstance(value, list):
+        return [_substitute(x, variables) for x in value]
+    if isinstance(value, dict):
+        return {k: _substitute(v, variables) for k, v in value.items()}
+    return value
+
+
+def load_pipeline(path, variables=None):
+    """ Read a pipeline definition and replace all variables
+        - variables: dict that overrides the variables of the pipeline,
+          environment variables are used for undefined variables
+        - returns dict: stage name -> stage definition
+    """
+    with open(path, 'r') as f:
+        definition = yaml.safe_load(f)
+    all_variables = dict(os.environ)
+    all_variables.update(
+        {k: str(v) for k, v in definition.get('variables', dict()).items()})
+    if variables is not None:
+        all_variables.update(variables)
+    # variables may be defined using other variables
+    for _ in range(0, 10):
+        resolved = {k: string.Template(v).safe_substitute(all_variables)
+                    for k, v in all_variables.items()}
+        if resolved == all_variables:
+            break
+        all_variables = resolved
+    stages = dict()
+    for name, stage in definition['stages'].items():
+        stage = _substitute(stage, all_variables)
+        if 'module' not in stage:
+            raise ValueError("stage {} requires a 'module'".format(name))
+        stages[name] = {
+            'module': stage['module'],
+            'args': stage.get('args', dict()),
+            'inputs': stage.get('inputs', list()),
+            'outputs': stage.get('outputs', list()),
+            'after': stage.get('after', list())}
+    return stages
+
+
+def build_command(stage):
+    """ Command of a stage: python -m module --key value ..
+        - True: flag, False / None: omitted, list: multiple values
+    """
+    command = [sys.executable, '-m', stage['module']]
+    for key, value in stage['args'].items():
+        if (value is None) or (value is False):
+            continue
+        command.append('--{}'.format(key))
+        if value is True:
+            continue
+        if isinstance(value, list):
+            command.extend([str(x) for x in value])
+        else:
+            command.append(str(value))
+    return command
+
+
+def find_dependencies(stages):
+    """ Stages each stage depends on: dict stage -> set of stages
+        - a stage depends on all other stages that write one of its inputs
+          and on the stages in 'after'
+    """
+    writers = dict()
+    for name, stage in stages.items():
+        for path in stage['outputs']:
+            writers.setdefault(os.path.normpath(path), set()).add(name)
+    dependencies = dict()
+    for name, stage in stages.items():
+        unknown = [x for x in stage['after'] if x not in stages]
+        if len(unknown) > 0:
+            raise ValueError("stage {} runs after unknown stages {}".format(
+                name, unknown))
+        depends_on = set(stage['after'])
+        for path in stage['inputs']:
+            depends_on.update(writers.get(os.path.normpath(path), set()))
+        depends_on.discard(name)
+        dependencies[name] = depends_on
+    # check for cycles
+    visited = dict()
+
+    def _visit(name, path):
+        if visited.get(name) == 'done':
+            return
+        if visited.get(name) == 'active':
+            raise ValueError("pipeline contains a cycle: {}".format(
+                ' -> '.join(path + [name])))
+        visited[name] = 'active'
+        for x in sorted(dependencies[name]):
+            _visit(x, path + [name])
+        visited[name] = 'done'
+
+    for name in stages.keys():
+        _visit(name, list())
+    return dependencies
+
+
+def fingerprint_path(path, max_depth=2):
+    """ Fingerprint of a file or directory (None if it does not exist)
+        - file: size and mtime
+        - directory: hash of relative path and mtime of the directory and
+          its sub-directories up to 'max_depth' levels (e.g. site and roll
+          directories of an album), files are not listed or stat'ed --
+          adding / removing / renaming a file changes the mtime of its
+          directory, files modified in place are not detected
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isdir(path):
+        return '{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+    entries = [('.', stat.st_mtime_ns)]
+    to_scan = [(path, 0)]
+    while len(to_scan) > 0:
+        current, depth = to_scan.pop()
+        if depth >= max_depth:
+            continue
+        with os.scandir(current) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                try:
+                    mtime = entry.stat(follow_symlinks=False).st_mtime_ns
+                except OSError:
+                    continue
+                entries.append((os.path.relpath(entry.path, path), mtime))
+                to_scan.append((entry.path, depth + 1))
+    hasher = hashlib.sha1()
+    for entry in sorted(entries):
+        hasher.update('{}:{}\n'.format(*entry).encode('utf-8'))
+    return 'dir:{}:{}'.format(len(entries), hasher.hexdigest())
+
+
+def _paths_overlap(path, other):
+    """ Check if two paths are identical or one contains the other """
+    path, other = os.path.normpath(path), os.path.normpath(other)
+    return (path == other) or path.startswith(other + os.sep) or \
+        other.startswith(path + os.sep)
+
+
+def read_state(path):
+    """ Read the state of previous runs """
+    if (path is None) or (not os.path.isfile(path)):
+        return dict()
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_state(path, state):
+    """ Write the state (atomic) """
+    if path is None:
+        return
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+    set_file_permission(path)
+
+
+def is_fresh(stage, command, input_fingerprints, previous):
+    """ Check whether a stage can be skipped """
+    if (previous is None) or (previous.get('status') != 'success'):
+        return False
+    if previous.get('command') != command:
+        return False
+    if not all(os.path.exists(x) for x in stage['outputs']):
+        return False
+    return previous.get('inputs') == input_fingerprints
+
+
+def run_command(command, output_path=None):
+    """ Run command, returns (exit code, wall time in s, peak memory in MB)
+        - peak memory: max. resident set size of the process and its
+          (waited-for) sub-processes, None if not available
+    """
+    start_time = time.time()
+    output = None
+    if output_path is not None:
+        output = open(output_path, 'a')
+    try:
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [REPO_ROOT] + [x for x in [env.get('PYTHONPATH')] if x])
+        proc = subprocess.Popen(
+            command, cwd=REPO_ROOT, env=env,
+            stdout=output, stderr=subprocess.STDOUT if output else None)
+        if hasattr(os, 'wait4'):
+            _, status, rusage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            # kilobytes on Linux, bytes on macOS
+            scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+            peak_memory_mb = rusage.ru_maxrss / scale
+        else:
+            proc.wait()
+            peak_memory_mb = None
+    finally:
+        if output is not None:
+            output.close()
+    return proc.returncode, time.time() - start_time, peak_memory_mb
+
+
+def run_pipeline(
+        stages, state_file=None, max_parallel=1, force=False,
+        only_stages=None, output_dir=None, dry_run=False):
+    """ Run all stages of a pipeline in dependency order
+        - state_file: json file storing fingerprints / timings
+        - force: run stages even if they are fresh
+        - only_stages: run only these stages (others are treated as done)
+        - output_dir: directory for the output of each stage
+          ('pipeline_{stage}.out'), otherwise printed
+        - dry_run: only log which stages would run
+        - returns dict: stage -> status (success, skipped, failed, blocked)
+    """
+    dependencies = find_dependencies(stages)
+    state = read_state(state_file)
+    status = dict()
+    if only_stages is not None:
+        unknown = [x for x in only_stages if x not in stages]
+        if len(unknown) > 0:
+            raise ValueError("unknown stages: {}".format(unknown))
+        for name in stages.keys():
+            if name not in only_stages:
+                status[name] = 'not_selected'
+
+    def _is_ready(name):
+        return all(status.get(x) in ('success', 'skipped', 'not_selected')
+                   for x in dependencies[name])
+
+    def _is_blocked(name):
+        return any(status.get(x) in ('failed', 'blocked')
+                   for x in dependencies[name])
+
+    # fingerprints are computed once per run, and again only if a stage
+    # wrote to the path
+    fingerprints = dict()
+
+    def _fingerprint(path):
+        key = os.path.normpath(path)
+        if key not in fingerprints:
+            fingerprints[key] = fingerprint_path(path)
+        return fingerprints[key]
+
+    def _invalidate_fingerprints(paths):
+        for key in list(fingerprints.keys()):
+            if any(_paths_overlap(key, x) for x in paths):
+                del fingerprints[key]
+
+    running = dict()
+    with ThreadPoolExecutor(max_workers=max(max_parallel, 1)) as pool:
+        while True:
+            # start all stages that are ready
+            for name in stages.keys():
+                if (name in status) or (name in running.values()):
+                    continue
+                if _is_blocked(name):
+                    status[name] = 'blocked'
+                    logger.error("Stage {} blocked by failed stages".format(
+                        name))
+                    continue
+                if not _is_ready(name):
+                    continue
+                stage = stages[name]
+                command = build_command(stage)
+                inputs = {x: _fingerprint(x) for x in stage['inputs']}
+                if not force and is_fresh(
+                        stage, command, inputs, state.get(name)):
+                    status[name] = 'skipped'
+                    logger.info("Stage {} is up to date - skipping".format(
+                        name))
+                    continue
+                if dry_run:
+                    status[name] = 'success'
+                    logger.info("Stage {} would run: {}".format(
+                        name, ' '.join(command)))
+                    continue
+                output_path = None
+                if output_dir is not None:
+                    output_path = os.path.join(
+                        output_dir, 'pipeline_{}.out'.format(name))
+                logger.info("Starting stage {}: {}".format(
+                    name, ' '.join(command)))
+                future = pool.submit(run_command, command, output_path)
+                running[future] = name
+                state[name] = {
+                    'status': 'running', 'command': command, 'inputs': inputs}
+            if len(running) == 0:
+                break
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                stage = stages[name]
+                try:
+                    exit_code, wall_time, peak_memory_mb = future.result()
+                except OSError:
+                    logger.error("Failed to run stage {}".format(name),
+                                 exc_info=True)
+                    exit_code, wall_time, peak_memory_mb = -1, None, None
+                _invalidate_fingerprints(stage['outputs'])
+                record = state[name]
+                record.update({
+                    'exit_code': exit_code,
+                    'wall_time_s': wall_time,
+                    'peak_memory_mb': peak_memory_mb,
+                    'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')})
+                if exit_code == 0:
+                    status[name] = 'success'
+                    # inputs that are modified by the stage itself
+                    for path in stage['outputs']:
+                        if path in record['inputs']:
+                            record['inputs'][path] = _fingerprint(path)
+                    record['outputs'] = {
+                        x: _fingerprint(x) for x in stage['outputs']}
+                else:
+                    status[name] = 'failed'
+                    logger.error("Stage {} failed with exit code {}".format(
+                        name, exit_code))
+                record['status'] = status[name]
+                logger.info(
+                    "Stage {} - {} - wall time: {} - peak memory: {}".format(
+                        name, status[name],
+                        _format_value(wall_time, '{:.1f}s'),
+                        _format_value(peak_memory_mb, '{:.0f}MB')))
+                if not dry_run:
+                    write_state(state_file, state)
+    return status
+
+
+def _format_value(value, fmt):
+    if value is None:
+        return 'n/a'
+    return fmt.format(value)
+
+
+def _parse_variables(assignments):
+    """ Parse KEY=VALUE strings """
+    variables = dict()
+    for assignment in assignments:
+        if '=' not in assignment:
+            raise ValueError(
+                "variable {} must be specified as KEY=VALUE".format(
+                    assignment))
+        key, value = assignment.split('=', 1)
+        variables[key] = value
+    return variables
+
+
+if __name__ == '__main__':
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--pipeline", type=str, required=True,
+        help="Pipeline definition (.yaml)")
+    parser.add_argument(
+        "--state_file", type=str, required=True,
+        help="File to store fingerprints and timings of the stages (.json)")
+    parser.add_argument(
+        "--var", type=str, nargs='+', default=[],
+        help="Set / override variables of the pipeline: KEY=VALUE")
+    parser.add_argument(
+        "--max_parallel", type=int, default=1,
+        help="Max. number of stages to run concurrently")
+    parser.add_argument(
+        "--stages", type=str, nargs='+', default=None,
+        help="Run only these stages (if not up to date)")
+    parser.add_argument(
+        "--force", action='store_true',
+        help="Run stages even if they are up to date")
+    parser.add_argument(
+        "--dry_run", action='store_true',
+        help="Only list the stages that would run")
+    parser.add_argument(
+        "--output_dir", type=str, default=None,
+        help="Directory to store the output of each stage")
+    parser.add_argument(
+        "--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str, default='pipeline')
+    args = vars(parser.parse_args())
+
+    set_logging(args['log_dir'], args['log_filename'])
+
+    logger = logging.getLogger(__name__)
+
+    for k, v in args.items():
+        logger.info("Argument {}: {}".format(k, v))
+
+    with record_run_status():
+        stages = load_pipeline(
+            args['pipeline'], _parse_variables(args['var']))
+
+        status = run_pipeline(
+            stages, state_file=args['state_file'],
+            max_parallel=args['max_parallel'], force=args['force'],
+            only_stages=args['stages'], output_dir=args['output_dir'],
+            dry_run=args['dry_run'])
+
+        state = read_state(args['state_file'])
+        for name, stage_status in status.items():
+            record = state.get(name, dict())
+            logger.info(
+                "{:35} {:12} wall time: {:>10} peak memory: {:>8}".format(
+                    name, stage_status,
+                    _format_value(record.get('wall_time_s'), '{:.1f}s'),
+                    _format_value(record.get('peak_memory_mb'), '{:.0f}MB')))
+
+        if any(x in ('failed', 'blocked') for x in status.values()):
+            sys.exit(1)
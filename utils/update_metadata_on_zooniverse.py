@@ -1,15 +1,16 @@
 """ Update MetaData of a subject on Zooniverse based on a pre-defined logic to
     fix legacy data - dont use this if you dont know what it does
 """
-import os
 import pandas as pd
-from collections import OrderedDict
 import argparse
+import logging
 
-from panoptes_client import Panoptes, Subject
+from panoptes_client import Panoptes
 
-from utils.utils import read_config_file, slice_generator, current_time_str
+from utils.logger import set_logging
+from utils.utils import read_config_file
 from zooniverse_uploads import uploader
+from zooniverse_uploads.subject_updater import update_subjects
 
 
 # project_id = '5155'
@@ -32,6 +33,44 @@ from zooniverse_uploads import uploader
 # --dry_run
 
 
+def fix_legacy_metadata(metadata, season_id_to_add=''):
+    """ Add '#season', '#capture_id' and 'capture_id_anonymized' if missing
+        and remove 'capture_id'
+    """
+    meta_to_update = dict()
+    # update season field
+    if '#season' not in metadata:
+        if season_id_to_add != '':
+            meta_to_update['#season'] = season_id_to_add
+    # add capture_id
+    if '#capture_id' not in metadata:
+        if '#season' in meta_to_update:
+            season = meta_to_update['#season']
+        else:
+            season = metadata['#season']
+        site = metadata['#site']
+        roll = metadata['#roll']
+        capture = metadata['#capture']
+        capture_id = '{season}#{site}#{roll}#{capture}'.format(
+            **{'season': season,
+               'site': site,
+               'roll': roll,
+               'capture': capture})
+        meta_to_update['#capture_id'] = capture_id
+    # add capture_id_anonymized
+    if 'capture_id_anonymized' not in metadata:
+        if '#capture_id' in metadata:
+            anonym = uploader.anonymize_id(metadata['#capture_id'])
+            meta_to_update['capture_id_anonymized'] = anonym
+        elif '#capture_id' in meta_to_update:
+            anonym = uploader.anonymize_id(meta_to_update['#capture_id'])
+            meta_to_update['capture_id_anonymized'] = anonym
+    # remove capture id
+    metadata.pop('capture_id', None)
+    metadata.update(meta_to_update)
+    return metadata
+
+
 if __name__ == "__main__":
 
     # Parse command line arguments
@@ -40,120 +79,41 @@ if __name__ == "__main__":
     parser.add_argument("--season_id_to_add", type=str, default='')
     parser.add_argument("--tracker_file", type=str, required=True)
     parser.add_argument("--dry_run", action='store_true')
+    parser.add_argument(
+        "--password_file", type=str, default='~/keys/passwords.ini')
+    parser.add_argument(
+        "--n_workers", type=int, default=5,
+        help="Max number of subjects to save concurrently.")
+    parser.add_argument(
+        "--page_size", type=int, default=100,
+        help="Number of subjects to fetch per request.")
 
     args = vars(parser.parse_args())
 
-    print("Reading Subjects File", flush=True)
-    df = pd.read_csv(args['subjects_to_update_csv'], dtype=str)
+    set_logging()
+    logger = logging.getLogger(__name__)
 
-    print("Read {} records".format(df.shape[0]), flush=True)
+    logger.info("Reading Subjects File")
+    df = pd.read_csv(args['subjects_to_update_csv'], dtype=str)
 
-    subject_ids = list(df['subject_id'])
+    logger.info("Read {} records".format(df.shape[0]))
 
-    if not os.path.isfile(args['tracker_file']):
-        with open(args['tracker_file'], 'w') as f:
-            f.writelines([''])
-        print("Created Tracker File at {}".format(
-            args['tracker_file']), flush=True)
+    subject_ids = list(df['subject_id'].unique())
 
-    with open(args['tracker_file'], 'r') as f:
-        tracker = f.read().splitlines()
+    config = read_config_file(args['password_file'])
+    Panoptes.connect(username=config['zooniverse']['username'],
+                     password=config['zooniverse']['password'])
 
-    subjects_already_updated = OrderedDict((x, None) for x in tracker)
-    print("Found {} records in tracker file".format(len(tracker)), flush=True)
+    logger.info("Starting to update subjects")
 
-    # subjects to update
-    subjects_to_update = list(set(subject_ids) - subjects_already_updated.keys())
-    print("{} subjects remain for update".format(
-        len(subjects_to_update)), flush=True)
+    stats = update_subjects(
+        subject_ids,
+        lambda subject_id, metadata: fix_legacy_metadata(
+            metadata, args['season_id_to_add']),
+        args['tracker_file'],
+        n_workers=args['n_workers'], page_size=args['page_size'],
+        dry_run=args['dry_run'])
 
-    config = read_config_file('~/keys/passwords.ini')
-    Panoptes.connect(username=config['zooniverse']['username'],
-                     password=config['zooniverse']['password'])
-    # my_project = Project(args['project_id'])
-    # my_set = SubjectSet().find(args['subject_set_id'])
-
-    n_updated = 0
-    n_already_updated = 0
-    print("Starting to update subjects", flush=True)
-
-    n_to_update = len(subjects_to_update)
-    slices = slice_generator(n_to_update, n_to_update // 100)
-
-    for i_start, i_end in slices:
-        subjects_updated = list()
-        subject_objects = list()
-        with Subject.async_saves():
-            for subject_id in subjects_to_update[i_start:i_end]:
-                subject = Subject.find(subject_id)
-                meta_to_update = dict()
-                # update season field
-                if not '#season' in subject.metadata:
-                    if args['season_id_to_add'] != '':
-                        meta_to_update['#season'] = args['season_id_to_add']
-                # add capture_id
-                if not '#capture_id' in subject.metadata:
-                    if '#season' in meta_to_update:
-                        season = meta_to_update['#season']
-                    else:
-                        season = subject.metadata['#season']
-                    site = subject.metadata['#site']
-                    roll = subject.metadata['#roll']
-                    capture = subject.metadata['#capture']
-                    capture_id = '{season}#{site}#{roll}#{capture}'.format(
-                        **{'season': season,
-                           'site': site,
-                           'roll': roll,
-                           'capture': capture})
-                    meta_to_update['#capture_id'] = capture_id
-                # add capture_id_anonymized
-                if not 'capture_id_anonymized' in subject.metadata:
-                    if '#capture_id' in subject.metadata:
-                        anonym = uploader.anonymize_id(subject.metadata['#capture_id'])
-                        meta_to_update['capture_id_anonymized'] = anonym
-                    elif '#capture_id' in meta_to_update:
-                        anonym = uploader.anonymize_id(meta_to_update['#capture_id'])
-                        meta_to_update['capture_id_anonymized'] = anonym
-                    else:
-                        pass
-                # remove capture id
-                if 'capture_id' in subject.metadata:
-                    subject.metadata.pop('capture_id', None)
-                # print
-                if n_updated <= 10:
-                    print("Updating From:", flush=True)
-                    print(subject.metadata, flush=True)
-                    print("=====================================", flush=True)
-                subject.metadata.update(meta_to_update)
-                if n_updated <= 10:
-                    print("Updating To:", flush=True)
-                    print(subject.metadata, flush=True)
-                    print("=====================================", flush=True)
-                if args['dry_run']:
-                    continue
-                if len(meta_to_update.keys()) == 0:
-                    subjects_updated.append(subject_id)
-                    n_updated += 1
-                    n_already_updated += 1
-                    continue
-                else:
-                    subject.save()
-                    subject_objects.append(subject)
-        # verify save status
-        for subject in subject_objects:
-            if subject.async_save_result:
-                subjects_updated.append(subject.id)
-                n_updated += 1
-            else:
-                print("Failed to save subject {}".format(
-                    subject.id), flush=True)
-        print("updated {} subjects".format(n_updated), flush=True)
-        print("Found {} already updated subjects".format(
-            n_already_updated), flush=True)
-        with open(args['tracker_file'], 'a') as f:
-            for line in subjects_updated:
-                f.write(line + '\n')
-        print("{} - Updated tracker file at {}".format(
-            current_time_str(),
-            args['tracker_file']), flush=True)
-    print("Finished updating subjects", flush=True)
+    for k, v in stats.items():
+        logger.info("Subjects {}: {}".format(k, v))
+    logger.info("Finished updating subjects")
@@ -1,13 +1,14 @@
 """ Update ML scores for a subject set on Zooniverse based on a
     Manifest with ML scores """
-import json
-import os
-from collections import OrderedDict
 import argparse
+import logging
 
-from panoptes_client import Panoptes, Subject
+from panoptes_client import Panoptes
 
-from utils.utils import read_config_file, slice_generator, current_time_str
+from utils.logger import set_logging
+from utils.utils import read_config_file
+from zooniverse_uploads.manifest import read_manifest_entries
+from zooniverse_uploads.subject_updater import update_subjects
 
 
 # project_id = '5155'
@@ -39,136 +40,43 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--manifest_path", type=str, required=True)
     parser.add_argument("--tracker_file", type=str, required=True)
+    parser.add_argument(
+        "--password_file", type=str, default='~/keys/passwords.ini')
+    parser.add_argument(
+        "--n_workers", type=int, default=5,
+        help="Max number of subjects to save concurrently.")
+    parser.add_argument(
+        "--page_size", type=int, default=100,
+        help="Number of subjects to fetch per request.")
 
     args = vars(parser.parse_args())
 
-    print("Reading Manifest", flush=True)
-    with open(args['manifest_path'], 'r') as f:
-        mani = json.load(f)
-    print("Finished Reading Manifest", flush=True)
-
-    if not os.path.isfile(args['tracker_file']):
-        with open(args['tracker_file'], 'w') as f:
-            f.writelines([''])
-        print("Created Tracker File at {}".format(
-            args['tracker_file']), flush=True)
-
-    with open(args['tracker_file'], 'r') as f:
-        tracker = f.read().splitlines()
-
-    subjects_uploaded = OrderedDict((x, None) for x in tracker)
-    print("Found {} records in tracker file".format(len(tracker)), flush=True)
+    set_logging()
+    logger = logging.getLogger(__name__)
 
     # create subject id to mapping
+    logger.info("Reading Manifest")
     subid_dict = dict()
-    for k, v in mani.items():
+    for k, v in read_manifest_entries(args['manifest_path']):
         _id = v['info']['subject_id']
         meta_data = v["upload_metadata"]
         subid_dict[_id] = {k: v for k, v in meta_data.items() if k.startswith('#machine')}
+    logger.info("Finished Reading Manifest")
 
-    # subjects to update
-    subjects_to_update = list(subid_dict.keys() - subjects_uploaded.keys())
-    print("{} subjects remain for update".format(
-        len(subjects_to_update)), flush=True)
+    def update_ml_scores(subject_id, metadata):
+        metadata.update(subid_dict[subject_id])
+        return metadata
 
-    config = read_config_file('~/keys/passwords.ini')
+    config = read_config_file(args['password_file'])
     Panoptes.connect(username=config['zooniverse']['username'],
                      password=config['zooniverse']['password'])
-    n_updated = 0
-    n_already_updated = 0
-    print("Starting to update subjects", flush=True)
-
-    n_to_update = len(subjects_to_update)
-    slices = slice_generator(n_to_update, n_to_update // 100)
-
-    for i_start, i_end in slices:
-        subjects_updated = list()
-        subject_objects = list()
-        with Subject.async_saves():
-            for subject_id in subjects_to_update[i_start:i_end]:
-                subject = Subject.find(subject_id)
-                new_data = subid_dict[subject_id]
-                if new_data.items() <= subject.metadata.items():
-                    subjects_updated.append(subject_id)
-                    n_updated += 1
-                    n_already_updated += 1
-                    continue
-                subject.metadata.update(new_data)
-                subject.save()
-                subject_objects.append(subject)
-        # verify save status
-        for subject in subject_objects:
-            if subject.async_save_result:
-                subjects_updated.append(subject.id)
-                n_updated += 1
-            else:
-                print("Failed to save subject {}".format(
-                    subject.id), flush=True)
-        print("updated {} subjects".format(n_updated), flush=True)
-        print("Found {} already updated subjects".format(
-            n_already_updated), flush=True)
-        with open(args['tracker_file'], 'a') as f:
-            for line in subjects_updated:
-                f.write(line + '\n')
-        print("{} - Updated tracker file at {}".format(
-            current_time_str(),
-            args['tracker_file']), flush=True)
-    print("Finished updating subjects", flush=True)
-
-
-
-
-    # for i_start, i_end in slices:
-    #     subjects_updated = list()
-    #     for subject_id in subjects_to_update[i_start:i_end]:
-    #         subject = Subject.find(subject_id)
-    #         new_data = subid_dict[subject_id]
-    #         if new_data.items() <= subject.metadata.items():
-    #             print("Already updated subject {}".format(subject_id), flush=True)
-    #             subjects_updated.append(subject_id)
-    #             n_updated += 1
-    #             continue
-    #         subject.metadata.update(new_data)
-    #         subject.save()
-    #         if args['verify_upload']:
-    #             subject_updated = Subject.find(subject_id)
-    #             if new_data.items() <= subject_updated.metadata.items():
-    #                 subjects_updated.append(subject_id)
-    #                 n_updated += 1
-    #             else:
-    #                 print("Failed to save subject {}".format(
-    #                     subject_id), flush=True)
-    #         else:
-    #             subjects_updated.append(subject_id)
-    #             n_updated += 1
-    #     print("updated {} subjects".format(n_updated), flush=True)
-    #     with open(args['tracker_file'], 'a') as f:
-    #         for line in subjects_updated:
-    #             f.write(line + '\n')
-    #     print("Updated tracker file at {}".format(
-    #         args['tracker_file']), flush=True)
-    # print("Finished updating subjects", flush=True)
-
-
-
-
-    # for i_start, i_end in slices:
-    #     subjects_updated = list()
-    #     with Subject.async_saves():
-    #         for subject_id in subjects_to_update[i_start:i_end]:
-    #             subject = Subject.find(subject_id)
-    #             new_data = subid_dict[subject_id]
-    #             subject.metadata.update(new_data)
-    #             subject.save()
-    #             subjects_updated.append(subject_id)
-    #             n_updated += 1
-    #             else:
-    #                 print("Failed to save subject {}".format(
-    #                     subject_id), flush=True)
-    #     print("updated {} subjects".format(n_updated), flush=True)
-    #     with open(args['tracker_file'], 'a') as f:
-    #         for line in subjects_updated:
-    #             f.write(line + '\n')
-    #     print("Updated tracker file at {}".format(
-    #         args['tracker_file']), flush=True)
-    # print("Finished updating subjects", flush=True)
+
+    logger.info("Starting to update subjects")
+
+    stats = update_subjects(
+        list(subid_dict.keys()), update_ml_scores, args['tracker_file'],
+        n_workers=args['n_workers'], page_size=args['page_size'])
+
+    for k, v in stats.items():
+        logger.info("Subjects {}: {}".format(k, v))
+    logger.info("Finished updating subjects")
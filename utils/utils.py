@@ -1,12 +1,11 @@
 """ Util Functions """
 import sys
 import os
+import re
 import time
 import datetime
 import json
 import hashlib
-import random
-import pandas as pd
 from hashlib import md5
 import logging
 import configparser
@@ -185,6 +184,60 @@ def assign_zero_one_to_split(zero_one_value, split_percents, split_names):
             return sn
 
 
+def ids_to_zero_one(ids):
+    """ Deterministically assign strings to values 0-1 (array)
+        - identical to 'id_to_zero_one' for each id
+    """
+    import numpy as np
+    digests = bytearray()
+    for value in ids:
+        try:
+            to_hash = str(value).encode('ascii')
+        except UnicodeEncodeError:
+            raise ValueError("value %s could not be hashed" % value)
+        # first 6 hex chars of the hash
+        digests += md5(to_hash).digest()[:3]
+    first_bytes = np.frombuffer(
+        bytes(digests), dtype=np.uint8).reshape(-1, 3).astype('int64')
+    values_hex = (first_bytes[:, 0] << 16) | (first_bytes[:, 1] << 8) | \
+        first_bytes[:, 2]
+    return values_hex / 0xFFFFFF
+
+
+def split_boundaries(split_percents):
+    """ Cumulative split percentages (upper boundaries of the splits) """
+    return [sum(split_percents[0:(i+1)]) for i in
+            range(0, len(split_percents))]
+
+
+def assign_zero_one_to_splits(zero_one_values, split_percents, split_names):
+    """ Assign values between 0 and 1 to splits according to a percentage
+        distribution (list) -- identical to 'assign_zero_one_to_split'
+        for each value (None for values above all splits)
+    """
+    import numpy as np
+    n_splits = min(len(split_percents), len(split_names))
+    boundaries = np.array(
+        split_boundaries(split_percents)[0:n_splits], dtype='float64')
+    split_ids = np.searchsorted(
+        boundaries, np.asarray(zero_one_values, dtype='float64'),
+        side='left')
+    split_names = list(split_names[0:n_splits]) + [None]
+    return [split_names[i] for i in split_ids]
+
+
+def ids_to_splits(ids, split_percents, split_names):
+    """ Deterministically assign ids to splits (list)
+        Example:
+            ids: ['SER_S1#B04#1#1', 'SER_S1#B04#1#17', 'SER_S1#B04#1#18']
+            split_percents: [0.9, 0.05, 0.05]
+            split_names: ['train', 'val', 'test']
+            returns: ['train', 'test', 'val']
+    """
+    return assign_zero_one_to_splits(
+        ids_to_zero_one(ids), split_percents, split_names)
+
+
 def sort_df_by_capture_id(df):
     """ Sort df by capture_id """
     if 'capture_id' in df.columns.tolist():
@@ -198,30 +251,46 @@ def sort_df_by_capture_id(df):
     df.drop('sort_id', inplace=True, axis=1)
 
 
+def int_values(values):
+    """ int() of all values of a column (pd.Series), returns a list
+        - vectorized if possible
+    """
+    try:
+        return values.astype('int64').tolist()
+    except (ValueError, TypeError, OverflowError):
+        return [int(x) for x in values]
+
+
+def _img_rank_values(values, row_ids):
+    """ int() of all image ranks (list), the row id is used for ranks that
+        are not integers
+    """
+    try:
+        return values.astype('int64').tolist()
+    except (ValueError, TypeError, OverflowError):
+        pass
+    img_ranks = list()
+    for value, row_id in zip(values, row_ids):
+        try:
+            img_ranks.append(int(value))
+        except ValueError:
+            img_ranks.append(row_id)
+    return img_ranks
+
+
 def sort_df(df):
     """ Sort df by season, site, roll, capture, image """
-    sort_id = []
-    for row_id, row in df.iterrows():
-        if 'image_rank_in_capture' in row:
-            try:
-                img_rank = int(row.image_rank_in_capture)
-            except ValueError:
-                img_rank = row_id
-        elif 'image' in row:
-            try:
-                img_rank = int(row.image)
-            except ValueError:
-                img_rank = row_id
-        else:
-            img_rank = int(row_id)
-        _id = '{}#{}#{}#{:05}#{:07}'.format(
-                row.season,
-                row.site,
-                row.roll,
-                int(row.capture),
-                img_rank
-                )
-        sort_id.append(_id)
+    row_ids = df.index.tolist()
+    if 'image_rank_in_capture' in df.columns:
+        img_ranks = _img_rank_values(df['image_rank_in_capture'], row_ids)
+    elif 'image' in df.columns:
+        img_ranks = _img_rank_values(df['image'], row_ids)
+    else:
+        img_ranks = [int(x) for x in row_ids]
+    sort_id = [
+        '{}#{}#{}#{:05}#{:07}'.format(*x) for x in zip(
+            df['season'].tolist(), df['site'].tolist(), df['roll'].tolist(),
+            int_values(df['capture']), img_ranks)]
     df['sort_id'] = sort_id
     df.sort_values(['sort_id'], inplace=True)
     df.drop('sort_id', inplace=True, axis=1)
@@ -246,6 +315,129 @@ def export_dict_to_json_with_newlines(data, path):
         outfile.write('}')
 
 
+class _IncrementalJsonReader(object):
+    """ Read JSON values from a file while keeping only a chunk of the file
+        (and the value being parsed) in memory
+    """
+    _whitespace = re.compile(r'\s*')
+
+    def __init__(self, f, path, chunk_size):
+        self.f = f
+        self.path = path
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek_char(self):
+        """ Next non-whitespace char ('' at the end of the file) """
+        while True:
+            self.pos = self._whitespace.match(self.buffer, self.pos).end()
+            if (self.pos < len(self.buffer)) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._read_more()
+
+    def read_char(self):
+        char = self.peek_char()
+        if char == '':
+            raise ValueError("Unexpected end of file: {}".format(self.path))
+        self.pos += 1
+        return char
+
+    def read_value(self):
+        while True:
+            self.pos = self._whitespace.match(self.buffer, self.pos).end()
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a value at the end of the buffer may be incomplete
+                if (end < len(self.buffer)) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read_more()
+
+    def expect_char(self, expected):
+        if self.read_char() != expected:
+            raise ValueError("Invalid JSON in: {}".format(self.path))
+
+    def iter_object_keys(self):
+        """ Consume a JSON object and yield its keys - the caller has to
+            consume the value of each key
+        """
+        self.expect_char('{')
+        if self.peek_char() == '}':
+            self.read_char()
+            return
+        while True:
+            key = self.read_value()
+            self.expect_char(':')
+            yield key
+            delim = self.read_char()
+            if delim == '}':
+                return
+            if delim != ',':
+                raise ValueError("Invalid JSON object in: {}".format(
+                    self.path))
+
+    def iter_array_values(self):
+        """ Consume a JSON array and yield its values """
+        self.expect_char('[')
+        if self.peek_char() == ']':
+            self.read_char()
+            return
+        while True:
+            yield self.read_value()
+            delim = self.read_char()
+            if delim == ']':
+                return
+            if delim != ',':
+                raise ValueError("Invalid JSON array in: {}".format(
+                    self.path))
+
+
+def iter_json_object_items(path, chunk_size=1024 * 1024):
+    """ Incrementally parse a file containing a single JSON object and
+        yield its (key, value) pairs -- memory is bounded by chunk_size
+        and the largest value instead of the size of the file
+    """
+    with open(path, 'r') as f:
+        reader = _IncrementalJsonReader(f, path, chunk_size)
+        if reader.peek_char() != '{':
+            raise ValueError("File does not contain a JSON object: {}".format(
+                path))
+        for key in reader.iter_object_keys():
+            yield key, reader.read_value()
+
+
+def iter_json_object_array_items(path, chunk_size=1024 * 1024):
+    """ Incrementally parse a file containing a single JSON object and
+        yield (key, value) pairs - values of arrays are yielded one by one,
+        e.g. {"a": [1, 2], "b": 3} yields ('a', 1), ('a', 2), ('b', 3)
+        -- memory is bounded by chunk_size and the largest array element
+    """
+    with open(path, 'r') as f:
+        reader = _IncrementalJsonReader(f, path, chunk_size)
+        if reader.peek_char() != '{':
+            raise ValueError("File does not contain a JSON object: {}".format(
+                path))
+        for key in reader.iter_object_keys():
+            if reader.peek_char() == '[':
+                for value in reader.iter_array_values():
+                    yield key, value
+            else:
+                yield key, reader.read_value()
+
+
 def file_path_generator(
         dir, id, name, batch="complete",
         file_delim="__", file_ext='json'):
@@ -273,49 +465,112 @@ def file_path_splitter(path, file_delim="__", file_ext='json'):
             'file_delim': file_delim, 'file_ext': file_ext}
 
 
-def _append_season_to_image_path(path, season):
-    """ Appned season tag to image path """
-    path_first = next(part for part in path.split(os.path.sep) if part)
-    if not path_first == season:
-        return os.path.join(season, path)
-    else:
-        return path
-
-
-def _any_row_val_in_map(row, map):
-    for col, vals_list in map.items():
-        if col in row:
-            if row[col] in vals_list:
-                return True
-    return False
+def _append_season_to_image_paths(paths, seasons):
+    """ Append season tag to image paths (if not already the first part)
+        - vectorized version of os.path.join(season, path)
+    """
+    sep = os.path.sep
+    path_first = paths.str.lstrip(sep).str.split(sep, n=1).str[0]
+    no_sep_needed = (seasons == '') | seasons.str.endswith(sep)
+    joined = (seasons + sep + paths).where(~no_sep_needed, seasons + paths)
+    joined = joined.where(~paths.str.startswith(sep), paths)
+    return joined.where(path_first != seasons, paths)
 
 
 def remove_images_from_df(
         df, remove_col_to_vals_map):
     """ Remove invalid / no_upload images from df """
-    i_to_include = list()
-    for row_i, row in df.iterrows():
-        if _any_row_val_in_map(row, remove_col_to_vals_map):
-            logger.debug("image {} excluded".format(row.path))
-        else:
-            i_to_include.append(row_i)
-    df = df.iloc[i_to_include]
+    import pandas as pd
+    to_remove = pd.Series(False, index=df.index)
+    for col, vals_list in remove_col_to_vals_map.items():
+        if col in df.columns:
+            to_remove |= df[col].isin(vals_list)
+    logger.debug("{} images excluded".format(to_remove.sum()))
+    return df[~to_remove]
+
+
+def _season_file_cache_paths(path):
+    """ Paths of the cached season file (csv) and its meta data (json) """
+    return '{}.cache.csv'.format(path), '{}.cache.json'.format(path)
+
+
+def _read_season_file_cache(path):
+    """ Read a cached season file (None if missing or outdated) """
+    import pandas as pd
+    cache_path, meta_path = _season_file_cache_paths(path)
+    if not (os.path.isfile(cache_path) and os.path.isfile(meta_path)):
+        return None
+    stat = os.stat(path)
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if (meta['source_mtime_ns'] != stat.st_mtime_ns) or \
+                (meta['source_size'] != stat.st_size) or \
+                (meta['cache_size'] != os.path.getsize(cache_path)):
+            logger.info("Cache {} is outdated".format(cache_path))
+            return None
+        df = pd.read_csv(
+            cache_path, dtype='str', index_col=None, keep_default_na=False)
+        for col, dtype in meta['dtypes'].items():
+            if dtype != 'object':
+                df[col] = df[col].astype(dtype)
+    except Exception as e:
+        logger.warning("Failed to read cache {}: {}".format(cache_path, e))
+        return None
+    logger.info("Read season file from cache {}".format(cache_path))
     return df
 
 
-def read_cleaned_season_file_df(path):
+def _write_season_file_cache(df, path):
+    """ Cache a parsed season file (csv) next to the season file, with the
+        size and modification time of the season file (json)
+    """
+    cache_path, meta_path = _season_file_cache_paths(path)
+    stat = os.stat(path)
+    try:
+        df.to_csv(cache_path + '.tmp', index=False)
+        meta = {
+            'source_mtime_ns': stat.st_mtime_ns,
+            'source_size': stat.st_size,
+            'cache_size': os.path.getsize(cache_path + '.tmp'),
+            'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}}
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        # meta data last: an old meta data file does not match the new
+        # cache file
+        os.replace(cache_path + '.tmp', cache_path)
+        os.replace(meta_path + '.tmp', meta_path)
+        set_file_permission(cache_path)
+        set_file_permission(meta_path)
+        logger.info("Wrote season file cache {}".format(cache_path))
+    except OSError as e:
+        logger.warning("Failed to write cache {}: {}".format(cache_path, e))
+
+
+def read_cleaned_season_file_df(path, use_cache=False):
+    """ Read a cleaned season file - adds 'path' and 'capture_id' columns
+        (if missing) and sorts the images
+        - use_cache: store the result in a sidecar file ('.cache.csv',
+          with '.cache.json') which is re-used while the season file is
+          unchanged
+    """
+    import pandas as pd
+    if use_cache:
+        df = _read_season_file_cache(path)
+        if df is not None:
+            return df
     df = pd.read_csv(path, dtype='str', index_col=None)
     df.fillna('', inplace=True)
     required_header_cols = ('capture_id', 'season', 'site', 'roll', 'capture',
                             'path')
     if 'path' not in df.columns:
         if 'image_path_rel' in df.columns:
-            df['path'] = df[['image_path_rel', 'season']].apply(
-                lambda x: _append_season_to_image_path(*x), axis=1)
+            df['path'] = _append_season_to_image_paths(
+                df['image_path_rel'], df['season'])
 
     if 'capture_id' not in df.columns:
-        df['capture_id'] = df[['season', 'site', 'roll', 'capture']].apply(
-                        lambda x: create_capture_id(*x), axis=1)
+        df['capture_id'] = df['season'].str.cat(
+            df[['site', 'roll', 'capture']], sep='#')
 
     for col in required_header_cols:
         if col not in df.columns:
@@ -328,6 +583,8 @@ def read_cleaned_season_file_df(path):
     except Exception as e:
         logger.warning("Failed to sort dataframe")
         logger.warning(e, exc_info=True)
+    if use_cache:
+        _write_season_file_cache(df, path)
     return df
 
 
@@ -355,11 +612,50 @@ def set_file_permission(path):
         pass
 
 
-def balanced_sample_best_effort(y, n_samples):
+def balanced_sample_quotas(class_sizes, n_samples):
+    """ Number of samples per class to sample as balanced as possible
+        - every class gets the same number of samples unless it has fewer
+          observations, samples exceeding 'n_samples' are removed from
+          the last classes
+    Args:
+        class_sizes: list - number of observations per class
+        n_samples: int - number of samples to take
+    Returns:
+        quotas: list - number of samples per class
+    Example:
+        class_sizes: [1, 10, 10]
+        n_samples: 4
+        quotas: [1, 2, 1]
+    """
+    import numpy as np
+    sizes = np.asarray(class_sizes, dtype='int64')
+    n_samples = min(n_samples, int(sizes.sum()))
+    if n_samples <= 0:
+        return [0 for _ in class_sizes]
+    # smallest level such that min(size, level) sums to at least n_samples
+    sorted_sizes = np.sort(sizes)
+    n_below = np.cumsum(sorted_sizes) - sorted_sizes
+    n_at_levels = n_below + sorted_sizes * (
+        len(sorted_sizes) - np.arange(len(sorted_sizes)))
+    i = np.searchsorted(n_at_levels, n_samples, side='left')
+    n_classes_above = len(sorted_sizes) - i
+    level = -(-(n_samples - n_below[i]) // n_classes_above)
+    quotas = np.minimum(sizes, level)
+    # remove samples exceeding n_samples from the last classes
+    n_before = np.cumsum(quotas) - quotas
+    quotas = np.clip(n_samples - n_before, 0, quotas)
+    return quotas.tolist()
+
+
+def balanced_sample_best_effort(y, n_samples, seed=None):
     """ Sample as balanced as possible from labels
+        - classes are sampled in order of increasing frequency
+        - sampling is reproducible for a given seed
     Args:
-        y: list - class labels of all observations
+        y: list / Series - class labels of all observations, or DataFrame to
+           use each combination of column values as a class
         n_samples: int - number of samples to take
+        seed: int - seed of the random number generator (default: random)
     Returns:
         sampled_list: list - indexes of 'y' that have been sampled
     Example:
@@ -367,46 +663,39 @@ def balanced_sample_best_effort(y, n_samples):
         n_samples: 3
         sampled_list: [3, 2, 0]
     """
-    # calculate class frequencies
-    class_to_frequency = Counter(y)
-    class_ordered_by_freq = class_to_frequency.most_common()
-    # calculate how many samples to (ideally) get per class
-    n_tot = sum(class_to_frequency.values())
-    n_samples = min(n_samples, n_tot)
-    # create class to id map / class to sample ids
-    class_to_ids_map = {k: [] for k in class_to_frequency.keys()}
-    class_ids_sampled = {k: [] for k in class_to_frequency.keys()}
-    for _id, yy in enumerate(y):
-        class_to_ids_map[yy].append(_id)
-    # sample iteratively
-    n_sampled = 0
-    n_to_sample_per_step = 1
-    while n_sampled < n_samples:
-        # sample from least frequent class
-        for k, f in reversed(class_ordered_by_freq):
-            n_in_group = len(class_to_ids_map[k])
-            n_to_sample = min(n_in_group, n_to_sample_per_step)
-            # randomly sample n_to_sample from the class and remove them
-            class_ids_sampled[k] += [
-                class_to_ids_map[k].pop(
-                    random.randrange(len(class_to_ids_map[k])))
-                for _ in range(n_to_sample)]
-            n_sampled += n_to_sample
-    # get all sampled ids
-    sampled_ids = [class_ids_sampled[k] for k, f in
-                   reversed(class_ordered_by_freq)]
-    sampled_list = list()
-    # ensure that sampled list has the correct length
-    for i, x in enumerate(sampled_ids):
-        sampled_list += x
-        if i >= n_samples:
-            break
-    sampled_list = sampled_list[0:n_samples]
-    return sampled_list
+    import numpy as np
+    import pandas as pd
+    if isinstance(y, pd.DataFrame):
+        codes = y.groupby(
+            list(y.columns), sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        codes = pd.factorize(pd.Series(y, dtype=object), sort=False)[0]
+    if len(codes) == 0:
+        return list()
+    # class frequencies, codes are in order of first appearance
+    class_sizes = np.bincount(codes)
+    # sample from least frequent class first (reverse of most_common)
+    class_order = np.argsort(-class_sizes, kind='stable')[::-1]
+    quotas = balanced_sample_quotas(class_sizes[class_order], n_samples)
+    # ids of each class
+    ids_by_class = np.argsort(codes, kind='stable')
+    class_starts = np.concatenate([[0], np.cumsum(class_sizes)])
+    rng = np.random.default_rng(seed)
+    sampled = list()
+    for class_id, n_to_sample in zip(class_order, quotas):
+        if n_to_sample == 0:
+            continue
+        class_ids = ids_by_class[
+            class_starts[class_id]:class_starts[class_id + 1]]
+        sampled.append(rng.choice(class_ids, n_to_sample, replace=False))
+    if len(sampled) == 0:
+        return list()
+    return np.concatenate(sampled).tolist()
 
 
 def merge_csvs(base_csv, to_add_csv, key, merge_new_cols_to_right=True):
     """ Merge two csvs and return a df """
+    import pandas as pd
 
     df_base = pd.read_csv(
         base_csv, dtype='str')
@@ -0,0 +1,222 @@
+""" Download (Export) Files over HTTP
+    - streams the raw bytes to disk
+    - downloads byte ranges in parallel if the server supports them
+    - resumes partial downloads, failed range requests are retried with
+      exponential backoff
+    - verifies the length and (if available) the MD5 checksum
+    - optionally gzips the output: the downloaded (uncompressed) parts are
+      compressed into the output file after the download (one more pass
+      over the data, the parts need the uncompressed size on disk)
+"""
+import os
+import json
+import time
+import gzip
+import base64
+import hashlib
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from utils.utils import slice_generator
+
+
+logger = logging.getLogger(__name__)
+
+
+# Information about a remote file
+DownloadInfo = namedtuple(
+    'DownloadInfo',
+    ['size', 'accepts_ranges', 'etag', 'md5'])
+
+
+def get_download_info(url, timeout=60):
+    """ Get size, range support, ETag and MD5 (base64) of a remote file
+        - all fields are None / False if the server does not answer HEAD
+    """
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=timeout)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning("HEAD request failed: {}".format(e))
+        return DownloadInfo(None, False, None, None)
+    headers = response.headers
+    size = headers.get('Content-Length')
+    size = int(size) if size is not None else None
+    accepts_ranges = headers.get('Accept-Ranges', '').lower() == 'bytes'
+    md5 = headers.get('Content-MD5', headers.get('x-ms-blob-content-md5'))
+    return DownloadInfo(size, accepts_ranges, headers.get('ETag'), md5)
+
+
+def _part_path(output_file, part_no):
+    return '{}.part{}'.format(output_file, part_no)
+
+
+def _state_path(output_file):
+    return '{}.download_state'.format(output_file)
+
+
+def _remove_parts(output_file, n_parts):
+    for part_no in range(0, n_parts):
+        if os.path.exists(_part_path(output_file, part_no)):
+            os.remove(_part_path(output_file, part_no))
+    if os.path.exists(_state_path(output_file)):
+        os.remove(_state_path(output_file))
+
+
+def _prepare_state(output_file, info, n_parts):
+    """ Keep partial downloads only if they belong to the same remote file """
+    state = {'size': info.size, 'etag': info.etag, 'n_parts': n_parts}
+    state_path = _state_path(output_file)
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            old_state = json.load(f)
+        if old_state == state:
+            logger.info("Resuming partial download of {}".format(
+                output_file))
+            return
+        logger.info("Remote file changed -- discarding partial download")
+        _remove_parts(output_file, old_state['n_parts'])
+    with open(state_path, 'w') as f:
+        json.dump(state, f)
+
+
+def _download_range(url, part_path, start, end, chunk_size, timeout):
+    """ Download bytes [start, end) into part_path, appending to what is
+        already there
+    """
+    n_existing = 0
+    if os.path.exists(part_path):
+        n_existing = os.path.getsize(part_path)
+    if (start + n_existing) >= end:
+        # create the part file of an empty range (empty remote file)
+        open(part_path, 'ab').close()
+        return
+    headers = {'Range': 'bytes={}-{}'.format(start + n_existing, end - 1)}
+    with requests.get(url, headers=headers, stream=True,
+                      timeout=timeout) as response:
+        if response.status_code != 206:
+            raise IOError(
+                "Range request failed with status {}".format(
+                    response.status_code))
+        with open(part_path, 'ab') as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+
+
+def _download_full(url, part_path, chunk_size, timeout):
+    """ Download the whole file into part_path (no resume possible) """
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        with open(part_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+
+
+def _download_part_with_retries(max_retries, backoff_seconds=1, **kwargs):
+    """ Download a range, retry with exponential backoff (resuming) """
+    for attempt in range(0, max_retries + 1):
+        try:
+            return _download_range(**kwargs)
+        except (IOError, requests.exceptions.RequestException) as e:
+            if attempt == max_retries:
+                raise
+            sleep_time = backoff_seconds * (2 ** attempt)
+            logger.warning(
+                "Failed to download {} - retrying in {}s: {}".format(
+                    kwargs['part_path'], sleep_time, e))
+            time.sleep(sleep_time)
+
+
+def _assemble_parts(output_file, n_parts, compress, chunk_size):
+    """ Concatenate parts into a temporary output file
+        - returns (path of the temporary file, n_bytes, md5)
+    """
+    md5 = hashlib.md5()
+    n_bytes = 0
+    open_function = gzip.open if compress else open
+    tmp_path = '{}.tmp'.format(output_file)
+    with open_function(tmp_path, 'wb') as f_out:
+        for part_no in range(0, n_parts):
+            with open(_part_path(output_file, part_no), 'rb') as f_in:
+                for chunk in iter(lambda: f_in.read(chunk_size), b''):
+                    md5.update(chunk)
+                    n_bytes += len(chunk)
+                    f_out.write(chunk)
+    return tmp_path, n_bytes, md5
+
+
+def _md5_matches(md5, expected_md5):
+    """ Compare with an expected MD5 in hex or base64 encoding """
+    if len(expected_md5) == 32:
+        return md5.hexdigest() == expected_md5.lower()
+    return base64.b64encode(md5.digest()).decode('ascii') == expected_md5
+
+
+def download_file(
+        url, output_file, n_connections=4, compress=False,
+        expected_md5=None, max_retries=3, backoff_seconds=1,
+        chunk_size=1024 * 1024, timeout=60):
+    """ Download a file over HTTP
+        Args:
+        - url: url of the file
+        - output_file: path to write the file to
+        - n_connections: number of parallel range requests (if supported)
+        - compress: gzip the output file (after the download)
+        - expected_md5: MD5 (hex or base64) to verify, default is to use
+          the 'Content-MD5' reported by the server (if any)
+        - max_retries / backoff_seconds: retry a failed range request
+          'max_retries' times (resuming each time), waiting
+          'backoff_seconds' * 2 ** attempt between attempts
+        Returns:
+        - number of bytes downloaded (uncompressed)
+    """
+    info = get_download_info(url, timeout=timeout)
+    if expected_md5 is None:
+        expected_md5 = info.md5
+    use_ranges = info.accepts_ranges and (info.size is not None)
+    if use_ranges:
+        n_parts = max(1, min(n_connections, info.size // chunk_size))
+        _prepare_state(output_file, info, n_parts)
+        slices = list(slice_generator(info.size, n_parts))
+        logger.info("Downloading {} bytes using {} range requests".format(
+            info.size, n_parts))
+        with ThreadPoolExecutor(max_workers=n_parts) as pool:
+            futures = [
+                pool.submit(
+                    _download_part_with_retries,
+                    max_retries=max_retries,
+                    backoff_seconds=backoff_seconds,
+                    url=url, part_path=_part_path(output_file, part_no),
+                    start=start, end=end, chunk_size=chunk_size,
+                    timeout=timeout)
+                for part_no, (start, end) in enumerate(slices)]
+            for future in futures:
+                future.result()
+    else:
+        n_parts = 1
+        logger.info(
+            "No range requests supported -- downloading in one request")
+        _download_full(url, _part_path(output_file, 0), chunk_size, timeout)
+
+    tmp_path, n_bytes, md5 = _assemble_parts(
+        output_file, n_parts, compress, chunk_size)
+
+    if (info.size is not None) and (n_bytes != info.size):
+        _remove_parts(output_file, n_parts)
+        os.remove(tmp_path)
+        raise IOError("Downloaded {} bytes but expected {}".format(
+            n_bytes, info.size))
+    if expected_md5 is not None:
+        if not _md5_matches(md5, expected_md5):
+            _remove_parts(output_file, n_parts)
+            os.remove(tmp_path)
+            raise IOError("MD5 checksum of download does not match {}".format(
+                expected_md5))
+        logger.info("Verified MD5 checksum {}".format(md5.hexdigest()))
+
+    os.replace(tmp_path, output_file)
+    _remove_parts(output_file, n_parts)
+    return n_bytes
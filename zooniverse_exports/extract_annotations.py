@@ -22,7 +22,7 @@ import logging
 import textwrap
 import json
 
-from utils.logger import set_logging
+from utils.logger import set_logging, timed_phase, get_metrics
 from zooniverse_exports import extractor
 from utils.utils import print_nested_dict, set_file_permission
 from config.cfg import cfg
@@ -130,6 +130,11 @@ if __name__ == '__main__':
         action='store_true',
         help="Wherther to include classifications that were made during \
               the non-live phase of a project")
+    parser.add_argument(
+        "--profile", type=str, nargs='?', const='cprofile', default=None,
+        choices=['cprofile', 'pyinstrument'],
+        help="Profile the script, the profile is written next to the log \
+              file (alternatively set the env var PROFILE)")
 
     args = vars(parser.parse_args())
 
@@ -138,7 +143,7 @@ if __name__ == '__main__':
     ######################################
 
     # logging
-    set_logging(args['log_dir'], args['log_filename'])
+    set_logging(args['log_dir'], args['log_filename'], args['profile'])
     logger = logging.getLogger(__name__)
 
     for k, v in args.items():
@@ -187,7 +192,9 @@ if __name__ == '__main__':
     # keep track of statistics
     stats = Counter()
 
-    with open(args['classification_csv'], "r") as ins:
+    with open(args['classification_csv'], "r") as ins, \
+            timed_phase('extract_classifications', unit='classifications',
+                        log_every=10000) as phase:
         csv_reader = csv.reader(ins, delimiter=',', quotechar='"')
         header = next(csv_reader)
 
@@ -195,9 +202,7 @@ if __name__ == '__main__':
         duplicate_tracker = set()
 
         for line_no, line in enumerate(csv_reader):
-            # print status
-            if ((line_no % 10000) == 0) and (line_no > 0):
-                print("Processed {:,} classifications".format(line_no))
+            phase.update()
 
             # create dictionary from input line
             cls_dict = {header[i]: x for i, x in enumerate(line)}
@@ -278,6 +283,7 @@ if __name__ == '__main__':
 
     for stats_name, count in stats.items():
         logger.info('{}: {:,}'.format(stats_name, count))
+    get_metrics().counters.update(stats)
 
     ######################################
     # Analyse Classifications
@@ -393,7 +399,8 @@ if __name__ == '__main__':
     logger.info("Automatically generated output header: {}".format(
         header))
 
-    with open(args['output_csv'], 'w') as f:
+    with open(args['output_csv'], 'w') as f, \
+            timed_phase('export_annotations', unit='annotations') as phase:
         csv_writer = csv.writer(f, delimiter=',')
         logger.info("Writing output to {}".format(args['output_csv']))
         csv_writer.writerow(header)
@@ -409,6 +416,7 @@ if __name__ == '__main__':
                 in question_header]
             csv_writer.writerow(
                 class_data + answers_ordered)
+            phase.update()
         logger.info("Wrote {} annotations to {}".format(
             line_no+1, args['output_csv']))
 
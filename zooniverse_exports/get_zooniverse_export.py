@@ -7,6 +7,7 @@ from panoptes_client import Project, Panoptes
 
 from utils.utils import read_config_file, set_file_permission
 from utils.logger import set_logging
+from zooniverse_exports.downloader import download_file
 
 
 if __name__ == '__main__':
@@ -25,6 +26,17 @@ if __name__ == '__main__':
     parser.add_argument("--export_type", default='classifications',
                         type=str, required=False)
     parser.add_argument("--generate_new_export", action='store_true')
+    parser.add_argument(
+        "--raw_download", action='store_true',
+        help="Stream the raw bytes of the export to disk (no CSV parsing), \
+              using parallel range requests and resuming partial downloads.")
+    parser.add_argument(
+        "--n_connections", type=int, default=4,
+        help="Number of parallel range requests if '--raw_download'.")
+    parser.add_argument(
+        "--gzip", action='store_true',
+        help="Gzip the output file if '--raw_download' (the export is \
+              downloaded uncompressed and compressed afterwards).")
     parser.add_argument("--log_dir", type=str, default=None)
     parser.add_argument(
         "--log_filename", type=str, default='get_zooniverse_export')
@@ -53,18 +65,29 @@ if __name__ == '__main__':
         logger.info("Generating new export and wait until it is ready")
         my_project.wait_export(args['export_type'])
 
-    export = my_project.get_export(args['export_type'])
-
-    # save classifications to csv file
-    logger.info("Starting to write file %s" % args['output_file'])
-    with open(args['output_file'], 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile, delimiter=',')
-        for i, row in enumerate(export.csv_reader()):
-            writer.writerow(row)
-            if (i % 10000) == 0:
-                print("Wrote %s records" % i)
-
-    logger.info("Finished Writing File %s - Wrote %s records" %
-                (args['output_file'], i))
+    if args['raw_download']:
+        export_description = my_project.describe_export(args['export_type'])
+        export_url = export_description['media'][0]['src']
+        logger.info("Starting to download file %s" % args['output_file'])
+        n_bytes = download_file(
+            export_url, args['output_file'],
+            n_connections=args['n_connections'],
+            compress=args['gzip'])
+        logger.info("Finished Downloading File %s - %s bytes" %
+                    (args['output_file'], n_bytes))
+    else:
+        export = my_project.get_export(args['export_type'])
+
+        # save classifications to csv file
+        logger.info("Starting to write file %s" % args['output_file'])
+        with open(args['output_file'], 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile, delimiter=',')
+            for i, row in enumerate(export.csv_reader()):
+                writer.writerow(row)
+                if (i % 10000) == 0:
+                    print("Wrote %s records" % i)
+
+        logger.info("Finished Writing File %s - Wrote %s records" %
+                    (args['output_file'], i))
 
     set_file_permission(args['output_file'])
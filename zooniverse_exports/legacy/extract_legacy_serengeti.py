@@ -88,13 +88,13 @@
         also not found this in the SerengetiDB: grep V13_R1/PICT6148.JPG
 """
 import os
+import csv
 import argparse
-from collections import Counter
 import logging
 from utils.logger import set_logging
 
 from zooniverse_exports.legacy import legacy_extractor
-from utils.utils import print_nested_dict, set_file_permission
+from utils.utils import print_nested_dict
 from config.cfg import cfg
 
 
@@ -125,8 +125,14 @@ if __name__ == '__main__':
     parser.add_argument(
         "--output_path", type=str, required=True,
         help="Output path for csv results")
-    parser.add_argument(
-        '--season_to_process', type=str, required=True)
+    season_group = parser.add_mutually_exclusive_group(required=True)
+    season_group.add_argument(
+        '--season_to_process', type=str, default=None)
+    season_group.add_argument(
+        '--seasons_to_process', type=str, nargs='+', default=None,
+        help="Process multiple seasons (one process per season) while \
+              reading the classification_csv only once. The raw file is \
+              not split into seasons.")
     parser.add_argument(
         '--season_captures_path', type=str,
         default='/home/packerc/shared/season_captures/SER/captures/',
@@ -139,6 +145,21 @@ if __name__ == '__main__':
     #     '--subject_to_capture_path', type=str,
     #     default='',
     #     help="Path to subject to capture map")
+    parser.add_argument(
+        '--cache_img_to_capture', action='store_true',
+        help="Save the image to capture lookup of each season next to the \
+              captures.csv ('.lookup' directory) and re-use it in later \
+              runs while the captures.csv is unchanged.")
+    parser.add_argument(
+        '--n_processes', type=int, default=1,
+        help="Number of processes to extract and consolidate the \
+              classifications of a season. If > 1 the classifications are \
+              partitioned (by user), processed in parallel and \
+              the partial outputs merged in order.")
+    parser.add_argument(
+        '--tmp_dir', type=str, default=None,
+        help="Directory for temporary partition files if n_processes > 1 \
+              (default: system temp directory)")
     parser.add_argument(
         '--split_raw_file', action='store_true',
         help="Split the raw file according to seasons. If not specified, the \
@@ -150,15 +171,20 @@ if __name__ == '__main__':
         default='extract_legacy_serengeti')
 
     args = vars(parser.parse_args())
-    s_id = args['season_to_process']
 
     all_seasons_ids = [
         'S1', 'S2', 'S3', 'S4', 'S5', 'S6',
         'S7', 'S8', 'S9', '10', 'WF1', 'tutorial']
 
-    if args['season_to_process'] not in all_seasons_ids:
-        raise ValueError("season_to_process must be one of {}".format(
-            all_seasons_ids))
+    if args['seasons_to_process'] is not None:
+        seasons_to_process = args['seasons_to_process']
+    else:
+        seasons_to_process = [args['season_to_process']]
+
+    for s_id in seasons_to_process:
+        if s_id not in all_seasons_ids:
+            raise ValueError("season_to_process must be one of {}".format(
+                all_seasons_ids))
 
     if not os.path.isdir(args['output_path']):
         raise ValueError("output_path: {} must be a directory".format(
@@ -189,7 +215,7 @@ if __name__ == '__main__':
     # - SER_{}_classifications_raw.csv
     ######################################
 
-    if args['split_raw_file']:
+    if args['split_raw_file'] and (args['seasons_to_process'] is None):
         file_writers = legacy_extractor.split_raw_classification_csv(
             args['classification_csv'], args['output_path'])
         all_seasons = {
@@ -205,9 +231,10 @@ if __name__ == '__main__':
                 'SER_{}_classifications_raw.csv'.format(k))
             for k in all_seasons_ids}
 
-    for season, season_path in all_seasons.items():
-        logger.info("Season: {} classifications stored at: {}".format(
-            season, season_path))
+    if args['seasons_to_process'] is None:
+        for season, season_path in all_seasons.items():
+            logger.info("Season: {} classifications stored at: {}".format(
+                season, season_path))
 
     ######################################
     # Read meta-data from season capture
@@ -229,9 +256,6 @@ if __name__ == '__main__':
         logger.info("Season: {} meta-data defined to be at: {}".format(
             season, season_path))
 
-    img_to_capture = legacy_extractor.build_img_to_capture_map(
-        season_capture_files[s_id], flags)
-
     if os.path.isfile(args['subject_to_capture_path']):
         logging.info("Reading subject_to_capture mapping: {}".format(
             args['subject_to_capture_path']))
@@ -241,88 +265,33 @@ if __name__ == '__main__':
     else:
         subject_to_capture = dict()
 
-    ######################################
-    # Process Classifications
-    ######################################
-
-    season_file = all_seasons[s_id]
-
-    classifications = legacy_extractor.process_season_classifications(
-        season_file, img_to_capture, subject_to_capture, flags)
-
-    ######################################
-    # Consolidate Classifications with
-    # multiple entries of the same
-    # species
-    ######################################
-
-    consolidated_classifications = \
-        legacy_extractor.consolidate_all_classifications(
-            classifications, flags)
-
-    # merge consolidated annotations into classifications dict
-    for c_id, annotations in consolidated_classifications.items():
-        classifications[c_id] = annotations
-
-    ######################################
-    # Print Stats
-    ######################################
-
-    retirement_reasons = list()
-    seasons = list()
-    answers = {k: list() for k in flags['CSV_QUESTIONS']}
-
-    try:
-        retirement_reason = flags['CSV_HEADER_MAPPER']['retire_reason']
-    except:
-        retirement_reason = 'retire_reason'
-
-    for c_id, annotations in classifications.items():
-        if not isinstance(annotations, list):
-            logger.info(annotations)
-        for annotation in annotations:
-            retirement_reasons.append(annotation[retirement_reason])
-            seasons.append(annotation['season'])
-            for question, _answers_list in answers.items():
-                _answers_list.append(annotation[question])
-
-    season_stats = Counter(seasons)
-    retirement_reasons_stats = Counter(retirement_reasons)
-    answers_stats = {k: Counter(v).most_common() for k, v in answers.items()}
-    season_stats.most_common()
-    retirement_reasons_stats.most_common()
-
-    for question, question_stats in answers_stats.items():
-        logger.info("Stats for question: %s" % question)
-        n_tot = sum([x[1] for x in question_stats])
-        for (answer, n) in question_stats:
-            percent = (n / n_tot) * 100
-            logger.info('{:15} - {:15} - {:10} / {} ({:.2f} %)'.format(
-                question, answer, n, n_tot, percent))
-
-    # Print examples
-    logger.info("Show some example classifications")
-    for i, (_id, data) in enumerate(classifications.items()):
-        if i > 10:
-            break
-        logger.info("ID: {}, Data: {}".format(_id, data))
-
-    ######################################
-    # Export Annotations to a File
-    ######################################
-
-    # access a random classification and get all the keys of the first
-    # annotation -- this is consistent for all other annotations
-    header = list(classifications[list(classifications.keys())[0]][0].keys())
-
     output_paths = {
         k: os.path.join(
             args['output_path'],
             'SER_{}_annotations.csv'.format(k))
         for k in all_seasons.keys()}
 
-    legacy_extractor.export_cleaned_annotations(
-        output_paths[s_id], classifications, header, flags, flags_global)
+    ######################################
+    # Process, Consolidate and Export
+    # Classifications
+    ######################################
 
-    # change permmissions to read/write for group
-    set_file_permission(output_paths[s_id])
+    if args['seasons_to_process'] is not None:
+        season_tasks = {
+            s_id: (season_capture_files[s_id], output_paths[s_id])
+            for s_id in seasons_to_process}
+        legacy_extractor.extract_seasons_in_one_pass(
+            args['classification_csv'], season_tasks,
+            subject_to_capture, flags, flags_global,
+            use_cache=args['cache_img_to_capture'],
+            n_processes=args['n_processes'], tmp_dir=args['tmp_dir'])
+    else:
+        s_id = args['season_to_process']
+        with open(all_seasons[s_id], "r") as ins:
+            csv_reader = csv.reader(ins, delimiter=',', quotechar='"')
+            header = next(csv_reader)
+            legacy_extractor.extract_season(
+                header, csv_reader, season_capture_files[s_id],
+                subject_to_capture, output_paths[s_id], flags, flags_global,
+                use_cache=args['cache_img_to_capture'],
+                n_processes=args['n_processes'], tmp_dir=args['tmp_dir'])
@@ -9,7 +9,7 @@ import logging
 import pandas as pd
 
 from utils.utils import set_file_permission
-from utils.logger import create_log_file, setup_logger
+from utils.logger import set_logging
 
 
 # args = dict()
@@ -54,11 +54,7 @@ if __name__ == '__main__':
     ######################################
 
     # logging
-    if args['log_dir'] is not None:
-        log_file_path = create_log_file(args['log_dir'], args['log_filename'])
-        setup_logger(log_file_path)
-    else:
-        setup_logger()
+    set_logging(args['log_dir'], args['log_filename'])
     logger = logging.getLogger(__name__)
 
     for k, v in args.items():
@@ -1,59 +1,201 @@
 """ Get Zooniverse Data from Ouroboros API
     # pip install --user aiohttp
+    - requests run concurrently (bounded by 'n_concurrent') over one session
+    - failed requests are retried with exponential backoff
+    - results are appended to a checkpoint file (JSONL) as they arrive,
+      re-runs skip subjects that are already in the checkpoint file (an
+      unterminated last line of an interrupted run is removed first)
+    - the final output (.json) is written from the checkpoint file
 """
-import aiohttp
-import asyncio
-import time
 import os
-import pandas as pd
 import json
-import textwrap
+import time
+import asyncio
 import argparse
-import math
+import logging
+from collections import OrderedDict
+
+import aiohttp
+import pandas as pd
+
+from utils.utils import estimate_remaining_time, set_file_permission
+from utils.logger import set_logging
 
-from utils.utils import (
-    slice_generator,
-    estimate_remaining_time, set_file_permission)
 
+logger = logging.getLogger(__name__)
 
-async def fetch(session, url):
-    async with session.get(url) as response:
-        assert response.status == 200
-        return await response.json()
+API_PATH = 'https://api.zooniverse.org/projects/serengeti/subjects/'
 
+# do not retry requests that failed with these status codes
+NO_RETRY_STATUSES = {400, 401, 403, 404, 410}
 
-async def fetch_urls(urls):
-    tasks = []
-    async with aiohttp.ClientSession() as session:
-        for url in urls:
-            tasks.append(fetch(session, url))
-        results = await asyncio.gather(*tasks)
+
+def checkpoint_path(output_path):
+    """ Path of the checkpoint file of an output file """
+    return output_path + '.checkpoint.jsonl'
+
+
+def read_checkpoint_file(path):
+    """ Read results from a checkpoint file
+        - returns OrderedDict: {subject_id: data}
+        - a truncated last line (interrupted write) is ignored
+    """
+    results = OrderedDict()
+    if not os.path.isfile(path):
         return results
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("Ignoring incomplete line in {}".format(path))
+                continue
+            results[record['subject_id']] = record['data']
+    return results
+
+
+def repair_checkpoint_file(path, chunk_size=65536):
+    """ Remove an unterminated last line (interrupted write) from a
+        checkpoint file, so that new results are not appended to it
+        - returns the number of removed bytes
+    """
+    if not os.path.isfile(path):
+        return 0
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(end - chunk_size, 0)
+            f.seek(start)
+            pos = f.read(end - start).rfind(b'\n')
+            if pos >= 0:
+                end = start + pos + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+            logger.warning(
+                "Removed an incomplete last line from {}".format(path))
+    return size - end
+
+
+def append_to_checkpoint_file(f, subject_id, data):
+    """ Append a result to an open checkpoint file """
+    f.write(json.dumps({'subject_id': subject_id, 'data': data}) + '\n')
+
+
+async def fetch(session, url, max_retries=5, backoff_seconds=1):
+    """ Get a json response from url, retry with exponential backoff """
+    for attempt in range(0, max_retries + 1):
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            no_retry = isinstance(e, aiohttp.ClientResponseError) and \
+                (e.status in NO_RETRY_STATUSES)
+            if no_retry or (attempt == max_retries):
+                raise
+            sleep_time = backoff_seconds * (2 ** attempt)
+            logger.debug("Retrying {} in {}s after {}: {}".format(
+                url, sleep_time, type(e).__name__, e))
+            await asyncio.sleep(sleep_time)
 
 
-def get_oroboros_api_data(subject_ids, quality='standard', batch_size=1000):
-    api_path = 'https://api.zooniverse.org/projects/serengeti/subjects/'
-    res_dict = dict()
+async def fetch_subjects(
+        subject_ids, checkpoint_file, api_path=API_PATH,
+        n_concurrent=20, max_retries=5, backoff_seconds=1,
+        timeout=60, log_every=1000):
+    """ Fetch subject data and append it to a checkpoint file
+        Args:
+        - subject_ids: list of subject ids to fetch
+        - checkpoint_file: path to the checkpoint file (JSONL) to append to
+        - n_concurrent: max number of concurrent requests
+        - max_retries / backoff_seconds: retry a failed request
+          'max_retries' times, waiting 'backoff_seconds' * 2 ** attempt
+        Returns:
+        - dict with the number of 'success' and 'failed' requests
+    """
+    stats = {'success': 0, 'failed': 0}
     n_total = len(subject_ids)
-    url_list = [api_path + x for x in subject_ids]
-    n_blocks = math.ceil(n_total / batch_size)
-    slices = slice_generator(n_total, n_blocks)
-    # loop over chunks
-    for i, (start_i, end_i) in enumerate(slices):
-        print("    Starting with sub-batch {}".format(i))
-        batch_urls = url_list[start_i: end_i]
-        loop = asyncio.get_event_loop()
-        res = loop.run_until_complete(fetch_urls(batch_urls))
-        res_batch_dict = {r['zooniverse_id']: r for r in res}
-        n_batch_success = len(res_batch_dict)
-        print("    Sub-Batch {} finished {:5}/{:5}".format(
-            i, n_batch_success, len(batch_urls)))
-        res_dict = {**res_dict, **res_batch_dict}
-    return res_dict
-
-# args = dict()
-# args['subjects_extracted'] = '/home/packerc/shared/zooniverse/Exports/SER/SER_S1_subjects_extracted.csv'
-# args['subjects_ouroboros'] = '/home/packerc/shared/zooniverse/Exports/SER/SER_S1_subjects_ouroboros.json'
+    time_start = time.time()
+    semaphore = asyncio.Semaphore(n_concurrent)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def fetch_subject(session, f, subject_id):
+        try:
+            data = await fetch(
+                session, api_path + subject_id,
+                max_retries=max_retries, backoff_seconds=backoff_seconds)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            stats['failed'] += 1
+            logger.error("Failed to fetch subject {} - {}: {}".format(
+                subject_id, type(e).__name__, e))
+            return
+        finally:
+            semaphore.release()
+        append_to_checkpoint_file(f, subject_id, data)
+        stats['success'] += 1
+        n_finished = stats['success'] + stats['failed']
+        if (n_finished % log_every) == 0:
+            f.flush()
+            logger.info(
+                "Fetched {}/{} ({:.2f} %) - failed {} - "
+                "Estimated Time Remaining: {}".format(
+                    n_finished, n_total, 100 * n_finished / n_total,
+                    stats['failed'], estimate_remaining_time(
+                        time_start, n_total, n_finished)))
+
+    with open(checkpoint_file, 'a') as f:
+        async with aiohttp.ClientSession(timeout=client_timeout) as session:
+            pending = set()
+            for subject_id in subject_ids:
+                # at most 'n_concurrent' requests are in flight
+                await semaphore.acquire()
+                task = asyncio.ensure_future(
+                    fetch_subject(session, f, subject_id))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            await asyncio.gather(*pending)
+    return stats
+
+
+def get_ouroboros_data(
+        subject_ids, output_path, api_path=API_PATH, **kwargs):
+    """ Fetch subject data not yet in the checkpoint file of output_path
+        and write all fetched subjects to output_path (.json)
+        - kwargs are passed to fetch_subjects
+        - returns the stats of fetch_subjects
+    """
+    checkpoint_file = checkpoint_path(output_path)
+
+    # seed the checkpoint file from an existing output file
+    if os.path.isfile(output_path) and not os.path.isfile(checkpoint_file):
+        with open(output_path, 'r') as f:
+            existing = json.load(f)
+        with open(checkpoint_file, 'w') as f:
+            for subject_id, data in existing.items():
+                append_to_checkpoint_file(f, subject_id, data)
+        logger.info("Read {} records from {}".format(
+            len(existing), output_path))
+
+    repair_checkpoint_file(checkpoint_file)
+    already_fetched = read_checkpoint_file(checkpoint_file).keys()
+    subject_ids = [x for x in subject_ids if x not in already_fetched]
+    logger.info("Records remaining for processing: {}".format(
+        len(subject_ids)))
+
+    stats = asyncio.run(
+        fetch_subjects(
+            subject_ids, checkpoint_file, api_path=api_path, **kwargs))
+    logger.info("Fetched {} subjects - failed {} (re-run to retry)".format(
+        stats['success'], stats['failed']))
+
+    results = read_checkpoint_file(checkpoint_file)
+    with open(output_path, 'w') as f:
+        json.dump(results, f)
+    logger.info("Wrote {} records to {}".format(len(results), output_path))
+    return stats
 
 
 if __name__ == '__main__':
@@ -61,61 +203,33 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--subjects_extracted", type=str, required=True)
     parser.add_argument("--subjects_ouroboros", type=str, required=True)
+    parser.add_argument(
+        "--n_concurrent", type=int, default=20,
+        help="Max number of concurrent requests (default 20)")
+    parser.add_argument(
+        "--max_retries", type=int, default=5,
+        help="Max number of retries per request (default 5)")
+    parser.add_argument("--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str, default='get_legacy_ouroboros_data')
     args = vars(parser.parse_args())
-    # read subject data, fetch urls via oroboros API and save to disk
+
+    set_logging(args['log_dir'], args['log_filename'])
+
+    for k, v in args.items():
+        logger.info("Argument {}: {}".format(k, v))
+
     input_path = args['subjects_extracted']
     output_path = args['subjects_ouroboros']
+
     df = pd.read_csv(input_path, na_values=str, index_col='subject_id')
-    subject_ids = df.index
-    print("Total {} subjects found".format(len(subject_ids)))
-    # read from disk if already exists
-    if os.path.isfile(output_path):
-        with open(output_path, 'r') as f:
-            df_out = json.load(f)
-        print("reading file {}".format(output_path))
-        print("read {} records".format(len(df_out)))
-        processed_subjects = df_out.keys()
-        res_dict_all = df_out
-    else:
-        res_dict_all = {}
-    # remove already processed
-    subject_ids = list(set(subject_ids) - res_dict_all.keys())
-    print("Records remaining for processing: {}".format(len(subject_ids)))
-    # read in batches
-    time_start = time.time()
-    n_total = df.shape[0]
-    n_finished = 0
-    n_blocks = math.ceil(n_total / 5000)
-    slices = slice_generator(n_total, n_blocks)
-    for batch_id, (i_start, i_end) in enumerate(slices):
-        subjects_batch = subject_ids[i_start:i_end]
-        finished_batch = False
-        # re-try on timeouts
-        while not finished_batch:
-            try:
-                urls_dict = get_oroboros_api_data(
-                    subjects_batch, batch_size=50)
-                finished_batch = True
-            except KeyboardInterrupt:
-                finished_batch = True
-            except TimeoutError:
-                print("Timeout error... sleep for 60s")
-                time.sleep(60)
-            except:
-                print("Unkown error ocurred... try again..")
-                pass
-        res_dict_all = {**res_dict_all, **urls_dict}
-        with open(output_path, 'w') as f:
-            json.dump(res_dict_all, f)
-        print("Write data to {}".format(output_path))
-        set_file_permission(output_path)
-        # print progress information
-        ts = time.time()
-        n_finished += len(subjects_batch)
-        tr = estimate_remaining_time(
-            time_start, n_total, n_finished)
-        msg = "Saved %s/%s (%s %%) - \
-               Estimated Time Remaining: %s" % \
-              (n_finished, n_total,
-               round((n_finished/n_total) * 100, 2), tr)
-        print(textwrap.shorten(msg, width=99))
+    subject_ids = list(df.index)
+    logger.info("Total {} subjects found".format(len(subject_ids)))
+
+    get_ouroboros_data(
+        subject_ids, output_path,
+        n_concurrent=args['n_concurrent'],
+        max_retries=args['max_retries'])
+
+    set_file_permission(output_path)
+    set_file_permission(checkpoint_path(output_path))
@@ -0,0 +1,156 @@
+""" Compact image to capture lookup for the legacy extraction
+    - maps image keys (season#site#roll#image_name) to capture_ids
+    - stored in numpy arrays: sorted fixed-width image keys (binary search)
+      and an integer code per image into the distinct capture_ids
+    - can be saved to disk and memory-mapped (read-only), the pages are
+      then shared between all processes reading the same lookup, saving
+      replaces the whole directory (never the mapped files in place)
+"""
+import os
+import json
+import shutil
+import logging
+
+import numpy as np
+
+from utils.utils import set_file_permission
+
+
+logger = logging.getLogger(__name__)
+
+
+def _replace_directory(src, dst):
+    """ Replace directory dst by src (both on the same file system)
+        - an existing dst is moved aside and removed afterwards
+        - if another process put a dst in place concurrently, that one
+          is kept
+    """
+    old_path = '{}.old{}'.format(dst, os.getpid())
+    try:
+        os.replace(dst, old_path)
+    except FileNotFoundError:
+        old_path = None
+    try:
+        os.replace(src, dst)
+    except OSError:
+        if not os.path.isdir(dst):
+            raise
+        logger.info("{} was replaced concurrently".format(dst))
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+class ImageCaptureLookup(object):
+    """ Read-only mapping of image keys to capture_ids """
+
+    _files = ('keys.npy', 'capture_codes.npy', 'capture_ids.npy')
+
+    def __init__(self, keys, capture_codes, capture_ids):
+        self.keys = keys
+        self.capture_codes = capture_codes
+        self.capture_ids = capture_ids
+
+    @classmethod
+    def from_items(cls, items):
+        """ Build from (image_key, capture_id) pairs - the last pair wins
+            for duplicate image keys (as in a dict)
+        """
+        keys = list()
+        captures = list()
+        for key, capture_id in items:
+            keys.append(key.encode('utf-8'))
+            captures.append(capture_id)
+        capture_ids, capture_codes = np.unique(
+            np.array(captures, dtype=object).astype(str),
+            return_inverse=True)
+        keys = np.array(keys, dtype=bytes)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        capture_codes = capture_codes[order]
+        # keep the last of duplicate keys
+        is_last = np.ones(keys.shape[0], dtype=bool)
+        is_last[:-1] = keys[1:] != keys[:-1]
+        return cls(
+            keys[is_last], capture_codes[is_last].astype(np.int32),
+            np.char.encode(capture_ids, 'utf-8'))
+
+    def _index(self, key):
+        key = key.encode('utf-8')
+        i = int(self.keys.searchsorted(key))
+        if (i < len(self.keys)) and (self.keys[i] == key):
+            return i
+        return None
+
+    def __getitem__(self, key):
+        i = self._index(key)
+        if i is None:
+            raise KeyError(key)
+        return self.capture_ids[self.capture_codes[i]].decode('utf-8')
+
+    def __contains__(self, key):
+        return self._index(key) is not None
+
+    def __len__(self):
+        return self.keys.shape[0]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def save(self, path, source_path=None):
+        """ Save to directory 'path' - if source_path is specified its
+            mtime / size are stored to detect outdated lookups
+            - the files are written to a temporary directory which then
+              replaces 'path', processes that memory-mapped an existing
+              lookup keep reading the old (unlinked) files
+        """
+        path = os.path.normpath(path)
+        tmp_path = '{}.tmp{}'.format(path, os.getpid())
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        try:
+            arrays = (self.keys, self.capture_codes, self.capture_ids)
+            for file_name, array in zip(self._files, arrays):
+                np.save(os.path.join(tmp_path, file_name), array)
+            meta = dict()
+            if source_path is not None:
+                stat = os.stat(source_path)
+                meta = {
+                    'source_mtime_ns': stat.st_mtime_ns,
+                    'source_size': stat.st_size}
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            for file_name in self._files + ('meta.json', ):
+                set_file_permission(os.path.join(tmp_path, file_name))
+            _replace_directory(tmp_path, path)
+        finally:
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """ Load from directory 'path' (memory-mapped if mmap) """
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(path, x), mmap_mode=mmap_mode)
+                  for x in cls._files]
+        return cls(*arrays)
+
+    @classmethod
+    def is_up_to_date(cls, path, source_path):
+        """ Check whether the lookup in path was built from source_path
+            in its current state
+        """
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not all(os.path.isfile(os.path.join(path, x))
+                   for x in cls._files):
+            return False
+        stat = os.stat(source_path)
+        return (meta.get('source_mtime_ns') == stat.st_mtime_ns) and \
+            (meta.get('source_size') == stat.st_size)
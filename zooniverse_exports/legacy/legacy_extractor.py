@@ -12,9 +12,17 @@ from collections import Counter
 import traceback
 import textwrap
 import logging
-
-from utils.utils import correct_image_name
+import multiprocessing
+from queue import Full
+import heapq
+import zlib
+import tempfile
+import shutil
+from array import array
+
+from utils.utils import correct_image_name, set_file_permission
 from zooniverse_exports import extractor
+from zooniverse_exports.legacy.image_capture_lookup import ImageCaptureLookup
 
 logger = logging.getLogger(__name__)
 
@@ -243,8 +251,8 @@ def build_image_id(line, row_name_to_id_mapper):
     return '#'.join([season, site, roll, image_name])
 
 
-def build_img_to_capture_map(path, flags):
-    img_to_capture = dict()
+def _iter_img_to_capture(path, flags):
+    """ Yield (img_key, capture_id) for all images in a captures csv """
     with open(path, 'r') as f:
         csv_reader = csv.reader(f, delimiter=',', quotechar='"')
         header = next(csv_reader)
@@ -258,7 +266,34 @@ def build_img_to_capture_map(path, flags):
                 print("Processed %s annotations" % line_no)
             capture_id = build_capture_id(line, row_name_to_id_mapper)
             img_key = build_image_id(line, row_name_to_id_mapper)
-            img_to_capture[img_key] = capture_id
+            yield img_key, capture_id
+
+
+def build_img_to_capture_map(path, flags):
+    return dict(_iter_img_to_capture(path, flags))
+
+
+def build_img_to_capture_lookup(path, flags, use_cache=False):
+    """ Build a compact (read-only) img_key -> capture_id lookup
+        - use_cache: save the lookup next to the captures csv
+          ('.lookup' directory) and memory-map it while the captures csv
+          is unchanged
+    """
+    cache_path = '{}.lookup'.format(path)
+    if use_cache and ImageCaptureLookup.is_up_to_date(cache_path, path):
+        logger.info("Reading img_to_capture lookup from {}".format(
+            cache_path))
+        return ImageCaptureLookup.load(cache_path)
+    img_to_capture = ImageCaptureLookup.from_items(
+        _iter_img_to_capture(path, flags))
+    if use_cache:
+        try:
+            img_to_capture.save(cache_path, source_path=path)
+            logger.info("Saved img_to_capture lookup to {}".format(
+                cache_path))
+        except OSError as e:
+            logger.warning("Failed to save lookup {}: {}".format(
+                cache_path, e))
     return img_to_capture
 
 
@@ -435,35 +470,54 @@ def extract_raw_classification(
 
 def process_season_classifications(path, img_to_capture, subject_to_capture, flags):
     """ Process season classifications """
-    stats = Counter()
-    user_subject_tracker = dict()
-    classifications = OrderedDict()
     with open(path, "r") as ins:
         csv_reader = csv.reader(ins, delimiter=',', quotechar='"')
         header = next(csv_reader)
-        for line_no, line in enumerate(csv_reader):
-            # print status
-            if ((line_no % 10000) == 0) and (line_no > 0):
-                print("Processed %s annotations" % line_no)
-            # create dictionary from input line
-            cls_dict = {header[i]: x for i, x in enumerate(line)}
-            try:
-                record = extract_raw_classification(
-                            cls_dict,
-                            img_to_capture,
-                            subject_to_capture,
-                            flags,
-                            stats,
-                            user_subject_tracker)
-            except Exception:
+        return process_classification_lines(
+            header, csv_reader, img_to_capture, subject_to_capture, flags)
+
+
+def process_classification_lines(
+        header, lines, img_to_capture, subject_to_capture, flags,
+        first_line_nos=None):
+    """ Process classifications - lines is an iterable of raw csv lines
+        (lists of values ordered according to header)
+        - first_line_nos: optional dict to store the line_no (index in
+          lines) of the first record of each classification
+    """
+    stats = Counter()
+    user_subject_tracker = dict()
+    classifications = OrderedDict()
+    for line_no, line in enumerate(lines):
+        # print status
+        if ((line_no % 10000) == 0) and (line_no > 0):
+            print("Processed %s annotations" % line_no)
+        # create dictionary from input line
+        cls_dict = {header[i]: x for i, x in enumerate(line)}
+        try:
+            record = extract_raw_classification(
+                        cls_dict,
+                        img_to_capture,
+                        subject_to_capture,
+                        flags,
+                        stats,
+                        user_subject_tracker)
+        except Exception:
+            record = {}
+            stats.update({'n_errors'})
+            if stats['n_errors'] <= 10:
                 logger.warning("Error - Skipping Record %s" % line_no)
                 logger.warning("Full line:\n %s" % line)
                 logger.warning(traceback.format_exc())
-
-            if len(record.keys()) > 0:
-                if record['classification_id'] not in classifications:
-                    classifications[record['classification_id']] = list()
-                classifications[record['classification_id']].append(record)
+            else:
+                logger.debug("Error - Skipping Record %s" % line_no)
+
+        if len(record.keys()) > 0:
+            if record['classification_id'] not in classifications:
+                classifications[record['classification_id']] = list()
+                if first_line_nos is not None:
+                    first_line_nos[record['classification_id']] = line_no
+            classifications[record['classification_id']].append(record)
     # print stats
     msg = "Removed {} non-eligible annotations".format(stats['n_not_eligible'])
     logger.info(textwrap.shorten(msg, width=150))
@@ -483,6 +537,8 @@ def process_season_classifications(path, img_to_capture, subject_to_capture, fla
     msg = "Removed {} annotations - without images".format(
      stats['n_annos_without_images'])
     logger.info(textwrap.shorten(msg, width=150))
+    msg = "Skipped {} records due to errors".format(stats['n_errors'])
+    logger.info(textwrap.shorten(msg, width=150))
     return classifications
 
 
@@ -507,10 +563,8 @@ def consolidate_all_classifications(classifications, flags):
     return consolidated_classifications
 
 
-def export_cleaned_annotations(path, classifications, header, flags, flags_global):
-    """ Export Cleaned Annotation """
-
-    # map questions if necessary
+def _annotation_header_to_print(header, flags, flags_global):
+    """ map questions if necessary """
     header_to_print = list()
     for col in header:
         if col in flags['CSV_QUESTIONS']:
@@ -519,6 +573,13 @@ def export_cleaned_annotations(path, classifications, header, flags, flags_globa
                     [flags_global['QUESTION_PREFIX'], col]))
         else:
             header_to_print.append(col)
+    return header_to_print
+
+
+def export_cleaned_annotations(path, classifications, header, flags, flags_global):
+    """ Export Cleaned Annotation """
+
+    header_to_print = _annotation_header_to_print(header, flags, flags_global)
 
     with open(path, 'w') as f:
         csv_writer = csv.writer(f, delimiter=',')
@@ -532,3 +593,352 @@ def export_cleaned_annotations(path, classifications, header, flags, flags_globa
                 n_annos_written += 1
         logger.info("Wrote {} classifications and {} annotations".format(
             line_no, n_annos_written))
+
+
+def count_answers(classifications, flags):
+    """ Count the answers to each question - dict of Counters """
+    answers = {k: Counter() for k in flags['CSV_QUESTIONS']}
+    for c_id, annotations in classifications.items():
+        if not isinstance(annotations, list):
+            logger.info(annotations)
+        for annotation in annotations:
+            for question, _answers_counter in answers.items():
+                _answers_counter[annotation[question]] += 1
+    return answers
+
+
+def log_answer_stats(answers):
+    """ Log the answer counts of each question """
+    for question, answer_counts in answers.items():
+        question_stats = answer_counts.most_common()
+        logger.info("Stats for question: %s" % question)
+        n_tot = sum([x[1] for x in question_stats])
+        for (answer, n) in question_stats:
+            percent = (n / n_tot) * 100
+            logger.info('{:15} - {:15} - {:10} / {} ({:.2f} %)'.format(
+                question, answer, n, n_tot, percent))
+
+
+def log_classification_stats(classifications, flags):
+    """ Log answer stats and some example classifications """
+    log_answer_stats(count_answers(classifications, flags))
+
+    # Print examples
+    logger.info("Show some example classifications")
+    for i, (_id, data) in enumerate(classifications.items()):
+        if i > 10:
+            break
+        logger.info("ID: {}, Data: {}".format(_id, data))
+
+
+def extract_season(
+        header, lines, season_captures_csv, subject_to_capture, output_csv,
+        flags, flags_global, use_cache=False, n_processes=1, tmp_dir=None):
+    """ Extract, consolidate and export the classifications of a season
+        - header / lines: raw classifications of the season
+        - use_cache: cache the img_to_capture lookup of the season
+        - n_processes: if > 1 the classifications are partitioned and
+          extracted / consolidated by n_processes workers
+          (see extract_season_partitioned)
+    """
+    if n_processes > 1:
+        return extract_season_partitioned(
+            header, lines, season_captures_csv, subject_to_capture,
+            output_csv, flags, flags_global, use_cache=use_cache,
+            n_processes=n_processes, tmp_dir=tmp_dir)
+
+    img_to_capture = build_img_to_capture_lookup(
+        season_captures_csv, flags, use_cache=use_cache)
+
+    classifications = process_classification_lines(
+        header, lines, img_to_capture, subject_to_capture, flags)
+
+    # merge consolidated annotations into classifications dict
+    consolidated_classifications = consolidate_all_classifications(
+        classifications, flags)
+    for c_id, annotations in consolidated_classifications.items():
+        classifications[c_id] = annotations
+
+    log_classification_stats(classifications, flags)
+
+    if len(classifications) == 0:
+        logger.warning("No classifications found - not writing {}".format(
+            output_csv))
+        return
+
+    # access a random classification and get all the keys of the first
+    # annotation -- this is consistent for all other annotations
+    output_header = list(
+        classifications[list(classifications.keys())[0]][0].keys())
+
+    export_cleaned_annotations(
+        output_csv, classifications, output_header, flags, flags_global)
+
+    # change permmissions to read/write for group
+    set_file_permission(output_csv)
+
+
+def partition_classification_lines(header, lines, tmp_dir, n_partitions):
+    """ Write raw classification lines to n_partitions csv files
+        - all lines of a user go to the same partition (hence also all
+          lines of a classification), duplicate classifications of a user
+          on the same subject are thus detected within a partition
+        - the first column of each partition is the line_no in lines
+        - returns the paths of the partitions and the number of lines
+    """
+    user_col = header.index('user_name')
+    paths = [os.path.join(tmp_dir, 'partition_{}.csv'.format(i))
+             for i in range(0, n_partitions)]
+    files = [open(path, 'w', newline='') for path in paths]
+    try:
+        writers = [csv.writer(f) for f in files]
+        line_no = -1
+        for line_no, line in enumerate(lines):
+            try:
+                partition = zlib.crc32(
+                    line[user_col].encode('utf-8')) % n_partitions
+            except IndexError:
+                partition = 0
+            writers[partition].writerow([line_no] + line)
+    finally:
+        for f in files:
+            f.close()
+    return paths, line_no + 1
+
+
+def _init_partition_worker(subject_to_capture):
+    global _worker_subject_to_capture
+    _worker_subject_to_capture = subject_to_capture
+
+
+def _extract_partition(
+        header, partition_csv, lookup_path, output_csv, flags):
+    """ Extract and consolidate the classifications of a partition
+        - writes the annotations to output_csv, the first column is the
+          line_no of the first record of the classification
+        - returns the answer counts of the partition
+    """
+    img_to_capture = ImageCaptureLookup.load(lookup_path)
+    line_nos = array('q')
+
+    def _iter_lines(csv_reader):
+        for line in csv_reader:
+            line_nos.append(int(line[0]))
+            yield line[1:]
+
+    first_line_nos = dict()
+    with open(partition_csv, 'r', newline='') as f:
+        classifications = process_classification_lines(
+            header, _iter_lines(csv.reader(f)), img_to_capture,
+            _worker_subject_to_capture, flags, first_line_nos)
+
+    consolidated_classifications = consolidate_all_classifications(
+        classifications, flags)
+    for c_id, annotations in consolidated_classifications.items():
+        classifications[c_id] = annotations
+
+    with open(output_csv, 'w', newline='') as f:
+        csv_writer = csv.writer(f)
+        if len(classifications) > 0:
+            output_header = list(
+                classifications[list(classifications.keys())[0]][0].keys())
+            csv_writer.writerow(['line_no'] + output_header)
+        for c_id, annotations in classifications.items():
+            line_no = line_nos[first_line_nos[c_id]]
+            for annotation in annotations:
+                csv_writer.writerow(
+                    [line_no] + [annotation[x] for x in output_header])
+    return count_answers(classifications, flags)
+
+
+def _iter_partial_annotations(path):
+    """ Yield (line_no, annotation) from a partial output """
+    with open(path, 'r', newline='') as f:
+        csv_reader = csv.DictReader(f)
+        for row in csv_reader:
+            yield int(row.pop('line_no')), row
+
+
+def merge_partial_annotations(
+        partial_csvs, output_csv, flags, flags_global):
+    """ Merge partial outputs (sorted by line_no) into output_csv - in the
+        order of the first record of each classification
+        - returns the number of annotations written
+    """
+    iterators = [_iter_partial_annotations(x) for x in partial_csvs]
+    merged = heapq.merge(*iterators, key=lambda x: x[0])
+    try:
+        first_line_no, first_annotation = next(merged)
+    except StopIteration:
+        return 0
+    header = list(first_annotation.keys())
+    header_to_print = _annotation_header_to_print(header, flags, flags_global)
+    n_classifications = 1
+    n_annos_written = 1
+    with open(output_csv, 'w') as f:
+        csv_writer = csv.writer(f, delimiter=',')
+        logger.info("Writing output to %s" % output_csv)
+        csv_writer.writerow(header_to_print)
+        csv_writer.writerow([first_annotation[x] for x in header])
+        previous_line_no = first_line_no
+        for line_no, annotation in merged:
+            csv_writer.writerow([annotation[x] for x in header])
+            n_annos_written += 1
+            if line_no != previous_line_no:
+                n_classifications += 1
+                previous_line_no = line_no
+    logger.info("Wrote {} classifications and {} annotations".format(
+        n_classifications, n_annos_written))
+    return n_annos_written
+
+
+def extract_season_partitioned(
+        header, lines, season_captures_csv, subject_to_capture, output_csv,
+        flags, flags_global, use_cache=False, n_processes=2, tmp_dir=None):
+    """ Extract, consolidate and export the classifications of a season
+        with n_processes workers
+        - the lines are partitioned by user (see
+          partition_classification_lines)
+        - each worker extracts and consolidates a partition and writes a
+          partial output
+        - the partial outputs are merged in the order of the input, the
+          output is identical to the serial extraction
+        - tmp_dir: directory for the partitions (default: system temp dir)
+    """
+    work_dir = tempfile.mkdtemp(prefix='legacy_extraction_', dir=tmp_dir)
+    try:
+        # build the lookup once and share it memory-mapped with all workers
+        img_to_capture = build_img_to_capture_lookup(
+            season_captures_csv, flags, use_cache=use_cache)
+        lookup_path = '{}.lookup'.format(season_captures_csv)
+        if not (use_cache and ImageCaptureLookup.is_up_to_date(
+                lookup_path, season_captures_csv)):
+            lookup_path = os.path.join(work_dir, 'img_to_capture.lookup')
+            img_to_capture.save(lookup_path)
+        del img_to_capture
+
+        partition_csvs, n_lines = partition_classification_lines(
+            header, lines, work_dir, n_processes)
+        logger.info("Partitioned {} classification lines into {} files".format(
+            n_lines, n_processes))
+        partial_csvs = [
+            os.path.join(work_dir, 'partial_{}.csv'.format(i))
+            for i in range(0, n_processes)]
+        with multiprocessing.Pool(
+                n_processes, initializer=_init_partition_worker,
+                initargs=(subject_to_capture, )) as pool:
+            answers_per_partition = pool.starmap(
+                _extract_partition,
+                [(header, partition_csv, lookup_path, partial_csv, flags)
+                 for partition_csv, partial_csv in
+                 zip(partition_csvs, partial_csvs)])
+
+        answers = {k: Counter() for k in flags['CSV_QUESTIONS']}
+        for partition_answers in answers_per_partition:
+            for question, answer_counts in partition_answers.items():
+                answers[question].update(answer_counts)
+        log_answer_stats(answers)
+
+        n_annos_written = merge_partial_annotations(
+            partial_csvs, output_csv, flags, flags_global)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if n_annos_written == 0:
+        logger.warning("No classifications found - not writing {}".format(
+            output_csv))
+        return
+
+    # change permmissions to read/write for group
+    set_file_permission(output_csv)
+
+
+def _iter_queued_lines(queue):
+    """ Yield lines from batches of lines put on the queue (None to stop) """
+    while True:
+        batch = queue.get()
+        if batch is None:
+            return
+        for line in batch:
+            yield line
+
+
+def _extract_season_from_queue(
+        header, queue, season_captures_csv, subject_to_capture, output_csv,
+        flags, flags_global, use_cache, n_processes, tmp_dir):
+    extract_season(
+        header, _iter_queued_lines(queue), season_captures_csv,
+        subject_to_capture, output_csv, flags, flags_global, use_cache,
+        n_processes, tmp_dir)
+
+
+def _put_batch(queue, batch, worker):
+    """ Put batch on the (bounded) queue of a worker, fail if the worker
+        stopped
+    """
+    while True:
+        try:
+            queue.put(batch, timeout=10)
+            return
+        except Full:
+            if not worker.is_alive():
+                raise RuntimeError("Worker {} stopped unexpectedly".format(
+                    worker.name))
+
+
+def extract_seasons_in_one_pass(
+        input_csv, season_tasks, subject_to_capture, flags, flags_global,
+        batch_size=10000, max_queued_batches=10, use_cache=False,
+        n_processes=1, tmp_dir=None):
+    """ Read the raw classification export once and extract all seasons in
+        parallel - one process per season
+        - season_tasks: dict of season -> (season_captures_csv, output_csv)
+        - classifications of other seasons are skipped
+        - n_processes / tmp_dir: see extract_season
+    """
+    with open(input_csv, "r") as ins:
+        csv_reader = csv.reader(ins, delimiter=',', quotechar='"')
+        header = next(csv_reader)
+        season_col = header.index('season')
+        queues = dict()
+        workers = dict()
+        batches = dict()
+        for season, (season_captures_csv, output_csv) in season_tasks.items():
+            queues[season] = multiprocessing.Queue(maxsize=max_queued_batches)
+            workers[season] = multiprocessing.Process(
+                target=_extract_season_from_queue,
+                name='extract_season_{}'.format(season),
+                args=(header, queues[season], season_captures_csv,
+                      subject_to_capture, output_csv, flags, flags_global,
+                      use_cache, n_processes, tmp_dir))
+            workers[season].start()
+            batches[season] = list()
+        try:
+            stats = Counter()
+            for line_no, line in enumerate(csv_reader):
+                if ((line_no % 1000000) == 0) and (line_no > 0):
+                    logger.info("Read %s classifications" % line_no)
+                season = line[season_col]
+                stats.update({season})
+                if season not in batches:
+                    continue
+                batches[season].append(line)
+                if len(batches[season]) >= batch_size:
+                    _put_batch(queues[season], batches[season], workers[season])
+                    batches[season] = list()
+            for season, batch in batches.items():
+                if len(batch) > 0:
+                    _put_batch(queues[season], batch, workers[season])
+                _put_batch(queues[season], None, workers[season])
+        except BaseException:
+            for worker in workers.values():
+                worker.terminate()
+            raise
+    for season, worker in workers.items():
+        worker.join()
+        logger.info("Season: {} - {} classifications - exit code {}".format(
+            season, stats[season], worker.exitcode))
+    failed = [s for s, w in workers.items() if w.exitcode != 0]
+    if len(failed) > 0:
+        raise RuntimeError("Failed to extract seasons: {}".format(failed))
+    return stats
@@ -1,14 +1,13 @@
 """ Create an inventory for timestams for all images / captures form S1-S10 """
 import os
+from array import array
+import numpy as np
 import pandas as pd
-import csv
-import json
-from collections import OrderedDict
 from collections import Counter
 from datetime import datetime
 
 from zooniverse_exports.legacy.legacy_extractor import build_img_path
-from utils.utils import correct_image_name
+from utils.utils import correct_image_name, iter_json_object_array_items
 
 
 #################################
@@ -74,58 +73,138 @@ def read_db(path_images_db, col_mapper):
     return df
 
 
-def read_lila(lila_path):
-    """ Read data from LILA json export """
-    with open(lila_path, 'r') as f:
-        lila_data = json.load(f)
-    species_map = {x['id']: x['name'] for x in lila_data['categories']}
-    image_to_capture = {
-        x['id']:
-            {'image_path': x['file_name'], 'subject_id': x['seq_id'],
-             'season': x['season'], 'site': x['location'],
-             'datetime': x.get('datetime', '')} for x in lila_data['images']}
-    capture_to_species = dict()
-    for anno in lila_data['annotations']:
-        subject_id = image_to_capture[anno['image_id']]['subject_id']
-        if subject_id not in capture_to_species:
-            capture_to_species[subject_id] = set()
-        capture_to_species[subject_id].add(species_map[anno['category_id']])
-    rows = list()
-    cols_imgs = ['image_path', 'subject_id', 'season', 'site', 'datetime']
-    for img_id, img_data in image_to_capture.items():
-        species = '#'.join(capture_to_species[img_data['subject_id']])
-        row = [img_data[x] for x in cols_imgs]
-        row.append(species)
-        rows.append(row)
-    df = pd.DataFrame(rows)
-    cols_all = cols_imgs
-    cols_all.append('species')
-    df.columns = cols_all
+class _CodedColumn(object):
+    """ Column buffer that stores every distinct str once and an integer
+        code per row
+    """
+    def __init__(self):
+        self.codes = array('i')
+        self.values = list()
+        self._value_to_code = dict()
+
+    def code(self, value):
+        try:
+            return self._value_to_code[value]
+        except KeyError:
+            code = self._value_to_code[value] = len(self.values)
+            self.values.append(value)
+            return code
+
+    def append(self, value):
+        self.codes.append(self.code(value))
+
+    def to_array(self):
+        """ Object array of all rows (rows share the str objects) """
+        values = np.empty(len(self.values), dtype=object)
+        values[:] = self.values
+        return values[np.frombuffer(self.codes, dtype=np.int32)]
+
+
+def _join_subject_species(subject_codes, category_codes, n_subjects,
+                          category_names):
+    """ '#'-joined species of each subject (in order of the first
+        annotation of each species)
+    """
+    subject_species = [list() for _ in range(n_subjects)]
+    pairs = np.frombuffer(subject_codes, dtype=np.int32).astype(np.int64) * \
+        max(len(category_names), 1) + \
+        np.frombuffer(category_codes, dtype=np.int32)
+    _, first_index = np.unique(pairs, return_index=True)
+    first_index.sort()
+    for i in first_index.tolist():
+        subject_species[subject_codes[i]].append(
+            category_names[category_codes[i]])
+    return ['#'.join(x) for x in subject_species]
+
+
+def read_lila(lila_path, seasons=None):
+    """ Read data from LILA json export
+        - the json file is parsed incrementally, repeated strs (season,
+          site, subject_id, datetime) are stored once
+        - seasons: only read images of these seasons, e.g. ['S1', 'S2']
+    """
+    category_to_name = dict()
+    image_paths = list()
+    cols = {x: _CodedColumn()
+            for x in ['subject_id', 'season', 'site', 'datetime']}
+    image_to_subject_code = dict()
+    # one (subject_code, category_code) per annotation
+    categories = _CodedColumn()
+    annotation_subject_codes = array('i')
+    # annotations before the images in the file
+    pending_annotations = list()
+    images_read = False
+    last_key = None
+    for key, value in iter_json_object_array_items(lila_path):
+        if (last_key == 'images') and (key != 'images'):
+            images_read = True
+        last_key = key
+        if key == 'categories':
+            category_to_name[value['id']] = value['name']
+        elif key == 'images':
+            if (seasons is not None) and (value['season'] not in seasons):
+                continue
+            image_paths.append(value['file_name'])
+            cols['season'].append(value['season'])
+            cols['site'].append(value['location'])
+            cols['datetime'].append(value.get('datetime', ''))
+            cols['subject_id'].append(value['seq_id'])
+            image_to_subject_code[value['id']] = cols['subject_id'].codes[-1]
+        elif key == 'annotations':
+            if value['image_id'] in image_to_subject_code:
+                annotation_subject_codes.append(
+                    image_to_subject_code[value['image_id']])
+                categories.append(value['category_id'])
+            elif not images_read:
+                pending_annotations.append(
+                    (value['image_id'], value['category_id']))
+    for image_id, category_id in pending_annotations:
+        if image_id in image_to_subject_code:
+            annotation_subject_codes.append(image_to_subject_code[image_id])
+            categories.append(category_id)
+    species = _CodedColumn()
+    species.codes = array('i', [species.code(x) for x in _join_subject_species(
+        annotation_subject_codes, categories.codes,
+        len(cols['subject_id'].values),
+        [category_to_name[x] for x in categories.values])])
+    subject_codes = np.frombuffer(cols['subject_id'].codes, dtype=np.int32)
+    df = pd.DataFrame({
+        'image_path': image_paths,
+        'subject_id': cols['subject_id'].to_array(),
+        'season': cols['season'].to_array(),
+        'site': cols['site'].to_array(),
+        'datetime': cols['datetime'].to_array(),
+        'species': species.to_array()[subject_codes]})
     return df
 
 
-def read_cleaned(path_cleaned):
+def parse_datetimes(date_strs, fmt="%Y-%m-%d %H:%M:%S"):
+    """ Re-format datetime strs of unknown format to 'fmt'
+        - every distinct value is parsed only once
+    """
+    date_strs = pd.Series(date_strs)
+    mapper = {x: _get_datetime_obj(x).strftime(fmt)
+              for x in date_strs.unique()}
+    return date_strs.map(mapper)
+
+
+def cleaned_csv_path(path_cleaned, season):
+    return os.path.join(path_cleaned, 'S{}_cleaned.csv'.format(season))
+
+
+def read_cleaned(path_cleaned, seasons=(4, 5, 6, 7, 8, 9, 10)):
     """ Read Data from Cleaned CSV files """
     cleaned = list()
-    for season in [4, 5, 6, 7, 8, 9, 10]:
+    for season in seasons:
         print("Starting with {}".format(season))
-        path = os.path.join(path_cleaned, 'S{}_cleaned.csv'.format(season))
-        df_dict = OrderedDict()
-        with open(path, 'r') as f:
-            csv_reader = csv.reader(f, delimiter=',', quotechar='"')
-            header = next(csv_reader)
-            mapper = {x: i for i, x in enumerate(header)}
-            for line_no, line in enumerate(csv_reader):
-                record = {k: line[v] for k, v in mapper.items()}
-                record['ImageName'] = os.path.split(record['path'])[-1]
-                record['season'] = 'S{}'.format(season)
-                record['PathFilename'] = build_img_path(
-                    record['season'], record['site'],
-                    record['roll'], record['ImageName'])
-                old_time_ob = _get_datetime_obj(record['oldtime'])
-                record['oldtime'] = old_time_ob.strftime("%Y-%m-%d %H:%M:%S")
-                df_dict[line_no] = record
-        df = pd.DataFrame.from_dict(df_dict, orient='index')
+        path = cleaned_csv_path(path_cleaned, season)
+        df = pd.read_csv(path, dtype=str, na_filter=False)
+        df['ImageName'] = [os.path.split(x)[-1] for x in df['path']]
+        df['season'] = 'S{}'.format(season)
+        df['PathFilename'] = [
+            build_img_path(*x) for x in zip(
+                df['season'], df['site'], df['roll'], df['ImageName'])]
+        df['oldtime'] = parse_datetimes(df['oldtime'])
         cleaned.append(df)
     df_cleaned = pd.concat(cleaned)
     df_cleaned.fillna('', inplace=True)
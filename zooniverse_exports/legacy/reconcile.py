@@ -0,0 +1,373 @@
+""" Reconcile the legacy data sources of Snapshot Serengeti S1-S10
+    - LILA/Dryad json (S1-S6), MSI DB export (S1-S8), SX_cleaned.csv files
+    - every source is normalized once, the normalized frames can be cached
+      (csv, with the paths / sizes / mtimes of the sources in a json file)
+      to quickly re-run the reconciliation
+    - the sources are joined on explicit keys, see *_JOIN_KEYS
+"""
+import os
+import json
+import logging
+
+import pandas as pd
+
+from utils.utils import sort_df, sort_df_by_capture_id, set_file_permission
+from zooniverse_exports.legacy.legacy_utils import (
+    read_lila, read_db, read_cleaned, cleaned_csv_path)
+
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_KEYS = ['season', 'site', 'roll', 'capture']
+
+# db export (image_path) to SX_cleaned.csv (PathFilename)
+DB_JOIN_KEYS = ['image_path', 'season', 'site', 'roll']
+CLEANED_JOIN_KEYS = ['PathFilename', 'season', 'site', 'roll']
+# db export / SX_cleaned.csv to LILA
+LILA_JOIN_KEYS = ['image_path', 'season', 'site']
+
+DB_COL_MAPPER = {
+    'ZoonID': 'subject_id',
+    'idCaptureEvent': 'CaptureEventId',
+    'Zooniverse_ID': 'subject_id',
+    'ZooniverseIdentifier': 'subject_id',
+    'Roll': 'roll_db_id',
+    'Season': 'season',
+    'Site': 'site_db_id',
+    'Capture': 'capture_db_id',
+    'GridCell': 'site',
+    'RollNumber': 'roll',
+    'CaptureEventNum': 'capture'
+    }
+
+# images that do not exist on MSI
+NON_EXISTING_IMAGES = [
+    'S1/L10/L10_R1/S1_L10_R1_PICT0004 (2).JPG',
+    'S1/L10/L10_R1/S1_L10_R1_PICT0023 (2).JPG',
+    'S1/L10/L10_R1/S1_L10_R1_PICT0024 (2).JPG',
+    'S1/L10/L10_R1/S1_L10_R1_PICT0025 (2).JPG',
+    'S7/G09/G09_R2/S7_G09_R2_P1060627.JPG']
+
+# columns (and their final names) taken from the merged data per season
+SEASON_COLS_LILA_AND_DB = [
+    'image_path', 'season', 'site', 'roll', 'capture',
+    'SequenceNum', 'TimestampJPG', 'TimestampFile',
+    'TimestampAccepted', 'Invalid', 'datetime']
+SEASON_COLS_DB = [
+    'image_path', 'season', 'site', 'roll', 'capture',
+    'SequenceNum', 'TimestampJPG', 'TimestampFile',
+    'TimestampAccepted', 'Invalid']
+SEASON_COLS_CLEANED = [
+    'image_path', 'season', 'site', 'roll', 'capture',
+    'image', 'oldtime', 'newtime',
+    'include', 'invalid']
+
+FINAL_COL_MAPPER = {
+    'SequenceNum': 'image_rank_in_capture',
+    'image': 'image_rank_in_capture',
+    'TimestampJPG': 'datetime_exif',
+    'oldtime': 'datetime_exif',
+    'TimestampFile': 'datetime_file_creation',
+    'TimestampAccepted': 'datetime',
+    'newtime': 'datetime',
+    'Invalid': 'invalid',
+    'image_path': 'image_path_rel',
+    'datetime': 'datetime_lila'
+    }
+
+FINAL_COLS = [
+    'capture_id', 'season', 'site', 'roll', 'capture',
+    'image_rank_in_capture', 'image_name', 'image_path_rel',
+    'datetime', 'datetime_exif', 'datetime_file_creation',
+    'image_is_invalid', 'image_datetime_uncertain',
+    'image_no_upload', 'image_was_deleted',
+    'action_taken', 'action_taken_reason',
+    'invalid', 'include']
+
+
+def season_cols(season_num):
+    """ Columns to take from the merged data for a season """
+    if season_num <= 6:
+        return SEASON_COLS_LILA_AND_DB
+    elif season_num <= 8:
+        return SEASON_COLS_DB
+    return SEASON_COLS_CLEANED
+
+
+def create_capture_ids(df):
+    """ Vectorized create_capture_id """
+    return 'SER_' + df['season'].str.cat(
+        [df['site'], df['roll'], df['capture']], sep='#')
+
+
+def remove_non_existing(df):
+    """ Remove images that dont exist """
+    return df.loc[~df['image_path'].isin(NON_EXISTING_IMAGES)]
+
+
+#################################
+# Normalize Sources
+#################################
+
+def normalize_lila(lila_path):
+    """ Read and normalize the LILA json export """
+    df = read_lila(lila_path)
+    df = df[['image_path', 'subject_id', 'season',
+             'site', 'datetime', 'species']].copy()
+    df['in_lila'] = '1'
+    return remove_non_existing(df).reset_index(drop=True)
+
+
+def normalize_db(path_images_db):
+    """ Read and normalize the MSI db export """
+    df = read_db(path_images_db, DB_COL_MAPPER)
+    df = df[[
+        'subject_id', 'image_path', 'season',
+        'site', 'roll', 'capture', 'SequenceNum',
+        'TimestampJPG', 'TimestampFile', 'TimestampAccepted',
+        'Invalid', 'idTimestampStatuses', 'StatusDescription']].copy()
+    df['in_db'] = '1'
+    return remove_non_existing(df).reset_index(drop=True)
+
+
+def normalize_cleaned(path_cleaned, seasons):
+    """ Read and normalize the SX_cleaned.csv files, timestamps are
+        parsed once per distinct value
+    """
+    df = read_cleaned(path_cleaned, seasons)
+    df = df[[
+        'newtime', 'oldtime', 'PathFilename', 'roll', 'season', 'site',
+        'capture', 'image', 'include', 'invalid']].copy()
+    df['in_clean'] = '1'
+    return df.reset_index(drop=True)
+
+
+def _cache_key(source_paths, params=None):
+    """ Path, size and mtime of every source and the build parameters """
+    sources = list()
+    for path in source_paths:
+        stat = os.stat(path)
+        sources.append(
+            [os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return {'sources': sources, 'params': params}
+
+
+def _read_cache(cache_path_no_ext, key):
+    """ Read a cached frame (None if missing or not built from key) """
+    cache_path = cache_path_no_ext + '.csv'
+    meta_path = cache_path_no_ext + '.json'
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if (meta['key'] != key) or \
+                (meta['cache_size'] != os.path.getsize(cache_path)):
+            return None
+        df = pd.read_csv(cache_path, dtype=str, na_filter=False)
+        for col, dtype in meta['dtypes'].items():
+            if dtype != 'object':
+                df[col] = df[col].astype(dtype)
+    except (OSError, ValueError, KeyError):
+        return None
+    return df
+
+
+def _write_cache(df, cache_path_no_ext, key):
+    """ Write df as csv and the key it was built from (json), the meta
+        data is replaced last
+    """
+    cache_path = cache_path_no_ext + '.csv'
+    meta_path = cache_path_no_ext + '.json'
+    df.to_csv(cache_path + '.tmp', index=False)
+    meta = {
+        'key': key,
+        'cache_size': os.path.getsize(cache_path + '.tmp'),
+        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}}
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(cache_path + '.tmp', cache_path)
+    os.replace(meta_path + '.tmp', meta_path)
+    set_file_permission(cache_path)
+    set_file_permission(meta_path)
+    logger.info("Wrote cache {}".format(cache_path))
+
+
+def cached_frame(build_function, name, cache_dir, source_paths, params=None):
+    """ Build a normalized frame or read it from cache
+        - build_function: returns the frame (str columns, no NaN)
+        - name: file name of the cached frame (without extension)
+        - cache_dir: directory of the cache (None to disable caching)
+        - source_paths: the cache is re-built unless it was built from
+          the same paths with the same size / mtime
+        - params: json-serializable build parameters, the cache is
+          re-built if they change
+    """
+    if cache_dir is None:
+        return build_function()
+    cache_path_no_ext = os.path.join(cache_dir, name)
+    # lists as in the json meta data
+    key = json.loads(json.dumps(_cache_key(source_paths, params)))
+    df = _read_cache(cache_path_no_ext, key)
+    if df is not None:
+        logger.info("Reading {} from cache".format(name))
+        return df
+    df = build_function()
+    _write_cache(df, cache_path_no_ext, key)
+    return df
+
+
+def read_sources(
+        lila_path, path_images_db, path_cleaned,
+        cleaned_seasons=(4, 5, 6, 7, 8, 9, 10), cache_dir=None):
+    """ Read the normalized LILA, db export and SX_cleaned.csv frames """
+    df_lila = cached_frame(
+        lambda: normalize_lila(lila_path),
+        'df_lila', cache_dir, [lila_path])
+    df_db = cached_frame(
+        lambda: normalize_db(path_images_db),
+        'df_db', cache_dir, [path_images_db])
+    df_cleaned = cached_frame(
+        lambda: normalize_cleaned(path_cleaned, cleaned_seasons),
+        'df_cleaned', cache_dir,
+        [cleaned_csv_path(path_cleaned, x) for x in cleaned_seasons],
+        params={'cleaned_seasons': list(cleaned_seasons)})
+    return df_lila, df_db, df_cleaned
+
+
+#################################
+# Reconcile
+#################################
+
+def merge_sources(df_db, df_cleaned, df_lila):
+    """ Full outer join of the db export, SX_cleaned.csv and LILA frames
+        - one row per image_path and source combination
+        - ' (2)' is removed from image names
+    """
+    df_merged = pd.merge(
+        left=df_db, how='outer',
+        right=df_cleaned,
+        left_on=DB_JOIN_KEYS,
+        right_on=CLEANED_JOIN_KEYS,
+        suffixes=('_db', '_cleaned'))
+    df_merged['image_path'] = \
+        df_merged['image_path'].fillna(df_merged['PathFilename'])
+    # take 'capture_db', substitute with 'capture_cleaned' if empty
+    i_replace = \
+        (df_merged['capture_db'] == '') | (df_merged['capture_db'].isna())
+    df_merged['capture'] = df_merged['capture_db'].where(
+        ~i_replace, df_merged['capture_cleaned'])
+    df_merged = pd.merge(
+        left=df_merged, how='outer',
+        right=df_lila,
+        on=LILA_JOIN_KEYS,
+        suffixes=('', '_lila'))
+    df_merged.fillna('', inplace=True)
+    # remove ' (2)' from image names with either '(' or ')'
+    i_special_char = \
+        df_merged['image_path'].str.contains('(', regex=False) | \
+        df_merged['image_path'].str.contains(')', regex=False)
+    df_merged.loc[i_special_char, 'image_path'] = \
+        df_merged.loc[i_special_char, 'image_path'].str.replace(
+            ' (2)', '', regex=False)
+    return df_merged
+
+
+def select_season_images(df_merged, n_seasons=10):
+    """ Select / rename the columns of each season from the merged data
+        and remove images of S1-S8 that are neither in the db export
+        nor in LILA (these are partly faulty captures)
+    """
+    season_dfs = list()
+    for season_num in range(1, n_seasons + 1):
+        i_season = df_merged['season'] == 'S{}'.format(season_num)
+        df_season = df_merged.loc[i_season, season_cols(season_num)]
+        season_dfs.append(df_season.rename(columns=FINAL_COL_MAPPER))
+    df_final = pd.concat(season_dfs)
+    df_final.fillna('', inplace=True)
+    i_only_in_cleaned_s1_s8 = \
+        df_final['season'].isin(['S{}'.format(x) for x in range(1, 9)]) & \
+        (df_final['invalid'] == '')
+    logger.info("Removed {} only in cleaned for S1-S8".format(
+        i_only_in_cleaned_s1_s8.sum()))
+    return df_final.loc[~i_only_in_cleaned_s1_s8]
+
+
+def build_capture_events(df_final):
+    """ One row per capture with the datetime of the first image with a
+        datetime (LILA datetime, else 'datetime'), '' if there is none
+    """
+    datetime_clean = df_final['datetime_lila'].where(
+        df_final['datetime_lila'] != '', df_final['datetime'])
+    df_capture = df_final[CAPTURE_KEYS].copy()
+    df_capture['datetime'] = datetime_clean
+    # images with a datetime first (stable) to keep the first one
+    order = (datetime_clean == '').argsort(kind='stable')
+    df_capture = df_capture.iloc[order].drop_duplicates(subset=CAPTURE_KEYS)
+    df_capture['capture_id'] = create_capture_ids(df_capture)
+    sort_df_by_capture_id(df_capture)
+    return df_capture[['capture_id'] + CAPTURE_KEYS + ['datetime']]
+
+
+def build_capture_to_subject(df_merged, df_captures):
+    """ Map capture_ids to subject_ids (db export, LILA if missing)
+        - one row per image of the captures
+    """
+    df_base = df_merged[['subject_id_lila', 'subject_id']].copy()
+    df_base['capture_id'] = create_capture_ids(df_merged)
+    df_subject = pd.merge(
+        left=df_captures[['capture_id']],
+        right=df_base,
+        on='capture_id',
+        how='left')
+    df_subject['subject_id'] = df_subject['subject_id'].where(
+        df_subject['subject_id'] != '', df_subject['subject_id_lila'])
+    df_subject = df_subject.loc[df_subject['subject_id'] != '']
+    n_subjects = df_subject.groupby('capture_id').subject_id.nunique()
+    if (n_subjects > 1).any():
+        raise ValueError("Found {} captures with multiple subjects".format(
+            (n_subjects > 1).sum()))
+    return df_subject[['capture_id', 'subject_id']]
+
+
+def build_cleaned_images(df_final, df_captures):
+    """ Create the final cleaned images with the datetime of the capture
+        and re-created 'include' / 'image_is_invalid' /
+        'image_datetime_uncertain' flags
+    """
+    df = df_final[[
+        'image_path_rel', 'season', 'site', 'roll', 'capture',
+        'image_rank_in_capture', 'datetime_exif', 'datetime_file_creation',
+        'invalid', 'include']].reset_index(drop=True)
+    df.fillna('', inplace=True)
+    i_to_include = df['invalid'].isin(['0'])
+    i_to_exclude = df['invalid'].isin(['1', '2', '3'])
+    i_to_unknown = df['invalid'].isin([''])
+    df.loc[i_to_include, 'include'] = '1'
+    df.loc[i_to_exclude, 'include'] = '0'
+    df.loc[i_to_unknown, 'include'] = ''
+    for flag in ['image_is_invalid', 'image_datetime_uncertain']:
+        df[flag] = ''
+        df.loc[i_to_exclude, flag] = '1'
+        df.loc[i_to_include, flag] = '0'
+    # dummy columns
+    for col in ['image_was_deleted', 'image_no_upload',
+                'action_taken', 'action_taken_reason']:
+        df[col] = ''
+    df['image_name'] = [os.path.basename(x) for x in df['image_path_rel']]
+    df['capture_id'] = create_capture_ids(df)
+    capture_datetimes = df_captures.set_index('capture_id')['datetime']
+    df['datetime'] = df['capture_id'].map(capture_datetimes)
+    if df['datetime'].isna().any():
+        raise ValueError("Found {} images without capture".format(
+            df['datetime'].isna().sum()))
+    return df[FINAL_COLS]
+
+
+def write_season_files(df_cleaned_images, output_dir):
+    """ Write one sorted 'SER_SX_cleaned.csv' per season """
+    for season, df_season in df_cleaned_images.groupby('season', sort=False):
+        logger.info("Writing Season {}".format(season))
+        df_season = df_season.copy()
+        sort_df(df_season)
+        output_path_season = os.path.join(
+            output_dir, 'SER_{}_cleaned.csv'.format(season))
+        df_season.to_csv(output_path_season, index=False)
@@ -3,7 +3,7 @@ import os
 import logging
 import argparse
 
-from utils.logger import setup_logger
+from utils.logger import set_logging
 from utils.utils import merge_csvs, sort_df_by_capture_id, set_file_permission
 
 
@@ -16,6 +16,10 @@ if __name__ == '__main__':
     parser.add_argument("--output_csv", type=str, required=True)
     parser.add_argument("--key", type=str, required=True)
     parser.add_argument("--add_new_cols_to_right", action='store_true')
+    parser.add_argument(
+        "--log_dir", type=str, default=None)
+    parser.add_argument(
+        "--log_filename", type=str, default='merge_csvs')
 
     args = vars(parser.parse_args())
 
@@ -38,7 +42,7 @@ if __name__ == '__main__':
     # Configuration
     ######################################
 
-    setup_logger()
+    set_logging(args['log_dir'], args['log_filename'])
     logger = logging.getLogger(__name__)
 
     for k, v in args.items():
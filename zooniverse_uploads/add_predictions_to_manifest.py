@@ -1,14 +1,21 @@
-""" Integrate Aggregated Predictions into Manifest """
-import json
+""" Integrate Aggregated Predictions into Manifest
+    - predictions are flattened into an on-disk index (SQLite) and looked up
+      while streaming through the manifest
+"""
 import os
+import sqlite3
+import tempfile
 import argparse
 import logging
 
 from utils.logger import set_logging
-from utils.utils import (
-    export_dict_to_json_with_newlines, set_file_permission)
-from machine_learning.flatten_preds import (
-    flatten_ml_empty_preds, flatten_ml_species_preds)
+from utils.utils import set_file_permission
+from machine_learning.predictions_db import (
+    create_predictions_db, count_predictions, predictions_db_is_current,
+    find_flat_empty_preds, find_flat_species_preds)
+from zooniverse_uploads.manifest import (
+    read_manifest_index, read_manifest_entries, write_manifest,
+    is_jsonl_manifest, manifest_index_path)
 
 # # For Testing
 # args = dict()
@@ -24,7 +31,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--manifest", type=str, required=True,
-        help="Path to manifest file (.json)")
+        help="Path to manifest file (.json/.jsonl)")
     parser.add_argument(
         "--predictions_empty", type=str, required=True,
         help="Path to the file with predictions from the empty model \
@@ -35,12 +42,22 @@ if __name__ == "__main__":
               (.json). Default is to generate the name based on the manifest.")
     parser.add_argument(
         "--output_file", type=str, default=None,
-        help="Output file to write new manifest to (.json). \
+        help="Output file to write new manifest to (.json/.jsonl). \
               Default is to overwrite the manifest.")
     parser.add_argument(
         "--add_all_species_scores", action='store_true',
         help="Whether to save all species scores into the manifest \
               (and not just the top prediction).")
+    parser.add_argument(
+        "--predictions_db", type=str, default=None,
+        help="Path to a (SQLite) file with the flattened predictions. Is \
+              created if it does not exist, else re-used (e.g. to add \
+              predictions to several batches) if it was built from the \
+              same (unchanged) prediction files, otherwise it is \
+              re-created. Default is to use a temporary file.")
+    parser.add_argument(
+        "--n_processes", type=int, default=1,
+        help="The number of processes to flatten the predictions with.")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
@@ -74,60 +91,92 @@ if __name__ == "__main__":
         raise FileNotFoundError("predictions: %s not found" %
                                 args['predictions_empty'])
 
-    # import manifest
-    with open(args['manifest'], 'r') as f:
-        mani = json.load(f)
-
-    logger.info("Imported {} records from {}".format(
-        len(mani.keys()), args['manifest']))
-
-    # import predictions
-    with open(args['predictions_species'], 'r') as f:
-        preds_species = json.load(f)
+    # import manifest index (the full manifest for '.json' manifests)
+    mani_index = read_manifest_index(args['manifest'])
 
     logger.info("Imported {} records from {}".format(
-        len(mani.keys()), args['predictions_species']))
+        len(mani_index.keys()), args['manifest']))
+
+    # flatten predictions into an on-disk index
+    tmp_dir = None
+    if args['predictions_db'] is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        args['predictions_db'] = os.path.join(
+            tmp_dir.name, 'predictions.sqlite')
+
+    if predictions_db_is_current(
+            args['predictions_db'],
+            args['predictions_empty'],
+            args['predictions_species']):
+        logger.info("Using existing predictions db {}".format(
+            args['predictions_db']))
+    else:
+        if os.path.exists(args['predictions_db']):
+            logger.info(
+                "Predictions db {} was not built from the current "
+                "prediction files -- re-creating it".format(
+                    args['predictions_db']))
+        else:
+            logger.info("Creating predictions db {}".format(
+                args['predictions_db']))
+        create_predictions_db(
+            args['predictions_db'],
+            args['predictions_empty'],
+            args['predictions_species'],
+            n_processes=args['n_processes'])
+
+    conn = sqlite3.connect(args['predictions_db'])
+
+    n_empty, n_species = count_predictions(conn)
+    logger.info(
+        "Found {} captures with empty and {} with species predictions".format(
+            n_empty, n_species))
+
+    stats = {'captures_with_preds': 0}
+    n_total = len(mani_index.keys())
+
+    def add_predictions(manifest_entries):
+        """ Extract predictions and add to manifest entries """
+        for capture_id, data in manifest_entries:
+            # set ml to False per default
+            data['info']['machine_learning'] = False
+            meta_data = data['upload_metadata']
+            # get predictions empty
+            flat_empty = find_flat_empty_preds(conn, capture_id)
+            if flat_empty is not None:
+                # prefix with '#' to hide on Zooniverse
+                flat_empty = {
+                    '#{}'.format(k): v for k, v in flat_empty.items()}
+                meta_data.update(flat_empty)
+                data['info']['machine_learning'] = True
+            # add species predictions
+            flat_species = find_flat_species_preds(
+                conn, capture_id,
+                only_top=(not args['add_all_species_scores']))
+            if flat_species is not None:
+                # prefix with '#' to hide on Zooniverse
+                flat_species = {
+                    '#{}'.format(k): v for k, v in flat_species.items()}
+                meta_data.update(flat_species)
+                data['info']['machine_learning'] = True
+            if data['info']['machine_learning']:
+                stats['captures_with_preds'] += 1
+            yield capture_id, data
 
-    with open(args['predictions_empty'], 'r') as f:
-        preds_empty = json.load(f)
+    # Export Manifest
+    manifest_entries = read_manifest_entries(
+        args['manifest'], index=mani_index)
+    write_manifest(add_predictions(manifest_entries), args['output_file'])
 
-    logger.info("Imported {} records from {}".format(
-        len(mani.keys()), args['predictions_empty']))
-
-    captures_with_preds = 0
-    n_total = len(mani.keys())
-
-    # Extract predictions and add to manifest
-    for capture_id, data in mani.items():
-        # set ml to False per default
-        data['info']['machine_learning'] = False
-        meta_data = data['upload_metadata']
-        # get predictions empty
-        if capture_id in preds_empty:
-            flat_empty = flatten_ml_empty_preds(preds_empty[capture_id])
-            # prefix with '#' to hide on Zooniverse
-            flat_empty = {'#{}'.format(k): v for k, v in flat_empty.items()}
-            meta_data.update(flat_empty)
-            data['info']['machine_learning'] = True
-        # add species predictions
-        if capture_id in preds_species:
-            flat_species = flatten_ml_species_preds(
-                preds_species[capture_id],
-                only_top=(not args['add_all_species_scores']))
-            # prefix with '#' to hide on Zooniverse
-            flat_species = {
-                '#{}'.format(k): v for k, v in flat_species.items()}
-            meta_data.update(flat_species)
-            data['info']['machine_learning'] = True
-        if data['info']['machine_learning']:
-            captures_with_preds += 1
+    conn.close()
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
 
     # statistic
     logger.info("Added predictions to {} / {} captures".format(
-          captures_with_preds, n_total))
-
-    # Export Manifest
-    export_dict_to_json_with_newlines(mani, args['output_file'])
+          stats['captures_with_preds'], n_total))
 
     # change permmissions to read/write for group
     set_file_permission(args['output_file'])
+    if is_jsonl_manifest(args['output_file']):
+        set_file_permission(manifest_index_path(args['output_file']))
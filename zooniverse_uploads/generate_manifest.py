@@ -9,10 +9,11 @@ import logging
 from config.cfg import cfg
 from utils.logger import set_logging
 from utils.utils import (
-    export_dict_to_json_with_newlines,
     read_cleaned_season_file_df,
     remove_images_from_df,
     file_path_generator, set_file_permission)
+from zooniverse_uploads.manifest import (
+    write_manifest, is_jsonl_manifest, manifest_index_path)
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +62,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--license", type=str, required=True,
         help="license information added to the manifest.")
+    parser.add_argument(
+        "--manifest_format", type=str, default='json',
+        choices=['json', 'jsonl'],
+        help="Format of the manifest: 'json' (one JSON object) or 'jsonl' \
+              (one capture per line with an offset index, allows for \
+              streaming and in-place updates).")
     parser.add_argument(
         "--log_dir", type=str, default=None)
     parser.add_argument(
@@ -96,7 +103,8 @@ if __name__ == "__main__":
     manifest_path = file_path_generator(
         dir=args['output_manifest_dir'],
         id=args['manifest_id'],
-        name="manifest")
+        name="manifest",
+        file_ext=args['manifest_format'])
 
     if os.path.exists(manifest_path):
         raise FileExistsError("manifest already exists: %s" % manifest_path)
@@ -168,9 +176,11 @@ if __name__ == "__main__":
     logger.info("Writing %s captures to %s" %
                 (len(manifest.keys()), manifest_path))
 
-    export_dict_to_json_with_newlines(manifest, manifest_path)
+    write_manifest(manifest.items(), manifest_path)
 
     logger.info("Finished writing to {}".format(manifest_path))
 
     # change permmissions to read/write for group
     set_file_permission(manifest_path)
+    if is_jsonl_manifest(manifest_path):
+        set_file_permission(manifest_index_path(manifest_path))
@@ -0,0 +1,197 @@
+""" Read and Write Manifests
+
+    Two formats are supported:
+    - '.json': a single JSON object mapping capture_id to capture data
+      (legacy format, fully loaded into memory)
+    - '.jsonl': one capture per line ({capture_id: capture data}) with a
+      sidecar offset index ('<manifest>.index') that allows iterating,
+      random access by capture_id, batching and appending updated
+      captures without reading the whole manifest
+"""
+import os
+import json
+import logging
+from collections import OrderedDict
+
+from utils.utils import export_dict_to_json_with_newlines
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_jsonl_manifest(path):
+    """ Check whether a manifest is in the line-delimited format """
+    return path.endswith('.jsonl')
+
+
+def manifest_file_ext(path):
+    """ Get the file extension of a manifest ('json' or 'jsonl') """
+    if is_jsonl_manifest(path):
+        return 'jsonl'
+    return 'json'
+
+
+def manifest_index_path(path):
+    """ Path of the sidecar offset index of a '.jsonl' manifest """
+    return '{}.index'.format(path)
+
+
+def _encode_manifest_line(capture_id, data):
+    line = json.dumps({capture_id: data}) + '\n'
+    return line.encode('utf-8')
+
+
+def _decode_manifest_line(line):
+    record = json.loads(line.decode('utf-8'))
+    return next(iter(record.items()))
+
+
+def _write_index_lines(index_file, index_entries):
+    for capture_id, offset in index_entries:
+        index_file.write('{},{}\n'.format(capture_id, offset))
+
+
+def build_manifest_index(path):
+    """ Build the offset index of a '.jsonl' manifest by scanning it
+        - later lines of the same capture_id override earlier ones
+        - the index is written to the sidecar file
+    """
+    index = OrderedDict()
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                capture_id, _ = _decode_manifest_line(line)
+                index[capture_id] = offset
+            offset += len(line)
+    with open(manifest_index_path(path), 'w') as f:
+        f.write('capture_id,offset\n')
+        _write_index_lines(f, index.items())
+    return index
+
+
+def _index_is_consistent(path, index):
+    """ Check that the last indexed line ends at the end of the manifest """
+    file_size = os.path.getsize(path)
+    if len(index) == 0:
+        return file_size == 0
+    last_offset = max(index.values())
+    with open(path, 'rb') as f:
+        f.seek(last_offset)
+        last_line = f.readline()
+    return (last_offset + len(last_line)) == file_size
+
+
+def read_manifest_index(path):
+    """ Read the capture_id index of a manifest
+        - '.jsonl': OrderedDict capture_id -> byte offset of its line,
+          read from the sidecar file (re-built if missing or stale)
+        - '.json': OrderedDict capture_id -> capture data (the whole
+          manifest is loaded)
+    """
+    if not is_jsonl_manifest(path):
+        with open(path, 'r') as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+    index_path = manifest_index_path(path)
+    if not os.path.exists(index_path):
+        logger.info("Building index for {}".format(path))
+        return build_manifest_index(path)
+    index = OrderedDict()
+    with open(index_path, 'r') as f:
+        _ = next(f)
+        for line in f:
+            capture_id, offset = line.rstrip('\n').rsplit(',', 1)
+            index[capture_id] = int(offset)
+    if not _index_is_consistent(path, index):
+        logger.warning("Index {} is stale -- re-building it".format(
+            index_path))
+        return build_manifest_index(path)
+    return index
+
+
+def read_manifest_entries(path, capture_ids=None, index=None):
+    """ Generator over (capture_id, data) of a manifest
+        Args:
+        - path: path to the manifest (.json or .jsonl)
+        - capture_ids: capture_ids to read (default: all, in manifest order)
+        - index: index as returned by 'read_manifest_index' (read if None)
+    """
+    if index is None:
+        index = read_manifest_index(path)
+    if capture_ids is None:
+        capture_ids = index.keys()
+    if not is_jsonl_manifest(path):
+        for capture_id in capture_ids:
+            yield capture_id, index[capture_id]
+        return
+    with open(path, 'rb') as f:
+        for capture_id in capture_ids:
+            f.seek(index[capture_id])
+            yield _decode_manifest_line(f.readline())
+
+
+def read_manifest_entry(path, capture_id, index=None):
+    """ Read the data of a single capture_id from a manifest """
+    _, data = next(read_manifest_entries(path, [capture_id], index))
+    return data
+
+
+def read_manifest_batches(path, batch_size, capture_ids=None, index=None):
+    """ Generator over batches (lists of (capture_id, data)) of a manifest
+        - only one batch is held in memory at a time
+    """
+    if index is None:
+        index = read_manifest_index(path)
+    if capture_ids is None:
+        capture_ids = list(index.keys())
+    for i_start in range(0, len(capture_ids), batch_size):
+        batch_ids = capture_ids[i_start: i_start + batch_size]
+        yield list(read_manifest_entries(path, batch_ids, index))
+
+
+def write_manifest(entries, path):
+    """ Write (capture_id, data) entries to a manifest (.json or .jsonl)
+        - '.jsonl' manifests are written line by line together with their
+          offset index into temporary files which replace 'path' at the
+          end -- 'entries' may thus be read from 'path' itself
+    """
+    if not is_jsonl_manifest(path):
+        export_dict_to_json_with_newlines(OrderedDict(entries), path)
+        return
+    tmp_path = '{}.tmp'.format(path)
+    tmp_index_path = '{}.tmp'.format(manifest_index_path(path))
+    offset = 0
+    with open(tmp_path, 'wb') as f, open(tmp_index_path, 'w') as f_index:
+        f_index.write('capture_id,offset\n')
+        for capture_id, data in entries:
+            line = _encode_manifest_line(capture_id, data)
+            f.write(line)
+            _write_index_lines(f_index, [(capture_id, offset)])
+            offset += len(line)
+    os.replace(tmp_path, path)
+    os.replace(tmp_index_path, manifest_index_path(path))
+
+
+def append_to_manifest(path, entries, index=None):
+    """ Append (capture_id, data) entries to a '.jsonl' manifest in-place
+        - new entries of an existing capture_id supersede the old ones
+        - the index (if provided) and its sidecar file are updated
+    """
+    if not is_jsonl_manifest(path):
+        raise ValueError(
+            "Appending is only supported for '.jsonl' manifests: {}".format(
+                path))
+    if index is None:
+        index = read_manifest_index(path)
+    new_index_entries = list()
+    with open(path, 'ab') as f:
+        offset = f.tell()
+        for capture_id, data in entries:
+            line = _encode_manifest_line(capture_id, data)
+            f.write(line)
+            new_index_entries.append((capture_id, offset))
+            offset += len(line)
+    with open(manifest_index_path(path), 'a') as f:
+        _write_index_lines(f, new_index_entries)
+    index.update(new_index_entries)
+    return index
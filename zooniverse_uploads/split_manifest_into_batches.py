@@ -1,17 +1,18 @@
 """ Split a manifest into multiple batches
 """
-import json
 import os
 import argparse
 import math
 import random
-from collections import OrderedDict
 import logging
 
 from utils.logger import set_logging
 from utils.utils import (
-    slice_generator, export_dict_to_json_with_newlines,
+    slice_generator,
     file_path_splitter, file_path_generator, set_file_permission)
+from zooniverse_uploads.manifest import (
+    read_manifest_index, read_manifest_entries, write_manifest,
+    manifest_file_ext, manifest_index_path, is_jsonl_manifest)
 
 
 if __name__ == "__main__":
@@ -20,7 +21,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--manifest", type=str, required=True,
-        help="Path to the manifest file (.json) file")
+        help="Path to the manifest file (.json/.jsonl) file")
     parser.add_argument(
         "--split_order", type=str, default='random',
         choices=['sequential', 'random'],
@@ -47,8 +48,8 @@ if __name__ == "__main__":
         raise FileNotFoundError("manifest: %s not found" % args['manifest'])
 
     # check Manifest filename
-    assert args['manifest'].endswith('.json'), \
-        "manifest file must end with '.json'"
+    assert args['manifest'].endswith(('.json', '.jsonl')), \
+        "manifest file must end with '.json' or '.jsonl'"
 
     # check inputs
     if (args['number_of_batches'] is None) and (args['max_batch_size'] is None):
@@ -66,13 +67,13 @@ if __name__ == "__main__":
     for k, v in args.items():
         logger.info("Argument {}: {}".format(k, v))
 
-    file_name_parts = file_path_splitter(args['manifest'])
+    file_name_parts = file_path_splitter(
+        args['manifest'], file_ext=manifest_file_ext(args['manifest']))
 
-    # import manifest
-    with open(args['manifest'], 'r') as f:
-        manifest = json.load(f)
+    # import manifest index (the full manifest for '.json' manifests)
+    manifest_index = read_manifest_index(args['manifest'])
 
-    n_captures = len(manifest.keys())
+    n_captures = len(manifest_index.keys())
 
     logger.info("Imported Manfest file %s with %s records" %
                 (args['manifest'], n_captures))
@@ -86,7 +87,7 @@ if __name__ == "__main__":
     slices = slice_generator(n_captures, n_batches)
 
     # select captures
-    capture_ids = list(manifest.keys())
+    capture_ids = list(manifest_index.keys())
 
     if args['split_order'] is 'random':
         random.seed(123)
@@ -95,8 +96,6 @@ if __name__ == "__main__":
     logger.info("Creating %s splits" % (n_batches))
 
     for batch_no, (i_start, i_end) in enumerate(slices):
-        batch_manifest = OrderedDict()
-
         batch_path = file_path_generator(
             dir=os.path.dirname(args['manifest']),
             id=file_name_parts['id'],
@@ -106,15 +105,19 @@ if __name__ == "__main__":
             file_ext=file_name_parts['file_ext']
         )
 
-        for batch_id in capture_ids[i_start: i_end]:
-            batch_manifest[batch_id] = manifest[batch_id]
+        batch_ids = capture_ids[i_start: i_end]
 
         logger.info("Writing batch %s to %s with %s records" %
-                    (batch_no + 1, batch_path, len(batch_manifest.keys())))
+                    (batch_no + 1, batch_path, len(batch_ids)))
 
-        export_dict_to_json_with_newlines(batch_manifest, batch_path)
+        write_manifest(
+            read_manifest_entries(
+                args['manifest'], batch_ids, manifest_index),
+            batch_path)
 
         logger.info("Finished writing to {}".format(batch_path))
 
         # change permmissions to read/write for group
         set_file_permission(batch_path)
+        if is_jsonl_manifest(batch_path):
+            set_file_permission(manifest_index_path(batch_path))
@@ -0,0 +1,175 @@
+""" Bulk Update Metadata of Zooniverse Subjects
+    - subjects are fetched in pages by a list of ids
+    - the new metadata is computed and compared locally, only subjects with
+      changed metadata are saved
+    - saves run concurrently (bounded number of threads) with retries and
+      exponential backoff
+    - processed subject ids are appended to a tracker file to resume
+"""
+import os
+import time
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from panoptes_client import Panoptes
+from panoptes_client.panoptes import PanoptesAPIException
+from requests.exceptions import RequestException
+
+
+logger = logging.getLogger(__name__)
+
+
+def read_update_tracker_file(file_path):
+    """ Read the subject ids from an update tracker file (one per line) """
+    if not os.path.isfile(file_path):
+        return set()
+    with open(file_path, 'r') as f:
+        return set(x for x in f.read().splitlines() if x != '')
+
+
+def update_update_tracker_file(file_path, subject_ids):
+    """ Append subject ids to an update tracker file """
+    with open(file_path, 'a') as f:
+        for subject_id in subject_ids:
+            f.write('{}\n'.format(subject_id))
+
+
+def _call_with_retries(function, max_retries=5, backoff_seconds=1, **kwargs):
+    """ Call a function and retry with exponential backoff on API errors """
+    for attempt in range(0, max_retries + 1):
+        try:
+            return function(**kwargs)
+        except (PanoptesAPIException, RequestException) as e:
+            if attempt == max_retries:
+                raise
+            sleep_time = backoff_seconds * (2 ** attempt)
+            logger.debug("Retrying in {}s after error: {}".format(
+                sleep_time, e))
+            time.sleep(sleep_time)
+
+
+def fetch_subjects_metadata(client, subject_ids, page_size=100):
+    """ Generator over (subject_id, metadata) of subjects fetched in pages
+        Args:
+        - client: a (connected) Panoptes client
+        - subject_ids: list of subject ids
+        - page_size: number of subjects per request
+    """
+    for i_start in range(0, len(subject_ids), page_size):
+        ids = subject_ids[i_start: i_start + page_size]
+        params = {'id': ','.join(ids), 'page_size': page_size}
+        response, _ = _call_with_retries(
+            client.get, path='/subjects', params=params)
+        while True:
+            for subject in response.get('subjects', []):
+                yield subject['id'], subject['metadata']
+            next_href = response.get('meta', {}).get(
+                'subjects', {}).get('next_href')
+            if not next_href:
+                break
+            response, _ = _call_with_retries(client.get, path=next_href)
+
+
+def _save_subject_metadata(client, subject_id, update_function):
+    """ Fetch a single subject (for its ETag), update and save it
+        - returns True if the subject was changed
+    """
+    response, etag = client.get('/subjects/{}'.format(subject_id))
+    metadata = response['subjects'][0]['metadata']
+    new_metadata = update_function(subject_id, dict(metadata))
+    if new_metadata == metadata:
+        return False
+    client.put(
+        '/subjects/{}'.format(subject_id),
+        json={'subjects': {'metadata': new_metadata}},
+        etag=etag)
+    return True
+
+
+def update_subjects(
+        subject_ids, update_function, tracker_file,
+        client=None, n_workers=5, page_size=100,
+        max_retries=5, backoff_seconds=1, dry_run=False,
+        n_examples_to_log=10):
+    """ Update the metadata of subjects
+        Args:
+        - subject_ids: list of subject ids to update
+        - update_function: function(subject_id, metadata) returning the new
+          metadata (dict) of a subject
+        - tracker_file: file that tracks already processed subject ids
+        - client: Panoptes client (default: the connected client)
+        - n_workers: max number of concurrent saves
+        - page_size: number of subjects to fetch per request
+        - max_retries / backoff_seconds: retry a failed save 'max_retries'
+          times, waiting 'backoff_seconds' * 2 ** attempt between attempts
+        - dry_run: only compare metadata, do not save / track anything
+        Returns:
+        - Counter with the number of 'changed' (to be saved), 'updated',
+          'unchanged', 'failed' and 'not_found' subjects
+    """
+    if client is None:
+        client = Panoptes.client()
+    stats = Counter()
+    already_processed = read_update_tracker_file(tracker_file)
+    subject_ids = [str(x) for x in subject_ids]
+    subject_ids = [x for x in subject_ids if x not in already_processed]
+    logger.info("Found {} subjects in tracker file - {} remain".format(
+        len(already_processed), len(subject_ids)))
+
+    def save(subject_id):
+        return _call_with_retries(
+            _save_subject_metadata,
+            max_retries=max_retries, backoff_seconds=backoff_seconds,
+            client=client, subject_id=subject_id,
+            update_function=update_function)
+
+    def collect(pending):
+        """ wait for pending saves and track the successful ones """
+        processed = list()
+        for subject_id, future in pending:
+            try:
+                future.result()
+                stats['updated'] += 1
+                processed.append(subject_id)
+            except (PanoptesAPIException, RequestException) as e:
+                stats['failed'] += 1
+                logger.error("Failed to save subject {}: {}".format(
+                    subject_id, e))
+        if len(processed) > 0:
+            update_update_tracker_file(tracker_file, processed)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        pending = list()
+        for i_start in range(0, len(subject_ids), page_size):
+            page_ids = subject_ids[i_start: i_start + page_size]
+            unchanged = list()
+            to_save = list()
+            fetched = fetch_subjects_metadata(client, page_ids, page_size)
+            n_fetched = 0
+            for subject_id, metadata in fetched:
+                n_fetched += 1
+                new_metadata = update_function(subject_id, dict(metadata))
+                if new_metadata == metadata:
+                    unchanged.append(subject_id)
+                    continue
+                if stats['changed'] < n_examples_to_log:
+                    logger.info("Subject {} - from: {} - to: {}".format(
+                        subject_id, metadata, new_metadata))
+                stats['changed'] += 1
+                to_save.append(subject_id)
+            stats['not_found'] += len(page_ids) - n_fetched
+            stats['unchanged'] += len(unchanged)
+            if dry_run:
+                continue
+            update_update_tracker_file(tracker_file, unchanged)
+            # saves of the previous page run while this page is fetched
+            collect(pending)
+            pending = [(x, pool.submit(save, x)) for x in to_save]
+            logger.info(
+                "Processed {}/{} subjects - {} updated, {} unchanged, "
+                "{} failed".format(
+                    i_start + len(page_ids), len(subject_ids),
+                    stats['updated'], stats['unchanged'], stats['failed']))
+        collect(pending)
+    return stats
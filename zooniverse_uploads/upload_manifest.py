@@ -1,5 +1,4 @@
 """ Upload Manifest to Zooniverse """
-import json
 import os
 import argparse
 import time
@@ -19,8 +18,12 @@ from utils.resize_and_compress_images import (
     resize_and_compress_list_of_images)
 from utils.utils import (
     read_config_file, estimate_remaining_time,
-    current_time_str, export_dict_to_json_with_newlines,
+    current_time_str,
     file_path_splitter, file_path_generator, set_file_permission)
+from zooniverse_uploads.manifest import (
+    read_manifest_index, read_manifest_entry, read_manifest_entries,
+    write_manifest, append_to_manifest,
+    is_jsonl_manifest, manifest_file_ext, manifest_index_path)
 
 
 logger = logging.getLogger(__name__)
@@ -165,7 +168,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--manifest", type=str, required=True,
-        help="Path to manifest file (.json)")
+        help="Path to manifest file (.json/.jsonl)")
 
     parser.add_argument(
         "--project_id", type=int, required=True,
@@ -178,8 +181,10 @@ if __name__ == "__main__":
 
     parser.add_argument(
         "--output_file", type=str, default=None,
-        help="Output file for updated manifest (.json). \
-              Default is to overwrite the manifest.")
+        help="Output file for updated manifest (.json/.jsonl). \
+              Default is to write a new '_uploaded' manifest. If set \
+              to the '.jsonl' manifest itself, the upload results are \
+              appended to it in-place.")
 
     parser.add_argument(
         "--password_file", type=str, required=True,
@@ -258,7 +263,8 @@ if __name__ == "__main__":
     # Generate Filenames
     ###################################
 
-    file_name_parts = file_path_splitter(args['manifest'])
+    file_name_parts = file_path_splitter(
+        args['manifest'], file_ext=manifest_file_ext(args['manifest']))
 
     # generate subject_set name
     sub_name = "%s_%s" % (file_name_parts['id'], file_name_parts['batch'])
@@ -274,7 +280,7 @@ if __name__ == "__main__":
             name="%s_%s" % (file_name_parts['name'], 'uploaded'),
             batch=file_name_parts['batch'],
             file_delim=file_name_parts['file_delim'],
-            file_ext='json'
+            file_ext=file_name_parts['file_ext']
             )
         logger.info("Outputfile is {}".format(args['output_file']))
 
@@ -311,12 +317,11 @@ if __name__ == "__main__":
     # Load Files
     ###################################
 
-    # import manifest
-    with open(args['manifest'], 'r') as f:
-        mani = json.load(f)
+    # import manifest index (the full manifest for '.json' manifests)
+    mani_index = read_manifest_index(args['manifest'])
 
     logger.info("Imported Manifest file {} with {} records".format(
-                args['manifest'], len(mani.keys())))
+                args['manifest'], len(mani_index.keys())))
 
     # read Zooniverse credentials
     config = read_config_file(args['password_file'])
@@ -349,7 +354,7 @@ if __name__ == "__main__":
     time_start = time.time()
     total_uploaded_subjects = n_in_tracker_file
 
-    capture_ids_all = list(mani.keys())
+    capture_ids_all = list(mani_index.keys())
 
     n_tot = len(capture_ids_all)
     n_tot_remaining = n_tot - n_in_tracker_file
@@ -397,7 +402,8 @@ if __name__ == "__main__":
 
         try:
             # current capture data
-            capture_data = mani[capture_id]
+            capture_data = read_manifest_entry(
+                args['manifest'], capture_id, mani_index)
 
             # Create subject - retry on connection issues
             subject = create_subject(capture_id, capture_data, args)
@@ -470,19 +476,36 @@ if __name__ == "__main__":
 
     tracker_data = uploader.read_tracker_file(tracker_file_path)
 
-    for capture_id, subject_id in tracker_data.items():
-        data = mani[capture_id]
-        add_subject_data_to_manifest(my_set, capture_id, subject_id, data)
+    def add_upload_results(manifest_entries):
+        for capture_id, data in manifest_entries:
+            if capture_id in tracker_data:
+                add_subject_data_to_manifest(
+                    my_set, capture_id, tracker_data[capture_id], data)
+            yield capture_id, data
 
     logger.info(
       "Finished uploading subjects - total {}/{} successfully uploaded".format(
        total_uploaded_subjects, n_tot))
 
     # Export Manifest
-    export_dict_to_json_with_newlines(mani, args['output_file'])
+    if is_jsonl_manifest(args['manifest']) and \
+            (args['output_file'] == args['manifest']):
+        # append only the uploaded captures
+        uploaded_entries = read_manifest_entries(
+            args['manifest'], list(tracker_data.keys()), mani_index)
+        append_to_manifest(
+            args['manifest'], add_upload_results(uploaded_entries),
+            mani_index)
+    else:
+        manifest_entries = read_manifest_entries(
+            args['manifest'], index=mani_index)
+        write_manifest(
+            add_upload_results(manifest_entries), args['output_file'])
 
     # change permmissions to read/write for group
     set_file_permission(args['output_file'])
+    if is_jsonl_manifest(args['output_file']):
+        set_file_permission(manifest_index_path(args['output_file']))
 
     # delete the tracker file
     os.remove(tracker_file_path)
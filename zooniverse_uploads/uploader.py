@@ -4,8 +4,6 @@ import hashlib
 import csv
 import logging
 
-from panoptes_client import SubjectSet, Subject
-
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +15,7 @@ def create_subject(project, media_files, metadata):
         - media_files: a list of media files to link to the subject
         - metadata: a dictionary with metadata to attach
     """
+    from panoptes_client import Subject
     subject = Subject()
     subject.links.project = project
     for media in media_files:
@@ -64,6 +63,7 @@ def read_tracker_file(file_path):
 
 def create_subject_set(project, subject_set_name):
     # Create a new subject set
+    from panoptes_client import SubjectSet
     new_set = SubjectSet()
     new_set.links.project = project
     new_set.display_name = subject_set_name